@@ -0,0 +1,218 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+# 프로세스당 동시에 실행하는 LLM 단계 작업 수 (넘으면 대기열, 대기열도 차면 규칙 기반 결과로 즉시 전환)
+MAX_ACTIVE = int(os.getenv("ADMISSION_MAX_ACTIVE", "8"))
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+# 대기열에서 이 시간 안에 시작하지 못한 작업은 취소 (이미 간편 결과를 보고 있는 사용자)
+QUEUE_TIMEOUT_SEC = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SEC", "60"))
+# 상세 분석(우선순위 0) 전용으로 남겨 두는 실행 슬롯 수
+RESERVED_SLOTS = int(os.getenv("ADMISSION_RESERVED_SLOTS", "2"))
+# 채팅처럼 화면에서 바로 기다리는 호출의 최대 대기 시간
+CHAT_WAIT_SEC = float(os.getenv("ADMISSION_CHAT_WAIT_SEC", "15"))
+
+# 숫자가 작을수록 먼저 (상세 분석 > 채팅 > 상품 추천 > 상황 예시)
+PRIORITIES = {"analysis": 0, "chat": 1, "step25": 2, "situations": 3}
+DEFAULT_PRIORITY = 2
+
+class Shed(Exception):
+    """부하 초과로 작업을 받지 않음 (queue_full | preempted | queue_timeout | wait_timeout | replaced)"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class Ticket:
+    __slots__ = ("key", "visitor", "stage", "priority", "compute", "future", "queued_at")
+
+    def __init__(self, key: str, visitor: str, stage: str, compute: Callable):
+        self.key = key
+        self.visitor = visitor
+        self.stage = stage
+        self.priority = PRIORITIES.get(stage, DEFAULT_PRIORITY)
+        self.compute = compute
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+# ============================================================================
+# 2. 승인 제어 + 방문자별 공정 대기열
+# ============================================================================
+class AdmissionController:
+    """우선순위별 대기열 안에서 실행 중인 작업이 적은 방문자부터, 같으면 라운드 로빈 (한 방문자의 작업이 몰려도 다른 방문자가 밀리지 않음)"""
+
+    def __init__(self, max_active: int = MAX_ACTIVE, max_queue: int = MAX_QUEUE,
+                 queue_timeout: float = QUEUE_TIMEOUT_SEC, reserved: int = RESERVED_SLOTS):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.reserved = min(reserved, max_active - 1)
+        self.lock = threading.Lock()
+        self.active: Dict[int, int] = {}
+        self.running: Dict[str, int] = {}
+        self.queues: Dict[int, "OrderedDict[str, deque]"] = {}
+        self.queued: Dict[str, Ticket] = {}
+        self.shed_count: Dict[str, int] = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_active, thread_name_prefix="admitted")
+
+    # --- 슬롯 계산 (우선순위 0이 아니면 예약 슬롯을 남겨 둠) ---
+    def _can_start(self, priority: int, active: Dict[int, int]) -> bool:
+        running = sum(active.values())
+        if priority == 0:
+            return running < self.max_active
+        return running < self.max_active - self.reserved
+
+    def _shed(self, ticket: Ticket, reason: str):
+        self.shed_count[reason] = self.shed_count.get(reason, 0) + 1
+        ticket.future.set_exception(Shed(reason))
+
+    def submit(self, key: str, visitor: str, stage: str, compute: Callable) -> Future:
+        """대기열 등록 후 빈 슬롯이 있으면 바로 실행 (Future 반환)
+        대기열이 가득 차면 더 낮은 우선순위의 가장 최근 작업을 밀어내고, 없으면 Shed
+        같은 key가 아직 대기 중이면 이전 작업을 대기열에서 빼고 Shed("replaced")로 끝낸 뒤 새 작업을 맨 뒤에 등록"""
+        ticket = Ticket(key, visitor, stage, compute)
+        with self.lock:
+            self._expire_locked()
+            previous = self.queued.get(key)
+            if previous is not None:
+                self._remove_locked(previous)
+                self._shed(previous, "replaced")
+            if len(self.queued) >= self.max_queue:
+                victim = max(self.queued.values(), key=lambda t: (t.priority, t.queued_at))
+                if victim.priority <= ticket.priority:
+                    self.shed_count["queue_full"] = self.shed_count.get("queue_full", 0) + 1
+                    raise Shed("queue_full")
+                self._remove_locked(victim)
+                self._shed(victim, "preempted")
+            self.queues.setdefault(ticket.priority, OrderedDict()).setdefault(visitor, deque()).append(ticket)
+            self.queued[key] = ticket
+            self._dispatch_locked()
+        return ticket.future
+
+    def _start_locked(self, ticket: Ticket):
+        self.active[ticket.priority] = self.active.get(ticket.priority, 0) + 1
+        self.running[ticket.visitor] = self.running.get(ticket.visitor, 0) + 1
+        self.executor.submit(self._run, ticket)
+
+    def _run(self, ticket: Ticket):
+        try:
+            if ticket.future.set_running_or_notify_cancel():
+                ticket.future.set_result(ticket.compute())
+        except Exception as e:
+            ticket.future.set_exception(e)
+        finally:
+            with self.lock:
+                self.active[ticket.priority] -= 1
+                self.running[ticket.visitor] -= 1
+                if not self.running[ticket.visitor]:
+                    del self.running[ticket.visitor]
+                self._dispatch_locked()
+
+    def _expire_locked(self):
+        cutoff = time.monotonic() - self.queue_timeout
+        for ticket in [t for t in self.queued.values() if t.queued_at < cutoff]:
+            self._remove_locked(ticket)
+            self._shed(ticket, "queue_timeout")
+
+    def _remove_locked(self, ticket: Ticket):
+        self.queued.pop(ticket.key, None)
+        visitors = self.queues[ticket.priority]
+        pending = visitors[ticket.visitor]
+        pending.remove(ticket)
+        if not pending:
+            del visitors[ticket.visitor]
+
+    def _order(self, queues: Dict[int, "OrderedDict[str, deque]"], running: Dict[str, int],
+               active: Optional[Dict[int, int]] = None) -> List[Ticket]:
+        """대기열에서 꺼내는 순서 (active를 주면 빈 슬롯만큼만 꺼냄, 없으면 전체 순서)"""
+        order = []
+        while True:
+            priority = next((p for p in sorted(queues) if queues[p]), None)
+            if priority is None or (active is not None and not self._can_start(priority, active)):
+                return order
+            visitors = queues[priority]
+            visitor = min(visitors, key=lambda v: running.get(v, 0))
+            pending = visitors[visitor]
+            order.append(pending.popleft())
+            running[visitor] = running.get(visitor, 0) + 1
+            if pending:
+                visitors.move_to_end(visitor)
+            else:
+                del visitors[visitor]
+            if active is not None:
+                active[priority] = active.get(priority, 0) + 1
+
+    def _dispatch_locked(self):
+        self._expire_locked()
+        for ticket in self._order(self.queues, dict(self.running), dict(self.active)):
+            self.queued.pop(ticket.key, None)
+            self._start_locked(ticket)
+
+    # --- 조회 ---
+    def position(self, key: str) -> Optional[int]:
+        """대기 순번 (1부터, 대기 중이 아니면 None)"""
+        with self.lock:
+            if key not in self.queued:
+                return None
+            order = self._order({p: OrderedDict((v, deque(q)) for v, q in visitors.items())
+                                 for p, visitors in self.queues.items()}, dict(self.running))
+        return next((i + 1 for i, t in enumerate(order) if t.key == key), None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "active": sum(self.active.values()),
+                "queued": len(self.queued),
+                "visitors_waiting": len({t.visitor for t in self.queued.values()}),
+                "shed": dict(self.shed_count),
+            }
+
+    @contextmanager
+    def admitted(self, visitor: str, stage: str, key: Optional[str] = None, timeout: Optional[float] = None):
+        """현재 스레드에서 실행할 작업의 슬롯 확보 (채팅처럼 화면에서 바로 기다리는 호출용)"""
+        key = key or f"{visitor}:{stage}:{time.monotonic_ns()}"
+        release = threading.Event()
+        started = threading.Event()
+        # 슬롯을 점유하는 자리 표시 작업 (호출 스레드가 끝날 때까지 대기)
+        future = self.submit(key, visitor, stage, lambda: (started.set(), release.wait()))
+        future.add_done_callback(lambda f: started.set())
+        try:
+            if not started.wait(timeout) and self._cancel(key):
+                raise Shed("wait_timeout")
+            started.wait()
+            if future.done():
+                raise future.exception() or Shed("cancelled")
+            yield
+        finally:
+            release.set()
+
+    def _cancel(self, key: str) -> bool:
+        """아직 대기 중인 작업 취소 (이미 시작했으면 False)"""
+        with self.lock:
+            ticket = self.queued.get(key)
+            if ticket is None:
+                return False
+            self._remove_locked(ticket)
+            ticket.future.cancel()
+            return True
+
+controller = AdmissionController()
+
+def submit(key: str, visitor: str, stage: str, compute: Callable) -> Future:
+    return controller.submit(key, visitor, stage, compute)
+
+def position(key: str) -> Optional[int]:
+    return controller.position(key)
+
+def stats() -> dict:
+    return controller.stats()
+
+def admitted(visitor: str, stage: str, timeout: Optional[float] = None):
+    return controller.admitted(visitor, stage, timeout=timeout)
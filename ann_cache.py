@@ -0,0 +1,224 @@
+import os
+import hashlib
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from retrievers import RetrieverStoreMixin, normalize_rows
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+# 검색 결과(청크 ID + 점수) 캐시 항목 수 (0이면 사용 안 함)
+ANN_CACHE_SIZE = int(os.getenv("ANN_CACHE_SIZE", "4096"))
+# 결과가 가리키는 청크 본문/메타데이터 캐시 항목 수 (여러 결과가 같은 청크를 공유)
+CHUNK_CACHE_SIZE = int(os.getenv("ANN_CHUNK_CACHE_SIZE", "20000"))
+# 질의 벡터 양자화 단계 (정규화 후 성분 × 단계를 반올림 → 배치 크기에 따른 미세한 부동소수점 차이는 같은 키)
+QUANT_LEVELS = int(os.getenv("ANN_CACHE_QUANT_LEVELS", "256"))
+
+_MISS = object()
+
+# ============================================================================
+# 2. 캐시 키 (정규화된 질의 문장 또는 양자화된 질의 벡터 + k + 필터 + 인덱스 버전)
+# ============================================================================
+def text_key(query: str) -> str:
+    return "t:" + " ".join(unicodedata.normalize("NFKC", query or "").split())
+
+def vector_key(vector, levels: int = QUANT_LEVELS) -> str:
+    unit = normalize_rows(np.asarray(vector, dtype=np.float32)[None, :])[0]
+    quantized = np.round(unit * levels).astype(np.int16)
+    return "v:" + hashlib.blake2b(quantized.tobytes(), digest_size=16).hexdigest()
+
+def filter_key(filter: Optional[dict]) -> str:
+    return json.dumps(filter or {}, ensure_ascii=False, sort_keys=True)
+
+# ============================================================================
+# 3. 결과 캐시 + 공유 청크 저장소 (LRU, 스냅샷 교체 시 전체 무효화)
+# ============================================================================
+class AnnCache:
+    """(네임스페이스, 질의 키, k, 상품/필터) → [(청크 ID, 점수)] 와 청크 ID → (본문, 메타데이터)
+
+    인덱스 버전이 바뀌면(새 스냅샷 활성화) 두 캐시를 모두 비웁니다.
+    이전 버전 저장소로 진행 중인 검색은 캐시를 읽지도 쓰지도 않습니다.
+    """
+
+    def __init__(self, max_results: int = ANN_CACHE_SIZE, max_chunks: int = CHUNK_CACHE_SIZE):
+        self.max_results = max_results
+        self.max_chunks = max_chunks
+        self.lock = threading.Lock()
+        self.version = _MISS
+        self.results: "OrderedDict[tuple, Optional[List[Tuple[str, float]]]]" = OrderedDict()
+        self.chunks: "OrderedDict[str, Tuple[str, dict]]" = OrderedDict()
+        self.counts = {"hits": 0, "misses": 0, "chunk_fetches": 0, "invalidations": 0}
+
+    def activate(self, version):
+        """새 인덱스 버전으로 전환 (버전이 같으면 유지)"""
+        with self.lock:
+            if version == self.version:
+                return
+            if self.version is not _MISS:
+                self.counts["invalidations"] += 1
+            self.version = version
+            self.results.clear()
+            self.chunks.clear()
+
+    def lookup(self, version, key: tuple):
+        """캐시된 [(청크 ID, 점수)] (상품을 모르면 None), 없으면 _MISS"""
+        with self.lock:
+            if version != self.version or key not in self.results:
+                self.counts["misses"] += 1
+                return _MISS
+            self.results.move_to_end(key)
+            self.counts["hits"] += 1
+            return self.results[key]
+
+    def store(self, version, key: tuple, rows: Optional[List[Tuple[Document, float]]]):
+        """검색 결과 저장 (ID 없는 문서가 섞이면 재조회가 불가능하므로 저장하지 않음)"""
+        if rows is not None and any(not getattr(doc, "id", None) for doc, _ in rows):
+            return
+        with self.lock:
+            if version != self.version:
+                return
+            if rows is not None:
+                for doc, _ in rows:
+                    self.chunks[doc.id] = (doc.page_content, dict(doc.metadata or {}))
+                    self.chunks.move_to_end(doc.id)
+                while len(self.chunks) > self.max_chunks:
+                    self.chunks.popitem(last=False)
+            self.results[key] = None if rows is None else [(doc.id, float(score)) for doc, score in rows]
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+
+    def hydrate(self, version, docstore, entries: List[Tuple[str, float]]) -> Optional[List[Tuple[Document, float]]]:
+        """청크 캐시에서 Document 구성, 없는 청크만 docstore에서 일괄 조회 (끝내 없으면 None → 재검색)"""
+        with self.lock:
+            cached = {cid: self.chunks[cid] for cid, _ in entries if cid in self.chunks}
+            for cid in cached:
+                self.chunks.move_to_end(cid)
+        missing = [cid for cid, _ in entries if cid not in cached]
+        if missing:
+            batch = docstore.get(ids=missing, include=["documents", "metadatas"])
+            fetched = {cid: (text or "", meta or {})
+                       for cid, text, meta in zip(batch.get("ids", []), batch.get("documents", []), batch.get("metadatas", []))}
+            if len(fetched) < len(set(missing)):
+                return None
+            with self.lock:
+                self.counts["chunk_fetches"] += len(fetched)
+                if version == self.version:
+                    for cid, value in fetched.items():
+                        self.chunks[cid] = value
+                    while len(self.chunks) > self.max_chunks:
+                        self.chunks.popitem(last=False)
+            cached.update(fetched)
+        # 호출부가 메타데이터를 고쳐도 캐시는 그대로 유지되도록 복사본 반환
+        return [(Document(page_content=cached[cid][0], metadata=dict(cached[cid][1]), id=cid), score)
+                for cid, score in entries]
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.counts["hits"] + self.counts["misses"]
+            return {
+                **self.counts,
+                "hit_rate": round(self.counts["hits"] / total, 3) if total else 0.0,
+                "results": len(self.results),
+                "chunks": len(self.chunks),
+                "version": None if self.version is _MISS else self.version,
+            }
+
+cache = AnnCache()
+
+def stats() -> dict:
+    return cache.stats()
+
+# ============================================================================
+# 4. 캐시 저장소 (Chroma / CompactStore / ExactProductStore / ShardStore 래핑)
+# ============================================================================
+class CachedStore(RetrieverStoreMixin):
+    """반복 검색은 벡터 DB를 거치지 않고 캐시된 청크 ID/점수 + 공유 청크 저장소로 응답
+
+    문장 질의(similarity_search, search_product)는 정규화된 문장이 키라 임베딩도 생략됩니다.
+    """
+
+    def __init__(self, store, namespace: str, version, result_cache: AnnCache = cache):
+        self.store = store
+        self.docstore = store
+        self.namespace = namespace
+        self.version = version
+        self.cache = result_cache
+        self.cache.activate(version)
+
+    def __getattr__(self, name):
+        # embedding/embeddings, _collection 등 나머지 속성은 원래 저장소로
+        return getattr(self.__dict__["store"], name)
+
+    def _cached(self, key: tuple, search):
+        key = (self.namespace,) + key
+        entries = self.cache.lookup(self.version, key)
+        if entries is not _MISS:
+            if entries is None:
+                return None
+            rows = self.cache.hydrate(self.version, self.store, entries)
+            if rows is not None:
+                return rows
+        rows = search()
+        self.cache.store(self.version, key, rows)
+        return rows
+
+    # --- 문장 질의 ---
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None):
+        return self._cached((text_key(query), k, filter_key(filter), "score"),
+                            lambda: self.store.similarity_search_with_score(query, k=k, filter=filter))
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[Document]:
+        # ExactProductStore.similarity_search는 점수 없이 ANN 저장소에 위임하므로 원래 메서드를 그대로 사용
+        rows = self._cached((text_key(query), k, filter_key(filter), "docs"),
+                            lambda: [(doc, 0.0) for doc in self.store.similarity_search(query, k=k, filter=filter)])
+        return [doc for doc, _ in rows]
+
+    def search_product(self, query: str, product_name: str, k: int = 8) -> Optional[list]:
+        if not hasattr(self.store, "search_product"):
+            return None
+        rows = self._cached((text_key(query), k, "product:" + product_name, "docs"),
+                            lambda: _with_zero_scores(self.store.search_product(query, product_name, k=k)))
+        return None if rows is None else [doc for doc, _ in rows]
+
+    # --- 벡터 질의 (다중 질의 검색, 사이드카/샤드 search_vector) ---
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: Optional[dict] = None):
+        return self._cached((vector_key(embedding), k, filter_key(filter), "score"),
+                            lambda: _search_by_vector_with_score(self.store, embedding, k, filter))
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: Optional[dict] = None) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def search_product_by_vector_with_score(self, embedding, product_name: str, k: int = 8) -> Optional[list]:
+        if hasattr(self.store, "search_product_by_vector_with_score"):
+            search = lambda: self.store.search_product_by_vector_with_score(embedding, product_name, k=k)
+        elif hasattr(self.store, "search_product_by_vector"):
+            search = lambda: _with_zero_scores(self.store.search_product_by_vector(embedding, product_name, k=k))
+        else:
+            return None
+        return self._cached((vector_key(embedding), k, "product:" + product_name, "score"), search)
+
+    def search_product_by_vector(self, embedding, product_name: str, k: int = 8) -> Optional[list]:
+        rows = self.search_product_by_vector_with_score(embedding, product_name, k=k)
+        return None if rows is None else [doc for doc, _ in rows]
+
+def _with_zero_scores(docs: Optional[List[Document]]) -> Optional[List[Tuple[Document, float]]]:
+    return None if docs is None else [(doc, 0.0) for doc in docs]
+
+def _search_by_vector_with_score(store, vector, k: int, filter: Optional[dict]):
+    if hasattr(store, "similarity_search_by_vector_with_score"):
+        return store.similarity_search_by_vector_with_score(vector, k=k, filter=filter)
+    return store.similarity_search_by_vector_with_relevance_scores(vector, k=k, filter=filter)
+
+def wrap(store, namespace: str, version):
+    """검색 저장소를 결과 캐시로 감쌈 (저장소가 없거나 ANN_CACHE_SIZE=0이면 그대로)"""
+    if store is None or ANN_CACHE_SIZE <= 0:
+        return store
+    return CachedStore(store, namespace, version)
@@ -1,29 +1,37 @@
 import streamlit as st
 import os
-import re
 import uuid
 import time
 import json
-import zipfile
-import gdown
+import shutil
+import html
+from contextlib import contextmanager, nullcontext
+from functools import partial
 from datetime import datetime
 from dotenv import load_dotenv
 
-# LangChain & Vector DB
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-
 # Recommendation System
 import recommend
+import engine
+import snapshot
+import warmup
+import structured_output
+import llm_gateway
+import rerun_profiler
+import session_store
+import result_store
+import degraded
+import serving
+# 선택 기능 모듈(request_profiler, memory_diag, admission)은 켠 경우/사용 시점에만 import (워커 기동 시간 단축)
 
 # ============================================================================
 # 0. DB 자동 다운로드 (최초 실행 시)
 # ============================================================================
 def setup_vector_dbs():
-    """Google Drive에서 Vector DB 다운로드 및 압축 해제"""
+    """Vector DB 준비: 스냅샷 manifest가 설정되어 있으면 버전 번들 동기화, 아니면 Google Drive에서 다운로드"""
+    if snapshot.MANIFEST_URL:
+        return setup_vector_snapshot()
+
     base_path = os.path.dirname(os.path.abspath(__file__))
     db_configs = [
         {"id": "1ttI_cujWXDOBFkD6WO_vlI21V3YGzgSB", "zip_name": "chroma_db_catalog.zip", "folder": "chroma_db_catalog"},
@@ -35,28 +43,58 @@ def setup_vector_dbs():
     if not needed:
         return True
 
+    import gdown
+
     # 데이터가 없을 때만 화면에 상태 표시
     with st.status("🚀 최초 실행을 위한 데이터베이스 구성 중...", expanded=True) as status:
         for db in needed:
             st.write(f"📥 {db['folder']} 다운로드 중 (약 30초 소요)...")
             url = f'https://drive.google.com/uc?id={db["id"]}'
             zip_path = os.path.join(base_path, db["zip_name"])
+            staging_path = os.path.join(base_path, f"{db['folder']}.staging")
             
             try:
                 gdown.download(url, zip_path, quiet=False, fuzzy=True)
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    zip_ref.extractall(base_path)
-                os.remove(zip_path)
+                # 임시 폴더에 해제 후 이동 (중간 실패 시 손상된 폴더가 남지 않도록)
+                snapshot.extract_streaming(zip_path, staging_path)
+                os.replace(os.path.join(staging_path, db["folder"]), os.path.join(base_path, db["folder"]))
             except Exception as e:
                 st.error(f"다운로드 실패: {e}")
                 return False
+            finally:
+                shutil.rmtree(staging_path, ignore_errors=True)
+                if os.path.exists(zip_path):
+                    os.remove(zip_path)
+        status.update(label="✅ 구성 완료! 서비스를 시작합니다.", state="complete", expanded=False)
+    return True
+
+def setup_vector_snapshot():
+    """버전 스냅샷 준비: 활성 버전이 없으면 동기화, 있으면 백그라운드에서 새 버전 확인"""
+    if snapshot.current_version():
+        snapshot.refresh_in_background(snapshot.MANIFEST_URL)
+        return True
+
+    with st.status("🚀 최초 실행을 위한 데이터베이스 구성 중...", expanded=True) as status:
+        try:
+            snapshot.sync_snapshot(snapshot.MANIFEST_URL, log=st.write)
+        except Exception as e:
+            st.error(f"다운로드 실패: {e}")
+            return False
         status.update(label="✅ 구성 완료! 서비스를 시작합니다.", state="complete", expanded=False)
     return True
 
 # ============================================================================
 # 1. 환경 설정 및 스타일링
 # ============================================================================
+# 전체 스크립트 재실행 비용 측정 시작점 (fragment 재실행은 rerun_profiler.fragment가 따로 기록)
+RUN_START = time.perf_counter()
 load_dotenv()
+# request_profiler/memory_diag와 같은 환경 변수 (꺼져 있으면 해당 모듈을 import하지 않음)
+PROFILING = float(os.getenv("PROFILE_SAMPLE_RATE", "0")) > 0 or bool(os.getenv("PROFILE_ADMIN_TOKEN"))
+MEMORY_DIAG = os.getenv("MEMORY_DIAG", "0") == "1"
+if MEMORY_DIAG:
+    import memory_diag
+    memory_diag.start()
 
 st.set_page_config(
     page_title="현대해상 Hi-light",
@@ -366,29 +404,11 @@ st.markdown("""
 </script>
 """, unsafe_allow_html=True)
 
-# ============================================================================
-# 1.5. Global Data Load
-# ============================================================================
-def load_toc_data():
-    toc_path = "toc_meta_summary.txt"
-    if os.path.exists(toc_path):
-        with open(toc_path, "r", encoding="utf-8") as f:
-            return f.read()
-    else:
-        return "TOC Data Not Found."
-
-if "global_toc_data" not in st.session_state:
-    st.session_state.global_toc_data = load_toc_data()
-
-PERSIST_DIR = "./chroma_db_clause"
-CATALOG_DIR = "./chroma_db_catalog"
-MODEL_NAME = "BAAI/bge-m3"
-DEVICE = "cpu"
-
 # ============================================================================
 # 2. Data Constants
 # ============================================================================
 
+@st.cache_data
 def get_tag_hierarchy():
     interests = recommend.get_all_interests()
     
@@ -426,31 +446,62 @@ PRODUCT_LINKS = {
 # ============================================================================
 # 3. Resource Loading
 # ============================================================================
+# 모델/벡터 DB/LLM 로드는 serving.py (세션 없이 프로세스 기동 시 워밍업 가능, 프로세스 공용 캐시)
+load_vectorstore = serving.load_vectorstore
+load_catalog_vectorstore = serving.load_catalog_vectorstore
+load_article_index = serving.load_article_index
+get_llm = serving.get_llm
+
+def start_warmup():
+    """serving.py로 기동했으면 이미 진행 중/완료 → 그대로, streamlit run으로 기동했으면 첫 실행에서 시작"""
+    return serving.start_warmup()
+
 @st.cache_resource
-def load_vectorstore():
-    embeddings = HuggingFaceEmbeddings(
-        model_name=MODEL_NAME,
-        model_kwargs={'device': DEVICE},
-        encode_kwargs={'normalize_embeddings': True}
-    )
-    if os.path.exists(PERSIST_DIR) and os.listdir(PERSIST_DIR):
-        return Chroma(persist_directory=PERSIST_DIR, embedding_function=embeddings, collection_name="insurance_rag")
-    return None
+def get_session_store():
+    """외부 세션 저장소 (SESSION_STORE_URL 미설정 시 None → 프로세스별 session_state만 사용)"""
+    return session_store.from_url(session_store.SESSION_STORE_URL)
 
 @st.cache_resource
-def load_catalog_vectorstore():
-    embeddings = HuggingFaceEmbeddings(
-        model_name=MODEL_NAME,
-        model_kwargs={'device': DEVICE},
-        encode_kwargs={'normalize_embeddings': True}
+def get_result_store():
+    """분석 결과 저장소 (RESULT_STORE_URL, 기본 로컬 SQLite)"""
+    return result_store.from_url(result_store.RESULT_STORE_URL)
+
+def analysis_result_key():
+    return result_store.result_key(
+        st.session_state.selected_situation,
+        st.session_state.selected_product_name,
+        st.session_state.selected_tags,
+        serving.index_version(),
+        engine.analysis_prompt_version(),
     )
-    if os.path.exists(CATALOG_DIR) and os.listdir(CATALOG_DIR):
-        return Chroma(persist_directory=CATALOG_DIR, embedding_function=embeddings, collection_name="insurance_catalog")
-    return None
 
-@st.cache_resource
-def get_llm():
-    return ChatGoogleGenerativeAI(model="gemini-2.0-flash-exp", temperature=0)
+def persist_session():
+    if SESSION_BACKEND is None:
+        return
+    try:
+        session_store.persist(SESSION_BACKEND, st.session_state)
+    except Exception as e:
+        print(f"❌ [세션 저장] 실패: {e}")
+
+SESSION_BACKEND = get_session_store()
+if SESSION_BACKEND is not None and "session_token" not in st.session_state:
+    # 워커 재시작/다른 워커 연결 시에도 주소의 sid(세션 토큰)로 진행 중인 상담 복원
+    # 토큰은 저장소 키/주소에만 쓰고 로그/화면에는 visitor_id만 사용 (저장된 세션이 없는 sid는 재사용하지 않음)
+    sid = st.query_params.get("sid")
+    if not (sid and session_store.restore(SESSION_BACKEND, st.session_state, sid)):
+        sid = session_store.new_token()
+    st.session_state.session_token = sid
+    st.session_state.visitor_id = st.session_state.get("visitor_id") or str(uuid.uuid4())
+    st.query_params["sid"] = sid
+
+def reset_consultation():
+    """처음으로: 방문자 ID/세션 토큰만 남기고 상담 상태 초기화"""
+    kept = {key: st.session_state[key] for key in ("visitor_id", "session_token") if key in st.session_state}
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    st.session_state.update(kept)
+    st.session_state.open_time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    st.session_state.step_start_time = time.time()
 
 # Session State 초기화
 if "step" not in st.session_state: st.session_state.step = 1
@@ -466,306 +517,15 @@ if "selected_product_name" not in st.session_state: st.session_state.selected_pr
 if "keyword_analysis" not in st.session_state: st.session_state.keyword_analysis = None
 if "analysis_result" not in st.session_state: st.session_state.analysis_result = None
 if "chat_history" not in st.session_state: st.session_state.chat_history = []
+if "provisional" not in st.session_state: st.session_state.provisional = {}
 
 # ============================================================================
-# 4. Analysis Engine
+# 4. Analysis Engine (engine.py - batch_recommend.py와 공용)
 # ============================================================================
-
-def preprocess_text(text):
-    if not text:
-        return ""
-    
-    text = re.sub(r'<br\s*/?>', '\n', text, flags=re.IGNORECASE)
-    text = re.sub(r'</br>', '\n', text, flags=re.IGNORECASE)
-    text = re.sub(r'\|[\s-]+\|', '\n', text)
-    text = text.replace('|', '  ')
-    text = re.sub(r'\n+', '\n', text)
-    text = re.sub(r' +', ' ', text)
-    
-    return text.strip()
-
-# ============================================================================
-# 4.1. 상황 질문 생성
-# ============================================================================
-def generate_situations_from_tags(llm, tags, natural_language_inputs, free_text):
-    """태그 + 자연어 + 자유 입력 기반으로 3개의 질문 생성"""
-    
-    tag_descriptions = []
-    for category, tag_list in tags.items():
-        if tag_list:
-            tag_descriptions.append(f"{category}: {', '.join(tag_list)}")
-        
-        nl_input = natural_language_inputs.get(category, "").strip()
-        if nl_input:
-            tag_descriptions.append(f"{category} (자연어): {nl_input}")
-    
-    if free_text.strip():
-        tag_descriptions.append(f"자유 입력: {free_text}")
-    
-    tag_str = " | ".join(tag_descriptions)
-    
-    template = """당신은 보험 소비자의 일상적 고민을 이해하는 전문가입니다.
-
-**[고객 선택 정보]**
-{tags}
-
----
-**[임무]**
-위 태그 조합에서 발생할 수 있는 **일상적이고 구체적인 상황 3가지**를 생성하세요.
-
-**[중요 원칙]**
-1. **전문용어 사용 금지**: "배상책임", "면책", "특약" 같은 보험 용어 사용하지 말 것
-2. **1인칭 시점**: "저는...", "제가..." 형식으로 작성
-3. **구체적 상황**: 추상적이지 않고 실제 일어날 법한 사건
-4. **길이 제한**: 각 질문은 50자 이내
-
-**[출력 형식 - JSON Only]**
-{{
-    "situations": [
-        "질문 1 (50자 이내, 전문용어 없이)",
-        "질문 2 (50자 이내, 전문용어 없이)",
-        "질문 3 (50자 이내, 전문용어 없이)"
-    ]
-}}
-"""
-    
-    prompt = ChatPromptTemplate.from_template(template)
-    chain = prompt | llm | StrOutputParser()
-    
-    response = chain.invoke({"tags": tag_str})
-    
-    return response
-
-# ============================================================================
-# 4.2. 키워드 변환
-# ============================================================================
-def analyze_situation_to_keywords(llm, situation_text, tags):
-    tag_str = ", ".join([f"{k}: {', '.join(v)}" for k, v in tags.items() if v])
-    
-    template = """당신은 보험 약관 전문가입니다.
-
-**[고객의 질문]**
-{situation}
-
-**[선택된 태그]**
-{tags}
-
----
-**[임무]**
-위 질문을 보험 약관에서 사용하는 **전문 키워드**로 변환하세요.
-
-**[출력 형식 - JSON Only]**
-{{
-    "keywords": [
-        {{"original": "일상 표현", "professional": "보험 전문용어", "explanation": "왜 이 용어인지 20자 이내 설명"}},
-        {{"original": "일상 표현", "professional": "보험 전문용어", "explanation": "설명"}},
-        {{"original": "일상 표현", "professional": "보험 전문용어", "explanation": "설명"}}
-    ],
-    "summary": "이 상황은 보험에서 어떤 영역인지 50자 이내 요약"
-}}
-"""
-    
-    prompt = ChatPromptTemplate.from_template(template)
-    chain = prompt | llm | StrOutputParser()
-    
-    response = chain.invoke({"situation": situation_text, "tags": tag_str})
-    
-    return response
-
-# ============================================================================
-# 4.3. 상품 추천
-# ============================================================================
-def recommend_products_for_situation(vectorstore, llm, situation_text, keywords_data):
-    """키워드 기반으로 관련 상품 2~3개 추천"""
-    
-    try:
-        keywords_obj = json.loads(keywords_data)
-        professional_keywords = [k["professional"] for k in keywords_obj.get("keywords", [])]
-        keyword_str = ", ".join(professional_keywords)
-    except:
-        keyword_str = situation_text
-    
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-    docs = retriever.invoke(keyword_str)
-    
-    def format_docs(docs):
-        return "\n".join([
-            f"<상품 {i+1}>\n- 상품명: {d.metadata.get('source', '알 수 없음')}\n- 내용: {preprocess_text(d.page_content)[:400]}..."
-            for i, d in enumerate(docs)
-        ])
-    
-    template = """당신은 보험 상품 추천 전문가입니다.
-
-**[고객 상황]**
-{situation}
-
-**[변환된 키워드]**
-{keywords}
-
-**[검색된 약관]**
-{docs}
-
----
-**[임무]**
-위 상황에 적합한 **상품 2~3개**를 추천하세요.
-
-**[중요]**
-- product_name은 반드시 **파일 확장자(.txt) 없이** 순수 상품명만 출력하세요.
-- 예: "무배당 현대해상 퍼펙트플러스 종합보험(세만기형)(Hi2508)" (O)
-
-**[출력 형식 - JSON Only]**
-{{
-    "products": [
-        {{
-            "product_name": "순수 상품명 (확장자 제외)",
-            "relevant_feature": "이 상황에 적합한 특약명",
-            "why_suitable": "왜 이 상품이 적합한지 30자 이내",
-            "match_score": 85
-        }},
-        {{
-            "product_name": "상품명 2",
-            "relevant_feature": "특약명",
-            "why_suitable": "이유",
-            "match_score": 75
-        }}
-    ]
-}}
-"""
-    
-    prompt = ChatPromptTemplate.from_template(template)
-    chain = prompt | llm | StrOutputParser()
-    
-    response = chain.invoke({
-        "situation": situation_text,
-        "keywords": keyword_str,
-        "docs": format_docs(docs)
-    })
-    
-    return response
-
-# ============================================================================
-# 4.4. 상세 분석 (수정: Python 레벨 필터링으로 변경)
-# ============================================================================
-def analyze_tags_and_situation(vectorstore, llm, tags, situation_text, target_product_name=None):
-    """
-    상황 기반 분석 (특정 상품 약관에서만 검색)
-    
-    Args:
-        target_product_name: 검색 대상 상품명 (None이면 전체 검색)
-    """
-    
-    current_toc_summary = st.session_state.get("global_toc_data", "목차 데이터 없음")
-    tag_str = ", ".join([f"{k}: {', '.join(v)}" for k, v in tags.items() if v])
-    
-    # Python 레벨 필터링 (Chroma DB 필터 대신)
-    if target_product_name:
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 30})  # 많이 검색
-        all_docs = retriever.invoke(f"{situation_text} {tag_str}")
-        
-        # 상품명으로 필터링 (부분 매칭)
-        docs = [d for d in all_docs if target_product_name in d.metadata.get('source', '')][:8]
-        
-        # 필터링 결과가 없으면 전체 검색 결과 사용
-        if not docs:
-            st.warning(f"⚠️ '{target_product_name}' 상품의 약관을 찾지 못해 전체 약관에서 검색합니다.")
-            docs = all_docs[:8]
-    else:
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 8})
-        docs = retriever.invoke(f"{situation_text} {tag_str}")
-    
-    def format_docs_with_meta(docs):
-        return "\n".join([f"<Chunk {i+1}>\n- Metadata: {d.metadata}\n- Content: {preprocess_text(d.page_content)[:600]}..." for i, d in enumerate(docs)])
-
-    template = """당신은 보험 소비자의 이익을 최우선으로 하는 객관적인 '보상 분석관'입니다.
-
-아래 제공된 정보를 바탕으로 사용자의 상황을 정밀 분석하세요.
-
-**[전체 목차]** {toc_summary}
-**[약관 증거]** {context}
-**[사용자 정보]** 상황: {situation} / 태그: {tags}
-{product_context}
-
----
-**[분석 프로토콜]**
-1. **매핑:** 사용자의 상황이 약관의 어느 조항에 해당하는지 찾으십시오.
-2. **증거 발췌:** 해당 조항의 원문 텍스트를 그대로 발췌하십시오.
-3. **한계점 식별:** 이 상품으로 해결되지 않는 한계점을 반드시 1개 이상 찾으십시오.
-4. **점수 산출:** 상황과 약관의 일치도를 0~100점으로 산출.
-
----
-**[최종 출력 형식 (JSON Only)]**
-{{
-    "product_name": "검증된 상품명",
-    "feature_name": "핵심 특약명",
-    "match_score": 95,
-    "summary": "가정법을 사용한 보장 가능성 요약",
-    "easy_explanation": "초등학생도 이해하는 쉬운 설명",
-    "reasoning": "논리적 분석 내용",
-    "evidence_snippet": "제N조(조항명)\\n① 항 내용...\\n② 항 내용...", 
-    "limitations": "이 상품이 보장하지 않는 아쉬운 점",
-    "checklist": ["확인할 점 1", "확인할 점 2"]
-}}
-"""
-    
-    product_context = f"\n**[분석 대상 상품]** {target_product_name}" if target_product_name else ""
-    
-    prompt = ChatPromptTemplate.from_template(template)
-    chain = (
-        {
-            "tags": lambda x: tag_str,
-            "situation": lambda x: situation_text,
-            "context": lambda x: format_docs_with_meta(docs),
-            "toc_summary": lambda x: current_toc_summary,
-            "product_context": lambda x: product_context
-        }
-        | prompt | llm | StrOutputParser()
-    )
-    return chain.stream(situation_text)
-
-# ============================================================================
-# 4.5. 챗봇 응답 생성
-# ============================================================================
-def generate_chat_response(vectorstore, llm, question, analysis_context):
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-    relevant_docs = retriever.invoke(question)
-    
-    docs_context = "\n\n".join([
-        f"[약관 {i+1}]\n상품: {doc.metadata.get('source', '알 수 없음')}\n내용: {preprocess_text(doc.page_content)[:500]}..."
-        for i, doc in enumerate(relevant_docs)
-    ])
-    
-    chat_template = """당신은 현대해상 보험 전문 상담 AI입니다.
-
-**[이전 추천 분석 결과]**
-{analysis_context}
-
-**[검색된 관련 약관]**
-{docs_context}
-
-**[사용자 질문]**
-{question}
-
----
-**[답변 원칙]**
-1. 위 약관 증거에 근거하여 답변하세요.
-2. 약관에 명시되지 않은 내용은 "약관에서 확인되지 않습니다"라고 솔직히 말하세요.
-3. 보장 여부는 가정법을 사용하세요.
-4. 구체적인 조항명이나 특약명을 언급하여 신뢰성을 높이세요.
-5. 친절하고 이해하기 쉽게 설명하세요.
-
-답변:
-"""
-    
-    prompt = ChatPromptTemplate.from_template(chat_template)
-    chain = prompt | llm | StrOutputParser()
-    
-    response = chain.invoke({
-        "analysis_context": analysis_context,
-        "docs_context": docs_context,
-        "question": question
-    })
-    
-    return response
+@st.cache_data(max_entries=256)
+def parse_payload(text):
+    """세션에 저장된 JSON 결과 파싱 (재실행마다 다시 파싱하지 않도록 문자열 기준 캐시)"""
+    return structured_output.loads(text)
 
 # ============================================================================
 # 5. UI Rendering
@@ -837,6 +597,7 @@ def render_situation_cards(situations):
             st.markdown('<script>window.scrollTo(0, 0);</script>', unsafe_allow_html=True)
             st.rerun()
 
+@rerun_profiler.fragment
 def render_mini_situation_cards(situations, exclude_current=True):
     """3페이지용: 작은 상황 카드 렌더링"""
     st.markdown("### 💡 다른 고민도 찾아보시겠어요?")
@@ -877,8 +638,7 @@ def render_mini_situation_cards(situations, exclude_current=True):
 def render_keyword_analysis(keywords_data, situation_text):
     """2단계: 키워드 변환 결과"""
     try:
-        json_str = keywords_data.replace("```json", "").replace("```", "").strip()
-        data = json.loads(json_str)
+        data = parse_payload(keywords_data)
         
         st.markdown(f"""
         <div class="hero-card">
@@ -910,8 +670,7 @@ def render_keyword_analysis(keywords_data, situation_text):
 def render_product_recommendations(products_data):
     """2단계 하단: 추천 상품 미니 카드"""
     try:
-        json_str = products_data.replace("```json", "").replace("```", "").strip()
-        data = json.loads(json_str)
+        data = parse_payload(products_data)
         
         products = data.get("products", [])
         
@@ -1035,21 +794,316 @@ def render_hero_card(data):
         with st.expander("🔍 디버그 정보", expanded=False):
             st.json(data)
 
-# ============================================================================
-# 6. Main App Flow
-# ============================================================================
+def stage_job_key(stage):
+    """단계 입력이 같을 때만 지연 도착한 LLM 결과를 적용하기 위한 작업 키"""
+    inputs = {
+        "situations": (st.session_state.selected_tags, st.session_state.natural_language_inputs, st.session_state.free_text_input),
+        "step25": (st.session_state.selected_situation, st.session_state.selected_tags),
+        "analysis": (st.session_state.selected_situation, st.session_state.selected_product_name, st.session_state.selected_tags),
+    }[stage]
+    return degraded.job_key(st.session_state.visitor_id, stage, json.dumps(inputs, ensure_ascii=False, sort_keys=True))
+
+def admin_requested(param):
+    """관리자 요청(?profile=/?memory=<PROFILE_ADMIN_TOKEN>, 토큰 미설정 시 꺼짐)"""
+    if not PROFILING:
+        return False
+    import request_profiler
+    return request_profiler.admin_requested(st.query_params.get(param))
+
+def profile_requested():
+    """관리자 요청이면 표본 추출과 무관하게 프로파일링"""
+    return admin_requested("profile")
+
+def instrument_stage(stage, func):
+    """단계 계산 함수를 요청 프로파일러 + 메모리 할당 비교로 감쌈 (백그라운드 작업 스레드에서 실행되어도 해당 스레드를 수집)"""
+    if PROFILING:
+        import request_profiler
+        func = request_profiler.wrap(stage, func, force=profile_requested(),
+                                     visitor=request_profiler.visitor_tag(st.session_state.get("visitor_id")))
+    if MEMORY_DIAG:
+        import memory_diag
+        func = memory_diag.wrap(stage, func)
+    return func
+
+def apply_stage_result(stage, value):
+    """LLM 결과를 세션에 반영 (마감 안에 도착했거나, 간편 결과를 표시한 뒤 늦게 도착한 경우 모두)"""
+    if stage == "situations":
+        st.session_state.generated_situations = value
+        action_type, user_input = "situations_generated", str(value)
+    elif stage == "step25":
+        st.session_state.keyword_analysis = value["keyword_analysis"]
+        st.session_state.product_recommendations = value["product_recommendations"]
+        action_type, user_input = "step25_generated", f"variant={value['variant']}"
+    else:
+        st.session_state.analysis_result = value["analysis_result"]
+        save_analysis_result(value["trace"])
+        st.session_state.consult_count += 1
+        action_type, user_input = "deep_analysis_complete", st.session_state.selected_situation
+    
+    recommend.log_user_action(
+        visitor_id=st.session_state.visitor_id,
+        consult_count=st.session_state.consult_count,
+        open_time_str=st.session_state.open_time_str,
+        action_type=action_type,
+        user_input=user_input,
+        recommended_product=st.session_state.selected_product_name if stage == "analysis" else "",
+        duration=value["duration"] if stage == "step25" else time.time() - st.session_state.step_start_time
+    )
 
-def main():
-    """메인 실행 함수"""
+def apply_stage_outcome(stage, outcome):
+    """ready면 LLM 결과, 아니면 규칙 기반 결과를 표시하고 간편 모드 표시 (provisional이면 나중에 교체)"""
+    provisional = st.session_state.setdefault("provisional", {})
+    if outcome.status == degraded.READY:
+        provisional.pop(stage, None)
+        apply_stage_result(stage, outcome.value)
+        return
     
-    # [중요] DB 자동 다운로드 (최초 실행 시)
-    if not setup_vector_dbs():
-        st.error("❌ 데이터베이스 로드에 실패했습니다. 관리자에게 문의하세요.")
+    if stage == "situations":
+        st.session_state.generated_situations = outcome.value
+    elif stage == "step25":
+        st.session_state.keyword_analysis, st.session_state.product_recommendations = outcome.value
+    else:
+        st.session_state.analysis_result = outcome.value
+        st.session_state.result_hash = None
+    provisional[stage] = outcome.job_key
+    
+    recommend.log_user_action(
+        visitor_id=st.session_state.visitor_id,
+        consult_count=st.session_state.consult_count,
+        open_time_str=st.session_state.open_time_str,
+        action_type="degraded_fallback",
+        user_input=f"{stage}: {outcome.reason}",
+        recommended_product="",
+        duration=time.time() - st.session_state.step_start_time
+    )
+
+@rerun_profiler.fragment(run_every=2)
+def render_upgrade_watcher():
+    """간편 결과 표시 중 LLM 작업이 끝나면 같은 화면에 실제 결과로 교체"""
+    provisional = st.session_state.get("provisional") or {}
+    for stage, key in list(provisional.items()):
+        if key is None:
+            continue
+        state, value = degraded.poll(key)
+        if state == "pending":
+            import admission
+            position = admission.position(key)
+            if position is not None:
+                st.caption(f"🚦 이용자가 많아 AI 분석 대기 중이에요 (대기 순번 {position}번)")
+            continue
+        provisional[stage] = None
+        if state == "done" and key == stage_job_key(stage):
+            provisional.pop(stage)
+            apply_stage_result(stage, value)
+            st.rerun()
+
+def render_provisional_notice(stage):
+    provisional = st.session_state.get("provisional") or {}
+    if stage not in provisional:
+        return
+    if provisional[stage]:
+        st.info("⏳ AI 분석이 지연되어 간편 추천을 먼저 보여드려요. 분석이 끝나면 자동으로 바뀝니다.")
+        render_upgrade_watcher()
+    else:
+        st.caption("ℹ️ 현재 AI 응답이 원활하지 않아 선택하신 정보 기준의 간편 추천으로 안내드려요.")
+
+def restore_stored_analysis():
+    """같은 상황/상품/태그 조합의 저장된 분석이 있으면 검색/LLM 호출 없이 재사용"""
+    results = get_result_store()
+    if results is None:
+        return
+    result_hash = analysis_result_key()
+    stored = results.get(result_hash)
+    if not stored:
+        return
+    st.session_state.analysis_result = json.dumps(stored["analysis"], ensure_ascii=False)
+    st.session_state.result_hash = result_hash
+    
+    recommend.log_user_action(
+        visitor_id=st.session_state.visitor_id,
+        consult_count=st.session_state.consult_count,
+        open_time_str=st.session_state.open_time_str,
+        action_type="deep_analysis_cached",
+        user_input=st.session_state.selected_situation,
+        recommended_product=st.session_state.selected_product_name,
+        duration=time.time() - st.session_state.step_start_time
+    )
+    st.session_state.consult_count += 1
+
+def save_analysis_result(trace):
+    """스키마 검증을 통과한 분석만 내용 주소로 저장하고 공유 링크용 해시 기록"""
+    st.session_state.result_hash = None
+    results = get_result_store()
+    if results is None:
+        return
+    try:
+        analysis = structured_output.AnalysisPayload.model_validate_json(st.session_state.analysis_result)
+    except ValueError:
+        return
+    result_hash = analysis_result_key()
+    try:
+        results.put(
+            result_hash,
+            analysis=analysis.model_dump(),
+            inputs=result_store.canonical_inputs(
+                st.session_state.selected_situation, st.session_state.selected_product_name, st.session_state.selected_tags
+            ),
+            chunk_ids=trace.get("chunk_ids", []),
+            timing={"retrieval_sec": trace.get("retrieval_sec"), "llm_sec": trace.get("llm_sec")},
+            index_version=serving.index_version(),
+            prompt_version=engine.analysis_prompt_version(),
+        )
+        st.session_state.result_hash = result_hash
+    except Exception as e:
+        print(f"❌ [분석 결과 저장] 실패: {e}")
+
+def render_shared_result(result_hash):
+    """공유 링크(/?result=<hash>): 저장된 분석 카드만 표시 (검색/LLM 호출 없음)"""
+    results = get_result_store()
+    stored = results.get(result_hash) if results else None
+    if not stored:
+        st.warning("공유된 분석 결과를 찾을 수 없습니다. 만료되었거나 잘못된 링크입니다.")
+    else:
+        situation = html.escape(stored["inputs"].get("situation", ""))
+        st.markdown(f"""
+        <div class="breadcrumb">
+            <div class="breadcrumb-title">💭 공유된 분석 상황</div>
+            <div class="breadcrumb-content">"{situation}"</div>
+        </div>
+        """, unsafe_allow_html=True)
+        render_hero_card(stored["analysis"])
+    
+    st.markdown("---")
+    if st.button("💡 나도 분석해보기", use_container_width=True, type="primary"):
+        del st.query_params["result"]
+        st.rerun()
+
+def render_share_link():
+    result_hash = st.session_state.get("result_hash")
+    if result_hash:
+        st.caption(f"🔗 이 분석 결과 공유하기: [링크]({result_store.share_url(result_hash, st.context.url)})")
+
+@contextmanager
+def llm_error_guard():
+    """LLM 지연/장애 시 무한 대기 대신 안내 후 현재 실행 중단 (다시 시도 버튼 제공)"""
+    try:
+        yield
+    except llm_gateway.LLMGatewayError as e:
+        st.error("⏳ AI 응답이 지연되고 있습니다. 잠시 후 다시 시도해주세요.")
+        st.caption(str(e))
+        st.button("🔄 다시 시도", key="llm_retry", use_container_width=True)
         st.stop()
+
+@rerun_profiler.fragment
+def render_consultation_panel(product_name):
+    """3단계: 상담 신청 배너 (신청 버튼은 배너만 다시 실행)"""
+    if "consultation_submitted" not in st.session_state:
+        st.session_state.consultation_submitted = False
     
-    # Vector Store 로드
-    vectorstore = load_vectorstore()
-    catalog_vectorstore = load_catalog_vectorstore()
+    if not st.session_state.consultation_submitted:
+        st.markdown("""
+        <div class="consultation-banner">
+            <h3>📞 전문 상담사와 1:1 상담하기</h3>
+            <p>클릭 한 번으로 상담 신청 완료! 24시간 내 연락드립니다.</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        col_left, col_center, col_right = st.columns([1, 2, 1])
+        with col_center:
+            if st.button("📞 바로 상담 신청하기", use_container_width=True, type="primary", key="quick_consult"):
+                try:
+                    user_name = f"고객_{st.session_state.visitor_id[:8]}"
+                    user_phone = "연락처 미입력"
+                    user_email = "이메일 미입력"
+                    
+                    success = recommend.log_consultation_request(
+                        visitor_id=st.session_state.visitor_id,
+                        consult_count=st.session_state.consult_count,
+                        open_time_str=st.session_state.open_time_str,
+                        recommended_product=product_name,
+                        user_name=user_name,
+                        user_phone=user_phone,
+                        user_email=user_email,
+                        preferred_time="언제든지 가능"
+                    )
+                    
+                    if success or success is None:
+                        st.session_state.consultation_submitted = True
+                        persist_session()
+                        st.rerun(scope="fragment")
+                    else:
+                        st.error("상담 신청 중 오류가 발생했습니다.")
+                        
+                except Exception as e:
+                    st.error(f"상담 신청 오류: {str(e)}")
+    
+    else:
+        st.success("✅ 상담 신청이 완료되었습니다!")
+        st.info(f"""
+        **📌 다음 단계**
+        - 방문자 ID: `{st.session_state.visitor_id[:16]}...`
+        - 추천 상품: **{product_name}**
+        - 영업일 기준 24시간 내에 전문 상담사가 연락드립니다.
+        """)
+
+@rerun_profiler.fragment
+def render_chat_panel(vectorstore, llm):
+    """3단계: AI 상담 채팅 (질문 1회는 이 영역만 다시 실행 → 결과 카드/CSS 재렌더링 없음)"""
+    st.subheader("💬 AI 상담사")
+    st.caption("추천 상품뿐만 아니라 모든 약관 정보를 검색하여 답변드립니다.")
+    
+    for msg in st.session_state.chat_history:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+    if prompt := st.chat_input("추가로 궁금한 점을 물어보세요!"):
+        recommend.log_user_action(
+            visitor_id=st.session_state.visitor_id,
+            consult_count=st.session_state.consult_count,
+            open_time_str=st.session_state.open_time_str,
+            action_type="chat_question",
+            user_input=prompt,
+            recommended_product="",
+            duration=time.time() - st.session_state.step_start_time
+        )
+        
+        st.session_state.chat_history.append({"role": "user", "content": prompt})
+        with st.chat_message("user"):
+            st.markdown(prompt)
+
+        with st.chat_message("assistant"):
+            with st.spinner("약관을 검색하여 답변을 준비하고 있습니다..."), llm_error_guard():
+                import admission
+                try:
+                    with admission.admitted(st.session_state.visitor_id, "chat", timeout=admission.CHAT_WAIT_SEC):
+                        response = instrument_stage("chat", engine.generate_chat_response)(
+                            vectorstore=vectorstore,
+                            llm=llm,
+                            question=prompt,
+                            analysis_context=st.session_state.analysis_result,
+                            product_name=st.session_state.selected_product_name,
+                            article_index=load_article_index()
+                        )
+                except admission.Shed as e:
+                    response = ("⏳ 지금 질문이 많아 답변을 드리기 어렵습니다. 잠시 후 다시 질문해주세요. "
+                                "위의 분석 결과와 상담 신청은 그대로 이용하실 수 있어요.")
+                    print(f"⚠️ [승인 제어] 채팅 대기 초과: {e.reason}")
+                st.markdown(response)
+                
+        st.session_state.chat_history.append({"role": "assistant", "content": response})
+        persist_session()
+
+# ============================================================================
+# 6. Main App Flow
+# ============================================================================
+
+def load_serving_resources():
+    """Vector Store + LLM 로드 (워밍업이 끝나지 않았으면 같은 캐시 항목의 로드 완료를 기다림)"""
+    if warmup.is_ready():
+        vectorstore, catalog_vectorstore = load_vectorstore(), load_catalog_vectorstore()
+    else:
+        with st.spinner("AI 모델을 준비하고 있습니다..."):
+            vectorstore, catalog_vectorstore = load_vectorstore(), load_catalog_vectorstore()
 
     if not vectorstore:
         st.error("❌ 'chroma_db_clause' 폴더를 찾을 수 없습니다.")
@@ -1058,7 +1112,35 @@ def main():
     if not catalog_vectorstore:
         st.warning("⚠️ 'chroma_db_catalog' 폴더를 찾을 수 없습니다.")
 
-    llm = get_llm()
+    return vectorstore, catalog_vectorstore, get_llm()
+
+def main():
+    """메인 실행 함수"""
+    
+    rerun_profiler.render_panel()
+    if MEMORY_DIAG or admin_requested("memory"):
+        import memory_diag
+        memory_diag.render_panel(st.session_state)
+    
+    # 공유 링크: 저장된 분석 결과만 표시 (DB 로드/검색/LLM 호출 없음)
+    shared_result = st.query_params.get("result")
+    if shared_result:
+        render_shared_result(shared_result)
+        render_footer()
+        return
+    
+    # [중요] DB 자동 다운로드 (최초 실행 시)
+    if not setup_vector_dbs():
+        st.error("❌ 데이터베이스 로드에 실패했습니다. 관리자에게 문의하세요.")
+        st.stop()
+    
+    # 모델/인덱스 워밍업 (프로세스당 1회, 백그라운드) 및 준비 상태 엔드포인트
+    start_warmup()
+    
+    # 1단계(관심사/태그 선택)는 모델 없이 바로 표시하고, 그동안 워밍업 스레드가 모델/인덱스를 로드
+    vectorstore = catalog_vectorstore = llm = None
+    if st.session_state.step != 1:
+        vectorstore, catalog_vectorstore, llm = load_serving_resources()
 
     if "recommend_initialized" not in st.session_state:
         recommend.initialize_recommendation_system()
@@ -1073,6 +1155,8 @@ def main():
         st.session_state.open_time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     if "step_start_time" not in st.session_state:
         st.session_state.step_start_time = time.time()
+    if SESSION_BACKEND is not None:
+        session_store.load_for_step(SESSION_BACKEND, st.session_state, st.session_state.step)
 
     # --- Step 1: Interest & Tag Selection ---
     if st.session_state.step == 1:
@@ -1200,44 +1284,27 @@ def main():
         
         if not st.session_state.generated_situations:
             loading = st.empty()
-            with loading.container():
+            with loading.container(), llm_error_guard():
                 st.markdown("<br>", unsafe_allow_html=True)
                 with st.spinner(""):
                     status = st.markdown('<p class="loading-text">💭 고객님의 상황을 정리하고 있습니다...</p>', unsafe_allow_html=True)
                     
-                    response = generate_situations_from_tags(
-                        llm,
-                        st.session_state.selected_tags,
-                        st.session_state.natural_language_inputs,
-                        st.session_state.free_text_input
+                    outcome = degraded.run_stage(
+                        "situations", stage_job_key("situations"),
+                        instrument_stage("situations", partial(engine.compute_situations, llm, st.session_state.selected_tags,
+                                                               st.session_state.natural_language_inputs, st.session_state.free_text_input)),
+                        partial(degraded.canned_situations, st.session_state.selected_interest, st.session_state.selected_tags),
+                        llm=llm
                     )
+                    apply_stage_outcome("situations", outcome)
                     
-                    time.sleep(1)
                     status.markdown('<p class="loading-text">✨ 질문 생성 완료!</p>', unsafe_allow_html=True)
                     time.sleep(0.5)
                     
-                    try:
-                        json_str = response.replace("```json", "").replace("```", "").strip()
-                        data = json.loads(json_str)
-                        st.session_state.generated_situations = data.get("situations", [])
-                    except json.JSONDecodeError as e:
-                        st.error("질문 생성 오류")
-                        st.code(response)
-                        st.session_state.generated_situations = ["오류가 발생했습니다."]
-                    
-                    recommend.log_user_action(
-                        visitor_id=st.session_state.visitor_id,
-                        consult_count=st.session_state.consult_count,
-                        open_time_str=st.session_state.open_time_str,
-                        action_type="situations_generated",
-                        user_input=str(st.session_state.generated_situations),
-                        recommended_product="",
-                        duration=time.time() - st.session_state.step_start_time
-                    )
-                    
             loading.empty()
             st.rerun()
         
+        render_provisional_notice("situations")
         render_situation_cards(st.session_state.generated_situations)
         
         # 자연어 입력 추가
@@ -1277,12 +1344,7 @@ def main():
         
         st.markdown("---")
         if st.button("⬅️ 처음으로", use_container_width=True):
-            visitor_id_backup = st.session_state.visitor_id
-            for key in list(st.session_state.keys()):
-                del st.session_state[key]
-            st.session_state.visitor_id = visitor_id_backup
-            st.session_state.open_time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            st.session_state.step_start_time = time.time()
+            reset_consultation()
             st.rerun()
 
     # --- Step 2.5: Keyword Analysis + Product Recommendation ---
@@ -1291,36 +1353,29 @@ def main():
         
         if not st.session_state.keyword_analysis:
             loading = st.empty()
-            with loading.container():
+            with loading.container(), llm_error_guard():
                 st.markdown("<br>", unsafe_allow_html=True)
                 with st.spinner(""):
                     status = st.markdown('<p class="loading-text">📦 고객님의 고민을 이해하는 중...</p>', unsafe_allow_html=True)
+                    variant = engine.step25_variant(st.session_state.visitor_id)
                     
-                    keyword_response = analyze_situation_to_keywords(
-                        llm,
-                        st.session_state.selected_situation,
-                        st.session_state.selected_tags
-                    )
-                    
-                    time.sleep(1)
-                    status.markdown('<p class="loading-text">🔍 보험 전문 키워드로 변환 중...</p>', unsafe_allow_html=True)
-                    
-                    product_response = recommend_products_for_situation(
-                        vectorstore,
-                        llm,
-                        st.session_state.selected_situation,
-                        keyword_response
+                    status.markdown('<p class="loading-text">🔍 보험 전문 키워드 변환 및 상품 검색 중...</p>', unsafe_allow_html=True)
+                    outcome = degraded.run_stage(
+                        "step25", stage_job_key("step25"),
+                        instrument_stage("step25", partial(engine.compute_step25, vectorstore, llm, st.session_state.selected_situation,
+                                                           st.session_state.selected_tags, variant)),
+                        partial(degraded.rule_based_step25, st.session_state.selected_situation, st.session_state.selected_tags),
+                        llm=llm
                     )
+                    apply_stage_outcome("step25", outcome)
                     
                     status.markdown('<p class="loading-text">✨ 분석 완료!</p>', unsafe_allow_html=True)
                     time.sleep(0.5)
                     
-                    st.session_state.keyword_analysis = keyword_response
-                    st.session_state.product_recommendations = product_response
-                    
             loading.empty()
             st.rerun()
         
+        render_provisional_notice("step25")
         render_keyword_analysis(st.session_state.keyword_analysis, st.session_state.selected_situation)
         render_product_recommendations(st.session_state.product_recommendations)
         
@@ -1338,106 +1393,43 @@ def main():
     elif st.session_state.step == 3:
         render_breadcrumb(3)
         
+        if not st.session_state.analysis_result:
+            restore_stored_analysis()
+        
         if not st.session_state.analysis_result:
             loading = st.empty()
-            with loading.container():
+            with loading.container(), llm_error_guard():
                 st.markdown("<br>", unsafe_allow_html=True)
                 with st.spinner(""):
                     status = st.markdown('<p class="loading-text">📚 약관 책장에서 관련 페이지 찾는 중...</p>', unsafe_allow_html=True)
                     
-                    # 특정 상품 약관에서만 검색
-                    stream = analyze_tags_and_situation(
-                        vectorstore,
-                        llm,
-                        st.session_state.selected_tags,
-                        st.session_state.selected_situation,
-                        target_product_name=st.session_state.selected_product_name
+                    outcome = degraded.run_stage(
+                        "analysis", stage_job_key("analysis"),
+                        instrument_stage("analysis", partial(engine.compute_analysis, vectorstore, llm, st.session_state.selected_tags,
+                                                             st.session_state.selected_situation, st.session_state.selected_product_name,
+                                                             load_article_index())),
+                        partial(degraded.rule_based_analysis, st.session_state.selected_product_name,
+                                st.session_state.selected_situation, st.session_state.selected_tags),
+                        llm=llm
                     )
-                    
-                    time.sleep(1)
-                    status.markdown('<p class="loading-text">🖍️ 보장 범위에 형광펜 칠하는 중...</p>', unsafe_allow_html=True)
-                    
-                    full_res = ""
-                    for chunk in stream:
-                        full_res += chunk
+                    apply_stage_outcome("analysis", outcome)
                     
                     status.markdown('<p class="loading-text">✨ 분석 완료!</p>', unsafe_allow_html=True)
                     time.sleep(0.5)
                     
-                    st.session_state.analysis_result = full_res
-                    
-                    recommend.log_user_action(
-                        visitor_id=st.session_state.visitor_id,
-                        consult_count=st.session_state.consult_count,
-                        open_time_str=st.session_state.open_time_str,
-                        action_type="deep_analysis_complete",
-                        user_input=st.session_state.selected_situation,
-                        recommended_product=st.session_state.selected_product_name,
-                        duration=time.time() - st.session_state.step_start_time
-                    )
-                    
-                    st.session_state.consult_count += 1
-                    
             loading.empty()
             st.rerun()
 
         try:
-            json_str = st.session_state.analysis_result.replace("```json", "").replace("```", "").strip()
-            data = json.loads(json_str)
+            data = parse_payload(st.session_state.analysis_result)
             
+            render_provisional_notice("analysis")
             render_hero_card(data)
+            render_share_link()
             
             st.markdown("---")
             
-            if "consultation_submitted" not in st.session_state:
-                st.session_state.consultation_submitted = False
-            
-            if not st.session_state.consultation_submitted:
-                st.markdown("""
-                <div class="consultation-banner">
-                    <h3>📞 전문 상담사와 1:1 상담하기</h3>
-                    <p>클릭 한 번으로 상담 신청 완료! 24시간 내 연락드립니다.</p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                col_left, col_center, col_right = st.columns([1, 2, 1])
-                with col_center:
-                    if st.button("📞 바로 상담 신청하기", use_container_width=True, type="primary", key="quick_consult"):
-                        try:
-                            user_name = f"고객_{st.session_state.visitor_id[:8]}"
-                            user_phone = "연락처 미입력"
-                            user_email = "이메일 미입력"
-                            
-                            product_name = data.get("product_name", "알 수 없음")
-                            
-                            success = recommend.log_consultation_request(
-                                visitor_id=st.session_state.visitor_id,
-                                consult_count=st.session_state.consult_count,
-                                open_time_str=st.session_state.open_time_str,
-                                recommended_product=product_name,
-                                user_name=user_name,
-                                user_phone=user_phone,
-                                user_email=user_email,
-                                preferred_time="언제든지 가능"
-                            )
-                            
-                            if success or success is None:
-                                st.session_state.consultation_submitted = True
-                                st.rerun()
-                            else:
-                                st.error("상담 신청 중 오류가 발생했습니다.")
-                                
-                        except Exception as e:
-                            st.error(f"상담 신청 오류: {str(e)}")
-            
-            else:
-                st.success("✅ 상담 신청이 완료되었습니다!")
-                st.info(f"""
-                **📌 다음 단계**
-                - 방문자 ID: `{st.session_state.visitor_id[:16]}...`
-                - 추천 상품: **{data.get('product_name', '알 수 없음')}**
-                - 영업일 기준 24시간 내에 전문 상담사가 연락드립니다.
-                """)
+            render_consultation_panel(data.get("product_name", "알 수 없음"))
             
         except json.JSONDecodeError as e:
             st.error("❌ 분석 결과 형식 오류")
@@ -1446,39 +1438,7 @@ def main():
 
         st.markdown("---")
         
-        st.subheader("💬 AI 상담사")
-        st.caption("추천 상품뿐만 아니라 모든 약관 정보를 검색하여 답변드립니다.")
-        
-        for msg in st.session_state.chat_history:
-            with st.chat_message(msg["role"]):
-                st.markdown(msg["content"])
-
-        if prompt := st.chat_input("추가로 궁금한 점을 물어보세요!"):
-            recommend.log_user_action(
-                visitor_id=st.session_state.visitor_id,
-                consult_count=st.session_state.consult_count,
-                open_time_str=st.session_state.open_time_str,
-                action_type="chat_question",
-                user_input=prompt,
-                recommended_product="",
-                duration=time.time() - st.session_state.step_start_time
-            )
-            
-            st.session_state.chat_history.append({"role": "user", "content": prompt})
-            with st.chat_message("user"):
-                st.markdown(prompt)
-
-            with st.chat_message("assistant"):
-                with st.spinner("약관을 검색하여 답변을 준비하고 있습니다..."):
-                    response = generate_chat_response(
-                        vectorstore=vectorstore,
-                        llm=llm,
-                        question=prompt,
-                        analysis_context=st.session_state.analysis_result
-                    )
-                    st.markdown(response)
-                    
-            st.session_state.chat_history.append({"role": "assistant", "content": response})
+        render_chat_panel(vectorstore, llm)
 
         # 다른 질문 탐색 섹션
         st.markdown("<br><br>", unsafe_allow_html=True)
@@ -1489,21 +1449,17 @@ def main():
         
         st.markdown("<br><br>", unsafe_allow_html=True)
         if st.button("🔄 처음으로 돌아가기", use_container_width=True):
-            visitor_id_backup = st.session_state.visitor_id
-            
-            for key in list(st.session_state.keys()):
-                del st.session_state[key]
-            
-            st.session_state.visitor_id = visitor_id_backup
-            st.session_state.open_time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            st.session_state.step_start_time = time.time()
+            reset_consultation()
             
             st.markdown('<script>window.scrollTo(0, 0);</script>', unsafe_allow_html=True)
             st.rerun()
 
-    # ============================================================================
-    # 7. 공통 푸터 (면책 조항)
-    # ============================================================================
+    render_footer()
+
+# ============================================================================
+# 7. 공통 푸터 (면책 조항)
+# ============================================================================
+def render_footer():
     st.markdown("<br><br><br>", unsafe_allow_html=True)
     st.markdown("---")
     st.markdown("""
@@ -1522,4 +1478,17 @@ def main():
     """, unsafe_allow_html=True)
 
 if __name__ == "__main__":
-    main()
+    # 화면 재실행 전체(리소스 로드, 로그 기록, 같은 스레드에서 실행되는 단계 포함)도 같은 표본 추출 규칙으로 프로파일링
+    run_profile = nullcontext()
+    if PROFILING:
+        import request_profiler
+        run_profile = request_profiler.profile("rerun", force=profile_requested(), step=st.session_state.get("step"),
+                                               visitor=request_profiler.visitor_tag(st.session_state.get("visitor_id")))
+    try:
+        with run_profile:
+            main()
+    finally:
+        persist_session()
+        rerun_profiler.record("app", time.perf_counter() - RUN_START)
+        if MEMORY_DIAG:
+            memory_diag.record_session(st.session_state.get("visitor_id"), st.session_state)
@@ -0,0 +1,300 @@
+import os
+import re
+import csv
+import sys
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional
+
+import recommend
+import engine
+import structured_output
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+TAG_CATEGORIES = ("누구", "위험", "우선순위", "변화")
+CHUNK_ROWS = 5000
+DEFAULT_WORKERS = 4
+# 일괄 실행이 화면 방문자의 LLM 호출 한도를 다 쓰지 않도록 기본값을 낮게
+DEFAULT_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+MODEL_NAME = "BAAI/bge-m3"
+DEVICE = "cpu"
+CLAUSE_FOLDER = "chroma_db_clause"
+
+_TAG_SPLIT = re.compile(r"[\s,;|]+")
+
+# ============================================================================
+# 2. 입력 (CSV/Parquet 청크 단위 읽기) / 고객 프로필 변환
+# ============================================================================
+def read_profiles(path: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[List[dict]]:
+    """행 dict 목록을 chunk_rows개씩 반환 (전체 파일을 메모리에 올리지 않음)"""
+    import pandas as pd
+
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            frame = pd.read_parquet(path).astype(str)
+            for start in range(0, len(frame), chunk_rows):
+                yield frame.iloc[start:start + chunk_rows].to_dict("records")
+            return
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas().fillna("").astype(str).to_dict("records")
+        return
+    for frame in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+        yield frame.to_dict("records")
+
+def parse_tags(value) -> List[str]:
+    """'#반려견, 노령펫' → ['#반려견', '#노령펫'] (구분자: 공백/쉼표/세미콜론/|)"""
+    if value is None or str(value).strip() in ("", "nan", "None"):
+        return []
+    return [tag if tag.startswith("#") else f"#{tag}" for tag in _TAG_SPLIT.split(str(value).strip()) if tag]
+
+def to_profile(row: dict, id_column: str, text_column: str, row_number: int) -> dict:
+    return {
+        "id": str(row.get(id_column) or row_number),
+        "interest": str(row.get("interest") or "").strip() or None,
+        "tags": {category: parse_tags(row.get(category)) for category in TAG_CATEGORIES},
+        "free_text": str(row.get(text_column) or "").strip(),
+    }
+
+# ============================================================================
+# 3. 출력 (스트리밍 기록 = 체크포인트, JSONL/CSV)
+# ============================================================================
+def _read_rows(f, path: str) -> Iterator[dict]:
+    if path.endswith(".csv"):
+        return csv.DictReader(f)
+    return (json.loads(line) for line in f if line.strip())
+
+def completed_ids(path: str) -> set:
+    """이미 기록된 고객 ID (오류 행은 제외 → 재개 시 다시 실행)"""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in _read_rows(f, path):
+            if not row.get("error"):
+                done.add(str(row["id"]))
+    return done
+
+def dedupe_results(path: str) -> int:
+    """같은 고객 ID의 행이 여러 개면 마지막 행만 남김 (재개 시 다시 실행한 오류 행의 이전 기록 제거), 제거한 행 수 반환"""
+    if not os.path.exists(path):
+        return 0
+    last = {}
+    total = 0
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for total, row in enumerate(_read_rows(f, path), start=1):
+            last[str(row["id"])] = total - 1
+    if len(last) == total:
+        return 0
+    keep = set(last.values())
+    tmp_path = path + ".tmp"
+    with open(path, "r", encoding="utf-8", newline="") as src, open(tmp_path, "w", encoding="utf-8", newline="") as dst:
+        if path.endswith(".csv"):
+            reader = csv.DictReader(src)
+            writer = csv.DictWriter(dst, fieldnames=reader.fieldnames)
+            writer.writeheader()
+            writer.writerows(row for i, row in enumerate(reader) if i in keep)
+        else:
+            lines = (line for line in src if line.strip())
+            dst.writelines(line for i, line in enumerate(lines) if i in keep)
+    os.replace(tmp_path, path)
+    return total - len(keep)
+
+class ResultWriter:
+    """결과를 완료 순서대로 바로 기록 (중단되어도 기록된 행은 재개 시 건너뜀, 다시 실행한 행은 뒤에 추가 → dedupe_results)"""
+
+    def __init__(self, path: str, fields: List[str], append: bool):
+        self.path = path
+        self.fields = fields
+        self.lock = threading.Lock()
+        exists = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, "a" if append else "w", encoding="utf-8", newline="")
+        self.csv = csv.DictWriter(self.file, fieldnames=fields, extrasaction="ignore") if path.endswith(".csv") else None
+        if self.csv is not None and not exists:
+            self.csv.writeheader()
+
+    def write(self, rows: List[dict]):
+        with self.lock:
+            for row in rows:
+                if self.csv is not None:
+                    self.csv.writerow({k: json.dumps(v, ensure_ascii=False) if isinstance(v, (list, dict)) else v
+                                       for k, v in row.items()})
+                else:
+                    self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+# ============================================================================
+# 4. 추천 (태그 점수: 벡터화 / 상세 분석: 화면과 같은 엔진 + 작업자 풀)
+# ============================================================================
+TAG_FIELDS = ["id", "interest", "tags", "product", "tag_score"]
+ANALYSIS_FIELDS = TAG_FIELDS + ["situation", "situation_source", "step25_variant", "recommended_products",
+                                "analysis_product", "match_score", "summary", "analysis", "elapsed_sec", "error"]
+
+def score_by_tags(profiles: List[dict]) -> List[dict]:
+    results = recommend.get_products_by_tags_batch([p["tags"] for p in profiles])
+    return [
+        {"id": p["id"], "interest": p["interest"], "tags": p["tags"], "product": product, "tag_score": round(score, 2)}
+        for p, (product, score) in zip(profiles, results)
+    ]
+
+def load_engine_resources(llm_concurrency: int = DEFAULT_LLM_CONCURRENCY):
+    """app.py와 같은 순서(샤드 → 사이드카 → 프로세스 내)로 약관 검색 저장소 + 조항 인덱스 + LLM 게이트웨이 준비"""
+    import snapshot
+    import sharding
+    import clause_index
+    import model_router
+    import ann_cache
+    import retrieval_sidecar
+
+    persist_dir = snapshot.resolve_db_dir(CLAUSE_FOLDER)
+    sidecar = retrieval_sidecar.SidecarClient() if retrieval_sidecar.RETRIEVAL_SOCKET else None
+    if sidecar is not None and not sidecar.ping():
+        sidecar = None
+
+    local = {}
+    def load_embeddings():
+        if "embeddings" not in local:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            local["embeddings"] = HuggingFaceEmbeddings(model_name=MODEL_NAME, model_kwargs={'device': DEVICE},
+                                                        encode_kwargs={'normalize_embeddings': True})
+        return local["embeddings"]
+    def load_local_store():
+        if "store" not in local:
+            store = retrieval_sidecar.open_clause_store(persist_dir, load_embeddings(),
+                                                        os.getenv("CLAUSE_INDEX_MODE", "chroma"))
+            # 고객 목록에는 같은 태그 조합이 반복되므로 검색 결과 캐시 사용
+            local["store"] = ann_cache.wrap(store, "clause", snapshot.current_version())
+        return local["store"]
+
+    if sharding.SHARD_SOCKETS:
+        embedding = retrieval_sidecar.RemoteEmbeddings(sidecar) if sidecar is not None else load_embeddings()
+        vectorstore = sharding.connect(sharding.SHARD_SOCKETS, embedding, fallback=load_local_store)
+    elif sidecar is not None:
+        vectorstore = retrieval_sidecar.SidecarStore(sidecar, "clause", fallback=load_local_store)
+    else:
+        vectorstore = load_local_store()
+    if vectorstore is None:
+        raise SystemExit(f"❌ '{CLAUSE_FOLDER}' 폴더를 찾을 수 없습니다.")
+
+    index_path = os.path.join(os.path.dirname(persist_dir), clause_index.ARTICLE_INDEX_FILE)
+    article_index = clause_index.load_article_index(index_path)
+    if article_index is None:
+        article_index = clause_index.build_article_index(vectorstore)
+        clause_index.save_article_index(article_index, index_path)
+    llm = model_router.build_gateway(max_concurrency=llm_concurrency)
+    return vectorstore, llm, article_index
+
+def analyze_profile(profile: dict, tag_row: dict, vectorstore, llm, article_index) -> dict:
+    """화면 흐름과 같은 순서: 상황(자유 입력 또는 생성 1번) → 키워드/상품 추천 → 1순위 상품 상세 분석"""
+    start = time.time()
+    row = dict(tag_row)
+    try:
+        situation, source = profile["free_text"], "free_text"
+        if not situation:
+            situations = engine.compute_situations(llm, profile["tags"], {c: "" for c in TAG_CATEGORIES}, "")
+            situation, source = situations[0], "generated"
+        variant = engine.step25_variant(profile["id"])
+        step25 = engine.compute_step25(vectorstore, llm, situation, profile["tags"], variant)
+        try:
+            products = [p.get("product_name") for p in structured_output.loads(step25["product_recommendations"]).get("products", [])]
+        except json.JSONDecodeError:
+            products = []
+        target = next((p for p in products if p), None) or tag_row["product"]
+        row.update(situation=situation, situation_source=source, step25_variant=variant, recommended_products=products,
+                   analysis_product=target)
+        if target:
+            analysis = engine.compute_analysis(vectorstore, llm, profile["tags"], situation, target, article_index)
+            row["analysis"] = analysis["analysis_result"]
+            try:
+                parsed = structured_output.loads(analysis["analysis_result"])
+                row.update(match_score=parsed.get("match_score"), summary=parsed.get("summary"))
+            except json.JSONDecodeError:
+                pass
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["elapsed_sec"] = round(time.time() - start, 2)
+    return row
+
+# ============================================================================
+# 5. 실행 / 처리량 보고
+# ============================================================================
+def run(input_path: str, out_path: str, analyze: bool = False, workers: int = DEFAULT_WORKERS,
+        llm_concurrency: int = DEFAULT_LLM_CONCURRENCY, chunk_rows: int = CHUNK_ROWS, resume: bool = True,
+        id_column: str = "customer_id", text_column: str = "free_text", limit: Optional[int] = None) -> Dict:
+    done = completed_ids(out_path) if resume else set()
+    writer = ResultWriter(out_path, ANALYSIS_FIELDS if analyze else TAG_FIELDS, append=resume)
+    resources = load_engine_resources(llm_concurrency) if analyze else None
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") if analyze else None
+
+    stats = {"rows": 0, "skipped": len(done), "errors": 0}
+    start = time.time()
+    row_number = 0
+    try:
+        for chunk in read_profiles(input_path, chunk_rows):
+            profiles = []
+            for row in chunk:
+                row_number += 1
+                profile = to_profile(row, id_column, text_column, row_number)
+                if profile["id"] not in done:
+                    profiles.append(profile)
+            if limit is not None:
+                profiles = profiles[:max(0, limit - stats["rows"])]
+            if not profiles:
+                if limit is not None and stats["rows"] >= limit:
+                    break
+                continue
+
+            tag_rows = score_by_tags(profiles)
+            if not analyze:
+                writer.write(tag_rows)
+                stats["rows"] += len(tag_rows)
+            else:
+                futures = [pool.submit(analyze_profile, p, t, *resources) for p, t in zip(profiles, tag_rows)]
+                for future in as_completed(futures):
+                    result = future.result()
+                    writer.write([result])
+                    stats["rows"] += 1
+                    stats["errors"] += bool(result.get("error"))
+            elapsed = time.time() - start
+            print(f"⏱️ {stats['rows']}행 완료 ({stats['rows'] / max(elapsed, 1e-9):.1f} rows/s, 오류 {stats['errors']})",
+                  file=sys.stderr)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.shutdown(wait=True)
+    # 재개 시 다시 실행한 오류 행은 이전 오류 행 뒤에 추가되므로 고객 ID별 마지막 행만 남김
+    stats["replaced"] = dedupe_results(out_path) if resume else 0
+
+    elapsed = time.time() - start
+    stats.update(elapsed_sec=round(elapsed, 2), rows_per_sec=round(stats["rows"] / max(elapsed, 1e-9), 2),
+                 mode="analyze" if analyze else "tags", out=out_path)
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="고객 목록 일괄 추천 (캠페인 타깃팅용, 화면과 같은 추천 엔진)")
+    parser.add_argument("input", help="CSV 또는 Parquet (열: customer_id, interest, 누구, 위험, 우선순위, 변화, free_text)")
+    parser.add_argument("--out", default="batch_recommendations.jsonl", help=".jsonl 또는 .csv")
+    parser.add_argument("--analyze", action="store_true", help="키워드/상품 추천 + 상세 분석(LLM)까지 실행")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--llm-concurrency", type=int, default=DEFAULT_LLM_CONCURRENCY)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--restart", action="store_true", help="기존 출력을 덮어쓰고 처음부터 (기본: 이어서 실행)")
+    parser.add_argument("--id-column", default="customer_id")
+    parser.add_argument("--text-column", default="free_text")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    report = run(args.input, args.out, analyze=args.analyze, workers=args.workers, llm_concurrency=args.llm_concurrency,
+                 chunk_rows=args.chunk_rows, resume=not args.restart, id_column=args.id_column,
+                 text_column=args.text_column, limit=args.limit)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
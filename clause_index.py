@@ -0,0 +1,228 @@
+import os
+import re
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+ARTICLE_INDEX_FILE = "clause_article_index.json"
+ARTICLE_INDEX_VERSION = 1
+PAGE_SIZE = 5000
+
+# 조항 제목 (청크 안의 "제3조(보험금의 지급사유)" 형태의 헤더)
+ARTICLE_HEADING_PATTERN = re.compile(
+    r'^[\s|#*>\-]*제\s*(\d+)\s*조(?:\s*의\s*(\d+))?\s*[(（]([^)）\n]{1,40})[)）]',
+    re.MULTILINE
+)
+# 질문/근거 문장 안의 조항 참조 ("제3조", "제3조의2", "제 12 조")
+ARTICLE_REF_PATTERN = re.compile(r'제\s*(\d+)\s*조(?:\s*의\s*(\d+))?(?!\s*원)')
+
+# ============================================================================
+# 2. 파싱 유틸
+# ============================================================================
+def normalize_product_name(source: str) -> str:
+    """약관 파일명(source)을 상품명 키로 정규화 (UI와 동일한 규칙)"""
+    return str(source or "").replace(".txt", "").replace("표준_", "").strip()
+
+def article_key(number, sub=None) -> str:
+    """조항 번호 키: 3 → "3", 3의2 → "3-2" """
+    return f"{int(number)}-{int(sub)}" if sub else str(int(number))
+
+def parse_article_headings(text: str) -> List[Tuple[str, str]]:
+    """청크 텍스트에서 (조항 키, 조항 제목) 목록 추출"""
+    if not text:
+        return []
+    text = re.sub(r'<br\s*/?>', '\n', text, flags=re.IGNORECASE)
+    headings = []
+    for m in ARTICLE_HEADING_PATTERN.finditer(text):
+        key = article_key(m.group(1), m.group(2))
+        headings.append((key, m.group(3).strip()))
+    return headings
+
+def detect_article_refs(text: str) -> List[str]:
+    """질문에서 조항 참조를 찾아 중복 없이 순서대로 반환"""
+    if not text:
+        return []
+    refs = []
+    for m in ARTICLE_REF_PATTERN.finditer(text):
+        key = article_key(m.group(1), m.group(2))
+        if key not in refs:
+            refs.append(key)
+    return refs
+
+# ============================================================================
+# 3. 인덱스 구축 (Ingestion Pass)
+# ============================================================================
+def iter_collection(vectorstore, page_size: int = PAGE_SIZE):
+    """Chroma 컬렉션 전체를 (id, 본문, 메타데이터) 단위로 순회"""
+    offset = 0
+    while True:
+        batch = vectorstore.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        ids = batch.get("ids", [])
+        if not ids:
+            break
+        for cid, text, meta in zip(ids, batch.get("documents", []), batch.get("metadatas", [])):
+            yield cid, text or "", meta or {}
+        offset += len(ids)
+
+def build_article_index(vectorstore) -> dict:
+    """(상품, 조항) → 청크 ID 인덱스 생성"""
+    products: Dict[str, Dict[str, dict]] = {}
+    chunk_count = 0
+    for cid, text, meta in iter_collection(vectorstore):
+        chunk_count += 1
+        product = normalize_product_name(meta.get("source", ""))
+        if not product:
+            continue
+        # 메타데이터에 조항 정보가 있으면 우선 사용
+        headings = []
+        if meta.get("article_no"):
+            headings.append((str(meta["article_no"]), str(meta.get("article_title", ""))))
+        headings.extend(parse_article_headings(text))
+
+        articles = products.setdefault(product, {})
+        for key, title in headings:
+            entry = articles.setdefault(key, {"title": title, "ids": []})
+            if not entry["title"] and title:
+                entry["title"] = title
+            if cid not in entry["ids"]:
+                entry["ids"].append(cid)
+
+    return {
+        "version": ARTICLE_INDEX_VERSION,
+        "built_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "chunk_count": chunk_count,
+        "products": products,
+    }
+
+def save_article_index(index: dict, path: str = ARTICLE_INDEX_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def load_article_index(path: str = ARTICLE_INDEX_FILE) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != ARTICLE_INDEX_VERSION:
+            return None
+        return index
+    except Exception:
+        return None
+
+# ============================================================================
+# 4. 조회 (벡터 검색 없이 O(1) 조회)
+# ============================================================================
+def resolve_product_key(index: dict, product_name: Optional[str]) -> Optional[str]:
+    """상품명을 인덱스 키로 변환 (정확 일치 우선, 없으면 부분 일치하는 상품이 하나뿐일 때만)"""
+    if not index or not product_name:
+        return None
+    products = index.get("products", {})
+    name = normalize_product_name(product_name)
+    if name in products:
+        return name
+    if not name:
+        return None
+    # 여러 상품에 걸치는 짧은 이름("상해" 등)은 어느 상품인지 알 수 없으므로 매칭하지 않음
+    candidates = [key for key in products if name in key or (len(key) >= 4 and key in name)]
+    return candidates[0] if len(candidates) == 1 else None
+
+def lookup_article_ids(index: dict, product_name: Optional[str], refs: List[str]) -> List[str]:
+    """(상품, 조항) 참조 목록에 해당하는 청크 ID 반환 (상품을 특정할 수 없으면 빈 리스트)"""
+    if not index or not refs:
+        return []
+    product_key = resolve_product_key(index, product_name)
+    if product_key is None:
+        # 상품 없이 "제3조"만으로는 모든 상품의 제3조가 섞이므로 조회하지 않음
+        return []
+    articles = index.get("products", {})[product_key]
+
+    ids = []
+    for ref in refs:
+        for cid in articles.get(ref, {}).get("ids", []):
+            if cid not in ids:
+                ids.append(cid)
+    return ids
+
+def fetch_documents(vectorstore, ids: List[str]) -> List[Document]:
+    """청크 ID로 문서를 직접 가져오기 (요청 순서 유지)"""
+    if not ids:
+        return []
+    batch = vectorstore.get(ids=ids, include=["documents", "metadatas"])
+    by_id = {
+        cid: Document(page_content=text or "", metadata=meta or {}, id=cid)
+        for cid, text, meta in zip(batch.get("ids", []), batch.get("documents", []), batch.get("metadatas", []))
+    }
+    return [by_id[cid] for cid in ids if cid in by_id]
+
+def get_article_documents(vectorstore, index: dict, text: str, product_name: Optional[str] = None, limit: int = 8) -> List[Document]:
+    """텍스트에 조항 참조가 있고 상품이 정해져 있으면 해당 청크를 바로 반환 (아니면 빈 리스트 → 벡터 검색)"""
+    if not product_name:
+        return []
+    refs = detect_article_refs(text)
+    if not refs:
+        return []
+    ids = lookup_article_ids(index, product_name, refs)[:limit]
+    return fetch_documents(vectorstore, ids)
+
+def expand_articles(vectorstore, docs: List[Document]) -> List[Document]:
+    """조항 단위 청크(ingest.py --chunker article)의 조각 검색 결과를 조항 전문으로 확장
+
+    같은 조항의 조각이 여러 개 검색되면 처음 나온 자리에 조항 전문 1개로 합칩니다.
+    조항 메타데이터가 없는 청크(기존 분할 방식)는 그대로 둡니다.
+    """
+    parents = []
+    for d in docs:
+        parent = d.metadata.get("parent_article")
+        if parent and d.metadata.get("article_parts", 1) > 1 and parent not in parents:
+            parents.append(parent)
+    parts: Dict[str, list] = {}
+    if parents:
+        where = {"parent_article": parents[0]} if len(parents) == 1 else {"parent_article": {"$in": parents}}
+        batch = vectorstore.get(where=where, include=["documents", "metadatas"])
+        for text, meta in zip(batch.get("documents", []), batch.get("metadatas", [])):
+            meta = meta or {}
+            parts.setdefault(meta.get("parent_article"), []).append((meta.get("article_part", 0), text or "", meta))
+
+    expanded, seen = [], set()
+    for d in docs:
+        parent = d.metadata.get("parent_article")
+        if parent and parent in seen:
+            continue
+        if parent:
+            seen.add(parent)
+        pieces = sorted(parts.get(parent, []), key=lambda p: p[0])
+        if not pieces:
+            expanded.append(d)
+            continue
+        # 두 번째 조각부터는 앞에 반복된 조항 제목 줄 제거
+        text = "\n".join([pieces[0][1]] + [piece.partition("\n")[2] for _, piece, _ in pieces[1:]])
+        meta = {k: v for k, v in pieces[0][2].items() if k not in ("article_part", "content_hash", "chunk_index")}
+        expanded.append(Document(page_content=text, metadata={**meta, "article_parts": len(pieces)}, id=parent))
+    return expanded
+
+# ============================================================================
+# 5. CLI: 인덱스 재생성
+# ============================================================================
+if __name__ == "__main__":
+    import argparse
+    from langchain_chroma import Chroma
+
+    parser = argparse.ArgumentParser(description="약관 조항 번호 인덱스 생성")
+    parser.add_argument("--persist-dir", default="./chroma_db_clause")
+    parser.add_argument("--collection", default="insurance_rag")
+    parser.add_argument("--output", default=ARTICLE_INDEX_FILE)
+    args = parser.parse_args()
+
+    store = Chroma(persist_directory=args.persist_dir, collection_name=args.collection)
+    article_index = build_article_index(store)
+    save_article_index(article_index, args.output)
+    article_total = sum(len(a) for a in article_index["products"].values())
+    print(f"✅ 조항 인덱스 생성 완료: 상품 {len(article_index['products'])}개, 조항 {article_total}개, 청크 {article_index['chunk_count']}개 → {args.output}")
@@ -0,0 +1,288 @@
+import os
+import json
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from retrievers import (RetrieverStoreMixin, check_fresh, export_collection, hydrate,
+                        ids_fingerprint, normalize_rows, top_k_indices)
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+COMPACT_DIR = "clause_compact"
+META_FILE = "compact_meta.json"
+FULL_FILE = "full_f32.npy"
+CODES_FILE = "codes.npy"
+MODES = ("int8", "pq")
+# 재채점용 전체 정밀도 벡터: chroma(후보만 Chroma에서 조회, 추가 디스크 없음) | file(float32 행렬 memmap, 더 빠름)
+RESCORE_SOURCES = ("chroma", "file")
+
+PQ_SUBSPACES = 64
+PQ_CENTROIDS = 256
+PQ_TRAIN_SAMPLE = 20000
+PQ_ITERATIONS = 12
+RESCORE_OVERSAMPLE = 8
+RESCORE_MIN = 64
+SCAN_BLOCK = 8192
+
+# ============================================================================
+# 2. 양자화 (int8 스칼라 / Product Quantization)
+# ============================================================================
+def truncate_dims(matrix: np.ndarray, dims: Optional[int]) -> np.ndarray:
+    """Matryoshka 방식 차원 축소: 앞쪽 dims 차원만 남기고 재정규화"""
+    if not dims or dims >= matrix.shape[-1]:
+        return matrix
+    return normalize_rows(matrix[..., :dims])
+
+def train_int8(matrix: np.ndarray) -> Tuple[np.ndarray, dict]:
+    """차원별 대칭 스케일로 int8 양자화"""
+    scale = np.abs(matrix).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8)
+    return codes, {"scale": scale.astype(np.float32)}
+
+def _kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        dist = (data ** 2).sum(1, keepdims=True) - 2 * data @ centroids.T + (centroids ** 2).sum(1)
+        assign = dist.argmin(1)
+        for c in range(k):
+            members = data[assign == c]
+            if len(members):
+                centroids[c] = members.mean(0)
+    return centroids
+
+def train_pq(matrix: np.ndarray, subspaces: int = PQ_SUBSPACES, centroids: int = PQ_CENTROIDS,
+             seed: int = 0) -> Tuple[np.ndarray, dict]:
+    """부분공간별 k-means 코드북 학습 후 uint8 코드로 인코딩"""
+    n, d = matrix.shape
+    if d % subspaces:
+        raise ValueError(f"차원({d})이 부분공간 수({subspaces})로 나누어떨어지지 않습니다.")
+    sub_d = d // subspaces
+    rng = np.random.default_rng(seed)
+    sample = matrix[rng.choice(n, min(n, PQ_TRAIN_SAMPLE), replace=False)]
+
+    codebooks = np.zeros((subspaces, centroids, sub_d), dtype=np.float32)
+    codes = np.zeros((n, subspaces), dtype=np.uint8)
+    for j in range(subspaces):
+        cols = slice(j * sub_d, (j + 1) * sub_d)
+        book = _kmeans(sample[:, cols], centroids, PQ_ITERATIONS, rng)
+        codebooks[j, :len(book)] = book
+        for start in range(0, n, SCAN_BLOCK):
+            part = matrix[start:start + SCAN_BLOCK, cols]
+            dist = (part ** 2).sum(1, keepdims=True) - 2 * part @ book.T + (book ** 2).sum(1)
+            codes[start:start + SCAN_BLOCK, j] = dist.argmin(1)
+    return codes, {"codebooks": codebooks}
+
+# ============================================================================
+# 3. 인덱스 생성 / 로드
+# ============================================================================
+def build_compact_index(vectorstore, out_dir: str, mode: str = "int8", dims: Optional[int] = None,
+                        subspaces: int = PQ_SUBSPACES, rescore: str = "chroma") -> dict:
+    """Chroma 컬렉션에서 임베딩을 추출해 압축 코드 저장 (rescore=file이면 전체 정밀도 행렬도 memmap용으로 저장)
+
+    컬렉션 지문(청크 수 + ID 해시)을 함께 기록해, 이후 컬렉션이 바뀌면 열 때 거부합니다.
+    """
+    if mode not in MODES:
+        raise ValueError(f"지원하지 않는 모드: {mode}")
+    if rescore not in RESCORE_SOURCES:
+        raise ValueError(f"지원하지 않는 재채점 방식: {rescore}")
+    os.makedirs(out_dir, exist_ok=True)
+    data = export_collection(vectorstore)
+    full = normalize_rows(data["embeddings"]).astype(np.float32)
+    reduced = truncate_dims(full, dims)
+
+    if mode == "int8":
+        codes, params = train_int8(reduced)
+    else:
+        codes, params = train_pq(reduced, subspaces=subspaces)
+
+    full_path = os.path.join(out_dir, FULL_FILE)
+    if rescore == "file":
+        np.save(full_path, full)
+    elif os.path.exists(full_path):
+        os.remove(full_path)
+    np.save(os.path.join(out_dir, CODES_FILE), codes)
+    for name, array in params.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), array)
+
+    meta = {
+        "mode": mode,
+        "dims": int(reduced.shape[1]),
+        "full_dims": int(full.shape[1]),
+        "count": len(data["ids"]),
+        "fingerprint": ids_fingerprint(data["ids"]),
+        "rescore": rescore,
+        "ids": data["ids"],
+        "sources": data["sources"],
+        "params": sorted(params),
+    }
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return meta
+
+def rebuild_compact_index(vectorstore, out_dir: str) -> dict:
+    """기존 인덱스와 같은 설정(모드/차원/부분공간/재채점 방식)으로 다시 생성 (증분 적재 후)"""
+    with open(os.path.join(out_dir, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    dims = meta["dims"] if meta["dims"] < meta.get("full_dims", meta["dims"]) else None
+    subspaces = PQ_SUBSPACES
+    if meta["mode"] == "pq":
+        subspaces = int(np.load(os.path.join(out_dir, "codebooks.npy"), mmap_mode="r").shape[0])
+    return build_compact_index(vectorstore, out_dir, mode=meta["mode"], dims=dims, subspaces=subspaces,
+                               rescore=meta.get("rescore", "file"))
+
+class CompactStore(RetrieverStoreMixin):
+    """압축 코드로 1차 검색 → 후보만 전체 정밀도 벡터(Chroma 조회 또는 memmap)로 재채점"""
+
+    def __init__(self, index_dir: str, embedding, docstore, oversample: int = RESCORE_OVERSAMPLE,
+                 verify: bool = True, fingerprint: Optional[str] = None):
+        """verify: 현재 컬렉션과 다르면 StaleIndexError (fingerprint: 호출부가 이미 계산한 현재 컬렉션 지문)"""
+        with open(os.path.join(index_dir, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if verify:
+            check_fresh(meta.get("fingerprint") or ids_fingerprint(meta.get("ids", [])), docstore, fingerprint, "압축 인덱스")
+        self.mode = meta["mode"]
+        self.dims = meta["dims"]
+        self.ids = meta["ids"]
+        self.sources = np.asarray(meta["sources"])
+        self.codes = np.load(os.path.join(index_dir, CODES_FILE))
+        # 이전 버전 인덱스(rescore 없음)는 항상 행렬 파일이 있음
+        self.rescore = meta.get("rescore", "file")
+        self.full = np.load(os.path.join(index_dir, FULL_FILE), mmap_mode="r") if self.rescore == "file" else None
+        self.params = {name: np.load(os.path.join(index_dir, f"{name}.npy")) for name in meta["params"]}
+        self.embedding = embedding
+        self.docstore = docstore
+        self.oversample = oversample
+
+    def _first_pass_scores(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        q = truncate_dims(query[None, :], self.dims)[0]
+        codes = self.codes if rows is None else self.codes[rows]
+        scores = np.empty(len(codes), dtype=np.float32)
+        if self.mode == "int8":
+            weighted = (q * self.params["scale"]).astype(np.float32)
+            for start in range(0, len(codes), SCAN_BLOCK):
+                scores[start:start + SCAN_BLOCK] = codes[start:start + SCAN_BLOCK].astype(np.float32) @ weighted
+        else:
+            books = self.params["codebooks"]
+            sub_d = books.shape[2]
+            lut = np.einsum("jcd,jd->jc", books, q.reshape(len(books), sub_d))
+            scores[:] = lut[np.arange(len(books)), codes].sum(1)
+        return scores
+
+    def search_vector(self, query: np.ndarray, k: int = 4, filter: Optional[dict] = None) -> Tuple[List[str], List[float]]:
+        rows = None
+        if filter and "source" in filter:
+            source = filter["source"]
+            if isinstance(source, dict):
+                rows = np.flatnonzero(np.isin(self.sources, source.get("$in", [])))
+            else:
+                rows = np.flatnonzero(self.sources == source)
+            if not len(rows):
+                return [], []
+        query = normalize_rows(np.asarray(query, dtype=np.float32)[None, :])[0]
+        approx = self._first_pass_scores(query, rows)
+        shortlist = top_k_indices(approx, max(k * self.oversample, RESCORE_MIN))
+        if rows is not None:
+            shortlist = rows[shortlist]
+        # 전체 정밀도 재채점 (후보 행만 읽음)
+        shortlist, vectors = self._full_vectors(np.sort(shortlist))
+        if not len(shortlist):
+            return [], []
+        exact = vectors @ query
+        order = top_k_indices(exact, k)
+        return [self.ids[i] for i in shortlist[order]], exact[order].tolist()
+
+    def _full_vectors(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """후보 행의 전체 정밀도 벡터 (Chroma 조회 시 컬렉션에서 사라진 청크는 제외)"""
+        if self.full is not None:
+            return rows, np.asarray(self.full[rows])
+        batch = self.docstore.get(ids=[self.ids[i] for i in rows], include=["embeddings"])
+        embeddings = batch.get("embeddings")
+        by_id = dict(zip(batch.get("ids", []), embeddings if embeddings is not None else []))
+        found = np.asarray([i for i in rows if self.ids[i] in by_id], dtype=np.int64)
+        if not len(found):
+            return found, None
+        vectors = np.asarray([by_id[self.ids[i]] for i in found], dtype=np.float32)
+        return found, normalize_rows(vectors)
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: Optional[dict] = None):
+        ids, scores = self.search_vector(np.asarray(embedding), k=k, filter=filter)
+        return hydrate(self.docstore, ids, scores)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k, filter=filter)
+
+# ============================================================================
+# 4. recall@k 리포트 (현재 Chroma HNSW 인덱스 대비)
+# ============================================================================
+def recall_report(vectorstore, store: CompactStore, k: int = 10, num_queries: int = 200, seed: int = 0) -> dict:
+    """저장된 청크 벡터를 질의로 사용해 정답(전수 검색) 대비 recall@k 비교"""
+    data = export_collection(vectorstore)
+    full = normalize_rows(data["embeddings"]).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(full), min(num_queries, len(full)), replace=False)
+
+    recall_compact, recall_hnsw = [], []
+    compact_ms, hnsw_ms = [], []
+    for row in query_rows:
+        query = full[row]
+        truth = {data["ids"][i] for i in top_k_indices(full @ query, k)}
+
+        start = time.perf_counter()
+        ids, _ = store.search_vector(query, k=k)
+        compact_ms.append((time.perf_counter() - start) * 1000)
+        recall_compact.append(len(truth & set(ids)) / k)
+
+        start = time.perf_counter()
+        docs = vectorstore.similarity_search_by_vector(query.tolist(), k=k)
+        hnsw_ms.append((time.perf_counter() - start) * 1000)
+        recall_hnsw.append(len(truth & {d.id for d in docs}) / k)
+
+    return {
+        "mode": store.mode,
+        "dims": store.dims,
+        "k": k,
+        "queries": len(query_rows),
+        "recall_compact": round(float(np.mean(recall_compact)), 4),
+        "recall_hnsw": round(float(np.mean(recall_hnsw)), 4),
+        "p50_ms_compact": round(float(np.percentile(compact_ms, 50)), 2),
+        "p50_ms_hnsw": round(float(np.percentile(hnsw_ms, 50)), 2),
+        "rescore": store.rescore,
+        "codes_mb": round(store.codes.nbytes / 1e6, 2),
+        "full_mb": round(store.full.nbytes / 1e6, 2) if store.full is not None else 0.0,
+    }
+
+# ============================================================================
+# 5. CLI
+# ============================================================================
+if __name__ == "__main__":
+    import argparse
+    from langchain_chroma import Chroma
+
+    parser = argparse.ArgumentParser(description="약관 임베딩 압축 인덱스 생성 및 recall@k 리포트")
+    parser.add_argument("command", choices=["build", "report"])
+    parser.add_argument("--persist-dir", default="./chroma_db_clause")
+    parser.add_argument("--collection", default="insurance_rag")
+    parser.add_argument("--out", default=None, help=f"기본값: DB 폴더 옆 {COMPACT_DIR}/")
+    parser.add_argument("--mode", choices=MODES, default="int8")
+    parser.add_argument("--dims", type=int, default=None, help="Matryoshka 차원 축소 (예: 256)")
+    parser.add_argument("--subspaces", type=int, default=PQ_SUBSPACES)
+    parser.add_argument("--rescore", choices=RESCORE_SOURCES, default="chroma",
+                        help="재채점 벡터: chroma(추가 파일 없음) | file(float32 행렬 저장, 더 빠름)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    out_dir = args.out or os.path.join(os.path.dirname(os.path.abspath(args.persist_dir)), COMPACT_DIR)
+    chroma = Chroma(persist_directory=args.persist_dir, collection_name=args.collection)
+    if args.command == "build":
+        built = build_compact_index(chroma, out_dir, mode=args.mode, dims=args.dims, subspaces=args.subspaces,
+                                    rescore=args.rescore)
+        print(f"✅ 압축 인덱스 생성 완료: {built['mode']} / {built['dims']}차원 / {built['count']}개 / 재채점 {built['rescore']} → {out_dir}")
+    else:
+        compact = CompactStore(out_dir, embedding=None, docstore=chroma)
+        print(json.dumps(recall_report(chroma, compact, k=args.k, num_queries=args.queries), ensure_ascii=False, indent=2))
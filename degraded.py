@@ -0,0 +1,215 @@
+import os
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import recommend
+import structured_output
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+# auto: 마감 시간 초과/차단 시 규칙 기반 결과 | off: 항상 LLM 결과를 기다림 | force: 항상 규칙 기반 (장애 훈련용)
+DEGRADED_MODE = os.getenv("DEGRADED_MODE", "auto")
+# 화면 단계별 마감 시간(초) - 넘기면 간편 결과를 먼저 보여주고 LLM 결과가 오면 교체
+STAGE_DEADLINES = {
+    "situations": float(os.getenv("DEADLINE_SITUATIONS_SEC", "8")),
+    "step25": float(os.getenv("DEADLINE_STEP25_SEC", "12")),
+    "analysis": float(os.getenv("DEADLINE_ANALYSIS_SEC", "30")),
+}
+# 화면 단계 → 게이트웨이 단계 (하나라도 차단 중이면 LLM 호출 없이 바로 간편 결과)
+GATEWAY_STAGES = {
+    "situations": ("generate_situations_from_tags",),
+    "step25": ("analyze_situation_to_keywords", "recommend_products_for_situation", "recommend_keywords_and_products"),
+    "analysis": ("analyze_tags_and_situation",),
+}
+JOB_RETENTION_SEC = 600
+
+READY, PROVISIONAL, FALLBACK = "ready", "provisional", "fallback"
+
+class StageOutcome(NamedTuple):
+    value: object
+    status: str                # ready | provisional(LLM 결과 대기 중) | fallback(교체 없음)
+    job_key: Optional[str]
+    reason: str = ""
+
+# ============================================================================
+# 2. 백그라운드 LLM 작업 (마감 후에도 계속 실행 → 완료 시 화면에서 교체)
+# ============================================================================
+# 실행은 admission 컨트롤러가 담당 (프로세스당 동시 작업 수 제한, 방문자별 공정 대기열, 상세 분석 우선)
+# admission은 작업을 처음 제출할 때 import (DEGRADED_MODE=force/off이면 import하지 않음)
+_jobs: Dict[str, tuple] = {}
+_jobs_lock = threading.Lock()
+
+def job_key(visitor_id: str, stage: str, inputs) -> str:
+    """방문자 + 단계 + 입력 해시 (입력이 바뀌면 이전 작업 결과는 적용하지 않음)"""
+    digest = hashlib.sha256(repr(inputs).encode("utf-8")).hexdigest()[:16]
+    return f"{visitor_id}:{stage}:{digest}"
+
+def _with_script_context(compute: Callable) -> Callable:
+    """Streamlit 세션 컨텍스트를 작업 스레드에 연결 (캐시/세션 상태 조회가 경고 없이 동작하도록)"""
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        ctx = get_script_run_ctx()
+    except ImportError:
+        return compute
+    if ctx is None:
+        return compute
+
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return compute()
+
+    return run
+
+def _prune_jobs():
+    now = time.monotonic()
+    with _jobs_lock:
+        for key in [k for k, (future, started) in _jobs.items() if future.done() and now - started > JOB_RETENTION_SEC]:
+            _jobs.pop(key, None)
+
+def _submit(key: str, compute: Callable):
+    import admission
+    _prune_jobs()
+    with _jobs_lock:
+        if key in _jobs and not (_jobs[key][0].done() and _jobs[key][0].exception() is not None):
+            return _jobs[key][0]
+        visitor, stage = key.split(":")[:2]
+        future = admission.submit(key, visitor, stage, _with_script_context(compute))
+        _jobs[key] = (future, time.monotonic())
+        return future
+
+def poll(key: str) -> Tuple[str, object]:
+    """('pending'|'done'|'failed'|'missing', 결과) - 다른 워커에서 시작된 작업은 missing"""
+    with _jobs_lock:
+        entry = _jobs.get(key)
+    if entry is None:
+        return "missing", None
+    future = entry[0]
+    if not future.done():
+        return "pending", None
+    with _jobs_lock:
+        _jobs.pop(key, None)
+    if future.exception() is not None:
+        return "failed", future.exception()
+    return "done", future.result()
+
+def circuit_open(llm, stage: str) -> bool:
+    check = getattr(llm, "circuit_open", None)
+    return bool(check) and any(check(s) for s in GATEWAY_STAGES.get(stage, ()))
+
+def run_stage(stage: str, key: str, compute: Callable, fallback: Callable, llm=None,
+              deadline: Optional[float] = None) -> StageOutcome:
+    """마감 시간 안에 LLM 결과가 오면 ready, 아니면 규칙 기반 결과(provisional/fallback)"""
+    if DEGRADED_MODE == "force":
+        return StageOutcome(fallback(), FALLBACK, None, "forced")
+    if DEGRADED_MODE == "off":
+        return StageOutcome(compute(), READY, None)
+    if circuit_open(llm, stage):
+        return StageOutcome(fallback(), FALLBACK, None, "circuit_open")
+
+    import admission
+    try:
+        future = _submit(key, compute)
+    except admission.Shed as e:
+        return StageOutcome(fallback(), FALLBACK, None, f"shed:{e.reason}")
+    try:
+        value = future.result(timeout=deadline or STAGE_DEADLINES.get(stage, 10.0))
+    except Exception as e:
+        if not future.done():
+            reason = "queued" if admission.position(key) is not None else "deadline"
+            return StageOutcome(fallback(), PROVISIONAL, key, reason)
+        poll(key)
+        print(f"❌ [간편 모드] {stage} LLM 실패 → 규칙 기반 결과 사용: {e}")
+        return StageOutcome(fallback(), FALLBACK, None, type(e).__name__)
+    poll(key)
+    return StageOutcome(value, READY, None)
+
+# ============================================================================
+# 3. 규칙 기반 결과 (catalog_tags.json + 고정 태그맵, LLM/벡터 검색 없음)
+# ============================================================================
+CANNED_SITUATIONS = {
+    "펫": ["강아지가 산책하다 다른 개를 물었는데 보상해줘야 하나요?", "반려견이 슬개골 수술을 해야 한대요. 병원비가 걱정돼요.",
+          "고양이가 장난감을 삼켜서 응급실에 갔어요."],
+    "여행/레저": ["해외여행 중 갑자기 아파서 현지 병원에 갔어요.", "공항에서 짐을 잃어버렸는데 보상받을 수 있나요?",
+              "스키 타다가 넘어져서 다쳤어요."],
+    "건강": ["건강검진에서 암 의심 소견을 받았어요.", "부모님이 뇌졸중으로 쓰러지셔서 입원하셨어요.",
+           "예전에 아팠던 적이 있는데 지금도 보험에 들 수 있을까요?"],
+    "연금저축": ["노후에 생활비가 부족할까 봐 걱정돼요.", "연말정산 때 세금을 돌려받고 싶어요.", "갑자기 목돈이 필요해지면 어떻게 하나요?"],
+    "자녀": ["아이가 놀이터에서 넘어져 팔이 부러졌어요.", "아이가 학교에서 친구 물건을 망가뜨렸어요.", "곧 아기가 태어나는데 미리 준비할 게 있을까요?"],
+    "운전자": ["운전하다 사람을 다치게 해서 합의금이 필요해요.", "교통사고로 변호사를 선임해야 할 것 같아요.", "처음 운전을 시작했는데 사고가 날까 걱정돼요."],
+    "자동차": ["주차장에서 다른 차를 긁었어요.", "비가 많이 와서 차가 물에 잠겼어요.", "새 차를 샀는데 보험을 어떻게 들어야 할지 모르겠어요."],
+    "화재/재산": ["우리 집에서 물이 새서 아랫집 천장이 젖었어요.", "집에 불이 나서 가전제품이 다 탔어요.", "가게에 도둑이 들었어요."],
+}
+DEFAULT_SITUATIONS = ["갑자기 다치거나 아프면 병원비가 걱정돼요.", "내가 실수로 남에게 피해를 주면 어떻게 하나요?",
+                      "지금 가입한 보험으로 충분한지 궁금해요."]
+
+def canned_situations(interest: Optional[str], tags: Dict[str, List[str]]) -> List[str]:
+    """관심사별 고정 상황 질문 (관심사가 없으면 선택 태그가 가장 많이 겹치는 관심사)"""
+    if interest not in CANNED_SITUATIONS:
+        selected = {tag for values in tags.values() for tag in values}
+        overlap = {
+            name: len(selected & {tag for values in tag_map.values() for tag in values})
+            for name, tag_map in recommend.INTEREST_TAG_MAP.items()
+        }
+        best = max(overlap, key=overlap.get) if overlap else None
+        interest = best if best and overlap[best] > 0 else None
+    return list(CANNED_SITUATIONS.get(interest, DEFAULT_SITUATIONS))
+
+def _compact(name: Optional[str]) -> str:
+    """상품명 비교용: NFC 정규화(카탈로그는 자모 분리형 포함) 후 공백/기호(·, 괄호 등) 제거"""
+    name = unicodedata.normalize("NFC", name or "")
+    return re.sub(r"[\Wㆍ]", "", name.replace(".txt", "").replace("표준_", ""))
+
+def _matched_tags(tags: Dict[str, List[str]], product_name: str, category: str) -> List[str]:
+    product_tags = recommend.get_catalog_product_tags().get(product_name, {}).get("tags", {})
+    return [tag for tag in tags.get(category, []) if tag in product_tags.get(category, [])]
+
+def rule_based_step25(situation_text: str, tags: Dict[str, List[str]]) -> Tuple[str, str]:
+    """선택 태그 기반 키워드 + 태그 점수 상위 상품 (키워드 분석 / 상품 추천 화면 형식)"""
+    keyword_tags = (tags.get("위험", []) + tags.get("우선순위", []))[:3]
+    keywords = structured_output.KeywordsPayload(
+        keywords=[
+            structured_output.KeywordItem(original=tag.replace("#", ""), professional=tag.replace("#", "").replace("_", " "),
+                                          explanation="선택하신 태그 기준")
+            for tag in keyword_tags
+        ],
+        summary="AI 분석이 지연되어 선택하신 태그를 기준으로 먼저 안내드려요.",
+    )
+    catalog = recommend.get_catalog_product_tags()
+    products = []
+    for product_name, score in recommend.rank_products_by_tags(tags, limit=3):
+        matched = _matched_tags(tags, product_name, "위험")
+        products.append(structured_output.ProductItem(
+            product_name=product_name,
+            relevant_feature=", ".join(t.replace("#", "") for t in matched) or "주요 보장",
+            why_suitable=catalog.get(product_name, {}).get("summary", ""),
+            match_score=min(95, int(40 + score * 10)),
+        ))
+    return (structured_output.to_json(keywords),
+            structured_output.to_json(structured_output.ProductsPayload(products=products)))
+
+def rule_based_analysis(product_name: str, situation_text: str, tags: Dict[str, List[str]]) -> str:
+    """상품 요약 + 태그 일치 기반 임시 결과 카드 (약관 원문 분석은 LLM 결과 도착 시 교체)"""
+    catalog = recommend.get_catalog_product_tags()
+    key = _compact(product_name)
+    resolved = next((name for name in catalog if key and (_compact(name) in key or key in _compact(name))), product_name)
+    entry = catalog.get(resolved, {})
+    matched = _matched_tags(tags, resolved, "위험")
+    score = recommend.score_product(tags, entry) if entry else 0.0
+    payload = structured_output.AnalysisPayload(
+        product_name=product_name or resolved or "추천 상품",
+        feature_name=", ".join(t.replace("#", "") for t in matched) or "주요 보장",
+        match_score=min(90, int(40 + score * 10)),
+        summary=entry.get("summary") or "상품 요약 정보를 준비 중입니다.",
+        easy_explanation="선택하신 태그와 상품 특징이 겹치는 부분을 기준으로 먼저 보여드려요.",
+        reasoning="AI 상세 분석이 지연되어 상품 카탈로그와 선택하신 태그를 기준으로 임시 결과를 표시합니다. "
+                  "약관 원문 분석이 끝나면 자동으로 바뀝니다.",
+        evidence_snippet="약관 원문 분석 결과가 준비되면 이곳에 표시됩니다.",
+        limitations="정확한 보장 여부와 보장 한도는 약관 원문 확인이 필요합니다.",
+        checklist=["실제 보장 범위와 면책 사항을 약관에서 확인하기", "가입 조건(나이/건강 상태) 확인하기"],
+    )
+    return structured_output.to_json(payload)
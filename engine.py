@@ -0,0 +1,586 @@
+import os
+import re
+import json
+import time
+import hashlib
+from contextlib import contextmanager
+from functools import lru_cache
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+import clause_index
+import structured_output
+import llm_gateway
+import multi_query
+import prompt_tokens
+
+# ============================================================================
+# 1. 설정 및 상수 (app.py 화면과 batch_recommend.py 일괄 추천이 같은 엔진 사용)
+# ============================================================================
+TOC_FILE = "toc_meta_summary.txt"
+# Step 2.5 방식: two_call(키워드 → 상품 순차 호출) | fused(검색 후 단일 호출) | ab(방문자 해시로 분배)
+STEP25_MODE = os.getenv("STEP25_MODE", "two_call")
+STEP25_FUSED_PERCENT = int(os.getenv("STEP25_FUSED_PERCENT", "50"))
+# 상품 추천 검색: multi_query(상황 + 키워드별 질의 배치 인코딩 후 순위 융합) | single(키워드를 이어 붙인 1개 질의)
+KEYWORD_RETRIEVAL_MODE = os.getenv("KEYWORD_RETRIEVAL_MODE", "multi_query")
+# 상세 분석 프롬프트를 바꾸면 올릴 것 (저장된 분석 결과 캐시 키에 포함)
+ANALYSIS_PROMPT_VERSION = "2026-10-1"
+# 프롬프트 크기 설정 (검색 문서 수 k / 문서당 글자 수 / 선택 구간) - prompt_tokens.py replay로 대안 비교
+# 상세 분석 관련 값을 바꾸면 ANALYSIS_PROMPT_VERSION도 올릴 것
+PROMPT_SETTINGS = {
+    "product_k": 5,               # 상품 추천 검색 문서 수 (single 모드 / fused)
+    "product_doc_chars": 400,
+    "product_groups": 5,          # multi_query 모드 상품 묶음 수
+    "product_group_chars": 300,
+    "analysis_k": 8,
+    "analysis_chunk_chars": 600,
+    "analysis_toc": "full",       # full | off
+    "analysis_metadata": "full",  # full | source (청크 메타데이터 전체 대신 상품명만)
+    # off | article (조항 단위 청크의 조각을 조항 전문으로 확장, 같은 조항은 1개로) - ingest.py --chunker article로 적재한 DB용
+    "analysis_expand": os.getenv("ANALYSIS_EXPAND", "off"),
+    "analysis_article_chars": 4000,  # analysis_expand=article일 때 조항당 글자 수 (analysis_chunk_chars 대신)
+    "chat_k": 5,
+    "chat_chunk_chars": 500,
+    "chat_context": "full",       # full | summary (이전 분석 결과 중 요약/근거 필드만 재전송)
+}
+
+def analysis_prompt_version() -> str:
+    """저장된 분석 결과 캐시 키용 프롬프트 버전 (환경 변수로 켜는 조항 확장 여부 포함)"""
+    if PROMPT_SETTINGS["analysis_expand"] == "off":
+        return ANALYSIS_PROMPT_VERSION
+    return f"{ANALYSIS_PROMPT_VERSION}+{PROMPT_SETTINGS['analysis_expand']}"
+
+@contextmanager
+def prompt_settings(**overrides):
+    """오프라인 재생 도구용 설정 교체 (프로세스 전역이므로 서비스 중에는 사용하지 않음)"""
+    unknown = set(overrides) - set(PROMPT_SETTINGS)
+    if unknown:
+        raise KeyError(f"알 수 없는 프롬프트 설정: {', '.join(sorted(unknown))}")
+    previous = dict(PROMPT_SETTINGS)
+    PROMPT_SETTINGS.update(overrides)
+    try:
+        yield PROMPT_SETTINGS
+    finally:
+        PROMPT_SETTINGS.clear()
+        PROMPT_SETTINGS.update(previous)
+
+@lru_cache(maxsize=1)
+def load_toc_data(toc_path: str = TOC_FILE) -> str:
+    if os.path.exists(toc_path):
+        with open(toc_path, "r", encoding="utf-8") as f:
+            return f.read()
+    return "TOC Data Not Found."
+
+# ============================================================================
+# 2. 공통 유틸
+# ============================================================================
+
+def preprocess_text(text):
+    if not text:
+        return ""
+    
+    text = re.sub(r'<br\s*/?>', '\n', text, flags=re.IGNORECASE)
+    text = re.sub(r'</br>', '\n', text, flags=re.IGNORECASE)
+    text = re.sub(r'\|[\s-]+\|', '\n', text)
+    text = text.replace('|', '  ')
+    text = re.sub(r'\n+', '\n', text)
+    text = re.sub(r' +', ' ', text)
+    
+    return text.strip()
+
+def _stage_llm(llm, stage, json_mode=False):
+    """게이트웨이면 단계별 타임아웃/재시도 정책이 적용된 Runnable, 아니면 모델 그대로"""
+    if isinstance(llm, llm_gateway.LLMGateway):
+        return llm.for_stage(stage, json_mode=json_mode)
+    return structured_output.with_json_mode(llm) if json_mode else llm
+
+def _invoke(llm, stage, template, variables, inputs=None, json_mode=False, stream=False):
+    """프롬프트 구간별 토큰 기록 후 호출 (inputs: 재생용 단계 입력, 함수 인자 이름 그대로)"""
+    prompt_tokens.record(stage, template, variables, inputs)
+    chain = ChatPromptTemplate.from_template(template) | _stage_llm(llm, stage, json_mode=json_mode) | StrOutputParser()
+    return chain.stream(variables) if stream else chain.invoke(variables)
+
+def search_product_docs(vectorstore, query, product_name, k):
+    """특정 상품 약관 안에서 검색 (상품별 행렬이 있으면 전수 검색, 없으면 넓게 검색 후 Python 필터링)"""
+    if hasattr(vectorstore, "search_product"):
+        docs = vectorstore.search_product(query, product_name, k=k)
+        if docs is not None:
+            return docs
+    retriever = vectorstore.as_retriever(search_kwargs={"k": 30})  # 많이 검색
+    all_docs = retriever.invoke(query)
+    # 상품명으로 필터링 (부분 매칭)
+    return [d for d in all_docs if product_name in d.metadata.get('source', '')][:k]
+
+def _merge_docs(primary, secondary):
+    """청크 ID(없으면 본문) 기준으로 중복을 제거하며 문서 목록 병합"""
+    seen = set()
+    merged = []
+    for d in list(primary) + list(secondary):
+        key = getattr(d, "id", None) or d.page_content
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append(d)
+    return merged
+
+def _format_product_docs(docs):
+    return "\n".join([
+        f"<상품 {i+1}>\n- 상품명: {d.metadata.get('source', '알 수 없음')}\n"
+        f"- 내용: {preprocess_text(d.page_content)[:PROMPT_SETTINGS['product_doc_chars']]}..."
+        for i, d in enumerate(docs)
+    ])
+
+# ============================================================================
+# 3. 상황 질문 생성
+# ============================================================================
+def generate_situations_from_tags(llm, tags, natural_language_inputs, free_text):
+    """태그 + 자연어 + 자유 입력 기반으로 3개의 질문 생성"""
+    
+    tag_descriptions = []
+    for category, tag_list in tags.items():
+        if tag_list:
+            tag_descriptions.append(f"{category}: {', '.join(tag_list)}")
+        
+        nl_input = natural_language_inputs.get(category, "").strip()
+        if nl_input:
+            tag_descriptions.append(f"{category} (자연어): {nl_input}")
+    
+    if free_text.strip():
+        tag_descriptions.append(f"자유 입력: {free_text}")
+    
+    tag_str = " | ".join(tag_descriptions)
+    
+    template = """당신은 보험 소비자의 일상적 고민을 이해하는 전문가입니다.
+
+**[고객 선택 정보]**
+{tags}
+
+---
+**[임무]**
+위 태그 조합에서 발생할 수 있는 **일상적이고 구체적인 상황 3가지**를 생성하세요.
+
+**[중요 원칙]**
+1. **전문용어 사용 금지**: "배상책임", "면책", "특약" 같은 보험 용어 사용하지 말 것
+2. **1인칭 시점**: "저는...", "제가..." 형식으로 작성
+3. **구체적 상황**: 추상적이지 않고 실제 일어날 법한 사건
+4. **길이 제한**: 각 질문은 50자 이내
+
+**[출력 형식 - JSON Only]**
+{{
+    "situations": [
+        "질문 1 (50자 이내, 전문용어 없이)",
+        "질문 2 (50자 이내, 전문용어 없이)",
+        "질문 3 (50자 이내, 전문용어 없이)"
+    ]
+}}
+"""
+    
+    return _invoke(llm, "generate_situations_from_tags", template, {"tags": tag_str},
+                   inputs={"tags": tags, "natural_language_inputs": natural_language_inputs, "free_text": free_text},
+                   json_mode=True)
+
+# ============================================================================
+# 4. 키워드 변환
+# ============================================================================
+def analyze_situation_to_keywords(llm, situation_text, tags):
+    tag_str = ", ".join([f"{k}: {', '.join(v)}" for k, v in tags.items() if v])
+    
+    template = """당신은 보험 약관 전문가입니다.
+
+**[고객의 질문]**
+{situation}
+
+**[선택된 태그]**
+{tags}
+
+---
+**[임무]**
+위 질문을 보험 약관에서 사용하는 **전문 키워드**로 변환하세요.
+
+**[출력 형식 - JSON Only]**
+{{
+    "keywords": [
+        {{"original": "일상 표현", "professional": "보험 전문용어", "explanation": "왜 이 용어인지 20자 이내 설명"}},
+        {{"original": "일상 표현", "professional": "보험 전문용어", "explanation": "설명"}},
+        {{"original": "일상 표현", "professional": "보험 전문용어", "explanation": "설명"}}
+    ],
+    "summary": "이 상황은 보험에서 어떤 영역인지 50자 이내 요약"
+}}
+"""
+    
+    return _invoke(llm, "analyze_situation_to_keywords", template, {"situation": situation_text, "tags": tag_str},
+                   inputs={"situation_text": situation_text, "tags": tags}, json_mode=True)
+
+# ============================================================================
+# 5. 상품 추천
+# ============================================================================
+def recommend_products_for_situation(vectorstore, llm, situation_text, keywords_data):
+    """키워드 기반으로 관련 상품 2~3개 추천"""
+    
+    try:
+        keywords_obj = structured_output.loads(keywords_data)
+        professional_keywords = [k["professional"] for k in keywords_obj.get("keywords", [])]
+        keyword_str = ", ".join(professional_keywords)
+    except:
+        professional_keywords = []
+        keyword_str = situation_text
+    
+    settings = PROMPT_SETTINGS
+    
+    def format_groups(groups):
+        return "\n".join([
+            f"<상품 {i+1}>\n- 상품명: {g['source']}\n" + "\n".join(
+                f"- 내용: {preprocess_text(d.page_content)[:settings['product_group_chars']]}..." for d in g["docs"]
+            )
+            for i, g in enumerate(groups)
+        ])
+    
+    if KEYWORD_RETRIEVAL_MODE == "multi_query" and professional_keywords:
+        # 키워드를 섞은 1개 벡터 대신 상황/키워드별 질의를 따로 검색해 한 키워드에만 강하게 맞는 조항도 포함
+        fused = multi_query.multi_query_search(vectorstore, [situation_text] + professional_keywords)
+        docs_text = format_groups(multi_query.group_by_product(fused)[:settings["product_groups"]])
+    else:
+        retriever = vectorstore.as_retriever(search_kwargs={"k": settings["product_k"]})
+        docs_text = _format_product_docs(retriever.invoke(keyword_str))
+    
+    template = """당신은 보험 상품 추천 전문가입니다.
+
+**[고객 상황]**
+{situation}
+
+**[변환된 키워드]**
+{keywords}
+
+**[검색된 약관]**
+{docs}
+
+---
+**[임무]**
+위 상황에 적합한 **상품 2~3개**를 추천하세요.
+
+**[중요]**
+- product_name은 반드시 **파일 확장자(.txt) 없이** 순수 상품명만 출력하세요.
+- 예: "무배당 현대해상 퍼펙트플러스 종합보험(세만기형)(Hi2508)" (O)
+
+**[출력 형식 - JSON Only]**
+{{
+    "products": [
+        {{
+            "product_name": "순수 상품명 (확장자 제외)",
+            "relevant_feature": "이 상황에 적합한 특약명",
+            "why_suitable": "왜 이 상품이 적합한지 30자 이내",
+            "match_score": 85
+        }},
+        {{
+            "product_name": "상품명 2",
+            "relevant_feature": "특약명",
+            "why_suitable": "이유",
+            "match_score": 75
+        }}
+    ]
+}}
+"""
+    
+    return _invoke(llm, "recommend_products_for_situation", template,
+                   {"situation": situation_text, "keywords": keyword_str, "docs": docs_text},
+                   inputs={"situation_text": situation_text, "keywords_data": keywords_data}, json_mode=True)
+
+# ============================================================================
+# 5.1. 키워드 변환 + 상품 추천 단일 호출 (fused 모드)
+# ============================================================================
+def step25_variant(visitor_id):
+    """Step 2.5 실험군: 방문자 ID 해시로 고정 분배 (같은 방문자는 항상 같은 방식)"""
+    if STEP25_MODE in ("two_call", "fused"):
+        return STEP25_MODE
+    bucket = int(hashlib.sha256(visitor_id.encode("utf-8")).hexdigest()[:8], 16) % 100
+    return "fused" if bucket < STEP25_FUSED_PERCENT else "two_call"
+
+def recommend_keywords_and_products(vectorstore, llm, situation_text, tags):
+    """상황 + 태그로 먼저 검색하고, 한 번의 호출로 키워드 변환과 상품 추천을 함께 생성"""
+    tag_str = ", ".join([f"{k}: {', '.join(v)}" for k, v in tags.items() if v])
+    
+    retriever = vectorstore.as_retriever(search_kwargs={"k": PROMPT_SETTINGS["product_k"]})
+    docs = retriever.invoke(f"{situation_text} {tag_str}".strip())
+    
+    template = """당신은 보험 약관 및 상품 추천 전문가입니다.
+
+**[고객의 질문]**
+{situation}
+
+**[선택된 태그]**
+{tags}
+
+**[검색된 약관]**
+{docs}
+
+---
+**[임무]**
+1. 위 질문을 보험 약관에서 사용하는 **전문 키워드 3개**로 변환하세요.
+2. 검색된 약관 중 위 상황에 적합한 **상품 2~3개**를 추천하세요.
+
+**[중요]**
+- product_name은 반드시 **파일 확장자(.txt) 없이** 순수 상품명만 출력하세요.
+
+**[출력 형식 - JSON Only]**
+{{
+    "keywords": [
+        {{"original": "일상 표현", "professional": "보험 전문용어", "explanation": "왜 이 용어인지 20자 이내 설명"}}
+    ],
+    "summary": "이 상황은 보험에서 어떤 영역인지 50자 이내 요약",
+    "products": [
+        {{
+            "product_name": "순수 상품명 (확장자 제외)",
+            "relevant_feature": "이 상황에 적합한 특약명",
+            "why_suitable": "왜 이 상품이 적합한지 30자 이내",
+            "match_score": 85
+        }}
+    ]
+}}
+"""
+    
+    return _invoke(llm, "recommend_keywords_and_products", template,
+                   {"situation": situation_text, "tags": tag_str, "docs": _format_product_docs(docs)},
+                   inputs={"situation_text": situation_text, "tags": tags}, json_mode=True)
+
+# ============================================================================
+# 6. 상세 분석 (수정: Python 레벨 필터링으로 변경)
+# ============================================================================
+def analyze_tags_and_situation(vectorstore, llm, tags, situation_text, target_product_name=None, trace=None, article_index=None):
+    """
+    상황 기반 분석 (특정 상품 약관에서만 검색)
+    
+    Args:
+        target_product_name: 검색 대상 상품명 (None이면 전체 검색)
+        trace: dict를 넘기면 검색된 청크 ID와 검색 소요 시간을 기록
+        article_index: 조항 번호 인덱스 (None이면 조항 직접 조회 생략)
+    """
+    retrieval_start = time.time()
+    settings = PROMPT_SETTINGS
+    analysis_k = settings["analysis_k"]
+    
+    current_toc_summary = load_toc_data() if settings["analysis_toc"] == "full" else "(생략)"
+    tag_str = ", ".join([f"{k}: {', '.join(v)}" for k, v in tags.items() if v])
+    
+    # 조항 번호 직접 조회 (예: "제3조") - 벡터 검색 없이 해당 청크를 먼저 확보
+    article_docs = clause_index.get_article_documents(
+        vectorstore, article_index, situation_text, product_name=target_product_name, limit=analysis_k
+    ) if article_index else []
+    remaining = analysis_k - len(article_docs)
+    
+    # Python 레벨 필터링 (Chroma DB 필터 대신)
+    if remaining <= 0:
+        docs = article_docs
+    elif target_product_name:
+        docs = search_product_docs(vectorstore, f"{situation_text} {tag_str}", target_product_name, remaining)
+        
+        # 필터링 결과가 없으면 전체 검색 결과 사용
+        if not docs and not article_docs:
+            print(f"⚠️ '{target_product_name}' 상품의 약관을 찾지 못해 전체 약관에서 검색합니다.")
+            if trace is not None:
+                trace["product_not_found"] = True
+            docs = vectorstore.as_retriever(search_kwargs={"k": analysis_k}).invoke(f"{situation_text} {tag_str}")
+        docs = _merge_docs(article_docs, docs)
+    else:
+        retriever = vectorstore.as_retriever(search_kwargs={"k": remaining})
+        docs = _merge_docs(article_docs, retriever.invoke(f"{situation_text} {tag_str}"))
+    
+    if settings["analysis_expand"] == "article":
+        docs = clause_index.expand_articles(vectorstore, docs)
+    
+    if trace is not None:
+        trace["chunk_ids"] = [d.id or d.metadata.get("content_hash", "") for d in docs]
+        trace["retrieval_sec"] = round(time.time() - retrieval_start, 3)
+    
+    def format_docs_with_meta(docs):
+        def meta(d):
+            return d.metadata if settings["analysis_metadata"] == "full" else {"source": d.metadata.get("source", "")}
+        # 조항 전문으로 확장했으면 조항 단위 상한으로 자름 (600자로 자르면 확장한 의미가 없음)
+        limit = settings["analysis_article_chars"] if settings["analysis_expand"] == "article" else settings["analysis_chunk_chars"]
+        return "\n".join([f"<Chunk {i+1}>\n- Metadata: {meta(d)}\n- Content: {preprocess_text(d.page_content)[:limit]}..."
+                          for i, d in enumerate(docs)])
+
+    template = """당신은 보험 소비자의 이익을 최우선으로 하는 객관적인 '보상 분석관'입니다.
+
+아래 제공된 정보를 바탕으로 사용자의 상황을 정밀 분석하세요.
+
+**[전체 목차]** {toc_summary}
+**[약관 증거]** {context}
+**[사용자 정보]** 상황: {situation} / 태그: {tags}
+{product_context}
+
+---
+**[분석 프로토콜]**
+1. **매핑:** 사용자의 상황이 약관의 어느 조항에 해당하는지 찾으십시오.
+2. **증거 발췌:** 해당 조항의 원문 텍스트를 그대로 발췌하십시오.
+3. **한계점 식별:** 이 상품으로 해결되지 않는 한계점을 반드시 1개 이상 찾으십시오.
+4. **점수 산출:** 상황과 약관의 일치도를 0~100점으로 산출.
+
+---
+**[최종 출력 형식 (JSON Only)]**
+{{
+    "product_name": "검증된 상품명",
+    "feature_name": "핵심 특약명",
+    "match_score": 95,
+    "summary": "가정법을 사용한 보장 가능성 요약",
+    "easy_explanation": "초등학생도 이해하는 쉬운 설명",
+    "reasoning": "논리적 분석 내용",
+    "evidence_snippet": "제N조(조항명)\\n① 항 내용...\\n② 항 내용...", 
+    "limitations": "이 상품이 보장하지 않는 아쉬운 점",
+    "checklist": ["확인할 점 1", "확인할 점 2"]
+}}
+"""
+    
+    product_context = f"\n**[분석 대상 상품]** {target_product_name}" if target_product_name else ""
+    
+    variables = {
+        "tags": tag_str,
+        "situation": situation_text,
+        "context": format_docs_with_meta(docs),
+        "toc_summary": current_toc_summary,
+        "product_context": product_context,
+    }
+    return _invoke(llm, "analyze_tags_and_situation", template, variables,
+                   inputs={"tags": tags, "situation_text": situation_text, "target_product_name": target_product_name},
+                   json_mode=True, stream=True)
+
+# ============================================================================
+# 7. 챗봇 응답 생성
+# ============================================================================
+def _chat_analysis_context(analysis_context):
+    """chat_context=summary면 이전 분석 결과 중 상품/요약/근거 필드만 다시 보냄"""
+    if PROMPT_SETTINGS["chat_context"] != "summary" or not analysis_context:
+        return analysis_context
+    try:
+        parsed = structured_output.loads(analysis_context)
+    except ValueError:
+        return analysis_context
+    keep = ("product_name", "feature_name", "summary", "evidence_snippet", "limitations")
+    return json.dumps({k: parsed[k] for k in keep if k in parsed}, ensure_ascii=False)
+
+def generate_chat_response(vectorstore, llm, question, analysis_context, product_name=None, article_index=None):
+    chat_k = PROMPT_SETTINGS["chat_k"]
+    # 질문에 조항 번호가 있으면 해당 조항을 바로 가져오고, 남은 자리만 유사도 검색
+    article_docs = clause_index.get_article_documents(
+        vectorstore, article_index, question, product_name=product_name, limit=chat_k
+    ) if article_index else []
+    relevant_docs = article_docs
+    # 분석 중인 상품 약관에서 정확한 상위 결과 2개를 먼저 확보 (상품별 행렬이 있을 때만)
+    if product_name and hasattr(vectorstore, "search_product") and len(relevant_docs) < chat_k:
+        product_docs = vectorstore.search_product(question, product_name, k=min(2, chat_k - len(relevant_docs))) or []
+        relevant_docs = _merge_docs(relevant_docs, product_docs)
+    if len(relevant_docs) < chat_k:
+        retriever = vectorstore.as_retriever(search_kwargs={"k": chat_k - len(relevant_docs)})
+        relevant_docs = _merge_docs(relevant_docs, retriever.invoke(question))
+    
+    docs_context = "\n\n".join([
+        f"[약관 {i+1}]\n상품: {doc.metadata.get('source', '알 수 없음')}\n"
+        f"내용: {preprocess_text(doc.page_content)[:PROMPT_SETTINGS['chat_chunk_chars']]}..."
+        for i, doc in enumerate(relevant_docs)
+    ])
+    
+    chat_template = """당신은 현대해상 보험 전문 상담 AI입니다.
+
+**[이전 추천 분석 결과]**
+{analysis_context}
+
+**[검색된 관련 약관]**
+{docs_context}
+
+**[사용자 질문]**
+{question}
+
+---
+**[답변 원칙]**
+1. 위 약관 증거에 근거하여 답변하세요.
+2. 약관에 명시되지 않은 내용은 "약관에서 확인되지 않습니다"라고 솔직히 말하세요.
+3. 보장 여부는 가정법을 사용하세요.
+4. 구체적인 조항명이나 특약명을 언급하여 신뢰성을 높이세요.
+5. 친절하고 이해하기 쉽게 설명하세요.
+
+답변:
+"""
+    
+    return _invoke(llm, "generate_chat_response", chat_template,
+                   {"analysis_context": _chat_analysis_context(analysis_context), "docs_context": docs_context,
+                    "question": question},
+                   inputs={"question": question, "analysis_context": analysis_context, "product_name": product_name})
+
+def _normalize_payload(llm, stage, response, schema, context):
+    """LLM 응답을 스키마로 검증해 정규화된 JSON으로 저장 (복구 불가 시 원문 유지 → 화면에서 디버그 표시)
+
+    누락 필드 재질의도 원래 단계의 모델/출력 토큰/타임아웃으로 보냅니다.
+    """
+    try:
+        return structured_output.to_json(
+            structured_output.ensure_structured(_stage_llm(llm, stage), response, schema, context=context)
+        )
+    except structured_output.StructuredOutputError:
+        return response
+
+# ============================================================================
+# 8. 단계별 LLM 작업 (마감 시간 초과 시 백그라운드에서 계속 실행)
+# ============================================================================
+def compute_situations(llm, tags, natural_language_inputs, free_text):
+    response = generate_situations_from_tags(llm, tags, natural_language_inputs, free_text)
+    # 스키마 검증 + 잘린/코드펜스 JSON 복구, 누락 필드만 재질의 (복구 불가 시 예외 → 고정 상황 질문)
+    parsed = structured_output.ensure_structured(
+        _stage_llm(llm, "generate_situations_from_tags"), response, structured_output.SituationsPayload,
+        context="고객 선택 태그 기반 일상 상황 질문 3개 생성"
+    )
+    return parsed.situations
+
+def compute_step25(vectorstore, llm, situation_text, tags, variant):
+    start = time.time()
+    if variant == "fused":
+        fused_response = recommend_keywords_and_products(vectorstore, llm, situation_text, tags)
+        try:
+            fused = structured_output.ensure_structured(
+                _stage_llm(llm, "recommend_keywords_and_products"), fused_response, structured_output.KeywordProductsPayload,
+                context=f"고객 질문의 보험 전문 키워드 변환 + 적합한 상품 2~3개 추천: {situation_text}"
+            )
+            keyword_payload, product_payload = fused.split()
+            keyword_response = structured_output.to_json(keyword_payload)
+            product_response = structured_output.to_json(product_payload)
+        except structured_output.StructuredOutputError:
+            keyword_response = product_response = fused_response
+    else:
+        keyword_response = _normalize_payload(
+            llm, "analyze_situation_to_keywords", analyze_situation_to_keywords(llm, situation_text, tags), structured_output.KeywordsPayload,
+            f"고객 질문을 보험 전문 키워드로 변환: {situation_text}"
+        )
+        product_response = _normalize_payload(
+            llm, "recommend_products_for_situation", recommend_products_for_situation(vectorstore, llm, situation_text, keyword_response),
+            structured_output.ProductsPayload,
+            f"고객 상황에 적합한 보험 상품 2~3개 추천: {situation_text}"
+        )
+    return {
+        "keyword_analysis": keyword_response,
+        "product_recommendations": product_response,
+        "variant": variant,
+        "duration": time.time() - start,
+    }
+
+def compute_analysis(vectorstore, llm, tags, situation_text, product_name, article_index=None):
+    # 특정 상품 약관에서만 검색
+    trace = {}
+    stream = analyze_tags_and_situation(vectorstore, llm, tags, situation_text, target_product_name=product_name,
+                                        trace=trace, article_index=article_index)
+    llm_start = time.time()
+    parser = structured_output.IncrementalJSONParser()
+    try:
+        for chunk in stream:
+            parser.feed(chunk)
+    except Exception as e:
+        # 생성이 중간에 끊겨도 이미 받은 필드는 살리고 누락 필드만 재질의 (전체 재생성 없음)
+        if not parser.close():
+            raise
+        trace["stream_error"] = f"{type(e).__name__}: {e}"
+        print(f"⚠️ [상세 분석] 응답 스트림 중단 → 받은 필드 {len(parser.partial)}개로 복구: {e}")
+    full_res = parser.buffer
+    trace["llm_sec"] = round(time.time() - llm_start, 3)
+    analysis_result = _normalize_payload(
+        llm, "analyze_tags_and_situation", full_res, structured_output.AnalysisPayload,
+        f"상황: {situation_text} / 분석 대상 상품: {product_name}"
+    )
+    return {"analysis_result": analysis_result, "trace": trace}
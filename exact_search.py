@@ -0,0 +1,156 @@
+import os
+import json
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from retrievers import (RetrieverStoreMixin, check_fresh, export_collection, hydrate,
+                        ids_fingerprint, normalize_rows, top_k_indices)
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+EXACT_DIR = "clause_exact"
+PRODUCTS_FILE = "products.json"
+# 후보가 이 개수 이하이면 전수 검색, 초과하면 ANN(HNSW/압축 인덱스)
+EXACT_MAX_CANDIDATES = int(os.getenv("EXACT_MAX_CANDIDATES", "5000"))
+
+# ============================================================================
+# 2. 상품별 행렬 생성
+# ============================================================================
+def build_exact_index(vectorstore, out_dir: str, dtype: str = "float32") -> dict:
+    """source(상품 약관 파일)별로 정규화된 임베딩을 연속 행렬로 저장"""
+    os.makedirs(out_dir, exist_ok=True)
+    data = export_collection(vectorstore)
+    matrix = normalize_rows(data["embeddings"]).astype(dtype)
+
+    groups: Dict[str, List[int]] = {}
+    for row, source in enumerate(data["sources"]):
+        groups.setdefault(source, []).append(row)
+
+    products = {}
+    for i, (source, rows) in enumerate(sorted(groups.items())):
+        file_name = f"product_{i:03d}.npy"
+        np.save(os.path.join(out_dir, file_name), np.ascontiguousarray(matrix[rows]))
+        products[source] = {"file": file_name, "ids": [data["ids"][r] for r in rows]}
+
+    meta = {"dtype": dtype, "dims": int(matrix.shape[1]) if len(matrix) else 0,
+            "fingerprint": ids_fingerprint(data["ids"]), "products": products}
+    with open(os.path.join(out_dir, PRODUCTS_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return meta
+
+def rebuild_exact_index(vectorstore, out_dir: str) -> dict:
+    """기존 행렬과 같은 dtype으로 다시 생성 (증분 적재 후, 사라진 상품의 행렬 파일은 삭제)"""
+    with open(os.path.join(out_dir, PRODUCTS_FILE), "r", encoding="utf-8") as f:
+        old = json.load(f)
+    meta = build_exact_index(vectorstore, out_dir, dtype=old.get("dtype", "float32"))
+    for file_name in {p["file"] for p in old["products"].values()} - {p["file"] for p in meta["products"].values()}:
+        os.remove(os.path.join(out_dir, file_name))
+    return meta
+
+# ============================================================================
+# 3. 상품 범위 전수 검색 저장소
+# ============================================================================
+class ExactProductStore(RetrieverStoreMixin):
+    """상품이 정해진 검색은 memmap 행렬 1회 곱으로 정확한 top-k, 그 외에는 ANN 저장소에 위임"""
+
+    def __init__(self, index_dir: str, ann_store, embedding, max_candidates: int = EXACT_MAX_CANDIDATES,
+                 verify: bool = True, fingerprint: Optional[str] = None):
+        """verify: 현재 컬렉션과 다르면 StaleIndexError (fingerprint: 호출부가 이미 계산한 현재 컬렉션 지문)"""
+        with open(os.path.join(index_dir, PRODUCTS_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if verify:
+            built = meta.get("fingerprint") or ids_fingerprint([cid for p in meta["products"].values() for cid in p["ids"]])
+            check_fresh(built, ann_store, fingerprint, "상품별 전수 검색 행렬")
+        self.index_dir = index_dir
+        self.products = meta["products"]
+        self.ann_store = ann_store
+        self.docstore = ann_store
+        self.embedding = embedding
+        self.max_candidates = max_candidates
+        self._matrices = {}
+
+    def _matrix(self, source: str) -> np.ndarray:
+        if source not in self._matrices:
+            path = os.path.join(self.index_dir, self.products[source]["file"])
+            self._matrices[source] = np.load(path, mmap_mode="r")
+        return self._matrices[source]
+
+    def resolve_sources(self, product_name: str) -> List[str]:
+        """상품명 부분 일치로 대상 약관 파일(source) 목록 반환 (app.py 필터 규칙과 동일)"""
+        if product_name in self.products:
+            return [product_name]
+        return [source for source in self.products if product_name and product_name in source]
+
+    def candidate_count(self, sources: List[str]) -> int:
+        return sum(len(self.products[s]["ids"]) for s in sources)
+
+    def exact_search(self, query_vector: np.ndarray, sources: List[str], k: int) -> Tuple[List[str], List[float]]:
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32)[None, :])[0]
+        ids, scores = [], []
+        for source in sources:
+            matrix = self._matrix(source)
+            ids.extend(self.products[source]["ids"])
+            # float16 저장분도 float32로 올려 계산 (상품당 수백 행이라 변환 비용은 무시 가능)
+            scores.append(np.asarray(matrix, dtype=np.float32) @ query)
+        if not ids:
+            return [], []
+        scores = np.concatenate(scores)
+        order = top_k_indices(scores, k)
+        return [ids[i] for i in order], scores[order].tolist()
+
+    def search_product(self, query: str, product_name: str, k: int = 8) -> Optional[list]:
+        """상품 범위 검색: 후보가 적으면 전수 검색, 많으면 ANN + source 필터 (상품을 모르면 None)"""
+        if not self.resolve_sources(product_name):
+            return None
+        return self.search_product_by_vector(self.embedding.embed_query(query), product_name, k=k)
+
+    def search_product_by_vector(self, embedding, product_name: str, k: int = 8) -> Optional[list]:
+        sources = self.resolve_sources(product_name)
+        if not sources:
+            return None
+        if self.candidate_count(sources) > self.max_candidates:
+            source_filter = {"source": sources[0]} if len(sources) == 1 else {"source": {"$in": sources}}
+            return [doc for doc, _ in self._ann_search_by_vector(embedding, k, source_filter)]
+        ids, scores = self.exact_search(embedding, sources, k)
+        return [doc for doc, _ in hydrate(self.docstore, ids, scores)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None):
+        source = (filter or {}).get("source")
+        if isinstance(source, str) and source in self.products and len(self.products[source]["ids"]) <= self.max_candidates:
+            ids, scores = self.exact_search(self.embedding.embed_query(query), [source], k)
+            return [doc for doc, _ in hydrate(self.docstore, ids, scores)]
+        return self.ann_store.similarity_search(query, k=k, filter=filter)
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: Optional[dict] = None):
+        source = (filter or {}).get("source")
+        if isinstance(source, str) and source in self.products and len(self.products[source]["ids"]) <= self.max_candidates:
+            ids, scores = self.exact_search(embedding, [source], k)
+            return hydrate(self.docstore, ids, scores)
+        return self._ann_search_by_vector(embedding, k, filter)
+
+    def _ann_search_by_vector(self, embedding, k: int, filter: Optional[dict]):
+        if hasattr(self.ann_store, "similarity_search_by_vector_with_score"):
+            return self.ann_store.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)
+        return self.ann_store.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter)
+
+# ============================================================================
+# 4. CLI
+# ============================================================================
+if __name__ == "__main__":
+    import argparse
+    from langchain_chroma import Chroma
+
+    parser = argparse.ArgumentParser(description="상품별 전수 검색용 임베딩 행렬 생성")
+    parser.add_argument("--persist-dir", default="./chroma_db_clause")
+    parser.add_argument("--collection", default="insurance_rag")
+    parser.add_argument("--out", default=None, help=f"기본값: DB 폴더 옆 {EXACT_DIR}/")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    args = parser.parse_args()
+
+    out_dir = args.out or os.path.join(os.path.dirname(os.path.abspath(args.persist_dir)), EXACT_DIR)
+    chroma = Chroma(persist_directory=args.persist_dir, collection_name=args.collection)
+    built = build_exact_index(chroma, out_dir, dtype=args.dtype)
+    sizes = [len(p["ids"]) for p in built["products"].values()]
+    print(f"✅ 상품별 행렬 생성 완료: 상품 {len(sizes)}개, 상품당 최대 {max(sizes, default=0)}개 청크 ({args.dtype}) → {out_dir}")
@@ -0,0 +1,106 @@
+import os
+import re
+import ast
+import sys
+import json
+import subprocess
+from typing import Dict, List, Optional
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+# 워커 기동 시 import 누적 시간 예산 (초과 시 CLI가 실패 코드로 종료)
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "3000"))
+# 기동 시 import되면 안 되는 무거운 모듈 (첫 사용 시점에 함수 안에서 import)
+HEAVY_MODULES = (
+    "torch", "transformers", "sentence_transformers", "langchain_huggingface", "langchain_chroma", "chromadb",
+    "langchain_google_genai", "pandas", "gspread", "google.oauth2", "gdown",
+)
+ENTRYPOINT = "app.py"
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+# ============================================================================
+# 2. 기동 import 목록 (스크립트를 실행하지 않고 최상위 import 문만 추출)
+# ============================================================================
+def startup_imports(path: str = ENTRYPOINT) -> str:
+    """엔트리포인트의 모듈 최상위 import 문 (함수 안의 지연 import는 제외)"""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+# ============================================================================
+# 3. -X importtime 측정 / 분석
+# ============================================================================
+def measure(code: str, cwd: Optional[str] = None) -> List[dict]:
+    """새 인터프리터에서 import 실행 → 모듈별 self/누적 시간(ms)과 중첩 깊이"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=cwd, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append({
+                "module": module,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": (len(indent) - 1) // 2,
+            })
+    if proc.returncode != 0:
+        last_line = (proc.stderr.strip().splitlines() or [f"종료 코드 {proc.returncode}"])[-1]
+        raise RuntimeError(f"import 실패: {last_line}")
+    return rows
+
+def heavy_imports(rows: List[dict], heavy=HEAVY_MODULES) -> List[str]:
+    return sorted({row["module"] for row in rows
+                   if any(row["module"] == name or row["module"].startswith(f"{name}.") for name in heavy)})
+
+def report(rows: List[dict], budget_ms: float = IMPORT_BUDGET_MS, top: int = 15) -> Dict:
+    """최상위 import 합계 + 누적 시간 상위 모듈 + 예산/금지 모듈 위반 여부"""
+    total_ms = sum(row["cumulative_ms"] for row in rows if row["depth"] == 0)
+    heavy = heavy_imports(rows)
+    return {
+        "total_ms": round(total_ms, 1),
+        "budget_ms": budget_ms,
+        "modules": len(rows),
+        "top": sorted(({k: row[k] for k in ("module", "self_ms", "cumulative_ms")} for row in rows),
+                      key=lambda r: -r["cumulative_ms"])[:top],
+        "heavy_imports": heavy,
+        "ok": total_ms <= budget_ms and not heavy,
+    }
+
+def check(path: str = ENTRYPOINT, budget_ms: float = IMPORT_BUDGET_MS, top: int = 15) -> Dict:
+    code = startup_imports(path)
+    return report(measure(code, cwd=os.path.dirname(os.path.abspath(path))), budget_ms=budget_ms, top=top)
+
+def check_modules(modules: List[str], budget_ms: float = IMPORT_BUDGET_MS, top: int = 15, cwd: Optional[str] = None) -> Dict:
+    """엔트리포인트 대신 지정한 모듈 목록의 import 측정 (streamlit 없는 CI에서 serving/engine 등만 검사)"""
+    code = "\n".join(f"import {module}" for module in modules)
+    return report(measure(code, cwd=cwd or os.path.dirname(os.path.abspath(__file__))), budget_ms=budget_ms, top=top)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="워커 기동 import 시간 측정 (예산 초과/무거운 모듈 import 시 종료 코드 1)")
+    parser.add_argument("--entrypoint", default=ENTRYPOINT)
+    parser.add_argument("--modules", default=None, help="엔트리포인트 대신 측정할 모듈 (쉼표 구분, 예: serving,engine)")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.modules:
+        result = check_modules([m.strip() for m in args.modules.split(",") if m.strip()], budget_ms=args.budget_ms, top=args.top)
+    else:
+        result = check(args.entrypoint, budget_ms=args.budget_ms, top=args.top)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'module':<48}{'self_ms':>10}{'cumul_ms':>10}")
+        for row in result["top"]:
+            print(f"{row['module']:<48}{row['self_ms']:>10.1f}{row['cumulative_ms']:>10.1f}")
+        print(f"\n⏱️ 기동 import 합계: {result['total_ms']}ms / 예산 {result['budget_ms']:.0f}ms ({result['modules']}개 모듈)")
+        if result["heavy_imports"]:
+            print(f"❌ 기동 시 무거운 모듈 import: {', '.join(result['heavy_imports'])}")
+    sys.exit(0 if result["ok"] else 1)
@@ -0,0 +1,418 @@
+import os
+import re
+import json
+import math
+import time
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+from multiprocessing import get_context
+from typing import Dict, List, Optional, Tuple
+
+from clause_index import ARTICLE_HEADING_PATTERN, article_key
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+MODEL_NAME = "BAAI/bge-m3"
+DEVICE = "cpu"
+CLAUSE_COLLECTION = "insurance_rag"
+CATALOG_COLLECTION = "insurance_catalog"
+STATE_FILE = "ingest_state.json"
+DOC_EXTENSIONS = (".txt", ".md")
+
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 100
+# 조항 단위 청크: 임베딩 모델 토큰 기준 최대 크기 (넘는 조항만 항 → 호 → 글자 단위로 분할)
+ARTICLE_MAX_TOKENS = 512
+# 항(①~⑳) / 호("1." "1)") 시작 줄
+PARAGRAPH_PATTERN = re.compile(r'^[ \t]*[\u2460-\u2473]', re.MULTILINE)
+# 목차 항목의 제목 뒤 (점선 + 쪽 번호)
+TOC_LEADER_PATTERN = re.compile(r'^[\s.·…ㆍ\-]*\d*[\s.·…ㆍ\-]*$')
+ITEM_PATTERN = re.compile(r'^[ \t]*\d{1,2}[ \t]*[.)][ \t]', re.MULTILINE)
+EMBED_BATCH_SIZE = 32
+UPSERT_BATCH_SIZE = 1000
+
+# ============================================================================
+# 2. 문서 로드 및 청크 분할
+# ============================================================================
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_id(source: str, text: str) -> str:
+    """청크 ID = (상품 파일명, 본문) 내용 해시 → 같은 내용은 항상 같은 ID"""
+    return sha256_text(f"{source}\n{text}")[:32]
+
+def load_documents(doc_dir: str) -> Dict[str, str]:
+    """약관 폴더의 문서를 {파일명(source): 본문}으로 로드"""
+    docs = {}
+    for name in sorted(os.listdir(doc_dir)):
+        if name.endswith(DOC_EXTENSIONS):
+            with open(os.path.join(doc_dir, name), "r", encoding="utf-8") as f:
+                docs[name] = f.read()
+    return docs
+
+def recursive_chunker(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[Tuple[str, dict]]:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return [(chunk, {}) for chunk in splitter.split_text(text)]
+
+@lru_cache(maxsize=1)
+def _tokenizer():
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(MODEL_NAME)
+    except Exception as e:
+        print(f"⚠️ 토크나이저 로드 실패 ({e}) → 글자 수 기반 근사치 사용")
+        return None
+
+def count_tokens(text: str) -> int:
+    """임베딩 모델 토큰 수 (토크나이저가 없으면 한글 약 1.5자당 1토큰 근사)"""
+    tokenizer = _tokenizer()
+    if tokenizer is None:
+        return math.ceil(len(text) / 1.5)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+def split_articles(text: str) -> List[Tuple[Optional[re.Match], str]]:
+    """문서를 조항 블록으로 분할 → [(제목 매치 또는 None(머리말/목차), 블록 본문)]"""
+    boundaries = []
+    matches = list(ARTICLE_HEADING_PATTERN.finditer(text))
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        line_end = text.find("\n", m.end(), end)
+        line_end = end if line_end == -1 else line_end
+        # 제목 줄 나머지(점선/쪽 번호만 있으면 본문 아님)와 다음 줄부터 본문이 모두 없으면 목차 항목 → 앞 블록에 포함
+        same_line = not TOC_LEADER_PATTERN.match(text[m.end():line_end])
+        if same_line or text[line_end:end].strip():
+            boundaries.append(m)
+    blocks = []
+    if not boundaries or boundaries[0].start() > 0:
+        blocks.append((None, text[:boundaries[0].start()] if boundaries else text))
+    for i, m in enumerate(boundaries):
+        end = boundaries[i + 1].start() if i + 1 < len(boundaries) else len(text)
+        blocks.append((m, text[m.start():end]))
+    return [(m, block.strip()) for m, block in blocks if block.strip()]
+
+def _split_on(pattern: re.Pattern, text: str) -> List[str]:
+    starts = [m.start() for m in pattern.finditer(text)]
+    if not starts:
+        return [text]
+    starts = ([0] if starts[0] > 0 else []) + starts
+    return [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)]) if text[a:b].strip()]
+
+def _units(body: str, max_tokens: int) -> List[str]:
+    """조항 본문을 항 → 호 → 글자 단위 순으로 max_tokens 이하 조각으로 분할"""
+    units = []
+    for paragraph in _split_on(PARAGRAPH_PATTERN, body):
+        if count_tokens(paragraph) <= max_tokens:
+            units.append(paragraph)
+            continue
+        for item in _split_on(ITEM_PATTERN, paragraph):
+            if count_tokens(item) <= max_tokens:
+                units.append(item)
+                continue
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            splitter = RecursiveCharacterTextSplitter(chunk_size=max_tokens, chunk_overlap=0, length_function=count_tokens)
+            units.extend(splitter.split_text(item))
+    return units
+
+def article_chunker(text: str, max_tokens: int = ARTICLE_MAX_TOKENS) -> List[Tuple[str, dict]]:
+    """조(제N조) 경계로 나누고, max_tokens를 넘는 조항만 항/호 경계로 나눔
+
+    나뉜 조각마다 조항 제목 줄을 앞에 붙여 단독으로도 읽히게 하고,
+    부모 조항(parent_article: 조항 원문 해시)과 조각 순번(article_part/article_parts)을 기록합니다.
+    """
+    chunks = []
+    for seq, (m, block) in enumerate(split_articles(text)):
+        if m is None:
+            if count_tokens(block) <= max_tokens:
+                chunks.append((block, {}))
+            else:
+                chunks.extend(recursive_chunker(block, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP))
+            continue
+        meta = {
+            "article_no": article_key(m.group(1), m.group(2)),
+            "article_title": m.group(3).strip(),
+            "article_seq": seq,
+            "parent_article": sha256_text(block)[:32],
+        }
+        if count_tokens(block) <= max_tokens:
+            chunks.append((block, {**meta, "article_part": 1, "article_parts": 1}))
+            continue
+        # 조항 제목("제N조(제목)")만 조각마다 반복 (제목 줄에 이어진 본문은 첫 조각 본문으로)
+        heading = m.group(0).strip()
+        body = block[len(heading):]
+        budget = max(max_tokens - count_tokens(heading) - 1, max_tokens // 2)
+        parts, current = [], ""
+        for unit in _units(body, budget):
+            if current and count_tokens(current + unit) > budget:
+                parts.append(current)
+                current = ""
+            current += unit
+        if current.strip():
+            parts.append(current)
+        for part_no, part in enumerate(parts, start=1):
+            chunks.append((f"{heading}\n{part.strip()}", {**meta, "article_part": part_no, "article_parts": len(parts)}))
+    return chunks
+
+CHUNKERS = {
+    "recursive": recursive_chunker,
+    "article": article_chunker,
+}
+
+def document_hash(text: str, chunker: str = "recursive") -> str:
+    """문서 상태 해시 (청크 방식이 바뀌면 내용이 같아도 다시 분할되도록 청크 방식 포함, 기본 방식은 기존 해시 유지)"""
+    return sha256_text(text) if chunker == "recursive" else sha256_text(f"{chunker}\n{text}")
+
+def chunk_document(source: str, text: str, chunker: str = "recursive") -> List[dict]:
+    """문서를 청크로 나누고 내용 해시 ID와 메타데이터 부여"""
+    chunks = []
+    for i, (chunk, extra_meta) in enumerate(CHUNKERS[chunker](text)):
+        cid = chunk_id(source, chunk)
+        meta = {"source": source, "chunk_index": i, "content_hash": cid}
+        meta.update(extra_meta)
+        if "parent_article" in meta:
+            # 다른 상품의 같은 조항 원문과 섞이지 않도록 상품 파일명 포함
+            meta["parent_article"] = chunk_id(source, meta["parent_article"])
+        chunks.append({"id": cid, "text": chunk, "metadata": meta})
+    return chunks
+
+# ============================================================================
+# 3. 임베딩 (멀티프로세스 풀)
+# ============================================================================
+_worker_embeddings = None
+
+def _init_worker(model_name: str, device: str, workers: int = 1):
+    """프로세스마다 모델 1벌 로드 (bge-m3 약 2GB), torch 스레드는 코어 수 / 작업자 수로 제한해 과다 할당 방지"""
+    global _worker_embeddings
+    import torch
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // max(1, workers)))
+    from langchain_huggingface import HuggingFaceEmbeddings
+    _worker_embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': device},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+def embed_texts(texts: List[str], workers: int = 1, batch_size: int = EMBED_BATCH_SIZE,
+                model_name: str = MODEL_NAME, device: str = DEVICE) -> List[List[float]]:
+    """배치 단위 임베딩 (workers > 1이면 프로세스 풀에 분산, 입력 순서 유지)"""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if not batches:
+        return []
+    if workers <= 1:
+        _init_worker(model_name, device)
+        results = [_embed_batch(b) for b in batches]
+    else:
+        with get_context("spawn").Pool(workers, initializer=_init_worker, initargs=(model_name, device, workers)) as pool:
+            results = pool.map(_embed_batch, batches)
+    return [vec for batch in results for vec in batch]
+
+# ============================================================================
+# 4. 증분 반영 (내용 해시 비교 → upsert / delete)
+# ============================================================================
+def load_state(persist_dir: str, collection_name: str) -> dict:
+    path = os.path.join(persist_dir, STATE_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get(collection_name, {})
+    return {}
+
+def save_state(persist_dir: str, collection_name: str, doc_hashes: dict):
+    path = os.path.join(persist_dir, STATE_FILE)
+    all_state = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            all_state = json.load(f)
+    all_state[collection_name] = doc_hashes
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(all_state, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def existing_ids_for_source(collection, source: str) -> set:
+    return set(collection.get(where={"source": source}, include=[]).get("ids", []))
+
+def ingest(doc_dir: str, persist_dir: str, collection_name: str = CLAUSE_COLLECTION,
+           workers: int = 1, batch_size: int = EMBED_BATCH_SIZE, chunker: str = "recursive",
+           prune: bool = False, force: bool = False, dry_run: bool = False) -> dict:
+    """변경된 문서만 청크 분할 → 새 해시만 임베딩 → upsert, 사라진 청크는 delete"""
+    import chromadb
+
+    start_total = time.perf_counter()
+    os.makedirs(persist_dir, exist_ok=True)
+    collection = chromadb.PersistentClient(path=persist_dir).get_or_create_collection(collection_name)
+
+    docs = load_documents(doc_dir)
+    stored_hashes = load_state(persist_dir, collection_name)
+    prev_hashes = {} if force else stored_hashes
+    doc_hashes = {source: document_hash(text, chunker) for source, text in docs.items()}
+    changed = [s for s in docs if prev_hashes.get(s) != doc_hashes[s]]
+    removed = [s for s in stored_hashes if s not in docs] if prune else []
+
+    new_chunks, stale_ids, kept = [], [], 0
+    for source in changed:
+        chunks = chunk_document(source, docs[source], chunker)
+        current_ids = {c["id"] for c in chunks}
+        existing = existing_ids_for_source(collection, source)
+        new_chunks.extend(c for c in chunks if c["id"] not in existing)
+        stale_ids.extend(existing - current_ids)
+        kept += len(current_ids & existing)
+    for source in removed:
+        stale_ids.extend(existing_ids_for_source(collection, source))
+
+    # 같은 내용 해시가 여러 번 나오면 한 번만 임베딩
+    unique_chunks = list({c["id"]: c for c in new_chunks}.values())
+
+    report = {
+        "documents": len(docs),
+        "changed_documents": len(changed),
+        "removed_documents": len(removed),
+        "new_chunks": len(unique_chunks),
+        "unchanged_chunks": kept,
+        "deleted_chunks": len(stale_ids),
+        "changed_sources": changed,
+        "removed_sources": removed,
+    }
+    if dry_run:
+        return report
+
+    embed_start = time.perf_counter()
+    vectors = embed_texts([c["text"] for c in unique_chunks], workers=workers, batch_size=batch_size)
+    embed_sec = time.perf_counter() - embed_start
+
+    for i in range(0, len(unique_chunks), UPSERT_BATCH_SIZE):
+        batch = unique_chunks[i:i + UPSERT_BATCH_SIZE]
+        collection.upsert(
+            ids=[c["id"] for c in batch],
+            embeddings=vectors[i:i + UPSERT_BATCH_SIZE],
+            documents=[c["text"] for c in batch],
+            metadatas=[c["metadata"] for c in batch],
+        )
+    for i in range(0, len(stale_ids), UPSERT_BATCH_SIZE):
+        collection.delete(ids=stale_ids[i:i + UPSERT_BATCH_SIZE])
+
+    kept_hashes = {s: h for s, h in stored_hashes.items() if s not in removed}
+    kept_hashes.update({s: doc_hashes[s] for s in changed})
+    save_state(persist_dir, collection_name, kept_hashes)
+
+    total_sec = time.perf_counter() - start_total
+    report.update({
+        "embed_sec": round(embed_sec, 2),
+        "total_sec": round(total_sec, 2),
+        "embed_chunks_per_sec": round(len(unique_chunks) / embed_sec, 1) if embed_sec > 0 else 0.0,
+        "finished_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    return report
+
+# ============================================================================
+# 5. 파생 인덱스 / 카탈로그 태그 (적재 후 컬렉션과 어긋나지 않도록)
+# ============================================================================
+DERIVED_ACTIONS = ("rebuild", "invalidate", "warn")
+CATALOG_TAGS_FILE = "catalog_tags.json"
+
+def refresh_derived_indexes(store, persist_dir: str, action: str = "rebuild") -> Dict[str, str]:
+    """약관 DB 옆 압축 인덱스/상품별 전수 검색 행렬을 다시 생성(rebuild), 삭제(invalidate) 또는 경고만(warn)
+
+    warn이어도 앱은 지문이 다른 인덱스를 거부하고 HNSW 검색으로 대체합니다.
+    """
+    import shutil
+    import compact_index
+    import exact_search
+
+    base_dir = os.path.dirname(os.path.abspath(persist_dir))
+    derived = [
+        (compact_index.COMPACT_DIR, lambda out_dir: compact_index.rebuild_compact_index(store, out_dir)),
+        (exact_search.EXACT_DIR, lambda out_dir: exact_search.rebuild_exact_index(store, out_dir)),
+    ]
+    results = {}
+    for name, rebuild in derived:
+        out_dir = os.path.join(base_dir, name)
+        if not os.path.isdir(out_dir):
+            continue
+        if action == "rebuild":
+            rebuild(out_dir)
+            results[name] = "rebuilt"
+        elif action == "invalidate":
+            shutil.rmtree(out_dir)
+            results[name] = "removed"
+        else:
+            results[name] = "stale"
+    return results
+
+def _compact_name(name: str) -> str:
+    for token in (".txt", ".md", "표준_", "카탈로그", "상품설명서"):
+        name = name.replace(token, "")
+    return re.sub(r"\s+", "", name)
+
+def catalog_tags_gaps(sources: List[str], catalog_file: str = CATALOG_TAGS_FILE) -> List[str]:
+    """catalog_tags.json에 대응하는 상품 태그가 없는 카탈로그 문서 (태그 파일은 자동 재생성되지 않음)"""
+    if not os.path.exists(catalog_file):
+        return list(sources)
+    with open(catalog_file, "r", encoding="utf-8") as f:
+        products = [_compact_name(name) for name in json.load(f).get("product_tags", {})]
+    gaps = []
+    for source in sources:
+        key = _compact_name(os.path.basename(source))
+        if not any(key and (name in key or key in name) for name in products):
+            gaps.append(source)
+    return gaps
+
+# ============================================================================
+# 6. CLI
+# ============================================================================
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="약관/카탈로그 문서 증분 적재 (내용 해시 기반)")
+    parser.add_argument("doc_dir", help="약관 문서 폴더 (.txt/.md, 파일명이 source 메타데이터가 됨)")
+    parser.add_argument("--persist-dir", default="./chroma_db_clause")
+    parser.add_argument("--collection", default=CLAUSE_COLLECTION)
+    # 작업자마다 모델을 따로 올리므로(약 2GB) 기본 1, 메모리가 충분할 때만 늘릴 것
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--chunker", choices=sorted(CHUNKERS), default="recursive",
+                        help="article: 조/항/호 경계 분할 (기존 DB에 지정하면 전체 문서를 다시 분할해 교체)")
+    parser.add_argument("--prune", action="store_true", help="폴더에서 사라진 문서의 청크 삭제")
+    parser.add_argument("--force", action="store_true", help="문서 해시 상태를 무시하고 전체 재검사")
+    parser.add_argument("--dry-run", action="store_true", help="변경 내역만 출력")
+    parser.add_argument("--derived", choices=DERIVED_ACTIONS, default="rebuild",
+                        help="약관 변경 시 압축 인덱스/상품별 행렬: rebuild(다시 생성) | invalidate(삭제) | warn(경고만)")
+    args = parser.parse_args()
+
+    result = ingest(
+        args.doc_dir, args.persist_dir, args.collection,
+        workers=args.workers, batch_size=args.batch_size, chunker=args.chunker,
+        prune=args.prune, force=args.force, dry_run=args.dry_run
+    )
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    changed_collection = result["new_chunks"] or result["deleted_chunks"]
+    # 약관 컬렉션이면 조항 번호 인덱스와 파생 검색 인덱스도 갱신
+    if args.collection == CLAUSE_COLLECTION and not args.dry_run:
+        import clause_index
+        from langchain_chroma import Chroma
+        store = Chroma(persist_directory=args.persist_dir, collection_name=args.collection)
+        index_path = os.path.join(os.path.dirname(os.path.abspath(args.persist_dir)), clause_index.ARTICLE_INDEX_FILE)
+        clause_index.save_article_index(clause_index.build_article_index(store), index_path)
+        print(f"✅ 조항 인덱스 갱신: {index_path}")
+        if changed_collection:
+            for name, status in refresh_derived_indexes(store, args.persist_dir, args.derived).items():
+                if status == "stale":
+                    print(f"⚠️ {name}: 컬렉션과 달라져 앱이 사용하지 않습니다 → 다시 생성하세요")
+                else:
+                    print(f"✅ {name}: {'다시 생성' if status == 'rebuilt' else '삭제'}")
+
+    # 카탈로그 컬렉션이면 상품 태그(catalog_tags.json) 확인 (자동 재생성 없음)
+    if args.collection != CLAUSE_COLLECTION and (result["changed_sources"] or result["removed_sources"]):
+        print("⚠️ catalog_tags.json은 자동으로 다시 만들어지지 않습니다. 아래 문서의 상품 태그를 확인하세요.")
+        gaps = set(catalog_tags_gaps(result["changed_sources"]))
+        for source in result["changed_sources"]:
+            print(f"   - {source}{' (태그 없음)' if source in gaps else ' (변경됨)'}")
+        for source in result["removed_sources"]:
+            print(f"   - {source} (삭제됨 → 태그 제거 필요)")
+
+    if "embed_chunks_per_sec" in result:
+        print(f"✅ 적재 완료: 신규 {result['new_chunks']}개 / 삭제 {result['deleted_chunks']}개, {result['embed_chunks_per_sec']} chunks/s")
@@ -0,0 +1,425 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+DEFAULT_TIMEOUT = 60.0
+STAGE_TIMEOUTS = {
+    "generate_situations_from_tags": 20.0,
+    "analyze_situation_to_keywords": 20.0,
+    "recommend_products_for_situation": 30.0,
+    "recommend_keywords_and_products": 35.0,
+    "analyze_tags_and_situation": 60.0,
+    "generate_chat_response": 40.0,
+}
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+RATE_PER_SEC = float(os.getenv("LLM_RATE_PER_SEC", "4"))
+RATE_BURST = int(os.getenv("LLM_RATE_BURST", "8"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "0") == "1"
+HEDGE_MIN_SAMPLES = 20
+# 연속 실패(재시도 가능 오류/타임아웃) N회 → 일정 시간 호출 차단 후 1건만 시험 호출
+BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN_SEC", "30"))
+LATENCY_WINDOW = 200
+
+# 재시도 대상 HTTP 상태 코드 (요청 시간 초과, 속도/할당량 제한, 서버 오류)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# google.api_core.exceptions 중 재시도 대상 (설치되어 있을 때만 사용)
+RETRYABLE_GOOGLE_ERRORS = ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+                           "BadGateway", "GatewayTimeout", "DeadlineExceeded")
+
+class LLMGatewayError(RuntimeError):
+    pass
+
+class LLMTimeoutError(LLMGatewayError, TimeoutError):
+    pass
+
+class LLMRateLimitedError(LLMGatewayError):
+    pass
+
+class LLMCircuitOpenError(LLMGatewayError):
+    pass
+
+@lru_cache(maxsize=1)
+def _google_retryable_types() -> tuple:
+    try:
+        from google.api_core import exceptions as google_exceptions
+    except ImportError:
+        return ()
+    return tuple(getattr(google_exceptions, name) for name in RETRYABLE_GOOGLE_ERRORS if hasattr(google_exceptions, name))
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """예외의 HTTP 상태 코드 (google.api_core/google.genai의 code, httpx/requests의 response.status_code)"""
+    for value in (getattr(exc, "code", None), getattr(exc, "status_code", None),
+                  getattr(getattr(exc, "response", None), "status_code", None)):
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    return None
+
+def is_retryable(exc: Exception) -> bool:
+    """예외 타입/상태 코드로 판단 (메시지 문자열은 보지 않음), LangChain이 감싼 원인 예외까지 확인"""
+    google_types = _google_retryable_types()
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (TimeoutError, ConnectionError)) or (google_types and isinstance(exc, google_types)):
+            return True
+        code = status_code(exc)
+        if code is not None:
+            return code in RETRYABLE_STATUS
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+# ============================================================================
+# 2. 토큰 버킷 / 단계별 지표
+# ============================================================================
+class TokenBucket:
+    """초당 rate개 토큰 충전, 최대 capacity개까지 버스트 허용"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_sec = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait_sec > deadline:
+                return False
+            time.sleep(wait_sec)
+
+class CircuitBreaker:
+    """closed → (연속 실패 threshold회) open → (cooldown 경과) half-open: 시험 호출 1건 성공 시 closed"""
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        with self.lock:
+            return self.opened_at is not None and (self.probing or time.monotonic() - self.opened_at < self.cooldown)
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def release(self):
+        """시험 호출이 LLM까지 가지 못한 경우(속도 제한 등) 다음 호출이 다시 시험하도록"""
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+class StageMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.rate_limited = 0
+        self.circuit_rejected = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        # 여러 세션 스레드가 같은 단계 지표를 갱신하므로 카운터 증가/지연 기록은 잠금 안에서
+        self.lock = threading.Lock()
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def record_latency(self, seconds: float):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def sample_count(self) -> int:
+        with self.lock:
+            return len(self.latencies)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self.lock:
+            return _percentile(sorted(self.latencies), q)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            ordered = sorted(self.latencies)
+            return {
+                "calls": self.calls,
+                "successes": self.successes,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "rate_limited": self.rate_limited,
+                "circuit_rejected": self.circuit_rejected,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "p50_sec": _percentile(ordered, 0.5),
+                "p95_sec": _percentile(ordered, 0.95),
+            }
+
+def _percentile(ordered: list, q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+# ============================================================================
+# 3. 게이트웨이
+# ============================================================================
+class LLMGateway:
+    """LLM 호출 공통 관문: 동시성 제한, 속도 제한, 단계별 타임아웃, 지터 백오프 재시도, 헤지 요청"""
+
+    def __init__(self, llm, stage_timeouts: Optional[Dict[str, float]] = None, default_timeout: float = DEFAULT_TIMEOUT,
+                 max_concurrency: int = MAX_CONCURRENCY, rate_per_sec: float = RATE_PER_SEC, burst: int = RATE_BURST,
+                 max_retries: int = MAX_RETRIES, hedge: bool = HEDGE_ENABLED,
+                 stage_llms: Optional[dict] = None, on_complete: Optional[Callable] = None,
+                 breaker_threshold: int = BREAKER_THRESHOLD, breaker_cooldown: float = BREAKER_COOLDOWN):
+        self.llm = llm
+        # 단계별 모델 (없으면 기본 llm) / 호출 완료 콜백(stage, 지연 시간, usage_metadata)
+        self.stage_llms = dict(stage_llms or {})
+        self.on_complete = on_complete
+        self.stage_timeouts = dict(STAGE_TIMEOUTS, **(stage_timeouts or {}))
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.bucket = TokenBucket(rate_per_sec, burst)
+        # 타임아웃으로 포기한 호출도 끝날 때까지 스레드를 점유하므로 여유 있게
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix="llm")
+        self._metrics: Dict[str, StageMetrics] = {}
+        self._metrics_lock = threading.Lock()
+        self._json_llms = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    # --- 지표 ---
+    def _stage_metrics(self, stage: str) -> StageMetrics:
+        with self._metrics_lock:
+            return self._metrics.setdefault(stage, StageMetrics())
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            return {stage: m.snapshot() for stage, m in self._metrics.items()}
+
+    def _breaker(self, stage: str) -> CircuitBreaker:
+        with self._metrics_lock:
+            return self._breakers.setdefault(stage, CircuitBreaker(self.breaker_threshold, self.breaker_cooldown))
+
+    def circuit_open(self, stage: str) -> bool:
+        """해당 단계가 차단 중이면 True (호출부가 LLM 대신 규칙 기반 결과를 바로 쓰도록)"""
+        return self._breaker(stage).is_open()
+
+    # --- 호출 ---
+    def _target(self, stage: str, json_mode: bool):
+        llm = self.stage_llms.get(stage, self.llm)
+        if not json_mode:
+            return llm
+        if id(llm) not in self._json_llms:
+            import structured_output
+            self._json_llms[id(llm)] = structured_output.with_json_mode(llm)
+        return self._json_llms[id(llm)]
+
+    def _call(self, target, prompt):
+        with self.semaphore:
+            return target.invoke(prompt)
+
+    def _attempt(self, target, prompt, timeout: float, metrics: StageMetrics):
+        """1회 시도 (헤지 사용 시 p95 경과 후 두 번째 요청을 보내 먼저 끝난 쪽 사용)"""
+        deadline = time.monotonic() + timeout
+        primary = self.executor.submit(self._call, target, prompt)
+        futures = [primary]
+
+        hedge_after = metrics.percentile(0.95) if self.hedge and metrics.sample_count() >= HEDGE_MIN_SAMPLES else None
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done and self.bucket.acquire(timeout=0):
+                metrics.add(hedges=1)
+                futures.append(self.executor.submit(self._call, target, prompt))
+
+        last_error = None
+        while futures:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                futures.remove(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if future is not primary:
+                    metrics.add(hedge_wins=1)
+                return result
+        if last_error is not None and not futures:
+            raise last_error
+        # 남은 단계 시간 예산을 모두 씀 (invoke가 단계 제한 시간을 담은 오류로 다시 보고)
+        raise LLMTimeoutError("LLM 응답 시간 초과")
+
+    def invoke(self, prompt, stage: str = "default", json_mode: bool = False):
+        metrics = self._stage_metrics(stage)
+        breaker = self._breaker(stage)
+        if not breaker.allow():
+            metrics.add(circuit_rejected=1)
+            raise LLMCircuitOpenError(f"LLM 장애 감지로 호출을 잠시 차단했습니다 ({stage}).")
+        timeout = self.stage_timeouts.get(stage, self.default_timeout)
+        target = self._target(stage, json_mode)
+        metrics.add(calls=1)
+        start = time.monotonic()
+
+        for attempt in range(self.max_retries + 1):
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            if not self.bucket.acquire(timeout=remaining):
+                metrics.add(rate_limited=1)
+                breaker.release()
+                raise LLMRateLimitedError("요청이 많아 LLM 호출을 보류했습니다.")
+            try:
+                result = self._attempt(target, prompt, remaining, metrics)
+            except LLMTimeoutError:
+                # 이번 시도가 남은 예산을 모두 썼으므로 재시도하지 않음
+                break
+            except Exception as e:
+                retryable = is_retryable(e)
+                # full jitter 백오프 (대기 후 남는 예산이 없으면 재시도로 세지 않고 바로 실패)
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                if attempt >= self.max_retries or not retryable or delay >= timeout - (time.monotonic() - start):
+                    metrics.add(errors=1)
+                    if retryable:
+                        breaker.record_failure()
+                    else:
+                        # 요청 자체 오류는 장애가 아니므로 시험 호출 중이었다면 차단만 해제
+                        breaker.record_success()
+                    if isinstance(e, LLMGatewayError):
+                        raise
+                    raise LLMGatewayError(f"LLM 호출 실패: {e}") from e
+                metrics.add(retries=1)
+                time.sleep(delay)
+                continue
+            elapsed = time.monotonic() - start
+            usage = getattr(result, "usage_metadata", None) or {}
+            metrics.add(successes=1, input_tokens=usage.get("input_tokens", 0),
+                        output_tokens=usage.get("output_tokens", 0))
+            metrics.record_latency(elapsed)
+            breaker.record_success()
+            if self.on_complete:
+                try:
+                    self.on_complete(stage, elapsed, usage)
+                except Exception as e:
+                    print(f"❌ [LLM 지표] 기록 실패: {e}")
+            return result
+
+        metrics.add(errors=1, timeouts=1)
+        breaker.record_failure()
+        raise LLMTimeoutError(f"LLM 응답 시간 초과 ({stage}: 단계 제한 {timeout:g}초)")
+
+    def for_stage(self, stage: str, json_mode: bool = False) -> RunnableLambda:
+        """LangChain 체인에 끼울 수 있는 단계별 Runnable"""
+        return RunnableLambda(lambda prompt: self.invoke(prompt, stage=stage, json_mode=json_mode), name=stage)
+
+# ============================================================================
+# 4. 오프라인 테스트용 가짜 LLM (지연/오류 주입)
+# ============================================================================
+class FakeServiceUnavailable(RuntimeError):
+    """가짜 LLM의 기본 오류 (HTTP 503 → 재시도 대상)"""
+    code = 503
+
+class FakeLLM:
+    """지정한 지연 분포와 오류율로 응답하는 LLM 대역 (API 키 없이 게이트웨이 동작 확인용)"""
+
+    def __init__(self, response: str = '{"ok": true}', latency=(0.05, 0.2), error_rate: float = 0.0,
+                 error: Exception = None, slow_rate: float = 0.0, slow_latency: float = 5.0, seed: Optional[int] = None,
+                 fail_first: int = 0, slow_first: int = 0):
+        self.response = response
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error = error or FakeServiceUnavailable("503 UNAVAILABLE (fake)")
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.rng = random.Random(seed)
+        # 처음 N번 호출은 항상 실패/지연 (재시도·헤지 동작을 결정적으로 확인)
+        self.fail_first = fail_first
+        self.slow_first = slow_first
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, prompt, **kwargs):
+        with self.lock:
+            self.calls += 1
+            slow = self.rng.random() < self.slow_rate or self.calls <= self.slow_first
+            fail = self.rng.random() < self.error_rate or self.calls <= self.fail_first
+            delay = self.slow_latency if slow else self.rng.uniform(*self.latency)
+        time.sleep(delay)
+        if fail:
+            raise self.error
+        return AIMessage(content=self.response)
+
+if __name__ == "__main__":
+    # 가짜 LLM으로 게이트웨이 동작/지표 확인 (API 키 불필요): python llm_gateway.py
+    fake = FakeLLM(latency=(0.02, 0.08), error_rate=0.1, slow_rate=0.05, slow_latency=2.0, seed=0)
+    gateway = LLMGateway(fake, stage_timeouts={"demo": 1.0}, rate_per_sec=200, burst=50, hedge=True)
+
+    def call(_):
+        try:
+            gateway.invoke("ping", stage="demo")
+            return True
+        except LLMGatewayError:
+            return False
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        outcomes = list(pool.map(call, range(200)))
+    print(f"성공 {sum(outcomes)} / 실패 {len(outcomes) - sum(outcomes)} / 실제 호출 {fake.calls}")
+    print(gateway.metrics())
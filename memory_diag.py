@@ -0,0 +1,321 @@
+import os
+import sys
+import json
+import time
+import functools
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+# 1이면 tracemalloc 추적 + 단계별 할당 비교 + 주기 보고 (추적 자체가 메모리/CPU를 쓰므로 진단할 때만)
+MEMORY_DIAG = os.getenv("MEMORY_DIAG", "0") == "1"
+TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "1"))
+REPORT_INTERVAL_SEC = int(os.getenv("MEMORY_REPORT_SEC", "60"))
+REPORT_FILE = os.getenv("MEMORY_REPORT_FILE", "memory_report.jsonl")
+# 이 시간 안에 재실행이 있었던 세션만 활성 세션으로 집계
+SESSION_WINDOW_SEC = int(os.getenv("MEMORY_SESSION_WINDOW_SEC", "1800"))
+TOP_N = 10
+STAGE_HISTORY = 50
+
+_SKIP_TYPES = (type, type(sys), type(len), type(lambda: 0))
+
+# ============================================================================
+# 2. 프로세스 메모리 (RSS / USS)
+# ============================================================================
+def _proc_kb(path: str, keys) -> Optional[int]:
+    try:
+        with open(path, "r") as f:
+            values = [int(line.split()[1]) for line in f if line.split(":")[0] in keys]
+    except (OSError, ValueError, IndexError):
+        return None
+    return sum(values) if values else None
+
+def process_memory() -> Dict[str, Optional[float]]:
+    """RSS(공유 라이브러리 포함) / USS(이 프로세스만 쓰는 메모리, 워커 수 계산 기준) MB"""
+    try:
+        import psutil
+        info = psutil.Process().memory_full_info()
+        return {"rss_mb": round(info.rss / 2**20, 1), "uss_mb": round(info.uss / 2**20, 1)}
+    except (ImportError, AttributeError, OSError):
+        pass
+    rss = _proc_kb("/proc/self/status", ("VmRSS",))
+    uss = _proc_kb("/proc/self/smaps_rollup", ("Private_Clean", "Private_Dirty"))
+    return {
+        "rss_mb": round(rss / 1024, 1) if rss is not None else None,
+        "uss_mb": round(uss / 1024, 1) if uss is not None else None,
+    }
+
+# ============================================================================
+# 3. 세션 상태 크기 추정
+# ============================================================================
+def deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """컨테이너/객체 속성까지 따라가며 합산한 바이트 (같은 객체는 한 번만, 모듈/함수/클래스 제외)"""
+    seen = set() if seen is None else seen
+    total = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, _SKIP_TYPES):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item, 0)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            pending.extend(item)
+        elif hasattr(item, "__dict__"):
+            pending.append(vars(item))
+    return total
+
+def session_breakdown(state) -> Dict[str, int]:
+    """st.session_state 키별 추정 바이트 (큰 순)"""
+    sizes = {}
+    seen = set()
+    for key in list(state.keys()):
+        try:
+            sizes[str(key)] = deep_sizeof(state[key], seen)
+        except Exception:
+            continue
+    return dict(sorted(sizes.items(), key=lambda kv: -kv[1]))
+
+_sessions: Dict[str, dict] = {}
+_sessions_lock = threading.Lock()
+
+def record_session(visitor_id: Optional[str], state) -> Dict[str, int]:
+    """재실행마다 세션 크기 기록 (주기 보고의 활성 세션 수/세션당 크기 집계용)"""
+    breakdown = session_breakdown(state)
+    with _sessions_lock:
+        _sessions[str(visitor_id)] = {"time": time.time(), "bytes": sum(breakdown.values()), "fields": breakdown}
+    return breakdown
+
+def active_sessions(window: int = SESSION_WINDOW_SEC) -> List[dict]:
+    cutoff = time.time() - window
+    with _sessions_lock:
+        for key in [k for k, v in _sessions.items() if v["time"] < cutoff]:
+            del _sessions[key]
+        return list(_sessions.values())
+
+# ============================================================================
+# 4. 단계별 할당 비교 (tracemalloc 스냅샷 전/후)
+# ============================================================================
+_stage_stats: Dict[str, deque] = {}
+_stage_lock = threading.Lock()
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+def _where(trace_stat) -> str:
+    frame = trace_stat.traceback[0]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno}"
+
+@contextmanager
+def track(stage: str):
+    """단계 실행 전후 스냅샷 비교 → 순증 메모리 + 증가량 상위 코드 위치 (추적 중이 아니면 아무것도 하지 않음)
+    스냅샷은 프로세스 전체 기준이라 동시에 실행된 다른 세션의 할당도 섞일 수 있음"""
+    if not tracemalloc.is_tracing():
+        yield
+        return
+    before = _snapshot()
+    start = time.time()
+    try:
+        yield
+    finally:
+        diff = _snapshot().compare_to(before, "lineno")
+        entry = {
+            "time": time.strftime("%H:%M:%S"),
+            "delta_kb": round(sum(d.size_diff for d in diff) / 1024, 1),
+            "elapsed_sec": round(time.time() - start, 2),
+            "top": [{"where": _where(d), "size_kb": round(d.size_diff / 1024, 1), "count": d.count_diff}
+                    for d in sorted(diff, key=lambda d: -d.size_diff)[:TOP_N] if d.size_diff > 0],
+        }
+        with _stage_lock:
+            _stage_stats.setdefault(stage, deque(maxlen=STAGE_HISTORY)).append(entry)
+
+def wrap(stage: str, func: Callable) -> Callable:
+    """함수 호출을 track(stage)로 감쌈 (추적을 켜지 않았으면 원래 함수 그대로)"""
+    if not MEMORY_DIAG:
+        return func
+
+    def tracked(*args, **kwargs):
+        with track(stage):
+            return func(*args, **kwargs)
+    return tracked
+
+def tracked(stage: str):
+    """데코레이터 형태 (매 호출 시 추적 여부 확인)"""
+    def decorate(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            with track(stage):
+                return func(*args, **kwargs)
+        return run
+    return decorate
+
+def stage_summary() -> Dict[str, dict]:
+    with _stage_lock:
+        history = {stage: list(entries) for stage, entries in _stage_stats.items()}
+    return {
+        stage: {
+            "runs": len(entries),
+            "avg_delta_kb": round(sum(e["delta_kb"] for e in entries) / len(entries), 1),
+            "max_delta_kb": max(e["delta_kb"] for e in entries),
+            "last_top": entries[-1]["top"][:5],
+        }
+        for stage, entries in history.items() if entries
+    }
+
+# ============================================================================
+# 5. 주기 보고 (memory_report.jsonl 한 줄 = 프로세스 1개의 한 시점)
+# ============================================================================
+def _percentile(values: List[int], q: float) -> int:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def report() -> dict:
+    sessions = active_sessions()
+    sizes = [s["bytes"] for s in sessions]
+    fields: Dict[str, int] = {}
+    for s in sessions:
+        for key, size in s["fields"].items():
+            fields[key] = fields.get(key, 0) + size
+    row = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "pid": os.getpid(),
+        **process_memory(),
+        "active_sessions": len(sessions),
+        "session_kb": {
+            "avg": round(sum(sizes) / len(sizes) / 1024, 1) if sizes else 0,
+            "p95": round(_percentile(sizes, 0.95) / 1024, 1),
+            "max": round(max(sizes, default=0) / 1024, 1),
+        },
+        "session_fields_kb": {k: round(v / 1024, 1) for k, v in sorted(fields.items(), key=lambda kv: -kv[1])[:TOP_N]},
+        "stages": stage_summary(),
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        row["traced_mb"] = round(current / 2**20, 1)
+        row["traced_peak_mb"] = round(peak / 2**20, 1)
+        row["top_allocators"] = [
+            {"where": _where(stat), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in _snapshot().statistics("lineno")[:TOP_N]
+        ]
+    return row
+
+def _report_loop(path: str, interval: int):
+    while True:
+        time.sleep(interval)
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(report(), ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"⚠️ 메모리 보고 기록 실패: {e}")
+
+_started = False
+_start_lock = threading.Lock()
+
+def start(path: str = REPORT_FILE, interval: int = REPORT_INTERVAL_SEC) -> bool:
+    """MEMORY_DIAG=1이면 프로세스당 한 번 tracemalloc 추적 + 주기 보고 스레드 시작"""
+    global _started
+    if not MEMORY_DIAG:
+        return False
+    with _start_lock:
+        if _started:
+            return True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+        threading.Thread(target=_report_loop, args=(path, interval), name="memory-report", daemon=True).start()
+        _started = True
+    return True
+
+# ============================================================================
+# 6. 표시 (사이드바, 관리자용)
+# ============================================================================
+def render_panel(state):
+    import streamlit as st
+
+    mem = process_memory()
+    breakdown = session_breakdown(state)
+    with st.sidebar.expander("🧠 메모리", expanded=True):
+        st.caption(f"RSS {mem['rss_mb']}MB · USS {mem['uss_mb']}MB · 활성 세션 {len(active_sessions())}개 (이 프로세스)")
+        st.caption(f"이 세션 상태: {sum(breakdown.values()) / 1024:.1f}KB")
+        st.table([{"field": k, "kb": round(v / 1024, 1)} for k, v in list(breakdown.items())[:TOP_N]])
+        stages = stage_summary()
+        if stages:
+            st.table([{"stage": stage, "runs": s["runs"], "avg_kb": s["avg_delta_kb"], "max_kb": s["max_delta_kb"]}
+                      for stage, s in stages.items()])
+        elif not tracemalloc.is_tracing():
+            st.caption("단계별 할당 비교는 MEMORY_DIAG=1로 실행해야 기록됩니다.")
+
+# ============================================================================
+# 7. 용량 산정 (보고 기록 → 워커 수 / 세션 상한)
+# ============================================================================
+def load_reports(path: str = REPORT_FILE) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def fit_capacity(rows: List[dict], metric: str = "uss_mb") -> Optional[dict]:
+    """활성 세션 수 → 프로세스 메모리 최소제곱 직선 (기본 메모리 + 세션당 증가분)"""
+    points = [(r["active_sessions"], r[metric]) for r in rows if r.get(metric) is not None]
+    if len({x for x, _ in points}) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    sxx = sum((x - mean_x) ** 2 for x, _ in points)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    slope = sxy / sxx
+    base = mean_y - slope * mean_x
+    ss_tot = sum((y - mean_y) ** 2 for _, y in points)
+    ss_res = sum((y - (base + slope * x)) ** 2 for x, y in points)
+    return {
+        "metric": metric,
+        "points": n,
+        "base_mb": round(base, 1),
+        "per_session_mb": round(slope, 3),
+        "r2": round(1 - ss_res / ss_tot, 3) if ss_tot else 1.0,
+        "max_observed_mb": max(y for _, y in points),
+    }
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="메모리 진단 보고 조회 / 워커 수·세션 상한 산정 (MEMORY_DIAG=1로 수집)")
+    parser.add_argument("command", choices=["tail", "capacity", "now"])
+    parser.add_argument("--file", default=REPORT_FILE)
+    parser.add_argument("--last", type=int, default=5)
+    parser.add_argument("--metric", default="uss_mb", choices=["uss_mb", "rss_mb"])
+    parser.add_argument("--node-mb", type=float, default=None, help="노드 메모리(MB) → 워커 수 산정")
+    parser.add_argument("--sessions-per-worker", type=int, default=50)
+    parser.add_argument("--worker-limit-mb", type=float, default=None, help="워커 1개 메모리 한도(MB) → 세션 상한 산정")
+    args = parser.parse_args()
+
+    if args.command == "now":
+        print(json.dumps(report(), ensure_ascii=False, indent=2))
+    elif args.command == "tail":
+        for row in load_reports(args.file)[-args.last:]:
+            print(json.dumps(row, ensure_ascii=False))
+    else:
+        fit = fit_capacity(load_reports(args.file), args.metric)
+        if fit is None:
+            sys.exit("❌ 활성 세션 수가 서로 다른 보고가 2개 이상 필요합니다.")
+        per_worker = fit["base_mb"] + fit["per_session_mb"] * args.sessions_per_worker
+        fit["worker_mb_at_sessions"] = {"sessions": args.sessions_per_worker, "mb": round(per_worker, 1)}
+        if args.node_mb:
+            fit["workers_per_node"] = int(args.node_mb // per_worker) if per_worker > 0 else None
+        if args.worker_limit_mb and fit["per_session_mb"] > 0:
+            fit["max_sessions_per_worker"] = int((args.worker_limit_mb - fit["base_mb"]) // fit["per_session_mb"])
+        print(json.dumps(fit, ensure_ascii=False, indent=2))
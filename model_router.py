@@ -0,0 +1,158 @@
+import os
+import json
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+import llm_gateway
+
+# ============================================================================
+# 1. 단계별 라우팅 설정
+# ============================================================================
+ROUTES_FILE = os.getenv("MODEL_ROUTES_FILE", "model_routes.json")
+USAGE_LOG_FILE = os.getenv("LLM_USAGE_LOG", "llm_usage.jsonl")
+DEFAULT_MODEL = "gemini-2.0-flash-exp"
+LIGHT_MODEL = "gemini-2.0-flash-lite"
+
+# provider: google(Gemini) | local(HuggingFace 소형 모델, 가벼운 단계 전용)
+# max_output_tokens가 None이면 모델 기본값 (상세 분석은 잘리면 JSON이 깨지므로 제한하지 않음)
+STAGE_ROUTES = {
+    "generate_situations_from_tags": {"provider": "google", "model": LIGHT_MODEL, "max_output_tokens": 512, "timeout": 15.0},
+    "analyze_situation_to_keywords": {"provider": "google", "model": LIGHT_MODEL, "max_output_tokens": 512, "timeout": 15.0},
+    "recommend_products_for_situation": {"provider": "google", "model": DEFAULT_MODEL, "max_output_tokens": 1024, "timeout": 30.0},
+    "recommend_keywords_and_products": {"provider": "google", "model": DEFAULT_MODEL, "max_output_tokens": 1536, "timeout": 35.0},
+    "analyze_tags_and_situation": {"provider": "google", "model": DEFAULT_MODEL, "max_output_tokens": None, "timeout": 60.0},
+    "generate_chat_response": {"provider": "google", "model": DEFAULT_MODEL, "max_output_tokens": 1536, "timeout": 40.0},
+}
+
+# 100만 토큰당 USD (입력, 출력) - 로컬 모델은 0
+MODEL_PRICES = {
+    "gemini-2.0-flash-exp": (0.10, 0.40),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+}
+
+def load_routes(path: str = ROUTES_FILE) -> Dict[str, dict]:
+    """기본 라우팅에 model_routes.json의 단계별 설정을 덮어씀"""
+    routes = {stage: dict(cfg) for stage, cfg in STAGE_ROUTES.items()}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for stage, override in json.load(f).items():
+                routes.setdefault(stage, {}).update(override)
+    return routes
+
+# ============================================================================
+# 2. 모델 생성
+# ============================================================================
+def _build_google(cfg: dict):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=cfg["model"], temperature=cfg.get("temperature", 0),
+                                  max_output_tokens=cfg.get("max_output_tokens"))
+
+def _build_local(cfg: dict):
+    from langchain_huggingface import HuggingFacePipeline
+    return HuggingFacePipeline.from_model_id(
+        model_id=cfg["model"],
+        task="text-generation",
+        device=-1,
+        pipeline_kwargs={"max_new_tokens": cfg.get("max_output_tokens") or 512, "return_full_text": False},
+    )
+
+PROVIDERS = {"google": _build_google, "local": _build_local}
+
+def build_stage_llms(routes: Dict[str, dict]) -> Dict[str, object]:
+    """설정이 같은 단계끼리는 모델 인스턴스 공유"""
+    cache, stage_llms = {}, {}
+    for stage, cfg in routes.items():
+        key = (cfg.get("provider", "google"), cfg["model"], cfg.get("max_output_tokens"), cfg.get("temperature", 0))
+        if key not in cache:
+            cache[key] = PROVIDERS[key[0]](cfg)
+        stage_llms[stage] = cache[key]
+    return stage_llms
+
+# ============================================================================
+# 3. 단계별 지연 시간 / 비용 기록
+# ============================================================================
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+class UsageRecorder:
+    """호출 완료마다 단계/모델/지연/토큰/비용을 JSONL로 남김"""
+
+    def __init__(self, routes: Dict[str, dict], path: Optional[str] = USAGE_LOG_FILE):
+        self.routes = routes
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, stage: str, latency: float, usage: dict):
+        model = self.routes.get(stage, {}).get("model", DEFAULT_MODEL)
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        record = {
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "stage": stage,
+            "model": model,
+            "latency_sec": round(latency, 3),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost_usd": round(estimate_cost(model, input_tokens, output_tokens), 6),
+        }
+        if self.path:
+            with self.lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def cost_report(gateway: llm_gateway.LLMGateway, routes: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+    """게이트웨이 지표 + 단계별 누적 비용"""
+    routes = routes or load_routes()
+    report = {}
+    for stage, m in gateway.metrics().items():
+        model = routes.get(stage, {}).get("model", DEFAULT_MODEL)
+        report[stage] = dict(m, model=model, cost_usd=round(estimate_cost(model, m["input_tokens"], m["output_tokens"]), 6))
+    return report
+
+def summarize_usage_log(path: str = USAGE_LOG_FILE) -> Dict[str, dict]:
+    """JSONL 사용 기록을 단계별 호출 수 / p50·p95 지연 / 평균 비용으로 요약"""
+    by_stage: Dict[str, list] = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                by_stage.setdefault(record["stage"], []).append(record)
+    summary = {}
+    for stage, records in by_stage.items():
+        latencies = sorted(r["latency_sec"] for r in records)
+        summary[stage] = {
+            "model": records[-1]["model"],
+            "calls": len(records),
+            "p50_sec": latencies[len(latencies) // 2],
+            "p95_sec": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+            "avg_cost_usd": round(sum(r["cost_usd"] for r in records) / len(records), 6),
+            "total_cost_usd": round(sum(r["cost_usd"] for r in records), 4),
+        }
+    return summary
+
+# ============================================================================
+# 4. 게이트웨이 구성
+# ============================================================================
+def build_gateway(routes: Optional[Dict[str, dict]] = None, **gateway_kwargs) -> llm_gateway.LLMGateway:
+    """단계별 모델/타임아웃이 설정된 게이트웨이 (기본 모델은 심층 분석 단계 모델)"""
+    routes = routes or load_routes()
+    stage_llms = build_stage_llms(routes)
+    default_llm = stage_llms.get("analyze_tags_and_situation") or next(iter(stage_llms.values()))
+    return llm_gateway.LLMGateway(
+        default_llm,
+        stage_llms=stage_llms,
+        stage_timeouts={stage: cfg["timeout"] for stage, cfg in routes.items() if "timeout" in cfg},
+        on_complete=UsageRecorder(routes),
+        **gateway_kwargs,
+    )
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="단계별 모델 라우팅 확인 및 사용 기록 요약")
+    parser.add_argument("command", choices=["routes", "usage"])
+    args = parser.parse_args()
+    data = load_routes() if args.command == "routes" else summarize_usage_log()
+    print(json.dumps(data, ensure_ascii=False, indent=2))
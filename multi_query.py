@@ -0,0 +1,80 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+RRF_K = 60
+K_PER_QUERY = 8
+MAX_WORKERS = 4
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="multi-query")
+
+# ============================================================================
+# 2. 배치 임베딩 / 벡터 검색
+# ============================================================================
+def store_embedding(store):
+    """검색 저장소의 임베딩 모델 (CompactStore/ExactProductStore: embedding, Chroma: embeddings)"""
+    return getattr(store, "embedding", None) or getattr(store, "embeddings", None)
+
+def embed_batch(embedding, queries: List[str]) -> List[List[float]]:
+    """질의 여러 개를 한 번의 forward pass로 인코딩 (bge-m3는 질의/문서 인코딩이 동일)"""
+    return embedding.embed_documents(queries)
+
+def search_by_vector(store, vector, k: int, filter: Optional[dict] = None) -> List[Document]:
+    """저장소 종류와 무관하게 벡터로 top-k 검색 (순위만 사용하므로 점수 척도는 무시)"""
+    if hasattr(store, "similarity_search_by_vector_with_score"):
+        return [doc for doc, _ in store.similarity_search_by_vector_with_score(vector, k=k, filter=filter)]
+    return store.similarity_search_by_vector(vector, k=k, filter=filter)
+
+def doc_key(doc: Document) -> str:
+    """중복 제거 키: 청크 ID, 없으면 source + 본문 해시"""
+    if getattr(doc, "id", None):
+        return doc.id
+    source = doc.metadata.get("source", "")
+    return hashlib.sha256(f"{source}\n{doc.page_content}".encode("utf-8")).hexdigest()
+
+# ============================================================================
+# 3. 순위 융합 (Reciprocal Rank Fusion) / 상품별 묶음
+# ============================================================================
+def rrf_fuse(result_lists: List[List[Document]], rrf_k: int = RRF_K) -> List[Tuple[Document, float, List[int]]]:
+    """질의별 결과를 1/(rrf_k + 순위) 합으로 융합, 청크 ID 기준 중복 제거 → (문서, 점수, 매칭 질의 번호)"""
+    fused: Dict[str, list] = {}
+    for query_no, docs in enumerate(result_lists):
+        for rank, doc in enumerate(docs):
+            entry = fused.setdefault(doc_key(doc), [doc, 0.0, []])
+            entry[1] += 1.0 / (rrf_k + rank + 1)
+            if query_no not in entry[2]:
+                entry[2].append(query_no)
+    return sorted((tuple(entry) for entry in fused.values()), key=lambda item: -item[1])
+
+def group_by_product(fused: List[Tuple[Document, float, List[int]]], per_product: int = 2) -> List[dict]:
+    """융합 결과를 source(상품)별로 묶고, 상품 점수(청크 점수 합) 내림차순 정렬"""
+    groups: Dict[str, dict] = {}
+    for doc, score, queries in fused:
+        source = doc.metadata.get("source", "알 수 없음")
+        group = groups.setdefault(source, {"source": source, "score": 0.0, "docs": [], "queries": set()})
+        group["score"] += score
+        group["queries"].update(queries)
+        if len(group["docs"]) < per_product:
+            group["docs"].append(doc)
+    ordered = sorted(groups.values(), key=lambda g: -g["score"])
+    for group in ordered:
+        group["queries"] = sorted(group["queries"])
+    return ordered
+
+# ============================================================================
+# 4. 다중 질의 검색
+# ============================================================================
+def multi_query_search(store, queries: List[str], k_per_query: int = K_PER_QUERY, filter: Optional[dict] = None,
+                       embedding=None, rrf_k: int = RRF_K) -> List[Tuple[Document, float, List[int]]]:
+    """상황 문장 + 키워드별 질의를 배치 인코딩 후 동시에 검색하고 순위 융합"""
+    queries = [q for q in dict.fromkeys(q.strip() for q in queries) if q]
+    if not queries:
+        return []
+    vectors = embed_batch(embedding or store_embedding(store), queries)
+    futures = [_executor.submit(search_by_vector, store, vector, k_per_query, filter) for vector in vectors]
+    return rrf_fuse([future.result() for future in futures], rrf_k=rrf_k)
@@ -0,0 +1,345 @@
+import os
+import re
+import json
+import math
+import time
+import queue
+import atexit
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+TOKEN_LOG_FILE = os.getenv("PROMPT_TOKEN_LOG", "prompt_tokens.jsonl")
+# 기록 파일이 이 크기를 넘으면 .1로 돌리고 새로 시작 (직전 파일 1개만 보관)
+TOKEN_LOG_MAX_MB = float(os.getenv("PROMPT_TOKEN_LOG_MAX_MB", "20"))
+# 1이면 재생(replay)용으로 단계 입력(상황/질문/이전 분석 등 고객 원문)도 기록 - 수집 기간에만 켤 것
+LOG_INPUTS = os.getenv("PROMPT_LOG_INPUTS", "0") == "1"
+# 입력 기록은 프로세스 시작 후 이 시간 동안만 (켜 둔 채 잊어도 고객 원문이 계속 쌓이지 않도록)
+LOG_INPUTS_WINDOW_SEC = float(os.getenv("PROMPT_LOG_INPUTS_WINDOW_SEC", "3600"))
+HISTORY = 500
+WRITE_QUEUE_MAX = 10000
+
+# 프롬프트 구간별 입력 토큰 예산 (template = 변수를 뺀 고정 지시문)
+SECTION_BUDGETS = {
+    "template": 800,
+    "toc_summary": 1500,
+    "context": 3000,
+    "docs": 2000,
+    "docs_context": 1500,
+    "analysis_context": 1200,
+}
+# 단계별 전체 입력 토큰 예산
+STAGE_BUDGETS = {
+    "generate_situations_from_tags": 800,
+    "analyze_situation_to_keywords": 800,
+    "recommend_products_for_situation": 2500,
+    "recommend_keywords_and_products": 2500,
+    "analyze_tags_and_situation": 6000,
+    "generate_chat_response": 3500,
+}
+# 예: PROMPT_BUDGETS='{"sections": {"toc_summary": 800}, "stages": {"analyze_tags_and_situation": 4000}}'
+_overrides = json.loads(os.getenv("PROMPT_BUDGETS", "{}") or "{}")
+SECTION_BUDGETS.update(_overrides.get("sections", {}))
+STAGE_BUDGETS.update(_overrides.get("stages", {}))
+
+_PLACEHOLDER = re.compile(r"(?<!\{)\{(\w+)\}(?!\})")
+_PIECES = re.compile(r"[가-힣]+|[A-Za-z]+|\d+|\S")
+
+# ============================================================================
+# 2. 토큰 추정
+# ============================================================================
+def estimate_tokens(text) -> int:
+    """Gemini 토크나이저 근사치 (한글 ~1.5음절, 영문 ~4자, 숫자 ~3자당 1토큰, 기호 1토큰)
+    실제 입력 토큰(llm_usage.jsonl)과의 비율은 report의 calibration으로 확인"""
+    if not text:
+        return 0
+    total = 0
+    for piece in _PIECES.findall(str(text)):
+        first = piece[0]
+        if "가" <= first <= "힣":
+            total += math.ceil(len(piece) / 1.5)
+        elif first.isascii() and first.isalpha():
+            total += math.ceil(len(piece) / 4)
+        elif first.isdigit():
+            total += math.ceil(len(piece) / 3)
+        else:
+            total += 1
+    return total
+
+def count_sections(template: str, variables: Dict[str, object]) -> Dict[str, int]:
+    """고정 지시문(template) + 변수별 토큰"""
+    static = _PLACEHOLDER.sub("", template).replace("{{", "{").replace("}}", "}")
+    sections = {"template": estimate_tokens(static)}
+    for name, value in variables.items():
+        sections[name] = estimate_tokens(value)
+    return sections
+
+def over_budget(stage: str, sections: Dict[str, int]) -> List[str]:
+    over = [name for name, tokens in sections.items() if tokens > SECTION_BUDGETS.get(name, math.inf)]
+    if sum(sections.values()) > STAGE_BUDGETS.get(stage, math.inf):
+        over.append("total")
+    return over
+
+# ============================================================================
+# 3. 호출별 기록 / 단계별 집계
+# ============================================================================
+class TokenAccountant:
+    """호출별 구간 토큰 기록 (파일 기록은 백그라운드 스레드, 크기 상한 넘으면 교체)"""
+
+    def __init__(self, path: Optional[str] = TOKEN_LOG_FILE, log_inputs: bool = LOG_INPUTS,
+                 inputs_window: float = LOG_INPUTS_WINDOW_SEC, max_bytes: int = int(TOKEN_LOG_MAX_MB * 1024 * 1024)):
+        self.path = path
+        self.log_inputs = log_inputs
+        self.inputs_until = time.monotonic() + inputs_window
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.history: Dict[str, deque] = {}
+        self.queue: "queue.Queue[str]" = queue.Queue(maxsize=WRITE_QUEUE_MAX)
+        self.dropped = 0
+        self.writer: Optional[threading.Thread] = None
+
+    def _inputs_enabled(self) -> bool:
+        return self.log_inputs and time.monotonic() < self.inputs_until
+
+    def record(self, stage: str, template: str, variables: Dict[str, object], inputs: Optional[dict] = None) -> dict:
+        sections = count_sections(template, variables)
+        entry = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "stage": stage,
+            "total": sum(sections.values()),
+            "sections": sections,
+            "over_budget": over_budget(stage, sections),
+        }
+        if entry["over_budget"]:
+            print(f"⚠️ [프롬프트 예산 초과] {stage}: {', '.join(entry['over_budget'])} (총 {entry['total']}토큰)")
+        if inputs is not None and self._inputs_enabled():
+            entry["inputs"] = inputs
+        with self.lock:
+            self.history.setdefault(stage, deque(maxlen=HISTORY)).append(entry)
+        if self.path:
+            self._enqueue(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        return entry
+
+    def _enqueue(self, line: str):
+        if self.writer is None:
+            with self.lock:
+                if self.writer is None:
+                    self.writer = threading.Thread(target=self._write_loop, name="prompt-tokens", daemon=True)
+                    self.writer.start()
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            # 기록이 밀리면 요청을 기다리게 하지 않고 버림 (집계용 근사치)
+            self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            line = self.queue.get()
+            try:
+                self._write(line)
+            except Exception as e:
+                print(f"❌ [프롬프트 토큰 기록] 실패: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _write(self, line: str):
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(line.encode("utf-8")) > self.max_bytes:
+            os.replace(self.path, f"{self.path}.1")
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def flush(self):
+        """대기 중인 기록을 파일에 반영 (종료 시/재생 도구용)"""
+        if self.writer is not None:
+            self.queue.join()
+
+    def summary(self) -> Dict[str, dict]:
+        with self.lock:
+            rows = [entry for entries in self.history.values() for entry in entries]
+        return summarize(rows)
+
+accountant = TokenAccountant()
+atexit.register(accountant.flush)
+_capture = threading.local()
+
+@contextmanager
+def capture():
+    """재생 도구용: 이 스레드의 기록을 파일 대신 목록으로 수집"""
+    rows: List[dict] = []
+    previous = getattr(_capture, "rows", None)
+    _capture.rows = rows
+    try:
+        yield rows
+    finally:
+        _capture.rows = previous
+
+def record(stage: str, template: str, variables: Dict[str, object], inputs: Optional[dict] = None) -> dict:
+    rows = getattr(_capture, "rows", None)
+    if rows is not None:
+        sections = count_sections(template, variables)
+        entry = {"stage": stage, "total": sum(sections.values()), "sections": sections}
+        rows.append(entry)
+        return entry
+    return accountant.record(stage, template, variables, inputs)
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0
+
+def summarize(rows: List[dict]) -> Dict[str, dict]:
+    """단계별 총 토큰 p50/p95 + 구간별 평균/p95/비중 + 예산 초과 횟수"""
+    by_stage: Dict[str, List[dict]] = {}
+    for row in rows:
+        by_stage.setdefault(row["stage"], []).append(row)
+    summary = {}
+    for stage, entries in by_stage.items():
+        totals = [e["total"] for e in entries]
+        grand = sum(totals) or 1
+        names = sorted({name for e in entries for name in e["sections"]})
+        sections = {}
+        for name in names:
+            values = [e["sections"].get(name, 0) for e in entries]
+            sections[name] = {
+                "avg": round(sum(values) / len(values), 1),
+                "p95": _percentile(values, 0.95),
+                "share": round(sum(values) / grand, 3),
+            }
+        over = {}
+        for e in entries:
+            for name in e.get("over_budget", []):
+                over[name] = over.get(name, 0) + 1
+        summary[stage] = {
+            "calls": len(entries),
+            "p50": _percentile(totals, 0.5),
+            "p95": _percentile(totals, 0.95),
+            "avg": round(sum(totals) / len(totals), 1),
+            "budget": STAGE_BUDGETS.get(stage),
+            "sections": dict(sorted(sections.items(), key=lambda kv: -kv[1]["share"])),
+            "over_budget": over,
+        }
+    return summary
+
+def load_log(path: str = TOKEN_LOG_FILE) -> List[dict]:
+    """기록 읽기 (크기 상한으로 교체된 직전 파일 .1 포함, 오래된 순)"""
+    rows = []
+    for candidate in (f"{path}.1", path):
+        if os.path.exists(candidate):
+            with open(candidate, "r", encoding="utf-8") as f:
+                rows.extend(json.loads(line) for line in f if line.strip())
+    return rows
+
+def calibration(summary: Dict[str, dict], usage_path: Optional[str] = None) -> Dict[str, float]:
+    """실제 입력 토큰 평균(llm_usage.jsonl) / 추정 평균 → 단계별 보정 비율"""
+    import model_router
+
+    usage: Dict[str, List[int]] = {}
+    for row in load_log(usage_path or model_router.USAGE_LOG_FILE):
+        if row.get("input_tokens"):
+            usage.setdefault(row["stage"], []).append(row["input_tokens"])
+    return {stage: round(sum(values) / len(values) / summary[stage]["avg"], 2)
+            for stage, values in usage.items() if stage in summary and summary[stage]["avg"]}
+
+# ============================================================================
+# 4. 재생 (기록된 입력 → 다른 프롬프트 설정에서의 토큰/지연 비교)
+# ============================================================================
+def _dry_run_llm():
+    """LLM을 호출하지 않고 빈 JSON을 돌려주는 모델 (프롬프트 구성/검색만 실행)"""
+    from langchain_core.messages import AIMessage
+    from langchain_core.runnables import RunnableLambda
+    return RunnableLambda(lambda prompt_value: AIMessage(content="{}"))
+
+def _run_stage(engine, stage: str, inputs: dict, resources: dict):
+    import inspect
+
+    func = getattr(engine, stage)
+    params = inspect.signature(func).parameters
+    kwargs = {name: value for name, value in resources.items() if name in params}
+    kwargs.update({name: value for name, value in inputs.items() if name in params})
+    result = func(**kwargs)
+    if not isinstance(result, str):  # 상세 분석은 스트림
+        result = "".join(result)
+    return result
+
+def replay(rows: List[dict], settings: Dict[str, object], resources: dict) -> Dict[str, dict]:
+    """기록된 단계 입력을 주어진 engine.PROMPT_SETTINGS로 다시 실행 → 단계별 평균 토큰/지연"""
+    import engine
+
+    results: Dict[str, dict] = {}
+    with engine.prompt_settings(**settings), capture() as captured:
+        for row in rows:
+            start, recorded = time.time(), len(captured)
+            try:
+                _run_stage(engine, row["stage"], row["inputs"], resources)
+            except Exception as e:
+                print(f"⚠️ 재생 실패 ({row['stage']}): {e}")
+                continue
+            stats = results.setdefault(row["stage"], {"calls": 0, "tokens": 0, "latency_sec": 0.0})
+            stats["calls"] += 1
+            stats["tokens"] += sum(entry["total"] for entry in captured[recorded:])
+            stats["latency_sec"] += time.time() - start
+    return {stage: {"calls": s["calls"], "avg_tokens": round(s["tokens"] / s["calls"], 1),
+                    "avg_latency_sec": round(s["latency_sec"] / s["calls"], 3)}
+            for stage, s in results.items() if s["calls"]}
+
+def _parse_setting(text: str):
+    key, _, value = text.partition("=")
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="프롬프트 구간별 토큰 집계 / 다른 템플릿·k 설정으로 기록된 입력 재생")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rep = sub.add_parser("report")
+    rep.add_argument("--file", default=TOKEN_LOG_FILE)
+    rep.add_argument("--usage", default=None, help="실제 토큰 보정용 llm_usage.jsonl")
+    play = sub.add_parser("replay")
+    play.add_argument("settings", nargs="+", help="engine.PROMPT_SETTINGS 대안 (예: analysis_k=5 analysis_toc=off chat_context=summary)")
+    play.add_argument("--file", default=TOKEN_LOG_FILE)
+    play.add_argument("--stage", default=None)
+    play.add_argument("--limit", type=int, default=50)
+    play.add_argument("--execute", action="store_true", help="실제 LLM 호출로 지연까지 측정 (기본: 프롬프트 구성/검색만)")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        summary = summarize(load_log(args.file))
+        output = {"stages": summary, "calibration": calibration(summary, args.usage)}
+        print(json.dumps(output, ensure_ascii=False, indent=2))
+    else:
+        import model_router
+        import batch_recommend
+
+        rows = [r for r in load_log(args.file) if "inputs" in r and args.stage in (None, r["stage"])][-args.limit:]
+        if not rows:
+            raise SystemExit("❌ 입력이 기록된 호출이 없습니다 (수집 기간 동안 PROMPT_LOG_INPUTS=1로 실행).")
+        vectorstore, gateway, article_index = batch_recommend.load_engine_resources()
+        resources = {"vectorstore": vectorstore, "article_index": article_index,
+                     "llm": gateway if args.execute else _dry_run_llm()}
+        settings = dict(_parse_setting(s) for s in args.settings)
+        baseline = replay(rows, {}, resources)
+        variant = replay(rows, settings, resources)
+        routes = model_router.load_routes()
+        comparison = {}
+        for stage, base in baseline.items():
+            alt = variant.get(stage)
+            if not alt:
+                continue
+            model = routes.get(stage, {}).get("model", model_router.DEFAULT_MODEL)
+            saved = base["avg_tokens"] - alt["avg_tokens"]
+            comparison[stage] = {
+                "calls": base["calls"],
+                "baseline_tokens": base["avg_tokens"],
+                "variant_tokens": alt["avg_tokens"],
+                "saved_pct": round(saved / base["avg_tokens"] * 100, 1) if base["avg_tokens"] else 0,
+                "saved_cost_usd_per_1k_calls": round(model_router.estimate_cost(model, saved, 0) * 1000, 4),
+                "baseline_latency_sec": base["avg_latency_sec"],
+                "variant_latency_sec": alt["avg_latency_sec"],
+            }
+        print(json.dumps({"settings": settings, "executed": args.execute, "stages": comparison}, ensure_ascii=False, indent=2))
@@ -1,11 +1,13 @@
 import os
 import json
-import pandas as pd
+import queue
+import atexit
+import threading
 import streamlit as st
 from datetime import datetime
-from typing import Dict, List, Optional
-import gspread
-from google.oauth2.service_account import Credentials
+from typing import Dict, List, Optional, Tuple
+
+# pandas/gspread/google.oauth2/numpy/memory_diag는 사용 시점에만 import (워커 기동 시간 단축)
 
 # ============================================================================
 # 1. 설정 및 상수
@@ -18,6 +20,10 @@ SPREADSHEET_NAME = 'Hilight_db'
 SHEET_USER_LOG = '사용자_로그'
 SHEET_CONSULT_LOG = '상담_신청'
 LOCAL_LOG_FILE = "local_log.xlsx"
+# 사용자 행동 기록 대기열 크기 (구글 시트/엑셀 기록은 백그라운드 스레드 1개가 순서대로 처리, 가득 차면 버림)
+USER_LOG_QUEUE_MAX = int(os.getenv("USER_LOG_QUEUE_MAX", "1000"))
+# memory_diag와 같은 환경 변수 (켠 경우에만 엑셀 기록의 메모리 할당 비교)
+MEMORY_DIAG = os.getenv("MEMORY_DIAG", "0") == "1"
 
 # ============================================================================
 # 2. 고정 태그맵 (룰베이스)
@@ -127,30 +133,93 @@ def calculate_tag_similarity(user_tags: List[str], product_tags: List[str]) -> f
                 break
     return score
 
+def score_product(selected_tags: Dict[str, List[str]], p_data: dict) -> float:
+    u_tags_flat = [tag for tags in selected_tags.values() for tag in tags]
+    p_tags_flat = []
+    for tags in p_data.get("tags", {}).values(): p_tags_flat.extend(tags)
+    
+    sim = calculate_tag_similarity(u_tags_flat, p_tags_flat)
+    risk_match = len(set(selected_tags.get("위험", [])) & set(p_data.get("tags", {}).get("위험", [])))
+    return sim + (risk_match * 0.5)
+
+def rank_products_by_tags(selected_tags: Dict[str, List[str]], limit: int = 3) -> List[tuple]:
+    """태그 점수 내림차순 (상품명, 점수) 목록 - LLM 지연 시 간편 추천용"""
+    p_tags_db = CATALOG_DATA.get("product_tags", {})
+    scored = [(p_name, score_product(selected_tags, p_data)) for p_name, p_data in p_tags_db.items()]
+    scored.sort(key=lambda item: -item[1])
+    return scored[:limit]
+
 def get_product_by_tags(selected_tags: Dict[str, List[str]]) -> Optional[str]:
     p_tags_db = CATALOG_DATA.get("product_tags", {})
     if not p_tags_db: return None
-    u_tags_flat = [tag for tags in selected_tags.values() for tag in tags]
     
     best_match, best_score = None, 0.0
     for p_name, p_data in p_tags_db.items():
-        p_tags_flat = []
-        for tags in p_data.get("tags", {}).values(): p_tags_flat.extend(tags)
-        
-        sim = calculate_tag_similarity(u_tags_flat, p_tags_flat)
-        risk_match = len(set(selected_tags.get("위험", [])) & set(p_data.get("tags", {}).get("위험", [])))
-        final_score = sim + (risk_match * 0.5)
+        final_score = score_product(selected_tags, p_data)
         
         if final_score > best_score:
             best_score, best_match = final_score, p_name
             
     return best_match if best_score >= 1.5 else None
 
+def get_products_by_tags_batch(profiles: List[Dict[str, List[str]]], threshold: float = 1.5) -> List[Tuple[Optional[str], float]]:
+    """get_product_by_tags와 같은 점수를 여러 고객에 대해 행렬 곱으로 계산 → (상품명 또는 None, 최고 점수)
+
+    점수 = 일치 태그 수 + 0.5 × 부분 일치 태그 수 + 0.5 × 일치 위험 태그 수 (고객 × 태그) @ (태그 × 상품)
+    """
+    p_tags_db = CATALOG_DATA.get("product_tags", {})
+    if not p_tags_db or not profiles:
+        return [(None, 0.0) for _ in profiles]
+    names = list(p_tags_db)
+    product_flat = [[tag for tags in p_tags_db[name].get("tags", {}).values() for tag in tags] for name in names]
+    product_risk = [set(p_tags_db[name].get("tags", {}).get("위험", [])) for name in names]
+
+    vocab = sorted({tag for profile in profiles for tags in profile.values() for tag in tags})
+    if not vocab:
+        return [(None, 0.0) for _ in profiles]
+    import numpy as np
+
+    col = {tag: i for i, tag in enumerate(vocab)}
+    exact = np.zeros((len(vocab), len(names)), dtype=np.float32)
+    partial = np.zeros_like(exact)
+    risk = np.zeros_like(exact)
+    for j, p_tags in enumerate(product_flat):
+        p_set = set(p_tags)
+        p_kws = [(p_tag, p_tag.replace("#", "").lower()) for p_tag in p_tags]
+        for tag, i in col.items():
+            u_kw = tag.replace("#", "").lower()
+            exact[i, j] = tag in p_set
+            partial[i, j] = any(p_tag != tag and (u_kw in p_kw or p_kw in u_kw) for p_tag, p_kw in p_kws)
+            risk[i, j] = tag in product_risk[j]
+
+    user_set = np.zeros((len(profiles), len(vocab)), dtype=np.float32)
+    user_count = np.zeros_like(user_set)
+    user_risk = np.zeros_like(user_set)
+    for r, profile in enumerate(profiles):
+        for tag in (tag for tags in profile.values() for tag in tags):
+            user_set[r, col[tag]] = 1
+            user_count[r, col[tag]] += 1
+        for tag in profile.get("위험", []):
+            user_risk[r, col[tag]] = 1
+
+    scores = user_set @ exact + 0.5 * (user_count @ partial) + 0.5 * (user_risk @ risk)
+    best = scores.argmax(axis=1)
+    return [(names[j] if scores[r, j] >= threshold else None, float(scores[r, j])) for r, j in enumerate(best)]
+
 # ============================================================================
 # 5. 로컬 엑셀 저장
 # ============================================================================
 def _log_to_local_excel(sheet_name: str, row_data: list, columns: list):
+    """MEMORY_DIAG=1이면 메모리 할당 비교로 감싸서 기록 (꺼져 있으면 memory_diag를 import하지 않음)"""
+    if not MEMORY_DIAG:
+        return _write_local_excel(sheet_name, row_data, columns)
+    import memory_diag
+    with memory_diag.track("excel_log"):
+        return _write_local_excel(sheet_name, row_data, columns)
+
+def _write_local_excel(sheet_name: str, row_data: list, columns: list):
     try:
+        import pandas as pd
         new_df = pd.DataFrame([row_data], columns=columns)
         
         if os.path.exists(LOCAL_LOG_FILE):
@@ -184,12 +253,15 @@ def _log_to_local_excel(sheet_name: str, row_data: list, columns: list):
 def get_sheets_client():
     try:
         if "gcp_service_account" not in st.secrets: return None
+        import gspread
+        from google.oauth2.service_account import Credentials
         creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=SCOPES)
         return gspread.authorize(creds)
     except Exception: return None
 
 def get_or_create_sheet(client, sheet_name: str):
     if client is None: return None
+    import gspread
     try:
         ss = client.open(SPREADSHEET_NAME)
         try: return ss.worksheet(sheet_name)
@@ -197,8 +269,12 @@ def get_or_create_sheet(client, sheet_name: str):
     except Exception: return None
 
 def log_user_action(visitor_id, consult_count, open_time_str, action_type, user_input="", recommended_product="", duration=0.0):
+    """사용자 행동 기록을 대기열에 넣고 바로 반환 (화면 실행 스레드에서 gspread/엑셀 I/O를 기다리지 않음)"""
     action_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     row = [visitor_id, consult_count, open_time_str, action_time, action_type, user_input, recommended_product, round(duration, 2)]
+    _user_log.put(row)
+
+def _write_user_action(row):
     headers = ['visitor_id', 'consult_count', 'open_time', 'action_time', 'action_type', 'user_input', 'recommended_product', 'duration_sec']
     
     try:
@@ -220,6 +296,46 @@ def log_user_action(visitor_id, consult_count, open_time_str, action_type, user_
     
     _log_to_local_excel(SHEET_USER_LOG, row, headers)
 
+class _BackgroundLog:
+    """기록 함수를 전용 스레드에서 순서대로 실행 (엑셀 파일 동시 쓰기 방지)"""
+
+    def __init__(self, write, maxsize: int = USER_LOG_QUEUE_MAX):
+        self.write = write
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.writer = None
+        self.dropped = 0
+
+    def put(self, row):
+        if self.writer is None:
+            with self.lock:
+                if self.writer is None:
+                    self.writer = threading.Thread(target=self._loop, name="user-log", daemon=True)
+                    self.writer.start()
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            print(f"⚠️ [사용자 로그] 대기열 가득 참 → 기록 생략 ({row[4]})")
+
+    def _loop(self):
+        while True:
+            row = self.queue.get()
+            try:
+                self.write(row)
+            except Exception as e:
+                print(f"❌ [사용자 로그] 기록 실패: {e}")
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """대기 중인 기록을 모두 반영 (종료 시)"""
+        if self.writer is not None:
+            self.queue.join()
+
+_user_log = _BackgroundLog(_write_user_action)
+atexit.register(_user_log.flush)
+
 def log_consultation_request(visitor_id, consult_count, open_time_str, recommended_product, user_name="", user_phone="", user_email="", preferred_time=""):
     req_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     row = [req_time, visitor_id, consult_count, open_time_str, recommended_product, user_name, user_phone, user_email, preferred_time, '대기중']
@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import hmac
+import hashlib
+import threading
+from collections import Counter
+from html import escape
+from typing import Callable, Dict, List, Optional
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+# 실제 트래픽 중 프로파일링할 요청 비율 (0이면 관리자 요청만: ?profile=<PROFILE_ADMIN_TOKEN>)
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# sampling: 주기적으로 호출 스택 수집(낮은 부하) | deterministic: 모든 함수 호출/반환 시간 기록(정확하지만 느림)
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sampling")
+SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+MAX_PROFILES = int(os.getenv("PROFILE_MAX_FILES", "500"))
+# 관리자 쿼리 파라미터(?profile=, ?memory=) 토큰 (미설정이면 관리자 요청 기능 꺼짐)
+ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+INDEX_FILE = "index.jsonl"
+
+SVG_WIDTH = 1200
+FRAME_HEIGHT = 16
+
+def admin_requested(value: Optional[str], token: Optional[str] = None) -> bool:
+    """관리자 쿼리 파라미터가 PROFILE_ADMIN_TOKEN과 일치하는지 확인 (토큰 미설정이면 항상 False)"""
+    token = ADMIN_TOKEN if token is None else token
+    if not token or not value:
+        return False
+    return hmac.compare_digest(value.encode("utf-8"), token.encode("utf-8"))
+
+def should_profile(force: bool = False) -> bool:
+    return force or (SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE)
+
+# ============================================================================
+# 2. 스택 수집 (샘플링 / 결정적)
+# ============================================================================
+_labels: Dict[object, str] = {}
+# 스레드마다 한 번에 하나만 (화면 재실행 안에서 같은 스레드로 실행되는 단계는 바깥 프로파일에 포함)
+_active = threading.local()
+
+def _frame_label(code) -> str:
+    """code 객체 → 'module:function' (site-packages 경로는 패키지 이름부터)"""
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename.replace("\\", "/")
+        if "site-packages/" in path:
+            path = path.rsplit("site-packages/", 1)[1]
+        else:
+            path = os.path.basename(path)
+        module = path[:-3] if path.endswith(".py") else path
+        label = f"{module.replace('/', '.')}:{code.co_name}".replace(";", ",")
+        _labels[code] = label
+    return label
+
+class Profile:
+    """현재 스레드의 실행을 프로파일링 → collapsed 스택 + 플레임그래프 파일 기록"""
+
+    def __init__(self, label: str, mode: str = PROFILE_MODE, interval_ms: float = SAMPLE_INTERVAL_MS,
+                 out_dir: str = PROFILE_DIR, meta: Optional[dict] = None):
+        self.label = label
+        self.mode = mode
+        self.interval = interval_ms / 1000
+        self.out_dir = out_dir
+        self.meta = meta or {}
+        self.stacks: Counter = Counter()
+        self.thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._frames: List[list] = []
+        self.started = 0.0
+        self.nested = False
+
+    # --- 샘플링: 별도 스레드가 대상 스레드의 현재 프레임을 주기적으로 읽음 ---
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    # --- 결정적: 호출/반환마다 스택 경로별 자기 시간(µs) 누적 ---
+    def _trace(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        if event in ("call", "c_call"):
+            name = _frame_label(frame.f_code) if event == "call" else f"builtin:{getattr(arg, '__qualname__', arg)}"
+            parent = self._frames[-1][0] if self._frames else ""
+            self._frames.append([f"{parent};{name}" if parent else name, now, 0])
+        elif event in ("return", "c_return", "c_exception") and self._frames:
+            path, start, child = self._frames.pop()
+            elapsed = now - start
+            self.stacks[path] += (elapsed - child) // 1000
+            if self._frames:
+                self._frames[-1][2] += elapsed
+
+    def start(self) -> "Profile":
+        self.nested = getattr(_active, "profile", None) is not None
+        if self.nested:
+            return self
+        _active.profile = self
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        if self.mode == "deterministic":
+            sys.setprofile(self._trace)
+        else:
+            self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.label}", daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self) -> Optional[str]:
+        if self.nested:
+            return None
+        _active.profile = None
+        wall_ms = (time.perf_counter() - self.started) * 1000
+        if self.mode == "deterministic":
+            sys.setprofile(None)
+            self._frames.clear()
+        else:
+            self._stop.set()
+            self._sampler.join()
+        try:
+            return self.write(wall_ms)
+        except OSError as e:
+            print(f"⚠️ 프로파일 기록 실패: {e}")
+            return None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    # --- 기록: <시각>_<단계>_<id>.collapsed / .svg + index.jsonl 한 줄 ---
+    def write(self, wall_ms: float) -> Optional[str]:
+        if not self.stacks:
+            return None
+        day_dir = os.path.join(self.out_dir, time.strftime("%Y%m%d"))
+        os.makedirs(day_dir, exist_ok=True)
+        base = os.path.join(day_dir, f"{time.strftime('%H%M%S')}_{self.label}_{uuid.uuid4().hex[:6]}")
+        write_collapsed(self.stacks, base + ".collapsed")
+        unit = "µs" if self.mode == "deterministic" else "samples"
+        with open(base + ".svg", "w", encoding="utf-8") as f:
+            f.write(render_flamegraph(self.stacks, title=f"{self.label} ({wall_ms:.0f}ms, {self.mode})", unit=unit))
+        entry = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "label": self.label,
+            "mode": self.mode,
+            "wall_ms": round(wall_ms, 1),
+            "weight": sum(self.stacks.values()),
+            "unit": unit,
+            "file": os.path.relpath(base, self.out_dir),
+            **self.meta,
+        }
+        with open(os.path.join(self.out_dir, INDEX_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        prune(self.out_dir)
+        return base
+
+def profile(label: str, force: bool = False, **meta):
+    """with 문용: 표본 추출되었거나 force면 Profile, 아니면 아무것도 하지 않는 컨텍스트"""
+    if should_profile(force):
+        return Profile(label, meta=meta)
+    return _NoProfile()
+
+class _NoProfile:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+def wrap(label: str, func: Callable, force: bool = False, **meta) -> Callable:
+    """호출 시점의 스레드를 프로파일링하는 함수로 감쌈 (표본 추출 여부는 감쌀 때 결정 → 백그라운드 작업에도 적용)"""
+    if not should_profile(force):
+        return func
+
+    def profiled(*args, **kwargs):
+        with Profile(label, meta=meta):
+            return func(*args, **kwargs)
+    return profiled
+
+def visitor_tag(visitor_id: Optional[str]) -> str:
+    """파일/인덱스에 남길 방문자 식별값 (원본 ID 대신 짧은 해시)"""
+    return hashlib.sha256(str(visitor_id).encode("utf-8")).hexdigest()[:8] if visitor_id else ""
+
+# ============================================================================
+# 3. 출력 형식 (collapsed 스택 / 플레임그래프 SVG)
+# ============================================================================
+def write_collapsed(stacks: Counter, path: str):
+    """flamegraph.pl / speedscope 호환 'frame;frame;frame count' 형식"""
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in sorted(stacks.items()):
+            if count > 0:
+                f.write(f"{stack} {count}\n")
+
+def read_collapsed(path: str) -> Counter:
+    stacks = Counter()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack and count.isdigit():
+                stacks[stack] += int(count)
+    return stacks
+
+def _build_tree(stacks: Counter) -> dict:
+    root = {"name": "all", "value": 0, "children": {}}
+    for stack, count in stacks.items():
+        if count <= 0:
+            continue
+        root["value"] += count
+        node = root
+        for name in stack.split(";"):
+            node = node["children"].setdefault(name, {"name": name, "value": 0, "children": {}})
+            node["value"] += count
+    return root
+
+def _color(name: str) -> str:
+    digest = int(hashlib.md5(name.encode("utf-8")).hexdigest()[:6], 16)
+    return f"rgb({205 + digest % 50},{80 + (digest >> 8) % 130},{(digest >> 16) % 55})"
+
+def render_flamegraph(stacks: Counter, title: str = "", unit: str = "samples", width: int = SVG_WIDTH) -> str:
+    """호출 스택 트리 → 위에서 아래로 쌓는 플레임그래프 SVG (마우스를 올리면 비율 표시)"""
+    root = _build_tree(stacks)
+    total = max(root["value"], 1)
+    rects = []
+    max_depth = 0
+    pending = [(root, 0.0, 0)]
+    while pending:
+        node, x, depth = pending.pop()
+        w = node["value"] / total * width
+        if w < 0.3:
+            continue
+        max_depth = max(max_depth, depth)
+        y = 24 + depth * FRAME_HEIGHT
+        label = escape(node["name"])
+        tip = f"{label} ({node['value']} {unit}, {node['value'] / total:.1%})"
+        text = label[:int(w / 7)] if w > 35 else ""
+        rects.append(
+            f'<g><title>{tip}</title><rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{FRAME_HEIGHT - 1}" '
+            f'fill="{_color(node["name"])}" rx="2"/>'
+            + (f'<text x="{x + 3:.1f}" y="{y + 11}">{text}</text>' if text else "") + "</g>"
+        )
+        child_x = x
+        for child in sorted(node["children"].values(), key=lambda c: c["name"]):
+            pending.append((child, child_x, depth + 1))
+            child_x += child["value"] / total * width
+    height = 24 + (max_depth + 1) * FRAME_HEIGHT + 8
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">'
+        f'<text x="4" y="16" font-size="13">{escape(title)}</text>' + "".join(rects) + "</svg>"
+    )
+
+def top_frames(stacks: Counter, limit: int = 20) -> List[dict]:
+    """자기 시간(스택 맨 끝 프레임) 기준 상위 함수"""
+    own = Counter()
+    for stack, count in stacks.items():
+        own[stack.rsplit(";", 1)[-1]] += count
+    total = max(sum(own.values()), 1)
+    return [{"frame": frame, "weight": count, "share": round(count / total, 3)} for frame, count in own.most_common(limit)]
+
+# ============================================================================
+# 4. 보관 / 조회 (index.jsonl 기준)
+# ============================================================================
+def load_index(out_dir: str = PROFILE_DIR) -> List[dict]:
+    path = os.path.join(out_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def prune(out_dir: str = PROFILE_DIR, keep: int = MAX_PROFILES):
+    """오래된 프로파일 파일 삭제 (인덱스는 남은 파일만 유지)"""
+    entries = load_index(out_dir)
+    if len(entries) <= keep:
+        return
+    for entry in entries[:-keep]:
+        for ext in (".collapsed", ".svg"):
+            try:
+                os.remove(os.path.join(out_dir, entry["file"] + ext))
+            except OSError:
+                pass
+    with open(os.path.join(out_dir, INDEX_FILE), "w", encoding="utf-8") as f:
+        for entry in entries[-keep:]:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def merge(entries: List[dict], out_dir: str = PROFILE_DIR) -> Counter:
+    """같은 단위(샘플/µs)의 프로파일 여러 개를 합침 (표본 추출된 실제 트래픽의 누적 핫스팟)"""
+    stacks = Counter()
+    for entry in entries:
+        path = os.path.join(out_dir, entry["file"] + ".collapsed")
+        if os.path.exists(path):
+            stacks.update(read_collapsed(path))
+    return stacks
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="요청별 프로파일 조회/병합 (PROFILE_SAMPLE_RATE 또는 ?profile=<PROFILE_ADMIN_TOKEN>로 수집)")
+    parser.add_argument("command", choices=["list", "merge", "top"])
+    parser.add_argument("--dir", default=PROFILE_DIR)
+    parser.add_argument("--label", default=None, help="단계 필터 (rerun, situations, step25, analysis, chat)")
+    parser.add_argument("--mode", default="sampling", choices=["sampling", "deterministic"])
+    parser.add_argument("--last", type=int, default=50)
+    parser.add_argument("--out", default="merged", help="merge 출력 경로 (확장자 제외)")
+    args = parser.parse_args()
+
+    entries = [e for e in load_index(args.dir) if args.label in (None, e["label"])]
+    if args.command == "list":
+        for e in entries[-args.last:]:
+            print(f"{e['time']}  {e['label']:<12}{e['mode']:<15}{e['wall_ms']:>10.1f}ms  {e['file']}")
+    else:
+        selected = [e for e in entries if e["mode"] == args.mode][-args.last:]
+        stacks = merge(selected, args.dir)
+        if args.command == "top":
+            print(json.dumps(top_frames(stacks), ensure_ascii=False, indent=2))
+        else:
+            unit = "µs" if args.mode == "deterministic" else "samples"
+            write_collapsed(stacks, args.out + ".collapsed")
+            with open(args.out + ".svg", "w", encoding="utf-8") as f:
+                f.write(render_flamegraph(stacks, title=f"{args.label or 'all'} x{len(selected)} ({args.mode})", unit=unit))
+            print(f"✅ {len(selected)}개 프로파일 병합 → {args.out}.collapsed / {args.out}.svg")
@@ -0,0 +1,71 @@
+import os
+import time
+import functools
+from collections import deque
+
+import streamlit as st
+
+# ============================================================================
+# 1. 설정
+# ============================================================================
+# 항상 켜기: RERUN_PROFILER=1 / 특정 세션만: ?profile_reruns=1
+ENABLED = os.getenv("RERUN_PROFILER", "0") == "1"
+HISTORY = 50
+
+def enabled() -> bool:
+    return ENABLED or st.query_params.get("profile_reruns") == "1"
+
+def _history() -> deque:
+    if "rerun_costs" not in st.session_state:
+        st.session_state.rerun_costs = deque(maxlen=HISTORY)
+    return st.session_state.rerun_costs
+
+# ============================================================================
+# 2. 실행 시간 기록
+# ============================================================================
+def record(scope: str, elapsed: float):
+    """재실행 1회의 벽시계 시간 기록 (scope: app = 전체 스크립트, fragment:<이름> = 부분 재실행)"""
+    _history().append({
+        "scope": scope,
+        "step": st.session_state.get("step"),
+        "wall_ms": round(elapsed * 1000, 1),
+        "time": time.strftime("%H:%M:%S"),
+    })
+
+def fragment(func=None, *, name=None, run_every=None):
+    """st.fragment + 재실행 시간 기록 (fragment 안의 위젯 조작은 이 함수만 다시 실행, run_every: 주기 실행)"""
+    def decorate(f):
+        scope = f"fragment:{name or f.__name__}"
+
+        @functools.wraps(f)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                record(scope, time.perf_counter() - start)
+
+        return st.fragment(timed, run_every=run_every)
+
+    return decorate(func) if func is not None else decorate
+
+# ============================================================================
+# 3. 표시 (사이드바)
+# ============================================================================
+def render_panel():
+    """최근 재실행 비용 표 + scope별 평균/최대 (직전 실행까지 반영)"""
+    if not enabled():
+        return
+    rows = list(_history())
+    with st.sidebar.expander("⏱️ 재실행 비용", expanded=True):
+        if not rows:
+            st.caption("기록된 재실행이 없습니다.")
+            return
+        summary = {}
+        for row in rows:
+            summary.setdefault(row["scope"], []).append(row["wall_ms"])
+        st.table([
+            {"scope": scope, "runs": len(ms), "avg_ms": round(sum(ms) / len(ms), 1), "max_ms": max(ms)}
+            for scope, ms in summary.items()
+        ])
+        st.dataframe(list(reversed(rows)), hide_index=True, use_container_width=True)
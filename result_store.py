@@ -0,0 +1,125 @@
+import os
+import re
+import json
+import hashlib
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, urlencode
+from typing import Dict, List, Optional
+
+import session_store
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+# 세션 저장소와 같은 KV 인터페이스 사용 (여러 서버가 공유하려면 redis://)
+RESULT_STORE_URL = os.getenv("RESULT_STORE_URL", "sqlite:///analysis_results.db")
+RESULT_TTL_SEC = int(os.getenv("RESULT_TTL_SEC", str(30 * 24 * 3600)))
+KEY_LENGTH = 24
+# 공유 링크 기준 주소 (예: https://example.com/hilight, 미설정 시 요청 주소 사용)
+APP_BASE_URL = os.getenv("APP_BASE_URL", "")
+# ingest.py가 컬렉션별 문서 해시를 기록하는 파일 (약관 DB 폴더 안)
+INGEST_STATE_FILE = "ingest_state.json"
+FINGERPRINT_PAGE_SIZE = 5000
+
+# ============================================================================
+# 2. 입력 정규화 / 내용 주소(해시)
+# ============================================================================
+def canonical_text(text: str) -> str:
+    return re.sub(r"\s+", " ", (text or "")).strip()
+
+def canonical_tags(tags: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """카테고리/태그 순서와 빈 카테고리 차이를 없앰"""
+    return {category: sorted(set(values)) for category, values in sorted((tags or {}).items()) if values}
+
+def canonical_inputs(situation: str, product_name: str, tags: Dict[str, List[str]]) -> dict:
+    return {
+        "situation": canonical_text(situation),
+        "product": canonical_text((product_name or "").replace(".txt", "").replace("표준_", "")),
+        "tags": canonical_tags(tags),
+    }
+
+def result_key(situation: str, product_name: str, tags: Dict[str, List[str]],
+               index_version: Optional[str], prompt_version: str) -> str:
+    """정규화된 입력 + 약관 인덱스 버전 + 프롬프트 버전의 해시 (인덱스/프롬프트가 바뀌면 새 결과)"""
+    payload = {
+        "inputs": canonical_inputs(situation, product_name, tags),
+        "index_version": index_version or "legacy",
+        "prompt_version": prompt_version,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:KEY_LENGTH]
+
+def collection_fingerprint(persist_dir: str, vectorstore=None, collection_name: str = "insurance_rag") -> Optional[str]:
+    """스냅샷을 쓰지 않을 때의 약관 인덱스 버전: 증분 적재 상태(문서 해시) 또는 청크 ID 목록의 해시
+
+    청크 ID에는 내용 해시가 들어가므로, 문서가 바뀌면 증분 적재 상태가 없어도 지문이 바뀝니다.
+    """
+    state_path = os.path.join(persist_dir, INGEST_STATE_FILE)
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f).get(collection_name)
+        if state:
+            raw = json.dumps(state, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+            return "state-" + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+    if vectorstore is None:
+        return None
+    import retrievers  # numpy 포함 → 지문 계산 시점에만 import
+    ids = retrievers.collection_ids(vectorstore, FINGERPRINT_PAGE_SIZE)
+    return retrievers.ids_fingerprint(ids) if ids else None
+
+def share_url(key: str, base_url: str = "") -> str:
+    """공유 링크: 기준 주소(APP_BASE_URL 또는 현재 요청 주소)의 경로를 유지하고 쿼리만 ?result=<해시>로 교체"""
+    base_url = APP_BASE_URL or base_url
+    if not base_url:
+        return f"./?{urlencode({'result': key})}"
+    parts = urlsplit(base_url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path or "/", urlencode({"result": key}), ""))
+
+def is_valid_key(key: str) -> bool:
+    return bool(key) and len(key) == KEY_LENGTH and all(c in "0123456789abcdef" for c in key)
+
+# ============================================================================
+# 3. 결과 저장소
+# ============================================================================
+class ResultStore:
+    """분석 결과(파싱된 JSON) + 검색된 청크 ID + 소요 시간을 내용 주소로 저장"""
+
+    def __init__(self, backend: session_store.SessionBackend, ttl: int = RESULT_TTL_SEC):
+        self.backend = backend
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[dict]:
+        if not is_valid_key(key):
+            return None
+        blob = self.backend.get(f"result:{key}")
+        return session_store.loads(blob) if blob else None
+
+    def put(self, key: str, analysis: dict, inputs: dict, chunk_ids: List[str], timing: dict,
+            index_version: Optional[str], prompt_version: str) -> dict:
+        record = {
+            "key": key,
+            "analysis": analysis,
+            "inputs": inputs,
+            "chunk_ids": chunk_ids,
+            "timing": timing,
+            "index_version": index_version or "legacy",
+            "prompt_version": prompt_version,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self.backend.set(f"result:{key}", session_store.dumps(record), self.ttl)
+        return record
+
+def from_url(url: str = RESULT_STORE_URL) -> Optional[ResultStore]:
+    backend = session_store.from_url(url)
+    return ResultStore(backend) if backend is not None else None
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="저장된 분석 결과 조회")
+    parser.add_argument("key")
+    parser.add_argument("--url", default=RESULT_STORE_URL)
+    args = parser.parse_args()
+
+    found = from_url(args.url).get(args.key)
+    print(json.dumps(found, ensure_ascii=False, indent=2) if found else "결과 없음")
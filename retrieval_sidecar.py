@@ -0,0 +1,425 @@
+import os
+import json
+import zlib
+import queue
+import socket
+import struct
+import threading
+import socketserver
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import snapshot
+import ann_cache
+import compact_index
+import exact_search
+from retrievers import RetrieverStoreMixin, StaleIndexError, collection_ids, ids_fingerprint
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+# 비어 있으면 사용 안 함(워커마다 모델/인덱스 로드) / 예: /tmp/hilight-retrieval.sock
+RETRIEVAL_SOCKET = os.getenv("RETRIEVAL_SOCKET", "")
+POOL_SIZE = int(os.getenv("RETRIEVAL_POOL_SIZE", "8"))
+CALL_TIMEOUT_SEC = float(os.getenv("RETRIEVAL_TIMEOUT_SEC", "30"))
+# 여러 워커의 동시 질의를 한 번의 인코딩으로 묶는 대기 시간/최대 개수
+BATCH_WAIT_MS = float(os.getenv("RETRIEVAL_BATCH_WAIT_MS", "5"))
+BATCH_MAX = int(os.getenv("RETRIEVAL_BATCH_MAX", "32"))
+
+COLLECTIONS = {"clause": ("chroma_db_clause", "insurance_rag"), "catalog": ("chroma_db_catalog", "insurance_catalog")}
+
+# 프레임: [본문 길이 u32][op u8][flags u8] + 본문([헤더 길이 u32][헤더 JSON][float32 배열])
+_FRAME = struct.Struct("!IBB")
+_HEADER_LEN = struct.Struct("!I")
+FLAG_ZLIB = 1
+COMPRESS_MIN_BYTES = 4096
+OPS = {"ping": 1, "search": 2, "search_vector": 3, "embed": 4, "get": 5, "count": 6}
+OP_NAMES = {code: name for name, code in OPS.items()}
+STATUS_OK, STATUS_ERROR = 0, 1
+
+class SidecarError(Exception):
+    """사이드카가 요청 처리 중 실패 (서버 측 예외 메시지 전달)"""
+
+class SidecarUnavailableError(SidecarError):
+    """소켓 연결/송수신 실패 → 프로세스 내 검색으로 대체 가능"""
+
+# ============================================================================
+# 2. 바이너리 프로토콜
+# ============================================================================
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("연결 종료")
+        buf.extend(chunk)
+    return bytes(buf)
+
+def send_frame(sock: socket.socket, code: int, header: dict, vectors: Optional[np.ndarray] = None):
+    raw_header = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    tail = np.ascontiguousarray(vectors, dtype=np.float32).tobytes() if vectors is not None else b""
+    body = _HEADER_LEN.pack(len(raw_header)) + raw_header + tail
+    flags = 0
+    if len(body) >= COMPRESS_MIN_BYTES:
+        body, flags = zlib.compress(body, 1), FLAG_ZLIB
+    sock.sendall(_FRAME.pack(len(body), code, flags) + body)
+
+def recv_frame(sock: socket.socket) -> Tuple[int, dict, Optional[np.ndarray]]:
+    """(op/상태 코드, 헤더, float32 행렬 - 헤더의 shape 기준, 없으면 None)"""
+    length, code, flags = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    body = _recv_exact(sock, length)
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    (header_len,) = _HEADER_LEN.unpack_from(body)
+    header = json.loads(body[_HEADER_LEN.size:_HEADER_LEN.size + header_len].decode("utf-8"))
+    tail = body[_HEADER_LEN.size + header_len:]
+    vectors = np.frombuffer(tail, dtype=np.float32).reshape(header["shape"]) if tail else None
+    return code, header, vectors
+
+def _doc_to_wire(doc: Document, score: float) -> list:
+    return [getattr(doc, "id", None), doc.page_content, doc.metadata, float(score)]
+
+def _doc_from_wire(row: list) -> Tuple[Document, float]:
+    cid, text, meta, score = row
+    return Document(page_content=text, metadata=meta or {}, id=cid), score
+
+# ============================================================================
+# 3. 검색 저장소 열기 (app.py 프로세스 내 로드와 사이드카가 공유)
+# ============================================================================
+def open_clause_store(persist_dir: str, embedding, index_mode: str = "chroma"):
+    """약관 Chroma + (있으면) 압축 인덱스 / 상품별 전수 검색 행렬 (DB 폴더가 없으면 None)"""
+    if not (os.path.exists(persist_dir) and os.listdir(persist_dir)):
+        return None
+    from langchain_chroma import Chroma
+    chroma = Chroma(persist_directory=persist_dir, embedding_function=embedding, collection_name=COLLECTIONS["clause"][1])
+    compact_dir = os.path.join(os.path.dirname(persist_dir), compact_index.COMPACT_DIR)
+    exact_dir = os.path.join(os.path.dirname(persist_dir), exact_search.EXACT_DIR)
+    use_compact = index_mode == "compact" and os.path.isdir(compact_dir)
+    # 파생 인덱스가 현재 컬렉션으로 만들어졌는지 확인할 지문 (1회 계산해 두 인덱스가 공유)
+    fingerprint = ids_fingerprint(collection_ids(chroma)) if use_compact or os.path.isdir(exact_dir) else None
+    store = chroma
+    if use_compact:
+        # 본문/메타데이터 조회만 Chroma에 맡기고 벡터 검색은 압축 인덱스로 (컬렉션과 다르면 HNSW 사용)
+        try:
+            store = compact_index.CompactStore(compact_dir, embedding=embedding, docstore=chroma, fingerprint=fingerprint)
+        except StaleIndexError as e:
+            print(f"⚠️ {e} → HNSW 검색 사용")
+    if os.path.isdir(exact_dir):
+        # 상품이 정해진 검색은 상품별 행렬 전수 검색 (후보가 많으면 자동으로 ANN, 컬렉션과 다르면 사용 안 함)
+        try:
+            store = exact_search.ExactProductStore(exact_dir, ann_store=store, embedding=embedding, fingerprint=fingerprint)
+        except StaleIndexError as e:
+            print(f"⚠️ {e} → 상품 검색은 ANN + source 필터 사용")
+    return store
+
+def open_catalog_store(persist_dir: str, embedding):
+    if not (os.path.exists(persist_dir) and os.listdir(persist_dir)):
+        return None
+    from langchain_chroma import Chroma
+    return Chroma(persist_directory=persist_dir, embedding_function=embedding, collection_name=COLLECTIONS["catalog"][1])
+
+def search_by_vector_with_score(store, vector, k: int, filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+    if hasattr(store, "similarity_search_by_vector_with_score"):
+        return store.similarity_search_by_vector_with_score(vector, k=k, filter=filter)
+    return store.similarity_search_by_vector_with_relevance_scores(vector, k=k, filter=filter)
+
+# ============================================================================
+# 4. 사이드카 서버 (모델/인덱스 1벌, 동시 질의 배치 인코딩)
+# ============================================================================
+class BatchedEmbeddings(Embeddings):
+    """여러 연결의 인코딩 요청을 BATCH_WAIT_MS 동안 모아 embed_documents 1회로 처리"""
+
+    def __init__(self, embedding, wait_ms: float = BATCH_WAIT_MS, max_batch: int = BATCH_MAX):
+        self.embedding = embedding
+        self.wait = wait_ms / 1000
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            size = len(batch[0][0])
+            while size < self.max_batch:
+                try:
+                    item = self.requests.get(timeout=self.wait)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            texts = [text for texts, _ in batch for text in texts]
+            try:
+                vectors = self.embedding.embed_documents(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for texts, future in batch:
+                future.set_result(vectors[offset:offset + len(texts)])
+                offset += len(texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        future = Future()
+        self.requests.put((list(texts), future))
+        return future.result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+class RetrievalService:
+    """op별 처리 (활성 스냅샷이 바뀌면 다음 요청에서 인덱스를 다시 엶)"""
+
+    def __init__(self, embedding, index_mode: str = "chroma"):
+        # embedding이 None이면 벡터 요청(search_vector/get)만 처리 (예: 샤드 프로세스)
+        self.embedding = BatchedEmbeddings(embedding) if embedding is not None else None
+        self.index_mode = index_mode
+        self.version = object()
+        self.stores: Dict[str, object] = {}
+        self.lock = threading.Lock()
+
+    def store(self, collection: str):
+        version = snapshot.current_version()
+        with self.lock:
+            if version != self.version:
+                # 결과 캐시는 워커 공용 (새 스냅샷이면 캐시도 비움)
+                self.stores = {name: ann_cache.wrap(store, name, version) for name, store in self.open_stores().items()}
+                self.version = version
+            store = self.stores.get(collection)
+        if store is None:
+            raise SidecarError(f"'{collection}' 인덱스가 없습니다.")
+        return store
+
+    def open_stores(self) -> Dict[str, object]:
+        return {
+            "clause": open_clause_store(snapshot.resolve_db_dir(COLLECTIONS["clause"][0]), self.embedding, self.index_mode),
+            "catalog": open_catalog_store(snapshot.resolve_db_dir(COLLECTIONS["catalog"][0]), self.embedding),
+        }
+
+    def _embed(self, texts: List[str]):
+        if self.embedding is None:
+            raise SidecarError("이 프로세스에는 임베딩 모델이 없습니다 (search_vector 사용).")
+        return self.embedding.embed_documents(texts)
+
+    def search_vectors(self, store, vectors, k: int, product: Optional[str], filter: Optional[dict]) -> list:
+        """질의 벡터별 결과 (상품 지정 시 상품 범위 검색, 상품을 모르면 None)"""
+        results = []
+        for vector in vectors:
+            if product and hasattr(store, "search_product_by_vector_with_score"):
+                rows = store.search_product_by_vector_with_score(vector, product, k=k)
+                results.append(None if rows is None else [_doc_to_wire(doc, score) for doc, score in rows])
+            elif product:
+                if not hasattr(store, "search_product_by_vector"):
+                    results.append(None)
+                    continue
+                docs = store.search_product_by_vector(vector, product, k=k)
+                results.append(None if docs is None else [_doc_to_wire(doc, 0.0) for doc in docs])
+            else:
+                results.append([_doc_to_wire(doc, score) for doc, score in search_by_vector_with_score(store, vector, k, filter)])
+        return results
+
+    def handle(self, op: str, header: dict, vectors: Optional[np.ndarray]) -> Tuple[dict, Optional[np.ndarray]]:
+        if op == "ping":
+            return {"pid": os.getpid(), "version": snapshot.current_version(), "ann_cache": ann_cache.stats()}, None
+        if op == "embed":
+            matrix = np.asarray(self._embed(header["texts"]), dtype=np.float32)
+            return {"shape": list(matrix.shape)}, matrix
+        store = self.store(header.get("collection", "clause"))
+        if op == "search":
+            # 한 요청의 질의들은 한 번에 인코딩
+            vectors = self._embed(header["queries"])
+            return {"results": self.search_vectors(store, vectors, header["k"], header.get("product"), header.get("filter"))}, None
+        if op == "search_vector":
+            return {"results": self.search_vectors(store, vectors, header["k"], header.get("product"), header.get("filter"))}, None
+        if op == "get":
+            batch = store.get(**header["kwargs"])
+            return {"result": {key: (value.tolist() if isinstance(value, np.ndarray) else value)
+                               for key, value in batch.items()}}, None
+        if op == "count":
+            # 청크 수만 응답 (ID 목록을 주고받지 않음)
+            kwargs = header.get("kwargs", {})
+            if hasattr(store, "count_chunks"):
+                return {"count": store.count_chunks(**kwargs)}, None
+            return {"count": len(store.get(**{**kwargs, "include": []})["ids"])}, None
+        raise SidecarError(f"알 수 없는 요청: {op}")
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                code, header, vectors = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                response, matrix = self.server.service.handle(OP_NAMES.get(code, ""), header, vectors)
+                send_frame(self.request, STATUS_OK, response, matrix)
+            except Exception as e:
+                send_frame(self.request, STATUS_ERROR, {"error": f"{type(e).__name__}: {e}"})
+
+class RetrievalServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128   # 워커 수 × 연결 풀 크기보다 크게
+
+    def __init__(self, socket_path: str, service: RetrievalService):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.service = service
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+
+# ============================================================================
+# 5. 클라이언트 (워커 프로세스, 연결 풀 + 프로세스 내 검색 대체)
+# ============================================================================
+class SidecarClient:
+    def __init__(self, socket_path: str = RETRIEVAL_SOCKET, pool_size: int = POOL_SIZE, timeout: float = CALL_TIMEOUT_SEC):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def call(self, op: str, header: dict, vectors: Optional[np.ndarray] = None) -> Tuple[dict, Optional[np.ndarray]]:
+        """풀의 연결로 요청 1회 (끊긴 연결이면 새 연결로 1회 재시도)"""
+        for attempt in range(2):
+            try:
+                sock = self.pool.get_nowait()
+            except queue.Empty:
+                sock = None
+            try:
+                sock = sock or self._connect()
+                send_frame(sock, OPS[op], header, vectors)
+                status, response, matrix = recv_frame(sock)
+            except (ConnectionError, OSError) as e:
+                if sock is not None:
+                    sock.close()
+                if attempt == 1:
+                    raise SidecarUnavailableError(f"{self.socket_path}: {e}") from e
+                continue
+            try:
+                self.pool.put_nowait(sock)
+            except queue.Full:
+                sock.close()
+            if status != STATUS_OK:
+                raise SidecarError(response.get("error", "알 수 없는 오류"))
+            return response, matrix
+
+    def ping(self) -> bool:
+        try:
+            self.call("ping", {})
+            return True
+        except SidecarError:
+            return False
+
+class RemoteEmbeddings(Embeddings):
+    def __init__(self, client: SidecarClient):
+        self.client = client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        _, matrix = self.client.call("embed", {"texts": list(texts)})
+        return matrix.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+class LocalFallbackMixin:
+    """원격 검색이 불가능하면 fallback()이 돌려주는 프로세스 내 저장소로 같은 요청 처리"""
+    fallback: Optional[Callable] = None
+
+    def _remote_or_local(self, remote: Callable, local: Callable):
+        try:
+            return remote()
+        except SidecarUnavailableError as e:
+            store = self.fallback() if self.fallback else None
+            if store is None:
+                raise
+            print(f"⚠️ [{type(self).__name__}] 원격 검색 실패 → 프로세스 내 검색: {e}")
+            return local(store)
+
+class SidecarStore(LocalFallbackMixin, RetrieverStoreMixin):
+    """사이드카의 검색 저장소를 Chroma/ExactProductStore처럼 사용 (연결 실패 시 fallback() 저장소로 대체)"""
+
+    def __init__(self, client: SidecarClient, collection: str = "clause", fallback: Optional[Callable] = None):
+        self.client = client
+        self.collection = collection
+        self.fallback = fallback
+        self.embedding = RemoteEmbeddings(client)
+
+    def search_batch(self, queries: List[str], k: int = 4, product: Optional[str] = None,
+                     filter: Optional[dict] = None) -> List[Optional[List[Tuple[Document, float]]]]:
+        """질의 여러 개를 요청 1회로 검색 (product 지정 시 상품 범위, 상품을 모르면 None)"""
+        response, _ = self.client.call("search", {
+            "collection": self.collection, "queries": list(queries), "k": k, "product": product, "filter": filter,
+        })
+        return [None if rows is None else [_doc_from_wire(row) for row in rows] for rows in response["results"]]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None):
+        return self._remote_or_local(
+            lambda: self.search_batch([query], k=k, filter=filter)[0],
+            lambda store: store.similarity_search_with_score(query, k=k, filter=filter),
+        )
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: Optional[dict] = None):
+        def remote():
+            matrix = np.asarray(embedding, dtype=np.float32)[None, :]
+            response, _ = self.client.call("search_vector", {
+                "collection": self.collection, "k": k, "filter": filter, "shape": list(matrix.shape),
+            }, matrix)
+            return [_doc_from_wire(row) for row in response["results"][0]]
+        return self._remote_or_local(remote, lambda store: search_by_vector_with_score(store, embedding, k, filter))
+
+    def search_product(self, query: str, product_name: str, k: int = 8) -> Optional[list]:
+        def remote():
+            rows = self.search_batch([query], k=k, product=product_name)[0]
+            return None if rows is None else [doc for doc, _ in rows]
+        def local(store):
+            return store.search_product(query, product_name, k=k) if hasattr(store, "search_product") else None
+        return self._remote_or_local(remote, local)
+
+    def get(self, **kwargs) -> dict:
+        return self._remote_or_local(
+            lambda: self.client.call("get", {"collection": self.collection, "kwargs": kwargs})[0]["result"],
+            lambda store: store.get(**kwargs),
+        )
+
+# ============================================================================
+# 6. CLI: 사이드카 실행 / 상태 확인
+# ============================================================================
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="워커 공용 검색 사이드카 (임베딩 모델 + 약관/카탈로그 인덱스 1벌)")
+    parser.add_argument("command", choices=["serve", "ping"])
+    parser.add_argument("--socket", default=RETRIEVAL_SOCKET or "/tmp/hilight-retrieval.sock")
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--index-mode", default=os.getenv("CLAUSE_INDEX_MODE", "chroma"))
+    args = parser.parse_args()
+
+    if args.command == "ping":
+        client = SidecarClient(args.socket)
+        print(json.dumps(client.call("ping", {})[0], ensure_ascii=False) if client.ping() else "❌ 응답 없음")
+    else:
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        embeddings = HuggingFaceEmbeddings(
+            model_name=args.model,
+            model_kwargs={'device': args.device},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+        service = RetrievalService(embeddings, index_mode=args.index_mode)
+        service.store("clause")
+        with RetrievalServer(args.socket, service) as server:
+            print(f"✅ 검색 사이드카 실행: {args.socket} (pid {os.getpid()})")
+            server.serve_forever()
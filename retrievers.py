@@ -0,0 +1,108 @@
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import Field
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# ============================================================================
+# 1. LangChain 호환 리트리버 (app.py의 as_retriever(...).invoke(...) 호출부 그대로 사용)
+# ============================================================================
+class StoreRetriever(BaseRetriever):
+    store: Any
+    search_kwargs: Dict[str, Any] = Field(default_factory=dict)
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.store.similarity_search(query, **self.search_kwargs)
+
+class RetrieverStoreMixin:
+    """similarity_search_by_vector_with_score만 구현하면 Chroma 대신 쓸 수 있는 검색 저장소
+
+    점수는 코사인 유사도(클수록 유사)입니다. 문장 질의는 embedding으로 인코딩한 뒤 벡터 검색으로 처리하고,
+    본문/메타데이터 조회(get)는 docstore(Chroma)에 위임합니다.
+    """
+    docstore = None
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        raise NotImplementedError
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def as_retriever(self, search_kwargs: Optional[dict] = None, **kwargs) -> StoreRetriever:
+        return StoreRetriever(store=self, search_kwargs=search_kwargs or {})
+
+    def get(self, **kwargs) -> dict:
+        return self.docstore.get(**kwargs)
+
+# ============================================================================
+# 2. 공통 유틸
+# ============================================================================
+def export_collection(vectorstore, page_size: int = 5000) -> dict:
+    """Chroma 컬렉션의 ID/임베딩/source를 배열로 추출 (압축·전수 검색 인덱스 생성용)"""
+    ids, sources, vectors = [], [], []
+    offset = 0
+    while True:
+        batch = vectorstore.get(include=["embeddings", "metadatas"], limit=page_size, offset=offset)
+        batch_ids = batch.get("ids", [])
+        if not batch_ids:
+            break
+        ids.extend(batch_ids)
+        sources.extend((meta or {}).get("source", "") for meta in batch.get("metadatas", []))
+        vectors.append(np.asarray(batch["embeddings"], dtype=np.float32))
+        offset += len(batch_ids)
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    return {"ids": ids, "sources": sources, "embeddings": matrix}
+
+def collection_ids(vectorstore, page_size: int = 5000) -> List[str]:
+    """컬렉션의 청크 ID 전체 (임베딩/본문 없이)"""
+    ids, offset = [], 0
+    while True:
+        batch = vectorstore.get(include=[], limit=page_size, offset=offset).get("ids", [])
+        ids.extend(batch)
+        if len(batch) < page_size:
+            return ids
+        offset += len(batch)
+
+def ids_fingerprint(ids: List[str]) -> str:
+    """청크 ID 집합의 지문 (ID에 내용 해시가 들어가므로 문서가 바뀌면 지문도 바뀜)"""
+    digest = hashlib.sha256("\n".join(sorted(ids)).encode("utf-8")).hexdigest()[:16]
+    return f"ids-{len(ids)}-{digest}"
+
+class StaleIndexError(RuntimeError):
+    """파생 인덱스(압축/전수 검색)가 현재 컬렉션과 다름 → 다시 생성 필요"""
+
+def check_fresh(built: str, docstore, live: Optional[str] = None, name: str = "파생 인덱스") -> str:
+    """인덱스 생성 시점의 컬렉션 지문과 현재 컬렉션 비교 (live를 넘기면 재계산하지 않음, 다르면 StaleIndexError)"""
+    live = live or ids_fingerprint(collection_ids(docstore))
+    if built != live:
+        raise StaleIndexError(f"{name}({built})가 현재 컬렉션({live})과 다릅니다. 다시 생성하세요 (ingest.py 적재 시 자동 재생성).")
+    return live
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """점수 내림차순 상위 k개 인덱스 (argpartition으로 전체 정렬 회피)"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part])]
+
+def hydrate(docstore, ids: List[str], scores: List[float]) -> List[Tuple[Document, float]]:
+    """청크 ID로 본문/메타데이터를 가져와 (Document, 점수) 목록 구성 (순서 유지)"""
+    if not ids:
+        return []
+    batch = docstore.get(ids=list(ids), include=["documents", "metadatas"])
+    by_id = {
+        cid: Document(page_content=text or "", metadata=meta or {}, id=cid)
+        for cid, text, meta in zip(batch.get("ids", []), batch.get("documents", []), batch.get("metadatas", []))
+    }
+    return [(by_id[cid], float(score)) for cid, score in zip(ids, scores) if cid in by_id]
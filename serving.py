@@ -0,0 +1,240 @@
+import os
+import sys
+import threading
+from functools import wraps
+from collections import OrderedDict
+
+import snapshot
+import warmup
+import clause_index
+import model_router
+import result_store
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+CLAUSE_FOLDER = "chroma_db_clause"
+CATALOG_FOLDER = "chroma_db_catalog"
+MODEL_NAME = "BAAI/bge-m3"
+DEVICE = "cpu"
+# 약관 검색 인덱스: chroma(HNSW) | compact(int8/PQ 1차 검색 + 전체 정밀도 재채점)
+CLAUSE_INDEX_MODE = os.getenv("CLAUSE_INDEX_MODE", "chroma")
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+# 선택 기능 설정 (retrieval_sidecar/sharding/ann_cache와 같은 환경 변수, 켠 경우에만 해당 모듈 import)
+RETRIEVAL_SOCKET = os.getenv("RETRIEVAL_SOCKET", "")
+CLAUSE_SHARDS = [path.strip() for path in os.getenv("CLAUSE_SHARDS", "").split(",") if path.strip()]
+ANN_CACHE_SIZE = int(os.getenv("ANN_CACHE_SIZE", "4096"))
+
+# 실패해도 준비 완료로 보는 워밍업 단계 (첫 사용 시 다시 시도됨)
+OPTIONAL_WARMUP_STEPS = ("canned_query_catalog", "article_index", "index_version", "llm_client")
+
+# ============================================================================
+# 2. 프로세스 공용 캐시 (Streamlit 세션 없이도 동작 → 기동 워밍업과 app.py가 같은 객체 사용)
+# ============================================================================
+def process_cache(max_entries=None):
+    """인자별로 1회만 생성 (동시 호출은 먼저 시작한 생성을 기다림), None 결과는 저장하지 않음"""
+    def decorator(factory):
+        entries = OrderedDict()
+        locks = {}
+        guard = threading.Lock()
+
+        @wraps(factory)
+        def cached(*args):
+            with guard:
+                if args in entries:
+                    entries.move_to_end(args)
+                    return entries[args]
+                lock = locks.setdefault(args, threading.Lock())
+            with lock:
+                with guard:
+                    if args in entries:
+                        return entries[args]
+                value = factory(*args)
+                with guard:
+                    locks.pop(args, None)
+                    if value is not None:
+                        entries[args] = value
+                        while max_entries and len(entries) > max_entries:
+                            entries.popitem(last=False)
+                return value
+        return cached
+    return decorator
+
+# ============================================================================
+# 3. 리소스 로드
+# ============================================================================
+@process_cache()
+def load_embeddings():
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=MODEL_NAME,
+        model_kwargs={'device': DEVICE},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+def _cache_results(store, namespace, version):
+    """검색 결과 캐시로 감쌈 (version이 바뀌면 캐시 전체 무효화)"""
+    if store is None or ANN_CACHE_SIZE <= 0:
+        return store
+    import ann_cache
+    return ann_cache.wrap(store, namespace, version)
+
+@process_cache(max_entries=1)
+def _open_clause_store(persist_dir, version):
+    import retrieval_sidecar
+    store = retrieval_sidecar.open_clause_store(persist_dir, load_embeddings(), CLAUSE_INDEX_MODE)
+    return _cache_results(store, "clause", version)
+
+@process_cache(max_entries=1)
+def _open_catalog_store(persist_dir, version):
+    import retrieval_sidecar
+    return _cache_results(retrieval_sidecar.open_catalog_store(persist_dir, load_embeddings()), "catalog", version)
+
+_NO_SIDECAR = object()
+_sidecar = None
+_sidecar_lock = threading.Lock()
+
+def get_retrieval_sidecar():
+    """RETRIEVAL_SOCKET의 검색 사이드카 (미설정/응답 없음이면 None → 워커마다 모델/인덱스 로드)"""
+    global _sidecar
+    with _sidecar_lock:
+        if _sidecar is None:
+            _sidecar = _NO_SIDECAR
+            if RETRIEVAL_SOCKET:
+                import retrieval_sidecar
+                client = retrieval_sidecar.SidecarClient(RETRIEVAL_SOCKET)
+                if client.ping():
+                    _sidecar = client
+                else:
+                    print(f"⚠️ 검색 사이드카 응답 없음 ({RETRIEVAL_SOCKET}) → 프로세스 내 로드")
+        return None if _sidecar is _NO_SIDECAR else _sidecar
+
+def _load_local_vectorstore():
+    """약관 인덱스 버전별로 캐시 → 새 스냅샷 활성화나 제자리 증분 적재(ingest.py) 후 재시작 없이 다음 실행부터 반영"""
+    return _open_clause_store(snapshot.resolve_db_dir(CLAUSE_FOLDER), index_version())
+
+def _load_local_catalog_vectorstore():
+    """카탈로그는 스냅샷 버전, 스냅샷이 없으면 DB 파일 수정 시각별로 캐시"""
+    persist_dir = snapshot.resolve_db_dir(CATALOG_FOLDER)
+    version = snapshot.current_version() or f"mtime-{_mtime(os.path.join(persist_dir, 'chroma.sqlite3'))}"
+    return _open_catalog_store(persist_dir, version)
+
+@process_cache()
+def get_sharded_store():
+    """CLAUSE_SHARDS의 샤드 프로세스들에 상품 단위로 나눠진 약관 검색 (질의 인코딩은 사이드카 또는 이 프로세스)"""
+    import sharding
+    import retrieval_sidecar
+    sidecar = get_retrieval_sidecar()
+    embedding = retrieval_sidecar.RemoteEmbeddings(sidecar) if sidecar is not None else load_embeddings()
+    return sharding.connect(CLAUSE_SHARDS, embedding, fallback=_load_local_vectorstore)
+
+def load_vectorstore():
+    """샤드 → 사이드카 → 프로세스 내 로드 순으로 사용 (원격 검색 실패 시 프로세스 내 로드로 대체)"""
+    if CLAUSE_SHARDS:
+        return get_sharded_store()
+    sidecar = get_retrieval_sidecar()
+    if sidecar is not None:
+        import retrieval_sidecar
+        return retrieval_sidecar.SidecarStore(sidecar, "clause", fallback=_load_local_vectorstore)
+    return _load_local_vectorstore()
+
+def load_catalog_vectorstore():
+    sidecar = get_retrieval_sidecar()
+    if sidecar is not None:
+        import retrieval_sidecar
+        return retrieval_sidecar.SidecarStore(sidecar, "catalog", fallback=_load_local_catalog_vectorstore)
+    return _load_local_catalog_vectorstore()
+
+@process_cache(max_entries=1)
+def _load_article_index(persist_dir, snapshot_version):
+    """조항 번호 인덱스 로드 (파일이 없으면 약관 DB에서 1회 생성)"""
+    index_path = os.path.join(os.path.dirname(persist_dir), clause_index.ARTICLE_INDEX_FILE)
+    index = clause_index.load_article_index(index_path)
+    if index is None:
+        vectorstore = load_vectorstore()
+        if vectorstore is None:
+            return None
+        index = clause_index.build_article_index(vectorstore)
+        clause_index.save_article_index(index, index_path)
+    return index
+
+def load_article_index():
+    return _load_article_index(snapshot.resolve_db_dir(CLAUSE_FOLDER), index_version())
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _clause_docstore(persist_dir):
+    """지문 계산용 약관 컬렉션 (임베딩 모델 없이 ID 목록만 조회, 원격 검색이면 원격 저장소)"""
+    if CLAUSE_SHARDS or get_retrieval_sidecar() is not None:
+        return load_vectorstore()
+    if not (os.path.exists(persist_dir) and os.listdir(persist_dir)):
+        return None
+    import retrieval_sidecar
+    from langchain_chroma import Chroma
+    return Chroma(persist_directory=persist_dir, collection_name=retrieval_sidecar.COLLECTIONS["clause"][1])
+
+@process_cache(max_entries=1)
+def _index_fingerprint(persist_dir, state_mtime, db_mtime):
+    # 증분 적재 상태 파일이 있으면 그 해시만 사용 (컬렉션을 열지 않음)
+    fingerprint = result_store.collection_fingerprint(persist_dir) if state_mtime is not None else None
+    return fingerprint or result_store.collection_fingerprint(persist_dir, _clause_docstore(persist_dir))
+
+def index_version():
+    """약관 인덱스 버전 (결과 저장소 키, 검색 결과 캐시/조항 인덱스 무효화 기준)
+
+    활성 스냅샷 버전, 없으면 컬렉션 지문 (DB/증분 적재 상태가 바뀌면 다시 계산)
+    """
+    version = snapshot.current_version()
+    if version:
+        return version
+    persist_dir = snapshot.resolve_db_dir(CLAUSE_FOLDER)
+    return _index_fingerprint(persist_dir, _mtime(os.path.join(persist_dir, result_store.INGEST_STATE_FILE)),
+                              _mtime(os.path.join(persist_dir, "chroma.sqlite3")))
+
+@process_cache()
+def get_llm():
+    """프로세스 공용 LLM 게이트웨이 (단계별 모델/출력 토큰/타임아웃은 model_router 설정)"""
+    return model_router.build_gateway()
+
+# ============================================================================
+# 4. 워밍업 (프로세스 기동 시 1회, 실패 시 다음 페이지 로드에서 재시도)
+# ============================================================================
+def warmup_steps():
+    # 사이드카 사용 시 모델/인덱스는 사이드카가 보유하므로 이 프로세스에서는 로드하지 않음
+    local_steps = [] if get_retrieval_sidecar() is not None else [
+        ("embedding_model_load", load_embeddings),
+        ("dummy_encode", lambda: warmup.encode_dummy(load_embeddings())),
+        ("touch_clause_index", lambda: warmup.touch_files(snapshot.resolve_db_dir(CLAUSE_FOLDER))),
+        ("touch_catalog_index", lambda: warmup.touch_files(snapshot.resolve_db_dir(CATALOG_FOLDER))),
+    ]
+    return local_steps + [
+        ("canned_query_clause", lambda: warmup.canned_query(load_vectorstore())),
+        ("canned_query_catalog", lambda: warmup.canned_query(load_catalog_vectorstore())),
+        ("article_index", load_article_index),
+        ("index_version", index_version),
+        ("llm_client", get_llm),
+    ]
+
+def start_warmup():
+    """준비 상태 엔드포인트 실행 + 모델/인덱스/LLM 클라이언트 백그라운드 워밍업 (이미 진행 중/완료면 그대로)"""
+    warmup.start_readiness_server()
+    return warmup.start_background(warmup_steps, optional=OPTIONAL_WARMUP_STEPS)
+
+def launch(streamlit_args):
+    """워커 기동: 첫 방문자를 기다리지 않고 워밍업을 시작한 뒤 같은 프로세스에서 Streamlit 실행"""
+    start_warmup()
+    from streamlit.web import cli as stcli
+    sys.argv = ["streamlit", "run", APP_SCRIPT] + list(streamlit_args)
+    return stcli.main()
+
+# ============================================================================
+# 5. CLI: 워커 실행 (python serving.py --server.port 8501)
+# ============================================================================
+if __name__ == "__main__":
+    # app.py가 import하는 serving 모듈과 같은 객체를 워밍업해야 하므로 __main__이 아닌 모듈로 실행
+    import serving
+    sys.exit(serving.launch(sys.argv[1:]))
@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import secrets
+import threading
+from typing import Dict, Iterable, List, Optional
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+# 비어 있으면 사용 안 함(프로세스별 st.session_state만 사용) / sqlite:///sessions.db / redis://host:6379/0
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "")
+SESSION_TTL_SEC = int(os.getenv("SESSION_TTL_SEC", str(24 * 3600)))
+CHAT_HISTORY_MAX = int(os.getenv("CHAT_HISTORY_MAX", "40"))
+COMPRESS_MIN_BYTES = 512
+PURGE_INTERVAL_SEC = 600
+
+# 매 실행 함께 저장/복원하는 작은 필드
+CORE_FIELDS = (
+    "visitor_id", "step", "selected_interest", "selected_tags", "natural_language_inputs", "free_text_input",
+    "situation", "generated_situations", "selected_situation", "selected_product", "selected_product_name",
+    "consult_count", "open_time_str", "step_start_time", "consultation_submitted", "result_hash",
+    "provisional",
+)
+# 필드별 키로 따로 저장하고, 해당 단계에 들어설 때만 읽는 큰 필드
+LAZY_FIELDS = ("catalog_result", "keyword_analysis", "product_recommendations", "analysis_result", "chat_history")
+STEP_FIELDS = {
+    2.5: ("keyword_analysis", "product_recommendations"),
+    3: ("keyword_analysis", "product_recommendations", "analysis_result", "chat_history"),
+}
+
+PENDING_KEY = "_store_pending"
+DIGESTS_KEY = "_store_digests"
+
+# ============================================================================
+# 2. 직렬화 (JSON + 큰 값만 zlib 압축)
+# ============================================================================
+def dumps(value) -> bytes:
+    raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) >= COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(raw, 6)
+    return b"j" + raw
+
+def loads(blob: bytes):
+    if blob[:1] == b"z":
+        return json.loads(zlib.decompress(blob[1:]).decode("utf-8"))
+    return json.loads(blob[1:].decode("utf-8"))
+
+def digest(blob: bytes) -> str:
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+# ============================================================================
+# 3. 저장소 백엔드 (공용 KV 인터페이스)
+# ============================================================================
+class SessionBackend:
+    """get/set/delete/touch만 구현하면 되는 키-값 저장소 (값은 bytes, 만료는 초 단위 TTL)"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: int):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def touch(self, key: str, ttl: int):
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        return 0
+
+class SQLiteBackend(SessionBackend):
+    """같은 서버의 여러 워커가 공유하는 로컬 파일 저장소 (WAL 모드)"""
+
+    def __init__(self, path: str = "sessions.db"):
+        self.path = path
+        # Streamlit 실행 스레드마다 연결을 열면 닫히지 않고 쌓이므로 연결 1개를 잠금으로 공유
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.last_purge = 0.0
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at)")
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM kv WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: int):
+        self._execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                      (key, sqlite3.Binary(value), time.time() + ttl))
+        if time.time() - self.last_purge > PURGE_INTERVAL_SEC:
+            self.purge_expired()
+
+    def delete(self, key: str):
+        self._execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def touch(self, key: str, ttl: int):
+        self._execute("UPDATE kv SET expires_at = ? WHERE key = ?", (time.time() + ttl, key))
+
+    def purge_expired(self) -> int:
+        self.last_purge = time.time()
+        return self._execute("DELETE FROM kv WHERE expires_at <= ?", (self.last_purge,)).rowcount
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class RedisBackend(SessionBackend):
+    """여러 서버가 공유하는 Redis 저장소 (redis 패키지 필요, 만료는 Redis TTL)"""
+
+    def __init__(self, url: str):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: int):
+        self.client.set(key, value, ex=ttl)
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def touch(self, key: str, ttl: int):
+        self.client.expire(key, ttl)
+
+def from_url(url: str = SESSION_STORE_URL) -> Optional[SessionBackend]:
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url)
+    raise ValueError(f"지원하지 않는 세션 저장소 URL: {url}")
+
+# ============================================================================
+# 4. 세션 상태 복원 / 저장
+# ============================================================================
+def new_token() -> str:
+    """세션 복원 토큰 (주소의 sid, 저장소 키에만 사용 - 로그에 남는 visitor_id와 분리)"""
+    return secrets.token_urlsafe(32)
+
+def _core_key(token: str) -> str:
+    return f"sess:{token}"
+
+def _field_key(token: str, field: str) -> str:
+    return f"sess:{token}:{field}"
+
+def restore(backend: SessionBackend, state, token: str) -> bool:
+    """작은 필드만 즉시 복원하고 큰 필드는 보류 목록에 등록 (저장된 세션이 없으면 False)"""
+    blob = backend.get(_core_key(token))
+    if blob is None:
+        return False
+    core = loads(blob)
+    for field in CORE_FIELDS:
+        if field in core:
+            state[field] = core[field]
+    state[PENDING_KEY] = [field for field in core.get("_lazy", []) if field in LAZY_FIELDS]
+    state[DIGESTS_KEY] = {}
+    return True
+
+def ensure_loaded(backend: SessionBackend, state, fields: Iterable[str]):
+    """보류 중인 큰 필드를 처음 필요할 때 읽어 옴"""
+    pending = state.get(PENDING_KEY) or []
+    if not pending:
+        return
+    token = state["session_token"]
+    for field in [f for f in fields if f in pending]:
+        blob = backend.get(_field_key(token, field))
+        if blob is not None:
+            state[field] = loads(blob)
+            state[DIGESTS_KEY][field] = digest(blob)
+        pending.remove(field)
+
+def load_for_step(backend: SessionBackend, state, step):
+    ensure_loaded(backend, state, STEP_FIELDS.get(step, ()))
+
+def cap_chat_history(history: List[dict], limit: int = CHAT_HISTORY_MAX) -> List[dict]:
+    """오래된 대화부터 제거 (질문/답변 쌍이 깨지지 않도록 짝수 개 유지)"""
+    if len(history) <= limit:
+        return history
+    keep = limit - (limit % 2)
+    return history[-keep:] if keep else []
+
+def persist(backend: SessionBackend, state, ttl: int = SESSION_TTL_SEC):
+    """변경된 필드만 기록 (큰 필드는 필드별 키, 보류 중인 필드는 건드리지 않고 만료만 연장)"""
+    token = state.get("session_token")
+    if not token:
+        return
+    digests: Dict[str, str] = state.get(DIGESTS_KEY) or {}
+    pending = state.get(PENDING_KEY) or []
+    if state.get("chat_history"):
+        state["chat_history"] = cap_chat_history(state["chat_history"])
+
+    stored_lazy = []
+    for field in LAZY_FIELDS:
+        key = _field_key(token, field)
+        if field in pending:
+            stored_lazy.append(field)
+            backend.touch(key, ttl)
+            continue
+        value = state.get(field)
+        if value in (None, [], ""):
+            if field in digests:
+                backend.delete(key)
+                digests.pop(field)
+            continue
+        blob = dumps(value)
+        stored_lazy.append(field)
+        if digests.get(field) != digest(blob):
+            backend.set(key, blob, ttl)
+            digests[field] = digest(blob)
+        else:
+            backend.touch(key, ttl)
+
+    core = {field: state[field] for field in CORE_FIELDS if field in state}
+    core["_lazy"] = stored_lazy
+    # 작은 필드는 변경이 없어도 매번 기록해 세션 만료 시각 연장
+    backend.set(_core_key(token), dumps(core), ttl)
+    state[DIGESTS_KEY] = digests
+
+def clear(backend: SessionBackend, token: str):
+    for field in LAZY_FIELDS:
+        backend.delete(_field_key(token, field))
+    backend.delete(_core_key(token))
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="세션 저장소 상태 확인 / 만료 세션 정리")
+    parser.add_argument("command", choices=["purge", "show"])
+    parser.add_argument("--url", default=SESSION_STORE_URL or "sqlite:///sessions.db")
+    parser.add_argument("--token", default=None, help="세션 토큰 (주소의 sid)")
+    args = parser.parse_args()
+
+    store = from_url(args.url)
+    if args.command == "purge":
+        print(f"🧹 만료 세션 항목 {store.purge_expired()}개 삭제")
+    else:
+        found = store.get(_core_key(args.token or ""))
+        print(json.dumps(loads(found), ensure_ascii=False, indent=2) if found else "세션 없음")
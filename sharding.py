@@ -0,0 +1,347 @@
+import os
+import json
+import bisect
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+import snapshot
+import exact_search
+import retrieval_sidecar
+from retrieval_sidecar import LocalFallbackMixin, SidecarClient, SidecarError, SidecarUnavailableError
+from retrievers import RetrieverStoreMixin, hydrate
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+# 비어 있으면 사용 안 함 / 샤드 소켓 경로를 샤드 번호 순서대로: /tmp/hilight-shard-0.sock,/tmp/hilight-shard-1.sock
+SHARD_SOCKETS = [path.strip() for path in os.getenv("CLAUSE_SHARDS", "").split(",") if path.strip()]
+# 샤드별 응답 대기 시간 (넘기면 해당 샤드를 빼고 부분 결과로 병합)
+SHARD_TIMEOUT_SEC = float(os.getenv("SHARD_TIMEOUT_SEC", "2"))
+VNODES = 64
+DEFAULT_SOCKET = "/tmp/hilight-shard-{}.sock"
+CLAUSE_FOLDER = "chroma_db_clause"
+
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="shard")
+
+def shard_names(count: int) -> List[str]:
+    return [f"shard-{i}" for i in range(count)]
+
+# ============================================================================
+# 2. 상품 → 샤드 배치 (consistent hashing, 샤드 추가 시 일부 상품만 이동)
+# ============================================================================
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+class HashRing:
+    def __init__(self, shards: List[str], vnodes: int = VNODES):
+        self.points = sorted((_hash(f"{shard}#{i}"), shard) for shard in shards for i in range(vnodes))
+        self.keys = [point for point, _ in self.points]
+
+    def shard_for(self, source: str) -> str:
+        """상품 약관 파일(source)을 담당하는 샤드"""
+        i = bisect.bisect(self.keys, _hash(source)) % len(self.keys)
+        return self.points[i][1]
+
+def shard_map(sources: List[str], ring: HashRing) -> Dict[str, List[str]]:
+    assignment: Dict[str, List[str]] = {}
+    for source in sources:
+        assignment.setdefault(ring.shard_for(source), []).append(source)
+    return assignment
+
+def exact_index_dir(persist_dir: Optional[str] = None) -> str:
+    persist_dir = persist_dir or snapshot.resolve_db_dir(CLAUSE_FOLDER)
+    return os.path.join(os.path.dirname(persist_dir), exact_search.EXACT_DIR)
+
+def load_sources(index_dir: Optional[str] = None) -> Optional[List[str]]:
+    """상품별 행렬 인덱스의 source 목록 (없으면 None → 상품 검색은 전체 샤드로)"""
+    path = os.path.join(index_dir or exact_index_dir(), exact_search.PRODUCTS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return list(json.load(f)["products"])
+
+# ============================================================================
+# 3. 샤드 저장소 (담당 상품의 행렬만 전수 검색, 본문은 Chroma에서 조회)
+# ============================================================================
+class ShardStore(RetrieverStoreMixin):
+    """담당 상품 행렬만 memmap으로 여는 검색 저장소 (HNSW 인덱스를 올리지 않으므로 메모리 = 파티션 크기)"""
+
+    def __init__(self, index_dir: str, docstore, shard: str, ring: HashRing):
+        self.exact = exact_search.ExactProductStore(index_dir, ann_store=docstore, embedding=None)
+        self.docstore = docstore
+        self.shard = shard
+        self.owned = [source for source in self.exact.products if ring.shard_for(source) == shard]
+        self.owned_set = set(self.owned)
+        self.owned_ids = {cid for source in self.owned for cid in self.exact.products[source]["ids"]}
+
+    def _sources(self, filter: Optional[dict]) -> List[str]:
+        source = (filter or {}).get("source")
+        if source is None:
+            return self.owned
+        wanted = source.get("$in", []) if isinstance(source, dict) else [source]
+        return [s for s in wanted if s in self.owned_set]
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: Optional[dict] = None):
+        ids, scores = self.exact.exact_search(embedding, self._sources(filter), k)
+        return hydrate(self.docstore, ids, scores)
+
+    def search_product_by_vector_with_score(self, embedding, product_name: str, k: int = 8) -> Optional[list]:
+        sources = [s for s in self.exact.resolve_sources(product_name) if s in self.owned_set]
+        if not sources:
+            return None
+        ids, scores = self.exact.exact_search(embedding, sources, k)
+        return hydrate(self.docstore, ids, scores)
+
+    def get(self, ids: Optional[List[str]] = None, **kwargs) -> dict:
+        """담당 청크만 반환 (ids 지정 시 담당 ID만, 아니면 담당 source 조건 추가)"""
+        empty = {"ids": [], "documents": [], "metadatas": []}
+        if ids is not None:
+            owned = [cid for cid in ids if cid in self.owned_ids]
+            return self.docstore.get(ids=owned, **kwargs) if owned else empty
+        if not self.owned:
+            return empty
+        where = {"source": {"$in": self.owned}}
+        if kwargs.get("where"):
+            where = {"$and": [kwargs["where"], where]}
+        return self.docstore.get(**{**kwargs, "where": where})
+
+    def count_chunks(self, where: Optional[dict] = None) -> int:
+        """담당 청크 수 (조건이 없으면 ID 목록 조회 없이 담당 ID 수)"""
+        if not where:
+            return len(self.owned_ids)
+        return len(self.get(where=where, include=[])["ids"])
+
+class ShardService(retrieval_sidecar.RetrievalService):
+    """샤드 프로세스: 임베딩 모델 없이 벡터 검색(search_vector)/본문 조회(get)만 처리"""
+
+    def __init__(self, shard_index: int, shard_count: int):
+        super().__init__(None)
+        self.names = shard_names(shard_count)
+        self.shard = self.names[shard_index]
+
+    def open_stores(self) -> Dict[str, object]:
+        from langchain_chroma import Chroma
+        persist_dir = snapshot.resolve_db_dir(CLAUSE_FOLDER)
+        docstore = Chroma(persist_directory=persist_dir, collection_name=retrieval_sidecar.COLLECTIONS["clause"][1])
+        return {"clause": ShardStore(exact_index_dir(persist_dir), docstore, self.shard, HashRing(self.names))}
+
+# ============================================================================
+# 4. 코디네이터 (scatter-gather, 점수 기준 top-k 병합, 샤드별 타임아웃)
+# ============================================================================
+def merge_top_k(result_lists: List[List[Tuple[Document, float]]], k: int) -> List[Tuple[Document, float]]:
+    """샤드별 결과를 점수(코사인 유사도) 내림차순으로 병합, 청크 ID 중복 제거"""
+    merged, seen = [], set()
+    for doc, score in sorted((row for rows in result_lists for row in rows), key=lambda row: -row[1]):
+        key = doc.id or doc.page_content
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append((doc, score))
+        if len(merged) >= k:
+            break
+    return merged
+
+class ShardedStore(LocalFallbackMixin, RetrieverStoreMixin):
+    """샤드 프로세스들을 하나의 검색 저장소로 사용 (app.py의 as_retriever/search_product/get 호출부 그대로)"""
+
+    def __init__(self, clients: List[SidecarClient], embedding, sources: Optional[List[str]] = None,
+                 timeout: float = SHARD_TIMEOUT_SEC, fallback: Optional[Callable] = None):
+        self.names = shard_names(len(clients))
+        self.ring = HashRing(self.names)
+        self.clients = dict(zip(self.names, clients))
+        self.embedding = embedding
+        self.sources = sources
+        self.timeout = timeout
+        self.fallback = fallback
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._counts_lock = threading.Lock()
+
+    def route(self, filter: Optional[dict] = None, product: Optional[str] = None) -> List[str]:
+        """요청을 받을 샤드 (source/상품이 정해지면 담당 샤드만, 아니면 전체)"""
+        if product is not None:
+            if self.sources is None:
+                return self.names
+            matched = [s for s in self.sources if s == product] or [s for s in self.sources if product and product in s]
+            return sorted({self.ring.shard_for(s) for s in matched})
+        source = (filter or {}).get("source")
+        if isinstance(source, str):
+            return [self.ring.shard_for(source)]
+        if isinstance(source, dict) and "$in" in source:
+            return sorted({self.ring.shard_for(s) for s in source["$in"]})
+        return self.names
+
+    def scatter(self, shards: List[str], op: str, header: dict, vectors: Optional[np.ndarray] = None) -> Dict[str, dict]:
+        """샤드에 동시에 요청하고 제한 시간 안에 응답한 샤드만 반환 (전부 실패하면 SidecarUnavailableError)"""
+        futures = {_executor.submit(self.clients[name].call, op, header, vectors): name for name in shards}
+        done, not_done = wait(futures, timeout=self.timeout)
+        responses, missing = {}, [futures[f] for f in not_done]
+        for future in done:
+            try:
+                responses[futures[future]] = future.result()[0]
+            except SidecarError as e:
+                missing.append(f"{futures[future]}({e})")
+        if missing:
+            print(f"⚠️ [샤드] 응답 없음/실패 → 부분 결과: {', '.join(sorted(missing))}")
+        if shards and not responses:
+            raise SidecarUnavailableError(f"모든 샤드 응답 없음: {', '.join(shards)}")
+        return responses
+
+    def _search(self, vector, k: int, filter: Optional[dict] = None, product: Optional[str] = None) -> Optional[list]:
+        shards = self.route(filter=filter, product=product)
+        if not shards:
+            return None
+        matrix = np.asarray(vector, dtype=np.float32)[None, :]
+        responses = self.scatter(shards, "search_vector", {
+            "collection": "clause", "k": k, "filter": filter, "product": product, "shape": list(matrix.shape),
+        }, matrix)
+        results = [rows for response in responses.values() for rows in response["results"] if rows is not None]
+        if product is not None and not results:
+            return None
+        return merge_top_k([[retrieval_sidecar._doc_from_wire(row) for row in rows] for rows in results], k)
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: Optional[dict] = None):
+        return self._remote_or_local(
+            lambda: self._search(embedding, k, filter=filter),
+            lambda store: retrieval_sidecar.search_by_vector_with_score(store, embedding, k, filter),
+        )
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k, filter=filter)
+
+    def search_product(self, query: str, product_name: str, k: int = 8) -> Optional[list]:
+        def remote():
+            rows = self._search(self.embedding.embed_query(query), k, product=product_name)
+            return None if rows is None else [doc for doc, _ in rows]
+        def local(store):
+            return store.search_product(query, product_name, k=k) if hasattr(store, "search_product") else None
+        return self._remote_or_local(remote, local)
+
+    def _get_ids(self, ids: List[str], kwargs: dict) -> dict:
+        """청크 ID 조회를 모든 샤드에 보내고 요청 순서대로 병합 (각 샤드는 담당 ID만 반환)"""
+        responses = self.scatter(self.names, "get", {"collection": "clause", "kwargs": {**kwargs, "ids": ids}})
+        rows, keys = {}, []
+        for response in responses.values():
+            batch = response["result"]
+            columns = [key for key, values in batch.items() if key != "ids" and isinstance(values, list)]
+            keys.extend(key for key in columns if key not in keys)
+            for i, cid in enumerate(batch["ids"]):
+                rows[cid] = {key: batch[key][i] for key in columns}
+        found = [cid for cid in ids if cid in rows]
+        return {"ids": found, **{key: [rows[cid].get(key) for cid in found] for key in keys}}
+
+    def _shard_counts(self, kwargs: dict) -> Dict[str, int]:
+        """샤드별 청크 수 (count 요청을 샤드에 동시에 보냄, 한 샤드라도 실패하면 offset을 맞출 수 없으므로 예외)"""
+        futures = {name: _executor.submit(self.clients[name].call, "count", {"collection": "clause", "kwargs": kwargs})
+                   for name in self.names}
+        return {name: future.result()[0]["count"] for name, future in futures.items()}
+
+    def _get_paged(self, kwargs: dict) -> dict:
+        """샤드 순서대로 이어 붙인 전체 청크에서 offset/limit 적용 (조항 인덱스 생성 등 전체 순회용)
+
+        샤드별 청크 수는 조건(where)별로 한 번만 세고 이후 페이지에서 재사용합니다.
+        offset=0(새 순회 시작)이면 다시 셉니다.
+        """
+        limit, offset = kwargs.pop("limit", None), kwargs.pop("offset", None) or 0
+        count_kwargs = {key: value for key, value in kwargs.items() if key == "where"}
+        key = json.dumps(count_kwargs, ensure_ascii=False, sort_keys=True)
+        with self._counts_lock:
+            if offset == 0:
+                self._counts.pop(key, None)
+            counts = self._counts.get(key)
+        if counts is None and offset > 0:
+            counts = self._shard_counts(count_kwargs)
+            with self._counts_lock:
+                self._counts[key] = counts
+        merged: Dict[str, list] = {"ids": []}
+        for name in self.names:
+            # 첫 페이지(offset=0)는 건너뛸 샤드가 없으므로 세지 않음
+            if counts is not None and offset >= counts[name]:
+                offset -= counts[name]
+                continue
+            take = None if limit is None else limit - len(merged["ids"])
+            batch = self.clients[name].call("get", {"collection": "clause", "kwargs": {**kwargs, "offset": offset, "limit": take}})[0]["result"]
+            for column, values in batch.items():
+                if isinstance(values, list):
+                    merged.setdefault(column, []).extend(values)
+            offset = 0
+            if limit is not None and len(merged["ids"]) >= limit:
+                break
+        return merged
+
+    def get(self, **kwargs) -> dict:
+        def remote():
+            ids = kwargs.get("ids")
+            if ids is not None:
+                return self._get_ids(list(ids), {k: v for k, v in kwargs.items() if k != "ids"})
+            return self._get_paged(dict(kwargs))
+        return self._remote_or_local(remote, lambda store: store.get(**kwargs))
+
+def connect(sockets: List[str] = SHARD_SOCKETS, embedding=None, timeout: float = SHARD_TIMEOUT_SEC,
+            fallback: Optional[Callable] = None) -> ShardedStore:
+    return ShardedStore([SidecarClient(path) for path in sockets], embedding, sources=load_sources(),
+                        timeout=timeout, fallback=fallback)
+
+# ============================================================================
+# 5. CLI: 샤드 실행 / 로컬 다중 프로세스 / 배치 확인 / 질의
+# ============================================================================
+if __name__ == "__main__":
+    import sys
+    import time
+    import argparse
+    import subprocess
+
+    parser = argparse.ArgumentParser(description="상품 단위 약관 검색 샤드")
+    parser.add_argument("command", choices=["serve", "local", "map", "query"])
+    parser.add_argument("text", nargs="?", default="보험금을 지급하지 않는 사유")
+    parser.add_argument("--shard", type=int, default=0)
+    parser.add_argument("--shards", type=int, default=len(SHARD_SOCKETS) or 2)
+    parser.add_argument("--socket", default=None)
+    parser.add_argument("--product", default=None)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    sockets = SHARD_SOCKETS or [DEFAULT_SOCKET.format(i) for i in range(args.shards)]
+
+    if args.command == "serve":
+        service = ShardService(args.shard, args.shards)
+        store = service.store("clause")
+        socket_path = args.socket or sockets[args.shard]
+        with retrieval_sidecar.RetrievalServer(socket_path, service) as server:
+            print(f"✅ {service.shard}/{args.shards}: 상품 {len(store.owned)}개, 청크 {len(store.owned_ids)}개 ({socket_path})")
+            server.serve_forever()
+    elif args.command == "local":
+        # 개발/테스트용: 샤드 N개를 로컬 프로세스로 실행 (Ctrl+C로 모두 종료)
+        procs = [subprocess.Popen([sys.executable, __file__, "serve", "--shard", str(i), "--shards", str(args.shards),
+                                   "--socket", sockets[i]]) for i in range(args.shards)]
+        print(f"CLAUSE_SHARDS={','.join(sockets[:args.shards])}")
+        try:
+            while all(proc.poll() is None for proc in procs):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for proc in procs:
+                proc.terminate()
+    elif args.command == "map":
+        sources = load_sources() or []
+        for shard, owned in sorted(shard_map(sources, HashRing(shard_names(args.shards))).items()):
+            print(f"{shard}: 상품 {len(owned)}개")
+            for source in owned:
+                print(f"  - {source}")
+    else:
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        embeddings = HuggingFaceEmbeddings(model_name="BAAI/bge-m3", model_kwargs={'device': 'cpu'},
+                                           encode_kwargs={'normalize_embeddings': True})
+        store = connect(sockets, embeddings)
+        start = time.perf_counter()
+        docs = store.search_product(args.text, args.product, k=args.k) if args.product else \
+            [doc for doc, _ in store.similarity_search_with_score(args.text, k=args.k)]
+        print(f"⏱️ {(time.perf_counter() - start) * 1000:.1f}ms")
+        for doc in docs or []:
+            print(f"- {doc.metadata.get('source')} | {doc.page_content[:80]!r}")
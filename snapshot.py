@@ -0,0 +1,388 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import zipfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_ROOT = os.path.join(BASE_PATH, "vector_snapshots")
+CURRENT_LINK = "current"
+MANIFEST_FILE = "manifest.json"
+# 같은 스냅샷 폴더를 쓰는 워커 프로세스들의 갱신 직렬화용 잠금 파일
+SYNC_LOCK_FILE = ".sync.lock"
+MANIFEST_URL = os.getenv("VECTOR_DB_MANIFEST_URL", "")
+
+CHUNK_SIZE = 1024 * 1024
+RANGE_PARTS = 4
+DOWNLOAD_WORKERS = 4
+REQUEST_TIMEOUT = 30
+REFRESH_INTERVAL_SEC = int(os.getenv("VECTOR_DB_REFRESH_SEC", "600"))
+
+class RangeNotSupported(Exception):
+    pass
+
+# ============================================================================
+# 2. 경로 및 버전 조회
+# ============================================================================
+def current_dir(root: str = SNAPSHOT_ROOT) -> str:
+    return os.path.join(root, CURRENT_LINK)
+
+def current_version(root: str = SNAPSHOT_ROOT) -> Optional[str]:
+    """현재 활성 스냅샷 버전 (스냅샷을 쓰지 않으면 None)"""
+    manifest_path = os.path.join(current_dir(root), MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("version")
+    except Exception:
+        return None
+
+def resolve_db_dir(folder: str, root: str = SNAPSHOT_ROOT) -> str:
+    """활성 스냅샷이 있으면 그 안의 DB 폴더, 없으면 기존 위치(./folder) 반환
+
+    current 링크가 아닌 버전 폴더의 실제 경로를 반환합니다. chromadb는 클라이언트를 저장 경로별로 캐시하므로,
+    링크 경로를 쓰면 교체 후에도 이전 버전의 sqlite/HNSW 세그먼트를 계속 쓸 수 있습니다.
+    """
+    snapshot_path = os.path.realpath(os.path.join(current_dir(root), folder))
+    if os.path.isdir(snapshot_path):
+        return snapshot_path
+    return os.path.join(".", folder)
+
+# ============================================================================
+# 3. 무결성 검증
+# ============================================================================
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def verify_tree(target_dir: str, files: Dict[str, dict]):
+    """압축 해제된 파일의 크기/sha256을 manifest와 대조"""
+    for rel_path, meta in files.items():
+        path = os.path.join(target_dir, rel_path)
+        if not os.path.exists(path):
+            raise ValueError(f"누락된 파일: {rel_path}")
+        if os.path.getsize(path) != meta["size"]:
+            raise ValueError(f"크기 불일치: {rel_path}")
+        if sha256_file(path) != meta["sha256"]:
+            raise ValueError(f"체크섬 불일치: {rel_path}")
+
+# ============================================================================
+# 4. 병렬 / 재개 가능 다운로드
+# ============================================================================
+def _load_progress(progress_path: str) -> dict:
+    if os.path.exists(progress_path):
+        try:
+            with open(progress_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {}
+
+def _download_range(url: str, part_path: str, start: int, end: int, done: int,
+                    on_block: Optional[Callable[[int], None]] = None) -> int:
+    """[start+done, end] 구간을 받아 part 파일의 해당 위치에 기록, 받은 바이트 수 반환
+    (on_block: 블록을 기록할 때마다 지금까지 받은 바이트 수로 호출 → 중단되어도 블록 단위로 이어받기)"""
+    received = done
+    if start + received > end:
+        return received
+    headers = {"Range": f"bytes={start + received}-{end}"}
+    with requests.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as resp:
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            raise RangeNotSupported(url)
+        with open(part_path, "r+b") as f:
+            f.seek(start + received)
+            for block in resp.iter_content(CHUNK_SIZE):
+                f.write(block)
+                received += len(block)
+                if on_block is not None:
+                    # 진행 상황보다 데이터가 먼저 파일에 반영되도록
+                    f.flush()
+                    on_block(received)
+    return received
+
+def _download_whole(url: str, part_path: str):
+    with requests.get(url, stream=True, timeout=REQUEST_TIMEOUT) as resp:
+        resp.raise_for_status()
+        with open(part_path, "wb") as f:
+            for block in resp.iter_content(CHUNK_SIZE):
+                f.write(block)
+
+def download_bundle(bundle: dict, download_dir: str, parts: int = RANGE_PARTS) -> str:
+    """번들을 구간별로 병렬 다운로드 (중단 시 이어받기), 검증 후 경로 반환"""
+    os.makedirs(download_dir, exist_ok=True)
+    final_path = os.path.join(download_dir, bundle["name"])
+    if os.path.exists(final_path) and sha256_file(final_path) == bundle["sha256"]:
+        return final_path
+
+    part_path = f"{final_path}.part"
+    progress_path = f"{part_path}.json"
+    size = int(bundle["size"])
+    progress = _load_progress(progress_path)
+
+    # 이전 진행 상황이 다른 번들의 것이면 처음부터
+    if progress.get("sha256") != bundle["sha256"] or not os.path.exists(part_path):
+        progress = {"sha256": bundle["sha256"], "received": {}}
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+
+    step = max(1, -(-size // parts))
+    ranges = [(i, min(i + step, size) - 1) for i in range(0, size, step)]
+    lock = threading.Lock()
+
+    def save(key: str, received: int):
+        with lock:
+            progress["received"][key] = received
+            with open(f"{progress_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(progress, f)
+            os.replace(f"{progress_path}.tmp", progress_path)
+
+    def fetch(rng):
+        start, end = rng
+        key = str(start)
+        done = progress["received"].get(key, 0)
+        received = _download_range(bundle["url"], part_path, start, end, done,
+                                   on_block=lambda n: save(key, n))
+        save(key, received)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(ranges))) as pool:
+            list(pool.map(fetch, ranges))
+    except RangeNotSupported:
+        # Range 미지원 서버: 단일 스트림으로 대체
+        _download_whole(bundle["url"], part_path)
+
+    if sha256_file(part_path) != bundle["sha256"]:
+        os.remove(part_path)
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        raise ValueError(f"번들 체크섬 불일치: {bundle['name']}")
+
+    os.replace(part_path, final_path)
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    return final_path
+
+# ============================================================================
+# 5. 스테이징 압축 해제 및 원자적 교체
+# ============================================================================
+def extract_streaming(zip_path: str, target_dir: str):
+    """멤버 단위로 스트리밍 해제 (경로 탈출 방지)"""
+    target_root = os.path.realpath(target_dir)
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        for member in zf.infolist():
+            dest = os.path.realpath(os.path.join(target_dir, member.filename))
+            if not dest.startswith(target_root + os.sep):
+                raise ValueError(f"잘못된 압축 경로: {member.filename}")
+            if member.is_dir():
+                os.makedirs(dest, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with zf.open(member) as src, open(dest, "wb") as out:
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+
+def swap_current(version_dir: str, root: str = SNAPSHOT_ROOT):
+    """current 심볼릭 링크를 새 버전으로 원자적 교체"""
+    tmp_link = os.path.join(root, f"{CURRENT_LINK}.tmp")
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.basename(version_dir), tmp_link)
+    os.replace(tmp_link, current_dir(root))
+
+def prune_versions(root: str = SNAPSHOT_ROOT, keep: int = 2):
+    """오래된 스냅샷 정리 (아직 열려 있을 수 있는 직전 버전까지는 유지)"""
+    active = os.path.realpath(current_dir(root))
+    versions = [
+        os.path.join(root, name) for name in os.listdir(root)
+        if name not in (CURRENT_LINK, "downloads") and not name.endswith((".staging", ".tmp"))
+        and os.path.isdir(os.path.join(root, name)) and not os.path.islink(os.path.join(root, name))
+    ]
+    versions.sort(key=os.path.getmtime, reverse=True)
+    for path in versions[keep:]:
+        if os.path.realpath(path) != active:
+            shutil.rmtree(path, ignore_errors=True)
+
+def fetch_manifest(manifest_url: str) -> dict:
+    resp = requests.get(manifest_url, timeout=REQUEST_TIMEOUT)
+    resp.raise_for_status()
+    manifest = resp.json()
+    # 번들 URL이 상대 경로면 manifest 위치 기준으로 변환
+    base_url = manifest_url.rsplit("/", 1)[0]
+    for bundle in manifest.get("bundles", []):
+        if "://" not in bundle["url"]:
+            bundle["url"] = f"{base_url}/{bundle['url']}"
+    return manifest
+
+@contextmanager
+def sync_lock(root: str = SNAPSHOT_ROOT):
+    """root/.sync.lock 배타 잠금 (여러 워커 프로세스가 같은 downloads/staging/버전 폴더를 동시에 고치지 않도록)"""
+    os.makedirs(root, exist_ok=True)
+    try:
+        import fcntl
+    except ImportError:
+        # fcntl이 없는 OS(Windows)는 프로세스 간 잠금 없이 진행
+        fcntl = None
+    with open(os.path.join(root, SYNC_LOCK_FILE), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def sync_snapshot(manifest_url: str, root: str = SNAPSHOT_ROOT, log=print) -> str:
+    """manifest 기준으로 새 스냅샷을 받아 검증 후 활성화, 활성 버전 반환"""
+    manifest = fetch_manifest(manifest_url)
+    version = manifest["version"]
+    if current_version(root) == version:
+        return version
+    with sync_lock(root):
+        # 잠금을 기다리는 동안 다른 프로세스가 같은 버전을 활성화했을 수 있음
+        if current_version(root) == version:
+            return version
+        return _install_snapshot(manifest, root, log)
+
+def _install_snapshot(manifest: dict, root: str, log) -> str:
+    """번들 다운로드 → 스테이징 해제/검증 → 버전 폴더로 이동 → current 교체 (sync_lock 안에서 호출)"""
+    version = manifest["version"]
+    download_dir = os.path.join(root, "downloads")
+    bundles = manifest.get("bundles", [])
+    log(f"📥 스냅샷 {version} 다운로드 중 ({len(bundles)}개 번들)...")
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        zip_paths = list(pool.map(lambda b: download_bundle(b, download_dir), bundles))
+
+    staging_dir = os.path.join(root, f"{version}.staging")
+    version_dir = os.path.join(root, version)
+    if os.path.exists(staging_dir):
+        shutil.rmtree(staging_dir)
+    os.makedirs(staging_dir)
+    try:
+        for bundle, zip_path in zip(bundles, zip_paths):
+            extract_streaming(zip_path, staging_dir)
+            verify_tree(staging_dir, bundle.get("files", {}))
+        with open(os.path.join(staging_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    if os.path.realpath(version_dir) == os.path.realpath(current_dir(root)):
+        # current가 가리키는 폴더(버전 정보가 깨진 활성 DB)는 지우지 않고 새 이름으로 설치
+        version_dir = os.path.join(root, f"{version}.{datetime.now().strftime('%Y%m%d%H%M%S')}")
+    if os.path.exists(version_dir):
+        shutil.rmtree(version_dir)
+    os.replace(staging_dir, version_dir)
+    swap_current(version_dir, root)
+    for zip_path in zip_paths:
+        os.remove(zip_path)
+    prune_versions(root)
+    log(f"✅ 스냅샷 {version} 활성화 완료")
+    return version
+
+_refresh_lock = threading.Lock()
+_last_refresh = 0.0
+
+def refresh_in_background(manifest_url: str, root: str = SNAPSHOT_ROOT, interval: int = REFRESH_INTERVAL_SEC) -> bool:
+    """새 버전 확인/교체를 백그라운드에서 실행 (주기 미도래 또는 실행 중이면 False)"""
+    global _last_refresh
+    if time.time() - _last_refresh < interval:
+        return False
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    _last_refresh = time.time()
+
+    def run():
+        try:
+            sync_snapshot(manifest_url, root)
+        except Exception as e:
+            print(f"❌ [스냅샷] 갱신 실패: {e}")
+        finally:
+            _refresh_lock.release()
+
+    threading.Thread(target=run, name="snapshot-refresh", daemon=True).start()
+    return True
+
+# ============================================================================
+# 6. 번들 생성 (배포용)
+# ============================================================================
+def _file_entries(base_dir: str, folder: str) -> Dict[str, dict]:
+    entries = {}
+    for dirpath, _, filenames in os.walk(os.path.join(base_dir, folder)):
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            rel_path = os.path.relpath(path, base_dir)
+            entries[rel_path] = {"size": os.path.getsize(path), "sha256": sha256_file(path)}
+    return entries
+
+def build_bundles(folders: List[str], version: str, out_dir: str, base_dir: str = ".") -> dict:
+    """DB 폴더를 zip 번들 + manifest.json으로 묶기 (번들 URL은 manifest 기준 상대 경로)"""
+    os.makedirs(out_dir, exist_ok=True)
+    bundles = []
+    for folder in folders:
+        zip_name = f"{folder}-{version}.zip"
+        zip_path = os.path.join(out_dir, zip_name)
+        files = _file_entries(base_dir, folder)
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for rel_path in files:
+                zf.write(os.path.join(base_dir, rel_path), rel_path)
+        bundles.append({
+            "name": zip_name,
+            "url": zip_name,
+            "folder": folder,
+            "size": os.path.getsize(zip_path),
+            "sha256": sha256_file(zip_path),
+            "files": files,
+        })
+    manifest = {
+        "version": version,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "bundles": bundles,
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+# ============================================================================
+# 7. CLI
+# ============================================================================
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="벡터 DB 스냅샷 번들 생성/동기화")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="DB 폴더를 번들로 묶기")
+    p_build.add_argument("--version", default=datetime.now().strftime("%Y%m%d%H%M%S"))
+    p_build.add_argument("--out", default="dist")
+    p_build.add_argument("--folders", nargs="+", default=["chroma_db_catalog", "chroma_db_clause"])
+
+    p_sync = sub.add_parser("sync", help="manifest 기준으로 스냅샷 받아 활성화")
+    p_sync.add_argument("--manifest", default=MANIFEST_URL, required=not MANIFEST_URL)
+    p_sync.add_argument("--root", default=SNAPSHOT_ROOT)
+
+    sub.add_parser("status", help="현재 활성 스냅샷 버전 출력")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        built = build_bundles(args.folders, args.version, args.out)
+        print(f"✅ 번들 생성 완료: {built['version']} → {args.out}/{MANIFEST_FILE}")
+    elif args.command == "sync":
+        sync_snapshot(args.manifest, args.root)
+    else:
+        print(current_version() or "스냅샷 미사용 (기존 폴더 사용 중)")
@@ -0,0 +1,241 @@
+import json
+from typing import List, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field, ValidationError
+
+# ============================================================================
+# 1. 단계별 출력 스키마
+# ============================================================================
+class SituationsPayload(BaseModel):
+    situations: List[str] = Field(description="1인칭 일상 상황 질문 3개 (각 50자 이내, 전문용어 없이)")
+
+class KeywordItem(BaseModel):
+    original: str = Field(description="일상 표현")
+    professional: str = Field(description="보험 전문용어")
+    explanation: str = Field(default="", description="왜 이 용어인지 20자 이내 설명")
+
+class KeywordsPayload(BaseModel):
+    keywords: List[KeywordItem] = Field(description="일상 표현 → 보험 전문 키워드 3개")
+    summary: str = Field(default="", description="이 상황은 보험에서 어떤 영역인지 50자 이내 요약")
+
+class ProductItem(BaseModel):
+    product_name: str = Field(description="순수 상품명 (확장자 제외)")
+    relevant_feature: str = Field(default="", description="이 상황에 적합한 특약명")
+    why_suitable: str = Field(default="", description="왜 이 상품이 적합한지 30자 이내")
+    match_score: int = Field(default=0, description="0~100 적합도")
+
+class ProductsPayload(BaseModel):
+    products: List[ProductItem] = Field(description="상황에 적합한 상품 2~3개")
+
+class KeywordProductsPayload(BaseModel):
+    """키워드 변환 + 상품 추천 단일 호출(fused 모드) 출력"""
+    keywords: List[KeywordItem] = Field(description="일상 표현 → 보험 전문 키워드 3개")
+    summary: str = Field(default="", description="이 상황은 보험에서 어떤 영역인지 50자 이내 요약")
+    products: List[ProductItem] = Field(description="상황에 적합한 상품 2~3개")
+
+    def split(self) -> Tuple["KeywordsPayload", "ProductsPayload"]:
+        """기존 화면(키워드 분석 / 상품 추천)이 그대로 읽을 수 있는 두 payload로 분리"""
+        return (KeywordsPayload(keywords=self.keywords, summary=self.summary),
+                ProductsPayload(products=self.products))
+
+class AnalysisPayload(BaseModel):
+    product_name: str = Field(description="검증된 상품명")
+    feature_name: str = Field(description="핵심 특약명")
+    match_score: int = Field(description="상황과 약관의 일치도 0~100")
+    summary: str = Field(description="가정법을 사용한 보장 가능성 요약")
+    easy_explanation: str = Field(description="초등학생도 이해하는 쉬운 설명")
+    reasoning: str = Field(description="논리적 분석 내용")
+    evidence_snippet: str = Field(description="해당 조항 원문 발췌 (제N조(조항명) 포함)")
+    limitations: str = Field(description="이 상품이 보장하지 않는 아쉬운 점")
+    checklist: List[str] = Field(default_factory=list, description="가입/청구 전 확인할 점")
+
+class StructuredOutputError(ValueError):
+    pass
+
+# ============================================================================
+# 2. 관대한 JSON 파서 (코드펜스 / 앞뒤 설명문 / 잘린 출력 복구)
+# ============================================================================
+def _strip_fences(text: str) -> str:
+    text = (text or "").replace("```json", "").replace("```", "").strip()
+    start = text.find("{")
+    return text[start:] if start >= 0 else text
+
+def _repair_candidates(text: str) -> List[str]:
+    """잘린 JSON 복구 후보: (1) 열린 문자열/괄호만 닫기 (2) 마지막 완결 지점에서 자르고 닫기"""
+    stack, in_string, escaped = [], False, False
+    cut_points = []
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            cut_points.append((i + 1, list(stack)))
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return [text[:i + 1]]
+            cut_points.append((i + 1, list(stack)))
+        elif ch == ",":
+            cut_points.append((i, list(stack)))
+
+    closed = text[:-1] if (in_string and escaped) else text
+    candidates = [closed + ('"' if in_string else "") + "".join(reversed(stack))]
+    for pos, open_stack in reversed(cut_points):
+        candidates.append(text[:pos].rstrip().rstrip(",") + "".join(reversed(open_stack)))
+    return candidates
+
+def _strip_trailing_commas(text: str) -> str:
+    """문자열 밖의 닫는 괄호 앞 쉼표 제거 ({"a": 1,} → {"a": 1})"""
+    out, in_string, escaped = [], False, False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == ",":
+            rest = text[i + 1:].lstrip()
+            if rest[:1] in ("}", "]"):
+                continue
+        out.append(ch)
+    return "".join(out)
+
+def loads(text: str) -> dict:
+    """LLM 응답에서 JSON 객체 복구 (실패 시 json.JSONDecodeError)"""
+    body = _strip_fences(text)
+    try:
+        return json.loads(body)
+    except json.JSONDecodeError as e:
+        error = e
+    body = _strip_trailing_commas(body)
+    for candidate in [body] + _repair_candidates(body):
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    raise error
+
+class IncrementalJSONParser:
+    """스트리밍 청크를 받아 현재까지의 부분 객체를 반환 (생성이 중간에 끊겨도 받은 필드까지는 복구)
+
+    필드 경계(쉼표/닫는 괄호)가 들어온 청크에서만 다시 파싱합니다 (청크마다 전체를 파싱하지 않음).
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.partial = {}
+
+    def feed(self, chunk: str) -> dict:
+        self.buffer += chunk
+        if any(ch in chunk for ch in ",}]"):
+            self._parse()
+        return self.partial
+
+    def close(self) -> dict:
+        """스트림 종료(정상/중단) 후 마지막 필드까지 반영"""
+        self._parse()
+        return self.partial
+
+    def _parse(self):
+        try:
+            data = loads(self.buffer)
+        except json.JSONDecodeError:
+            return
+        if isinstance(data, dict):
+            self.partial = data
+
+# ============================================================================
+# 3. 스키마 검증 및 누락 필드 재질의
+# ============================================================================
+def parse_structured(text: str, schema: Type[BaseModel]) -> Tuple[Optional[BaseModel], dict, List[str]]:
+    """(검증된 모델 또는 None, 복구된 부분 dict, 누락/오류 필드 목록)"""
+    try:
+        data = loads(text)
+    except json.JSONDecodeError:
+        return None, {}, list(schema.model_fields)
+    if not isinstance(data, dict):
+        return None, {}, list(schema.model_fields)
+    try:
+        return schema.model_validate(data), data, []
+    except ValidationError as e:
+        bad_fields = []
+        for err in e.errors():
+            field = str(err["loc"][0]) if err.get("loc") else None
+            if field and field not in bad_fields:
+                bad_fields.append(field)
+        partial = {k: v for k, v in data.items() if k not in bad_fields}
+        return None, partial, bad_fields
+
+REASK_TEMPLATE = """아래는 이전에 작성한 JSON 결과 중 일부입니다. 누락되었거나 형식이 잘못된 필드만 작성하세요.
+
+**[작업 맥락]**
+{context}
+
+**[이미 작성된 필드]**
+{partial}
+
+**[작성할 필드]**
+{fields}
+
+**[출력 형식 - JSON Only]** 위 필드만 포함한 JSON 객체
+"""
+
+def reask_missing(llm, schema: Type[BaseModel], partial: dict, missing: List[str], context: str = "") -> dict:
+    """누락 필드만 다시 요청해 부분 결과와 병합"""
+    fields = "\n".join(
+        f"- {name}: {schema.model_fields[name].description or ''}" for name in missing if name in schema.model_fields
+    )
+    prompt = REASK_TEMPLATE.format(
+        context=context or "(없음)",
+        partial=json.dumps(partial, ensure_ascii=False),
+        fields=fields,
+    )
+    response = llm.invoke(prompt)
+    content = getattr(response, "content", response)
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    merged = dict(partial)
+    try:
+        merged.update({k: v for k, v in loads(content).items() if k in missing})
+    except (json.JSONDecodeError, AttributeError):
+        pass
+    return merged
+
+def ensure_structured(llm, text: str, schema: Type[BaseModel], context: str = "", max_reasks: int = 1) -> BaseModel:
+    """응답을 스키마로 검증하고, 누락 필드가 있으면 해당 필드만 재질의 (전체 재생성 없음)"""
+    model, partial, missing = parse_structured(text, schema)
+    attempts = 0
+    while model is None and attempts < max_reasks and llm is not None:
+        attempts += 1
+        merged = reask_missing(llm, schema, partial, missing, context)
+        model, partial, missing = parse_structured(json.dumps(merged, ensure_ascii=False), schema)
+    if model is None:
+        raise StructuredOutputError(f"필드 누락/형식 오류: {', '.join(missing)}")
+    return model
+
+def to_json(model: BaseModel) -> str:
+    """세션에 저장할 정규화된 JSON 문자열"""
+    return model.model_dump_json()
+
+# ============================================================================
+# 4. 제공자 JSON 모드
+# ============================================================================
+def with_json_mode(llm):
+    """Gemini 등 JSON 출력 모드를 지원하는 모델이면 application/json 응답으로 설정"""
+    fields = getattr(type(llm), "model_fields", {})
+    if "response_mime_type" in fields:
+        return llm.model_copy(update={"response_mime_type": "application/json"})
+    return llm
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+import admission
+
+@pytest.fixture
+def make_controller():
+    """슬롯을 막아 두는 작업(release 전까지 대기)과 함께 쓰는 테스트용 컨트롤러"""
+    release = threading.Event()
+    controllers = []
+
+    def make(**kwargs):
+        kwargs.setdefault("max_queue", 8)
+        kwargs.setdefault("queue_timeout", 60)
+        controller = admission.AdmissionController(**kwargs)
+        controllers.append(controller)
+        return controller
+
+    make.release = release
+    yield make
+    release.set()
+    for controller in controllers:
+        controller.executor.shutdown(wait=True)
+
+def block(controller, visitor, stage, release, key=None):
+    started = threading.Event()
+    future = controller.submit(key or f"{visitor}:{stage}:block", visitor, stage,
+                               lambda: (started.set(), release.wait()))
+    assert started.wait(2)
+    return future
+
+def test_fair_order_round_robin_between_visitors(make_controller):
+    controller = make_controller(max_active=1, reserved=0)
+    block(controller, "x", "situations", make_controller.release)
+    for key in ("a1", "a2", "a3"):
+        controller.submit(key, "a", "step25", lambda: None)
+    controller.submit("b1", "b", "step25", lambda: None)
+
+    # 한 방문자가 먼저 3개를 넣어도 다른 방문자는 두 번째로 시작
+    assert [controller.position(k) for k in ("a1", "b1", "a2", "a3")] == [1, 2, 3, 4]
+    # 상세 분석은 먼저 들어온 낮은 우선순위 작업보다 앞
+    controller.submit("c1", "c", "analysis", lambda: None)
+    assert controller.position("c1") == 1
+    assert controller.position("a1") == 2
+
+def test_reserved_slots_only_for_analysis(make_controller):
+    controller = make_controller(max_active=2, reserved=1)
+    block(controller, "a", "chat", make_controller.release)
+    controller.submit("b:chat", "b", "chat", lambda: None)
+    assert controller.position("b:chat") == 1
+
+    block(controller, "c", "analysis", make_controller.release)
+    assert controller.stats()["active"] == 2
+    assert controller.stats()["queued"] == 1
+
+def test_full_queue_preempts_lower_priority_then_sheds(make_controller):
+    controller = make_controller(max_active=1, reserved=0, max_queue=2)
+    block(controller, "x", "analysis", make_controller.release)
+    older = controller.submit("s1", "a", "situations", lambda: None)
+    newer = controller.submit("s2", "b", "situations", lambda: None)
+
+    controller.submit("an", "c", "analysis", lambda: None)
+    with pytest.raises(admission.Shed) as excinfo:
+        newer.result(timeout=1)
+    assert excinfo.value.reason == "preempted"
+    assert not older.done()
+
+    # 더 낮은 우선순위가 없으면 새 작업을 거절
+    with pytest.raises(admission.Shed) as excinfo:
+        controller.submit("s3", "d", "situations", lambda: None)
+    assert excinfo.value.reason == "queue_full"
+    assert controller.stats()["shed"] == {"preempted": 1, "queue_full": 1}
+
+def test_queue_timeout_sheds_waiting_ticket(make_controller):
+    controller = make_controller(max_active=1, reserved=0, queue_timeout=0.05)
+    block(controller, "x", "analysis", make_controller.release)
+    stale = controller.submit("old", "a", "chat", lambda: None)
+    time.sleep(0.1)
+    controller.submit("new", "b", "chat", lambda: None)
+
+    with pytest.raises(admission.Shed) as excinfo:
+        stale.result(timeout=1)
+    assert excinfo.value.reason == "queue_timeout"
+    assert controller.position("new") == 1
+
+def test_admitted_wait_timeout_leaves_queue_empty(make_controller):
+    controller = make_controller(max_active=1, reserved=0)
+    block(controller, "x", "analysis", make_controller.release)
+    with pytest.raises(admission.Shed) as excinfo:
+        with controller.admitted("a", "chat", timeout=0.05):
+            pass
+    assert excinfo.value.reason == "wait_timeout"
+    assert controller.stats()["queued"] == 0
+
+def test_admitted_runs_when_slot_free(make_controller):
+    controller = make_controller(max_active=1, reserved=0)
+    with controller.admitted("a", "chat", timeout=1):
+        assert controller.stats()["active"] == 1
+
+def test_duplicate_key_replaces_queued_ticket(make_controller):
+    controller = make_controller(max_active=1, reserved=0)
+    block(controller, "x", "analysis", make_controller.release)
+    first = controller.submit("a:step25", "a", "step25", lambda: "old")
+    controller.submit("b:step25", "b", "step25", lambda: "other")
+    second = controller.submit("a:step25", "a", "step25", lambda: "new")
+
+    with pytest.raises(admission.Shed) as excinfo:
+        first.result(timeout=1)
+    assert excinfo.value.reason == "replaced"
+    assert controller.stats()["queued"] == 2
+    # 교체된 작업은 맨 뒤로
+    assert controller.position("b:step25") == 1
+    assert controller.position("a:step25") == 2
+
+    make_controller.release.set()
+    assert second.result(timeout=2) == "new"
@@ -0,0 +1,72 @@
+import pytest
+from langchain_core.documents import Document
+
+import clause_index
+import ingest
+
+GENERAL = """무배당 상해보험 보통약관
+목차
+제1조(목적) ········ 1
+제2조(용어의 정의) ········ 2
+
+제1조(목적) 이 약관은 회사와 계약자 사이의 권리와 의무를 정하는 것을 목적으로 합니다.
+제2조(용어의 정의)
+① 이 약관에서 사용하는 용어의 뜻은 다음과 같습니다.
+1. 계약자: 회사와 계약을 체결하고 보험료를 납입할 의무를 지는 사람
+2. 피보험자: 보험사고의 대상이 되는 사람
+② 그 밖의 용어는 관련 법령에서 정하는 바에 따릅니다.
+제3조(보험금의 지급사유) 회사는 피보험자가 상해를 입은 경우 보험금을 지급합니다.
+"""
+RIDERS = """
+골절진단특약
+제1조(보장내용) 회사는 피보험자가 골절로 진단 확정된 경우 골절진단금을 지급합니다.
+제2조(보험금의 지급제한) 고의로 자신을 해친 경우에는 보험금을 지급하지 않습니다.
+
+입원일당특약
+제1조(보장내용)
+① 회사는 피보험자가 입원한 경우 입원 1일당 입원일당을 지급합니다.
+② 입원일수는 180일을 한도로 합니다.
+"""
+
+@pytest.fixture(autouse=True)
+def no_tokenizer(monkeypatch):
+    # 모델 토크나이저 대신 글자 수 근사치 사용 (네트워크/transformers 불필요)
+    monkeypatch.setattr(ingest, "_tokenizer", lambda: None)
+
+def articles(chunks):
+    return [(c["metadata"].get("article_no"), c["metadata"].get("article_title")) for c in chunks]
+
+def test_single_and_multi_line_headings_are_article_boundaries():
+    chunks = ingest.chunk_document("상해.txt", GENERAL, "article")
+    assert articles(chunks) == [(None, None), ("1", "목적"), ("2", "용어의 정의"), ("3", "보험금의 지급사유")]
+    # 목차 줄은 머리말 블록에 남음
+    assert "제2조(용어의 정의) ········ 2" in chunks[0]["text"]
+    assert chunks[1]["text"].startswith("제1조(목적) 이 약관은")
+    assert "제3조" not in chunks[2]["text"]
+
+def test_repeated_article_numbers_across_riders():
+    chunks = ingest.chunk_document("상해.txt", GENERAL + RIDERS, "article")
+    assert [no for no, _ in articles(chunks)] == [None, "1", "2", "3", "1", "2", "1"]
+    assert articles(chunks)[-1] == ("1", "보장내용")
+    assert chunks[-1]["text"].startswith("제1조(보장내용)\n① 회사는 피보험자가 입원한")
+    assert len({c["metadata"]["parent_article"] for c in chunks[1:]}) == 6
+    assert len({c["metadata"]["article_seq"] for c in chunks[1:]}) == 6
+
+def test_long_article_split_on_items_and_expanded_back():
+    body = "".join(f"{i}. 용어{i}: " + "보험금 지급 사유에 관한 설명입니다. " * 8 + "\n" for i in range(1, 9))
+    text = f"제2조(용어의 정의)\n① 이 약관에서 사용하는 용어의 뜻은 다음과 같습니다.\n{body}② 그 밖의 용어는 관련 법령에 따릅니다.\n"
+    chunks = ingest.chunk_document("상해.txt", text, "article")
+    assert len(chunks) > 1
+    assert all(ingest.count_tokens(c["text"]) <= ingest.ARTICLE_MAX_TOKENS for c in chunks)
+    assert all(c["text"].startswith("제2조(용어의 정의)\n") for c in chunks)
+    assert [c["metadata"]["article_part"] for c in chunks] == list(range(1, len(chunks) + 1))
+
+    class Store:
+        def get(self, where=None, include=None):
+            return {"ids": [c["id"] for c in chunks], "documents": [c["text"] for c in chunks],
+                    "metadatas": [c["metadata"] for c in chunks]}
+
+    hits = [Document(page_content=c["text"], metadata=c["metadata"], id=c["id"]) for c in reversed(chunks)]
+    expanded = clause_index.expand_articles(Store(), hits)
+    assert len(expanded) == 1
+    assert expanded[0].page_content.split() == text.split()
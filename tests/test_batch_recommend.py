@@ -0,0 +1,32 @@
+import csv
+import json
+
+import pytest
+
+pytest.importorskip("streamlit")
+import batch_recommend
+
+def _write_jsonl(path, rows):
+    path.write_text("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows), encoding="utf-8")
+
+def test_dedupe_keeps_last_row_per_id_jsonl(tmp_path):
+    path = tmp_path / "recs.jsonl"
+    _write_jsonl(path, [{"id": "1", "error": "Timeout"}, {"id": "2", "product": "A"}, {"id": "1", "product": "B"}])
+    assert batch_recommend.completed_ids(str(path)) == {"1", "2"}
+    assert batch_recommend.dedupe_results(str(path)) == 1
+    rows = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert rows == [{"id": "2", "product": "A"}, {"id": "1", "product": "B"}]
+    assert batch_recommend.dedupe_results(str(path)) == 0
+
+def test_dedupe_keeps_last_row_per_id_csv(tmp_path):
+    path = tmp_path / "recs.csv"
+    writer = batch_recommend.ResultWriter(str(path), ["id", "analysis", "error"], append=False)
+    writer.write([{"id": "1", "error": "Timeout"}, {"id": "2", "analysis": "줄\n바꿈"}])
+    writer.close()
+    writer = batch_recommend.ResultWriter(str(path), ["id", "analysis", "error"], append=True)
+    writer.write([{"id": "1", "analysis": "ok"}])
+    writer.close()
+    assert batch_recommend.dedupe_results(str(path)) == 1
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["id"], row["analysis"], row["error"]) for row in rows] == [("2", "줄\n바꿈", ""), ("1", "ok", "")]
@@ -0,0 +1,27 @@
+import clause_index
+
+INDEX = {
+    "version": clause_index.ARTICLE_INDEX_VERSION,
+    "products": {
+        "무배당 상해보험": {"3": {"title": "보험금의 지급사유", "ids": ["a3"]}},
+        "무배당 상해보험 플러스": {"3": {"title": "보험금의 지급사유", "ids": ["b3"]}},
+        "운전자보험": {"3": {"title": "보험금의 지급사유", "ids": ["c3"]}},
+    },
+}
+
+def test_lookup_requires_resolved_product():
+    assert clause_index.lookup_article_ids(INDEX, "표준_운전자보험.txt", ["3"]) == ["c3"]
+    assert clause_index.lookup_article_ids(INDEX, None, ["3"]) == []
+    assert clause_index.lookup_article_ids(INDEX, "화재보험", ["3"]) == []
+
+def test_resolve_product_key_rejects_ambiguous_partial_match():
+    assert clause_index.resolve_product_key(INDEX, "무배당 상해보험") == "무배당 상해보험"
+    assert clause_index.resolve_product_key(INDEX, "플러스") == "무배당 상해보험 플러스"
+    assert clause_index.resolve_product_key(INDEX, "상해") is None
+    assert clause_index.resolve_product_key(INDEX, "보험") is None
+
+def test_direct_lookup_skipped_without_product():
+    class Store:
+        def get(self, **kwargs):
+            raise AssertionError("상품 없이 조회하면 안 됨")
+    assert clause_index.get_article_documents(Store(), INDEX, "제3조 알려줘") == []
@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+import pytest
+
+import compact_index
+from retrievers import StaleIndexError
+
+class FakeChroma:
+    """ID/임베딩/메타데이터만 가진 컬렉션 (limit/offset 페이지 조회, ID 조회)"""
+    def __init__(self, vectors, sources):
+        self.ids = [f"c{i}" for i in range(len(vectors))]
+        self.vectors = dict(zip(self.ids, vectors))
+        self.sources = dict(zip(self.ids, sources))
+        self.id_lookups = 0
+
+    def get(self, ids=None, include=(), limit=None, offset=0, **kwargs):
+        if ids is None:
+            ids = self.ids[offset:offset + limit] if limit else self.ids[offset:]
+        else:
+            self.id_lookups += 1
+            ids = [cid for cid in ids if cid in self.vectors]
+        batch = {"ids": list(ids)}
+        if "embeddings" in include:
+            batch["embeddings"] = np.asarray([self.vectors[cid] for cid in ids], dtype=np.float32)
+        if "metadatas" in include:
+            batch["metadatas"] = [{"source": self.sources[cid]} for cid in ids]
+        if "documents" in include:
+            batch["documents"] = [cid for cid in ids]
+        return batch
+
+def make_collection(n=300, d=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, d)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return FakeChroma(vectors, [f"p{i % 3}.txt" for i in range(n)])
+
+def brute_force(chroma, query, k):
+    ids = list(chroma.vectors)
+    scores = np.asarray([chroma.vectors[cid] for cid in ids]) @ query
+    return [ids[i] for i in np.argsort(-scores)[:k]]
+
+def test_default_build_rescore_from_chroma_without_matrix_file(tmp_path):
+    chroma = make_collection()
+    meta = compact_index.build_compact_index(chroma, str(tmp_path), mode="int8")
+    assert meta["rescore"] == "chroma"
+    assert not os.path.exists(tmp_path / compact_index.FULL_FILE)
+
+    store = compact_index.CompactStore(str(tmp_path), embedding=None, docstore=chroma)
+    query = chroma.vectors["c7"]
+    ids, scores = store.search_vector(query, k=5)
+    assert ids == brute_force(chroma, query, 5)
+    assert scores[0] == pytest.approx(1.0, abs=1e-5)
+    assert chroma.id_lookups == 1
+
+def test_file_rescore_keeps_memmap(tmp_path):
+    chroma = make_collection()
+    compact_index.build_compact_index(chroma, str(tmp_path), mode="int8", rescore="file")
+    store = compact_index.CompactStore(str(tmp_path), embedding=None, docstore=chroma)
+    query = chroma.vectors["c11"]
+    assert store.search_vector(query, k=3)[0] == brute_force(chroma, query, 3)
+    assert chroma.id_lookups == 0
+
+def test_changed_collection_is_refused(tmp_path):
+    chroma = make_collection()
+    compact_index.build_compact_index(chroma, str(tmp_path), mode="int8")
+    chroma.ids.append("c-new")
+    chroma.vectors["c-new"] = chroma.vectors["c0"]
+    chroma.sources["c-new"] = "p0.txt"
+    with pytest.raises(StaleIndexError):
+        compact_index.CompactStore(str(tmp_path), embedding=None, docstore=chroma)
+
+def test_ingest_rebuilds_derived_indexes_with_same_settings(tmp_path):
+    import ingest
+    import exact_search
+
+    chroma = make_collection()
+    persist_dir = tmp_path / "chroma_db_clause"
+    persist_dir.mkdir()
+    compact_dir = tmp_path / compact_index.COMPACT_DIR
+    exact_dir = tmp_path / exact_search.EXACT_DIR
+    compact_index.build_compact_index(chroma, str(compact_dir), mode="int8", dims=8)
+    exact_search.build_exact_index(chroma, str(exact_dir))
+
+    chroma.ids.append("c-new")
+    chroma.vectors["c-new"] = chroma.vectors["c0"]
+    chroma.sources["c-new"] = "p0.txt"
+    assert ingest.refresh_derived_indexes(chroma, str(persist_dir), "warn") == {
+        compact_index.COMPACT_DIR: "stale", exact_search.EXACT_DIR: "stale"}
+
+    results = ingest.refresh_derived_indexes(chroma, str(persist_dir), "rebuild")
+    assert set(results.values()) == {"rebuilt"}
+    store = compact_index.CompactStore(str(compact_dir), embedding=None, docstore=chroma)
+    assert (store.dims, store.rescore) == (8, "chroma")
+    exact_search.ExactProductStore(str(exact_dir), ann_store=chroma, embedding=None)
+
+    ingest.refresh_derived_indexes(chroma, str(persist_dir), "invalidate")
+    assert not compact_dir.exists() and not exact_dir.exists()
+
+def test_catalog_tags_gaps(tmp_path):
+    import json
+    import ingest
+
+    catalog_file = tmp_path / "catalog_tags.json"
+    catalog_file.write_text(json.dumps({"product_tags": {"두배받는암보험": {}}}), encoding="utf-8")
+    gaps = ingest.catalog_tags_gaps(["두배받는 암보험.txt", "새상품 보험.txt"], str(catalog_file))
+    assert gaps == ["새상품 보험.txt"]
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import engine
+import prompt_tokens
+
+TAGS = {"누구": ["#반려견"], "위험": ["#배상"], "우선순위": [], "변화": []}
+
+DOCS = [
+    Document(page_content="제3조 타인의 신체에 장해를 입힌 경우 보상", metadata={"source": "펫보험A"}, id="a1"),
+    Document(page_content="반려견이 타인을 물어 생긴 손해 보상", metadata={"source": "펫보험A"}, id="a2"),
+    Document(page_content="운전자 벌금 보상", metadata={"source": "운전자보험B"}, id="b1"),
+]
+
+ANALYSIS = {
+    "product_name": "펫보험A", "feature_name": "배상책임", "match_score": 90, "summary": "보상 가능",
+    "easy_explanation": "설명", "reasoning": "근거", "evidence_snippet": "제3조", "limitations": "고의 제외",
+    "checklist": ["확인"],
+}
+
+class FakeRetriever:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def invoke(self, query):
+        return self.docs
+
+class FakeStore:
+    """as_retriever/search_product만 제공하는 약관 검색 저장소 대역"""
+
+    def __init__(self, docs=DOCS):
+        self.docs = docs
+        self.product_queries = []
+
+    def as_retriever(self, search_kwargs=None):
+        return FakeRetriever(self.docs[:(search_kwargs or {}).get("k", 4)])
+
+    def search_product(self, query, product_name, k=8):
+        self.product_queries.append(product_name)
+        return [d for d in self.docs if product_name in d.metadata["source"]][:k]
+
+def _llm(*responses):
+    return FakeListChatModel(responses=[r if isinstance(r, str) else json.dumps(r, ensure_ascii=False) for r in responses])
+
+@pytest.fixture(autouse=True)
+def no_token_log():
+    # 프롬프트 토큰 기록을 파일 대신 목록으로
+    with prompt_tokens.capture() as rows:
+        yield rows
+
+def test_compute_situations_repairs_fenced_json():
+    llm = _llm('```json\n{"situations": ["제 개가 이웃을 물었어요", "산책 중 사고", "치료비 걱정"]}\n```')
+    assert engine.compute_situations(llm, TAGS, {}, "") == ["제 개가 이웃을 물었어요", "산책 중 사고", "치료비 걱정"]
+
+def test_compute_step25_two_call(monkeypatch, no_token_log):
+    monkeypatch.setattr(engine, "KEYWORD_RETRIEVAL_MODE", "single")
+    llm = _llm({"keywords": [{"original": "물었어요", "professional": "배상책임"}], "summary": "배상"},
+               {"products": [{"product_name": "펫보험A", "match_score": 80}]})
+    result = engine.compute_step25(FakeStore(), llm, "제 개가 이웃을 물었어요", TAGS, "two_call")
+    assert json.loads(result["keyword_analysis"])["keywords"][0]["professional"] == "배상책임"
+    assert [p["product_name"] for p in json.loads(result["product_recommendations"])["products"]] == ["펫보험A"]
+    assert [row["stage"] for row in no_token_log] == ["analyze_situation_to_keywords", "recommend_products_for_situation"]
+
+def test_compute_step25_fused_splits_payload():
+    llm = _llm({"keywords": [{"original": "물었어요", "professional": "배상책임"}], "summary": "배상",
+                "products": [{"product_name": "펫보험A"}]})
+    result = engine.compute_step25(FakeStore(), llm, "제 개가 이웃을 물었어요", TAGS, "fused")
+    assert result["variant"] == "fused"
+    assert "products" not in json.loads(result["keyword_analysis"])
+    assert json.loads(result["product_recommendations"])["products"][0]["product_name"] == "펫보험A"
+
+def test_compute_analysis_searches_target_product():
+    store = FakeStore()
+    result = engine.compute_analysis(store, _llm(ANALYSIS), TAGS, "제 개가 이웃을 물었어요", "펫보험A")
+    assert json.loads(result["analysis_result"])["match_score"] == 90
+    assert store.product_queries == ["펫보험A"]
+    assert result["trace"]["chunk_ids"] == ["a1", "a2"]
+
+def test_step25_variant_is_stable_per_visitor(monkeypatch):
+    monkeypatch.setattr(engine, "STEP25_MODE", "ab")
+    assert {engine.step25_variant("visitor-1") for _ in range(3)} == {engine.step25_variant("visitor-1")}
+    monkeypatch.setattr(engine, "STEP25_MODE", "fused")
+    assert engine.step25_variant("visitor-1") == "fused"
+
+def test_compute_analysis_recovers_interrupted_stream():
+    full = json.dumps(ANALYSIS, ensure_ascii=False)
+    cut = full.index('"easy_explanation"')
+    missing = {k: ANALYSIS[k] for k in ("easy_explanation", "reasoning", "evidence_snippet", "limitations", "checklist")}
+    # 1번째 응답은 스트리밍 도중 오류, 2번째 응답은 누락 필드 재질의 답
+    llm = FakeListChatModel(responses=[full, json.dumps(missing, ensure_ascii=False)], error_on_chunk_number=cut)
+    result = engine.compute_analysis(FakeStore(), llm, TAGS, "제 개가 이웃을 물었어요", "펫보험A")
+    parsed = json.loads(result["analysis_result"])
+    assert parsed["match_score"] == 90
+    assert parsed["limitations"] == "고의 제외"
+    assert "stream_error" in result["trace"]
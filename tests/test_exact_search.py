@@ -0,0 +1,52 @@
+import json
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import ann_cache
+import exact_search
+from retrievers import StaleIndexError
+
+class FakeEmbedding:
+    def embed_query(self, text):
+        return [1.0, 0.0] if "골절" in text else [0.0, 1.0]
+
+class FakeChroma:
+    """전수 검색 후 본문 조회(get)만 쓰이는지 확인용"""
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get(self, ids=None, include=None, limit=None, offset=0, **kwargs):
+        if ids is None:
+            # 컬렉션 지문 계산용 ID 목록 조회
+            return {"ids": list(self.rows)[offset:offset + limit if limit else None]}
+        rows = [self.rows[cid] for cid in ids]
+        return {"ids": list(ids), "documents": [r[0] for r in rows], "metadatas": [r[1] for r in rows]}
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None):
+        return [(Document(page_content="ann", metadata={}, id="ann"), 0.1)]
+
+def make_store(tmp_path):
+    np.save(tmp_path / "p0.npy", np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32))
+    meta = {"products": {"상해.txt": {"file": "p0.npy", "ids": ["c0", "c1"]}}}
+    (tmp_path / exact_search.PRODUCTS_FILE).write_text(json.dumps(meta), encoding="utf-8")
+    docstore = FakeChroma({"c0": ("골절 진단", {"source": "상해.txt"}), "c1": ("입원 일당", {"source": "상해.txt"})})
+    return exact_search.ExactProductStore(str(tmp_path), ann_store=docstore, embedding=FakeEmbedding())
+
+def test_similarity_search_with_score_embeds_then_searches(tmp_path):
+    store = make_store(tmp_path)
+    rows = store.similarity_search_with_score("골절", k=1, filter={"source": "상해.txt"})
+    assert [(doc.id, round(score, 3)) for doc, score in rows] == [("c0", 1.0)]
+
+def test_stale_matrix_is_refused(tmp_path):
+    store = make_store(tmp_path)
+    store.docstore.rows["c2"] = ("새 조항", {"source": "상해.txt"})
+    with pytest.raises(StaleIndexError):
+        exact_search.ExactProductStore(str(tmp_path), ann_store=store.docstore, embedding=FakeEmbedding())
+
+def test_cached_exact_store_with_score(tmp_path):
+    cached = ann_cache.CachedStore(make_store(tmp_path), "test", "v-test", result_cache=ann_cache.AnnCache())
+    first = cached.similarity_search_with_score("입원", k=1, filter={"source": "상해.txt"})
+    again = cached.similarity_search_with_score("입원", k=1, filter={"source": "상해.txt"})
+    assert [doc.id for doc, _ in first] == [doc.id for doc, _ in again] == ["c1"]
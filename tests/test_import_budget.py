@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+import import_budget
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# streamlit 없이 import 가능한 워커 기동 경로 (app.py가 최상위에서 import하는 모듈 중 화면 외 부분)
+WORKER_MODULES = ["serving", "engine", "snapshot", "warmup", "result_store", "structured_output", "llm_gateway"]
+
+def test_worker_modules_within_budget_without_heavy_imports():
+    result = import_budget.check_modules(WORKER_MODULES, cwd=ROOT)
+    assert result["heavy_imports"] == []
+    assert result["total_ms"] <= result["budget_ms"]
+    assert result["ok"]
+
+def test_app_entrypoint_within_budget():
+    pytest.importorskip("streamlit")
+    pytest.importorskip("dotenv")
+    result = import_budget.check(os.path.join(ROOT, import_budget.ENTRYPOINT))
+    assert result["heavy_imports"] == []
+    assert result["ok"], result["top"][:5]
+
+def test_report_flags_heavy_module_and_budget():
+    rows = [
+        {"module": "serving", "self_ms": 5.0, "cumulative_ms": 40.0, "depth": 0},
+        {"module": "torch.nn", "self_ms": 30.0, "cumulative_ms": 30.0, "depth": 1},
+    ]
+    result = import_budget.report(rows, budget_ms=100)
+    assert result["heavy_imports"] == ["torch.nn"]
+    assert result["total_ms"] == 40.0
+    assert not result["ok"]
+    assert import_budget.report(rows[:1], budget_ms=10)["ok"] is False
+    assert import_budget.report(rows[:1], budget_ms=100)["ok"] is True
+
+def test_startup_imports_skips_function_level_imports(tmp_path):
+    script = tmp_path / "entry.py"
+    script.write_text("import os\nfrom json import dumps\n\ndef load():\n    import torch\n", encoding="utf-8")
+    assert import_budget.startup_imports(str(script)).splitlines() == ["import os", "from json import dumps"]
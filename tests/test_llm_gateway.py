@@ -0,0 +1,176 @@
+import time
+import threading
+
+import pytest
+
+import llm_gateway
+
+class StatusError(Exception):
+    def __init__(self, code):
+        super().__init__(f"status {code}")
+        self.code = code
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+class HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__("http error")
+        self.response = Response(status_code)
+
+@pytest.mark.parametrize("exc, expected", [
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (HTTPError(502), True),
+    (StatusError(400), False),
+    (HTTPError(404), False),
+    (TimeoutError(), True),
+    (ConnectionError(), True),
+    # 메시지에 "rate"/"timeout"/"500" 같은 단어가 있어도 상태 코드가 없으면 재시도하지 않음
+    (ValueError("invalid temperature rate 500; set timeout"), False),
+])
+def test_is_retryable_uses_types_and_status(exc, expected):
+    assert llm_gateway.is_retryable(exc) is expected
+
+def test_is_retryable_follows_wrapped_cause():
+    try:
+        try:
+            raise StatusError(429)
+        except StatusError as e:
+            raise RuntimeError("wrapped by langchain") from e
+    except RuntimeError as wrapped:
+        assert llm_gateway.is_retryable(wrapped)
+
+def test_fake_llm_default_error_is_retryable():
+    assert llm_gateway.is_retryable(llm_gateway.FakeLLM().error)
+
+def test_stage_metrics_counts_concurrent_updates():
+    metrics = llm_gateway.StageMetrics()
+
+    def bump():
+        for _ in range(2000):
+            metrics.add(calls=1, input_tokens=3)
+            metrics.record_latency(0.1)
+
+    threads = [threading.Thread(target=bump) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    snapshot = metrics.snapshot()
+    assert snapshot["calls"] == 16000
+    assert snapshot["input_tokens"] == 48000
+    assert snapshot["p50_sec"] == 0.1
+
+def _gateway(fake, **kwargs):
+    options = dict(stage_timeouts={"s": 1.0}, rate_per_sec=1000, burst=100, max_retries=2)
+    options.update(kwargs)
+    return llm_gateway.LLMGateway(fake, **options)
+
+def _counts(gateway, *names):
+    snapshot = gateway.metrics()["s"]
+    return {name: snapshot[name] for name in names}
+
+def test_stage_timeout_counted_once_without_retry():
+    gateway = _gateway(llm_gateway.FakeLLM(latency=(0.5, 0.5)), stage_timeouts={"s": 0.1})
+    with pytest.raises(llm_gateway.LLMTimeoutError, match="0.1초"):
+        gateway.invoke("ping", stage="s")
+    assert _counts(gateway, "calls", "timeouts", "retries", "errors", "successes") == {
+        "calls": 1, "timeouts": 1, "retries": 0, "errors": 1, "successes": 0}
+
+def test_retry_then_succeed(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "BACKOFF_BASE", 0.001)
+    fake = llm_gateway.FakeLLM(latency=(0, 0), fail_first=2)
+    gateway = _gateway(fake)
+    assert gateway.invoke("ping", stage="s").content == '{"ok": true}'
+    assert fake.calls == 3
+    assert _counts(gateway, "retries", "successes", "errors", "timeouts") == {
+        "retries": 2, "successes": 1, "errors": 0, "timeouts": 0}
+
+def test_retries_exhausted_reports_error(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "BACKOFF_BASE", 0.001)
+    gateway = _gateway(llm_gateway.FakeLLM(latency=(0, 0), error_rate=1.0), max_retries=1)
+    with pytest.raises(llm_gateway.LLMGatewayError):
+        gateway.invoke("ping", stage="s")
+    assert _counts(gateway, "retries", "errors", "timeouts") == {"retries": 1, "errors": 1, "timeouts": 0}
+
+def test_non_retryable_error_is_not_retried():
+    fake = llm_gateway.FakeLLM(latency=(0, 0), error_rate=1.0, error=ValueError("bad request"))
+    gateway = _gateway(fake)
+    with pytest.raises(llm_gateway.LLMGatewayError):
+        gateway.invoke("ping", stage="s")
+    assert fake.calls == 1
+    assert _counts(gateway, "retries", "errors") == {"retries": 0, "errors": 1}
+
+def test_hedge_wins_when_primary_is_slow():
+    fake = llm_gateway.FakeLLM(latency=(0, 0), slow_first=1, slow_latency=1.0)
+    gateway = _gateway(fake, stage_timeouts={"s": 2.0}, hedge=True)
+    metrics = gateway._stage_metrics("s")
+    for _ in range(llm_gateway.HEDGE_MIN_SAMPLES):
+        metrics.record_latency(0.01)
+    start = time.monotonic()
+    gateway.invoke("ping", stage="s")
+    assert time.monotonic() - start < 0.5
+    assert _counts(gateway, "hedges", "hedge_wins", "successes") == {"hedges": 1, "hedge_wins": 1, "successes": 1}
+
+def test_rate_limited_when_bucket_is_empty():
+    gateway = _gateway(llm_gateway.FakeLLM(latency=(0, 0)), rate_per_sec=0.01, burst=1, stage_timeouts={"s": 0.2})
+    gateway.invoke("ping", stage="s")
+    with pytest.raises(llm_gateway.LLMRateLimitedError):
+        gateway.invoke("ping", stage="s")
+    assert _counts(gateway, "rate_limited", "successes", "errors") == {"rate_limited": 1, "successes": 1, "errors": 0}
+
+def test_semaphore_bounds_concurrent_calls():
+    active, peak, lock = [0], [0], threading.Lock()
+
+    class Tracking(llm_gateway.FakeLLM):
+        def invoke(self, prompt, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            try:
+                return super().invoke(prompt, **kwargs)
+            finally:
+                with lock:
+                    active[0] -= 1
+
+    gateway = _gateway(Tracking(latency=(0.05, 0.05)), max_concurrency=2)
+    threads = [threading.Thread(target=gateway.invoke, args=("ping",), kwargs={"stage": "s"}) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 2
+    assert gateway.metrics()["s"]["successes"] == 6
+
+def test_breaker_opens_then_half_opens():
+    fake = llm_gateway.FakeLLM(latency=(0, 0), error_rate=1.0)
+    gateway = _gateway(fake, max_retries=0, breaker_threshold=2, breaker_cooldown=0.1)
+    for _ in range(2):
+        with pytest.raises(llm_gateway.LLMGatewayError):
+            gateway.invoke("ping", stage="s")
+    assert gateway.circuit_open("s")
+    with pytest.raises(llm_gateway.LLMCircuitOpenError):
+        gateway.invoke("ping", stage="s")
+    assert fake.calls == 2
+    assert _counts(gateway, "errors", "circuit_rejected") == {"errors": 2, "circuit_rejected": 1}
+
+    # 대기 시간 경과 → 시험 호출 1건 허용, 성공하면 차단 해제
+    time.sleep(0.15)
+    fake.error_rate = 0.0
+    gateway.invoke("ping", stage="s")
+    assert not gateway.circuit_open("s")
+    assert _counts(gateway, "successes", "circuit_rejected") == {"successes": 1, "circuit_rejected": 1}
+
+def test_failed_probe_reopens_breaker():
+    fake = llm_gateway.FakeLLM(latency=(0, 0), error_rate=1.0)
+    gateway = _gateway(fake, max_retries=0, breaker_threshold=1, breaker_cooldown=0.1)
+    with pytest.raises(llm_gateway.LLMGatewayError):
+        gateway.invoke("ping", stage="s")
+    time.sleep(0.15)
+    with pytest.raises(llm_gateway.LLMGatewayError):
+        gateway.invoke("ping", stage="s")
+    assert fake.calls == 2
+    with pytest.raises(llm_gateway.LLMCircuitOpenError):
+        gateway.invoke("ping", stage="s")
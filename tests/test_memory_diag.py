@@ -0,0 +1,109 @@
+import json
+import sys
+import time
+import tracemalloc
+
+import pytest
+
+import memory_diag
+
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch):
+    monkeypatch.setattr(memory_diag, "_sessions", {})
+    monkeypatch.setattr(memory_diag, "_stage_stats", {})
+
+class Holder:
+    def __init__(self, payload):
+        self.payload = payload
+
+def test_deep_sizeof_counts_nested_containers_and_attributes():
+    payload = ["x" * 1000]
+    assert memory_diag.deep_sizeof(payload) >= sys.getsizeof(payload) + sys.getsizeof(payload[0])
+    # 객체 속성까지 따라감
+    assert memory_diag.deep_sizeof(Holder(payload)) > memory_diag.deep_sizeof(payload)
+    assert memory_diag.deep_sizeof({"k": payload}) > memory_diag.deep_sizeof(payload)
+
+def test_deep_sizeof_counts_shared_objects_once_and_handles_cycles():
+    big = "y" * 10_000
+    single = memory_diag.deep_sizeof([big])
+    assert memory_diag.deep_sizeof([big, big]) - single < 100
+    cycle = []
+    cycle.append(cycle)
+    assert memory_diag.deep_sizeof(cycle) == sys.getsizeof(cycle, 0)
+
+def test_deep_sizeof_skips_modules_functions_and_classes():
+    assert memory_diag.deep_sizeof([json, len, Holder, lambda: 0]) == sys.getsizeof([None] * 4, 0)
+
+class BrokenState(dict):
+    def __getitem__(self, key):
+        if key == "broken":
+            raise RuntimeError("unreadable")
+        return super().__getitem__(key)
+
+def test_session_breakdown_sorted_and_shared_values_counted_once():
+    shared = "z" * 5000
+    state = BrokenState(small=1, big=["b" * 20_000], first=[shared], second=[shared], broken=None)
+    breakdown = memory_diag.session_breakdown(state)
+    assert list(breakdown)[0] == "big"
+    assert "broken" not in breakdown
+    # 여러 키가 같은 값을 참조하면 먼저 본 키에만 집계
+    assert breakdown["first"] > 5000
+    assert breakdown["second"] < 1000
+
+def test_record_session_and_active_window():
+    memory_diag.record_session("a", {"history": ["m" * 2048]})
+    memory_diag.record_session("b", {"history": []})
+    assert len(memory_diag.active_sessions()) == 2
+
+    memory_diag._sessions["a"]["time"] = time.time() - 100
+    sessions = memory_diag.active_sessions(window=10)
+    assert len(sessions) == 1
+    assert "a" not in memory_diag._sessions
+
+def test_report_aggregates_active_sessions():
+    memory_diag.record_session("a", {"history": ["m" * 4096]})
+    memory_diag.record_session("b", {"history": ["m" * 1024]})
+    row = memory_diag.report()
+    assert row["active_sessions"] == 2
+    assert row["session_kb"]["max"] >= row["session_kb"]["avg"] > 1
+    assert list(row["session_fields_kb"]) == ["history"]
+    json.dumps(row)
+
+def test_track_is_noop_without_tracing():
+    if tracemalloc.is_tracing():
+        pytest.skip("tracemalloc already tracing")
+    with memory_diag.track("stage"):
+        data = [0] * 1000
+    assert data and memory_diag.stage_summary() == {}
+
+def test_track_records_stage_delta():
+    already = tracemalloc.is_tracing()
+    if not already:
+        tracemalloc.start()
+    try:
+        kept = []
+        for _ in range(2):
+            with memory_diag.track("stage"):
+                kept.append(bytearray(512 * 1024))
+    finally:
+        if not already:
+            tracemalloc.stop()
+    summary = memory_diag.stage_summary()["stage"]
+    assert summary["runs"] == 2
+    assert summary["max_delta_kb"] >= 500
+    assert summary["last_top"][0]["where"].startswith("test_memory_diag.py:")
+
+def test_fit_capacity_linear_model(tmp_path):
+    path = tmp_path / "memory_report.jsonl"
+    rows = [{"active_sessions": n, "uss_mb": 500 + 2 * n, "rss_mb": None} for n in (0, 10, 20, 40)]
+    path.write_text("".join(json.dumps(r) + "\n" for r in rows), encoding="utf-8")
+
+    fit = memory_diag.fit_capacity(memory_diag.load_reports(str(path)))
+    assert fit["base_mb"] == 500
+    assert fit["per_session_mb"] == 2
+    assert fit["r2"] == 1.0
+    assert fit["max_observed_mb"] == 580
+    # 값이 없는 지표나 세션 수가 한 가지뿐이면 산정 불가
+    assert memory_diag.fit_capacity(rows, "rss_mb") is None
+    assert memory_diag.fit_capacity(rows[:1] * 3) is None
+    assert memory_diag.load_reports(str(tmp_path / "missing.jsonl")) == []
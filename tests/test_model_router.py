@@ -0,0 +1,126 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import llm_gateway
+import model_router
+
+class MeteredLLM(llm_gateway.FakeLLM):
+    """usage_metadata를 채워 돌려주는 가짜 LLM (비용 기록 확인용)"""
+
+    def __init__(self, cfg, input_tokens=1000, output_tokens=200):
+        super().__init__(latency=(0, 0))
+        self.cfg = cfg
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+    def invoke(self, prompt, **kwargs):
+        message = super().invoke(prompt, **kwargs)
+        return AIMessage(content=message.content, usage_metadata={
+            "input_tokens": self.input_tokens, "output_tokens": self.output_tokens,
+            "total_tokens": self.input_tokens + self.output_tokens})
+
+@pytest.fixture
+def fake_providers(monkeypatch):
+    built = []
+
+    def builder(provider):
+        def build(cfg):
+            llm = MeteredLLM(dict(cfg, provider=provider))
+            built.append(llm)
+            return llm
+        return build
+
+    monkeypatch.setattr(model_router, "PROVIDERS", {"google": builder("google"), "local": builder("local")})
+    return built
+
+def test_load_routes_defaults_without_file(tmp_path):
+    routes = model_router.load_routes(str(tmp_path / "missing.json"))
+    assert routes == model_router.STAGE_ROUTES
+    routes["generate_chat_response"]["model"] = "changed"
+    assert model_router.STAGE_ROUTES["generate_chat_response"]["model"] == model_router.DEFAULT_MODEL
+
+def test_load_routes_merges_overrides(tmp_path):
+    path = tmp_path / "model_routes.json"
+    path.write_text(json.dumps({
+        "generate_situations_from_tags": {"provider": "local", "model": "Qwen/Qwen2.5-0.5B-Instruct"},
+        "new_stage": {"model": "gemini-2.0-flash", "timeout": 5.0},
+    }), encoding="utf-8")
+    routes = model_router.load_routes(str(path))
+    situations = routes["generate_situations_from_tags"]
+    assert situations["provider"] == "local"
+    assert situations["model"] == "Qwen/Qwen2.5-0.5B-Instruct"
+    # 덮어쓰지 않은 값은 기본값 유지
+    assert situations["max_output_tokens"] == 512
+    assert routes["new_stage"] == {"model": "gemini-2.0-flash", "timeout": 5.0}
+
+def test_build_stage_llms_shares_instances_and_picks_provider(fake_providers):
+    routes = {
+        "a": {"provider": "google", "model": "gemini-2.0-flash", "max_output_tokens": 512},
+        "b": {"model": "gemini-2.0-flash", "max_output_tokens": 512},
+        "c": {"provider": "google", "model": "gemini-2.0-flash", "max_output_tokens": 1024},
+        "d": {"provider": "local", "model": "Qwen/Qwen2.5-0.5B-Instruct"},
+    }
+    llms = model_router.build_stage_llms(routes)
+    # provider 생략 시 google, 설정이 같으면 인스턴스 공유
+    assert llms["a"] is llms["b"]
+    assert llms["a"] is not llms["c"]
+    assert len(fake_providers) == 3
+    assert llms["d"].cfg["provider"] == "local"
+    assert llms["a"].cfg["provider"] == "google"
+
+def test_estimate_cost():
+    assert model_router.estimate_cost("gemini-2.0-flash-lite", 1_000_000, 1_000_000) == pytest.approx(0.375)
+    assert model_router.estimate_cost("gemini-2.0-flash", 2000, 500) == pytest.approx(0.0004)
+    # 가격표에 없는 모델(로컬 모델 등)은 0
+    assert model_router.estimate_cost("Qwen/Qwen2.5-0.5B-Instruct", 10_000, 10_000) == 0.0
+
+def test_usage_recorder_writes_jsonl(tmp_path):
+    path = tmp_path / "usage.jsonl"
+    routes = {"s": {"model": "gemini-2.0-flash"}}
+    recorder = model_router.UsageRecorder(routes, str(path))
+    recorder("s", 0.12345, {"input_tokens": 1000, "output_tokens": 100})
+    recorder("unknown", 1.0, {})
+
+    first, second = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert first["stage"] == "s"
+    assert first["model"] == "gemini-2.0-flash"
+    assert first["latency_sec"] == 0.123
+    assert first["cost_usd"] == pytest.approx(0.00014)
+    # 라우팅에 없는 단계는 기본 모델, 토큰 정보가 없으면 0
+    assert second["model"] == model_router.DEFAULT_MODEL
+    assert (second["input_tokens"], second["output_tokens"], second["cost_usd"]) == (0, 0, 0)
+
+def test_usage_recorder_without_path_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model_router.UsageRecorder({}, None)("s", 0.1, {"input_tokens": 1})
+    assert list(tmp_path.iterdir()) == []
+
+def test_build_gateway_routes_stages_and_records_usage(fake_providers, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    routes = {
+        "light": {"provider": "local", "model": "Qwen/Qwen2.5-0.5B-Instruct", "timeout": 3.0},
+        "analyze_tags_and_situation": {"provider": "google", "model": "gemini-2.0-flash", "timeout": 7.0},
+    }
+    gateway = model_router.build_gateway(routes, rate_per_sec=1000, burst=100)
+    assert gateway.stage_timeouts["light"] == 3.0
+    assert gateway.stage_timeouts["analyze_tags_and_situation"] == 7.0
+    # 기본 모델은 심층 분석 단계 모델
+    assert gateway.llm.cfg["model"] == "gemini-2.0-flash"
+
+    gateway.invoke("ping", stage="light")
+    gateway.invoke("ping", stage="analyze_tags_and_situation")
+    gateway.invoke("ping", stage="analyze_tags_and_situation")
+    local_llm = next(llm for llm in fake_providers if llm.cfg["provider"] == "local")
+    assert local_llm.calls == 1
+
+    report = model_router.cost_report(gateway, routes)
+    assert report["light"]["cost_usd"] == 0.0
+    assert report["analyze_tags_and_situation"]["input_tokens"] == 2000
+    assert report["analyze_tags_and_situation"]["cost_usd"] == pytest.approx(0.00036)
+
+    summary = model_router.summarize_usage_log(str(tmp_path / model_router.USAGE_LOG_FILE))
+    assert summary["light"]["calls"] == 1
+    assert summary["analyze_tags_and_situation"]["calls"] == 2
+    assert summary["analyze_tags_and_situation"]["total_cost_usd"] == pytest.approx(0.0004)
@@ -0,0 +1,125 @@
+import json
+import threading
+
+import pytest
+from langchain_core.documents import Document
+
+import engine
+import prompt_tokens
+
+TAGS = {"누구": ["#반려견"], "위험": ["#배상"], "우선순위": [], "변화": []}
+
+class FakeStore:
+    """as_retriever만 제공하는 약관 검색 저장소 대역"""
+
+    def __init__(self, count=8):
+        self.docs = [Document(page_content=f"제{i}조 반려견이 타인을 물어 생긴 손해를 보상합니다", metadata={"source": "펫보험A"})
+                     for i in range(count)]
+
+    def as_retriever(self, search_kwargs=None):
+        docs = self.docs[:(search_kwargs or {}).get("k", 4)]
+        return type("Retriever", (), {"invoke": lambda self, query: docs})()
+
+@pytest.fixture
+def accountant(tmp_path):
+    return prompt_tokens.TokenAccountant(str(tmp_path / "prompt_tokens.jsonl"), log_inputs=False)
+
+def test_estimate_tokens_by_script():
+    assert prompt_tokens.estimate_tokens("") == 0
+    assert prompt_tokens.estimate_tokens(None) == 0
+    assert prompt_tokens.estimate_tokens("보험료") == 2
+    assert prompt_tokens.estimate_tokens("insurance") == 3
+    assert prompt_tokens.estimate_tokens("2026") == 2
+    assert prompt_tokens.estimate_tokens("보험 ok!") == 4
+
+def test_count_sections_excludes_placeholders_and_unescapes_braces():
+    sections = prompt_tokens.count_sections("상황: {situation}\n{{\"a\": 1}}", {"situation": "개가 물었어요"})
+    assert sections["template"] == prompt_tokens.estimate_tokens('상황: \n{"a": 1}')
+    assert sections["situation"] == prompt_tokens.estimate_tokens("개가 물었어요")
+
+def test_record_total_is_sum_of_sections_and_flags_budget(accountant, monkeypatch, capsys):
+    monkeypatch.setitem(prompt_tokens.SECTION_BUDGETS, "docs", 5)
+    monkeypatch.setitem(prompt_tokens.STAGE_BUDGETS, "stage", 10)
+    entry = accountant.record("stage", "문서: {docs} 상황: {situation}",
+                              {"docs": "약관 " * 20, "situation": "물림"}, inputs={"situation_text": "물림"})
+    assert entry["total"] == sum(entry["sections"].values())
+    assert entry["over_budget"] == ["docs", "total"]
+    # 기본 설정에서는 고객 원문을 기록하지 않음
+    assert "inputs" not in entry
+    assert "프롬프트 예산 초과" in capsys.readouterr().out
+
+    accountant.flush()
+    logged = prompt_tokens.load_log(accountant.path)
+    assert logged[0]["total"] == entry["total"]
+
+def test_summarize_stage_totals_add_up(accountant):
+    for docs in ("짧은 문서", "조금 더 긴 약관 문서 내용입니다", "가장 긴 약관 문서 내용과 추가 설명이 붙은 문단입니다"):
+        accountant.record("stage", "문서: {docs} / 상황: {situation}", {"docs": docs, "situation": "개가 물었어요"})
+    accountant.record("other", "{question}", {"question": "보상되나요?"})
+    summary = accountant.summary()
+
+    stage = summary["stage"]
+    rows = list(accountant.history["stage"])
+    assert stage["calls"] == 3
+    assert stage["avg"] == round(sum(r["total"] for r in rows) / 3, 1)
+    # 구간별 평균의 합 = 전체 평균, 비중의 합 = 1
+    assert sum(s["avg"] for s in stage["sections"].values()) == pytest.approx(stage["avg"], abs=0.2)
+    assert sum(s["share"] for s in stage["sections"].values()) == pytest.approx(1.0, abs=0.01)
+    assert list(stage["sections"])[0] == max(stage["sections"], key=lambda n: stage["sections"][n]["share"])
+    assert summary["other"]["calls"] == 1
+
+def test_load_log_reads_rotated_file_first(tmp_path):
+    path = tmp_path / "prompt_tokens.jsonl"
+    accountant = prompt_tokens.TokenAccountant(str(path), max_bytes=1)
+    accountant.record("first", "{a}", {"a": "x"})
+    accountant.flush()
+    accountant.record("second", "{a}", {"a": "y"})
+    accountant.flush()
+    assert (tmp_path / "prompt_tokens.jsonl.1").exists()
+    assert [r["stage"] for r in prompt_tokens.load_log(str(path))] == ["first", "second"]
+
+def test_capture_is_per_thread():
+    other = []
+
+    def record_elsewhere():
+        with prompt_tokens.capture() as rows:
+            prompt_tokens.record("other", "{a}", {"a": "x"})
+            other.extend(rows)
+
+    with prompt_tokens.capture() as rows:
+        prompt_tokens.record("mine", "{a}", {"a": "x"})
+        thread = threading.Thread(target=record_elsewhere)
+        thread.start()
+        thread.join()
+    assert [r["stage"] for r in rows] == ["mine"]
+    assert [r["stage"] for r in other] == ["other"]
+
+def test_calibration_ratio(tmp_path):
+    usage = tmp_path / "llm_usage.jsonl"
+    usage.write_text("".join(json.dumps({"stage": "s", "input_tokens": n}) + "\n" for n in (120, 130)), encoding="utf-8")
+    assert prompt_tokens.calibration({"s": {"avg": 100}}, str(usage)) == {"s": 1.25}
+
+def test_replay_without_toc_keeps_analysis_within_budget(monkeypatch):
+    stage = "analyze_tags_and_situation"
+    toc = "\n".join(f"제{i}장 배상책임 특별약관 보장 내용 및 보상하지 않는 손해" for i in range(400))
+    monkeypatch.setattr(engine, "load_toc_data", lambda: toc)
+    resources = {"vectorstore": FakeStore(), "llm": prompt_tokens._dry_run_llm(), "article_index": None}
+    rows = [{"stage": stage, "inputs": {"tags": TAGS, "situation_text": "제 개가 이웃을 물었어요", "target_product_name": None}}]
+
+    baseline = prompt_tokens.replay(rows, {}, resources)
+    variant = prompt_tokens.replay(rows, {"analysis_toc": "off"}, resources)
+    assert baseline[stage]["avg_tokens"] > prompt_tokens.STAGE_BUDGETS[stage]
+    assert variant[stage]["avg_tokens"] <= prompt_tokens.STAGE_BUDGETS[stage]
+    assert engine.PROMPT_SETTINGS["analysis_toc"] == "full"
+
+    # 목차만 빠지고 약관 증거/상황 등 나머지 구간은 그대로
+    sections = {}
+    for toc_setting in ("full", "off"):
+        with engine.prompt_settings(analysis_toc=toc_setting), prompt_tokens.capture() as captured:
+            prompt_tokens._run_stage(engine, stage, rows[0]["inputs"], resources)
+        sections[toc_setting] = captured[0]["sections"]
+    before, after = sections["full"], sections["off"]
+    assert before["toc_summary"] > prompt_tokens.SECTION_BUDGETS["toc_summary"]
+    assert after["toc_summary"] < 10
+    for name in ("template", "context", "situation", "tags"):
+        assert after[name] == before[name]
@@ -0,0 +1,10 @@
+import request_profiler
+
+def test_admin_request_disabled_without_token():
+    assert not request_profiler.admin_requested("1", token="")
+    assert not request_profiler.admin_requested("", token="")
+
+def test_admin_request_requires_matching_token():
+    assert request_profiler.admin_requested("s3cret", token="s3cret")
+    assert not request_profiler.admin_requested("1", token="s3cret")
+    assert not request_profiler.admin_requested(None, token="s3cret")
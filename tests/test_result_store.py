@@ -0,0 +1,35 @@
+import json
+
+import result_store
+
+class FakeStore:
+    def __init__(self, ids):
+        self.ids = ids
+
+    def get(self, include=None, limit=None, offset=0):
+        return {"ids": self.ids[offset:offset + limit]}
+
+def test_fingerprint_prefers_ingest_state(tmp_path):
+    state = {"insurance_rag": {"a.txt": "h1"}}
+    (tmp_path / result_store.INGEST_STATE_FILE).write_text(json.dumps(state), encoding="utf-8")
+    first = result_store.collection_fingerprint(str(tmp_path), FakeStore(["x"]))
+    assert first.startswith("state-")
+    state["insurance_rag"]["a.txt"] = "h2"
+    (tmp_path / result_store.INGEST_STATE_FILE).write_text(json.dumps(state), encoding="utf-8")
+    assert result_store.collection_fingerprint(str(tmp_path)) != first
+
+def test_fingerprint_from_chunk_ids_pages_and_ignores_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "FINGERPRINT_PAGE_SIZE", 2)
+    ids = [f"c{i}" for i in range(5)]
+    forward = result_store.collection_fingerprint(str(tmp_path), FakeStore(ids))
+    assert forward == result_store.collection_fingerprint(str(tmp_path), FakeStore(ids[::-1]))
+    assert forward.startswith("ids-5-")
+    assert result_store.collection_fingerprint(str(tmp_path), FakeStore(ids[:4])) != forward
+    assert result_store.collection_fingerprint(str(tmp_path), FakeStore([])) is None
+
+def test_share_url_keeps_base_path(monkeypatch):
+    monkeypatch.setattr(result_store, "APP_BASE_URL", "")
+    assert result_store.share_url("abc", "https://example.com/hilight/?sid=tok") == "https://example.com/hilight/?result=abc"
+    assert result_store.share_url("abc") == "./?result=abc"
+    monkeypatch.setattr(result_store, "APP_BASE_URL", "https://cdn.example.com/app")
+    assert result_store.share_url("abc", "http://10.0.0.5:8501/") == "https://cdn.example.com/app?result=abc"
@@ -0,0 +1,69 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OPTIONAL = ("sharding", "retrieval_sidecar", "ann_cache", "admission", "request_profiler", "memory_diag", "numpy")
+
+def _imported(modules, env=None):
+    """새 인터프리터에서 modules를 import한 뒤 로드된 선택 기능 모듈 목록"""
+    code = f"import sys; import {', '.join(modules)}; print(','.join(m for m in {OPTIONAL!r} if m in sys.modules))"
+    environ = {k: v for k, v in os.environ.items() if k not in ("CLAUSE_SHARDS", "RETRIEVAL_SOCKET", "MEMORY_DIAG")}
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env={**environ, **(env or {})},
+                          capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    return [m for m in proc.stdout.strip().split(",") if m]
+
+def test_serving_imports_optional_modules_lazily():
+    assert _imported(["serving", "result_store"]) == []
+
+def test_stage_modules_import_optional_modules_lazily():
+    pytest.importorskip("streamlit")
+    # streamlit 자체가 numpy를 import하므로 numpy는 확인하지 않음
+    assert [m for m in _imported(["recommend", "degraded"]) if m != "numpy"] == []
+
+def test_clause_store_cache_follows_index_version(monkeypatch):
+    from langchain_core.documents import Document
+
+    import ann_cache
+    import serving
+    import retrieval_sidecar
+
+    class FakeStore:
+        def __init__(self):
+            self.searches = 0
+
+        def similarity_search_with_score(self, query, k=4, filter=None):
+            self.searches += 1
+            return [(Document(page_content="본문", metadata={"source": "A"}, id="c1"), 0.9)]
+
+        def get(self, ids=None, include=None):
+            return {"ids": ids, "documents": ["본문"] * len(ids), "metadatas": [{"source": "A"}] * len(ids)}
+
+    opened = []
+    def open_clause_store(persist_dir, embedding, mode):
+        opened.append(FakeStore())
+        return opened[-1]
+
+    versions = iter(["ids-1-aaaa", "ids-1-aaaa", "ids-1-bbbb"])
+    monkeypatch.setattr(serving, "load_embeddings", lambda: None)
+    monkeypatch.setattr(retrieval_sidecar, "open_clause_store", open_clause_store)
+    monkeypatch.setattr(serving, "index_version", lambda: next(versions))
+    monkeypatch.setattr(serving, "ANN_CACHE_SIZE", 16)
+    first = serving._load_local_vectorstore()
+    invalidations = ann_cache.cache.stats()["invalidations"]
+    first.similarity_search_with_score("질문")
+    # 같은 인덱스 버전 → 같은 저장소, 반복 검색은 캐시에서
+    assert serving._load_local_vectorstore() is first
+    first.similarity_search_with_score("질문")
+    assert opened[0].searches == 1
+
+    # 제자리 증분 적재로 지문이 바뀜 → 새 저장소 + 캐시 무효화
+    second = serving._load_local_vectorstore()
+    assert second is not first
+    second.similarity_search_with_score("질문")
+    assert opened[1].searches == 1
+    assert ann_cache.cache.stats()["invalidations"] == invalidations + 1
+    assert ann_cache.cache.version == "ids-1-bbbb"
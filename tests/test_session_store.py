@@ -0,0 +1,33 @@
+import threading
+
+import session_store
+
+def test_restore_only_by_session_token(tmp_path):
+    backend = session_store.SQLiteBackend(str(tmp_path / "sessions.db"))
+    state = {"visitor_id": "visitor-1", "session_token": session_store.new_token(), "step": 3,
+             "analysis_result": {"summary": "요약"}}
+    session_store.persist(backend, state)
+
+    assert not session_store.restore(backend, {}, "visitor-1")
+    restored = {}
+    assert session_store.restore(backend, restored, state["session_token"])
+    restored["session_token"] = state["session_token"]
+    session_store.load_for_step(backend, restored, 3)
+    assert restored["step"] == 3 and restored["analysis_result"] == {"summary": "요약"}
+    backend.close()
+
+def test_sqlite_backend_shares_one_connection_across_threads(tmp_path):
+    backend = session_store.SQLiteBackend(str(tmp_path / "sessions.db"))
+
+    def work(n):
+        for i in range(20):
+            backend.set(f"k{n}:{i}", b"v", 60)
+            assert backend.get(f"k{n}:{i}") == b"v"
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert backend.get("k7:19") == b"v"
+    backend.close()
@@ -0,0 +1,47 @@
+import sharding
+
+class FakeShardClient:
+    """샤드 프로세스 대신 청크 ID 목록으로 get/count 요청에 응답 (요청 기록)"""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.calls = []
+
+    def call(self, op, header, vectors=None):
+        kwargs = header["kwargs"]
+        self.calls.append((op, kwargs))
+        if op == "count":
+            return {"count": len(self.ids)}, None
+        offset, limit = kwargs.get("offset") or 0, kwargs.get("limit")
+        ids = self.ids[offset:] if limit is None else self.ids[offset:offset + limit]
+        return {"result": {"ids": ids, "documents": [f"doc-{cid}" for cid in ids]}}, None
+
+def _store(shard_ids):
+    clients = [FakeShardClient(ids) for ids in shard_ids]
+    return sharding.ShardedStore(clients, embedding=None), clients
+
+def _scan(store, page):
+    ids, offset = [], 0
+    while True:
+        batch = store.get(include=["documents"], limit=page, offset=offset)
+        if not batch["ids"]:
+            return ids
+        ids.extend(batch["ids"])
+        offset += len(batch["ids"])
+
+def test_paged_scan_counts_each_shard_once():
+    store, clients = _store([["a1", "a2", "a3"], ["b1"], ["c1", "c2", "c3", "c4"]])
+    ids = _scan(store, page=2)
+    assert ids == ["a1", "a2", "a3", "b1", "c1", "c2", "c3", "c4"]
+    for client in clients:
+        ops = [op for op, _ in client.calls]
+        assert ops.count("count") == 1
+        # 청크 ID 목록 전체 조회(limit 없는 get)는 하지 않음
+        assert all(kwargs.get("limit") is not None for op, kwargs in client.calls if op == "get")
+
+def test_new_scan_recounts():
+    store, clients = _store([["a1", "a2"], ["b1", "b2"]])
+    _scan(store, page=3)
+    clients[0].ids.append("a3")
+    assert _scan(store, page=3) == ["a1", "a2", "a3", "b1", "b2"]
+    assert [op for op, _ in clients[0].calls].count("count") == 2
@@ -0,0 +1,147 @@
+import os
+import hashlib
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import snapshot
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """Range 요청을 지원하는 정적 파일 서버 (fail_after_bytes를 넘기면 첫 요청을 중간에 끊음)"""
+    fail_after_bytes = None
+    ranges = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        header = self.headers.get("Range")
+        if not header:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        start, end = header.split("=", 1)[1].split("-")
+        start, end = int(start), int(end or len(data) - 1)
+        type(self).ranges.append((start, end))
+        body = data[start:end + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        limit = type(self).fail_after_bytes
+        if limit is not None:
+            type(self).fail_after_bytes = None
+            self.wfile.write(body[:limit])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+@pytest.fixture
+def server(tmp_path):
+    dist = tmp_path / "dist"
+    dist.mkdir()
+    RangeHandler.fail_after_bytes = None
+    RangeHandler.ranges = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(RangeHandler, directory=str(dist)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield dist, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+def make_db(base, folder, payload):
+    os.makedirs(base / folder, exist_ok=True)
+    (base / folder / "chroma.sqlite3").write_bytes(payload)
+
+def test_sync_activates_version_and_resolves_real_path(tmp_path, server):
+    dist, url = server
+    source = tmp_path / "src"
+    make_db(source, "chroma_db_clause", os.urandom(300_000))
+    snapshot.build_bundles(["chroma_db_clause"], "v1", str(dist), base_dir=str(source))
+    root = str(tmp_path / "snapshots")
+
+    assert snapshot.sync_snapshot(f"{url}/{snapshot.MANIFEST_FILE}", root, log=lambda *_: None) == "v1"
+    assert snapshot.current_version(root) == "v1"
+    db_dir = snapshot.resolve_db_dir("chroma_db_clause", root)
+    assert db_dir == os.path.realpath(os.path.join(root, "v1", "chroma_db_clause"))
+    assert (source / "chroma_db_clause" / "chroma.sqlite3").read_bytes() == open(os.path.join(db_dir, "chroma.sqlite3"), "rb").read()
+
+    make_db(source, "chroma_db_clause", os.urandom(300_000))
+    snapshot.build_bundles(["chroma_db_clause"], "v2", str(dist), base_dir=str(source))
+    snapshot.sync_snapshot(f"{url}/{snapshot.MANIFEST_FILE}", root, log=lambda *_: None)
+    assert snapshot.resolve_db_dir("chroma_db_clause", root) == os.path.realpath(os.path.join(root, "v2", "chroma_db_clause"))
+
+def test_interrupted_range_resumes_from_last_written_block(tmp_path, server, monkeypatch):
+    dist, url = server
+    monkeypatch.setattr(snapshot, "CHUNK_SIZE", 4096)
+    payload = os.urandom(200_000)
+    (dist / "bundle.zip").write_bytes(payload)
+    bundle = {"name": "bundle.zip", "url": f"{url}/bundle.zip", "size": len(payload),
+              "sha256": hashlib.sha256(payload).hexdigest()}
+    download_dir = str(tmp_path / "downloads")
+
+    RangeHandler.fail_after_bytes = 3 * 4096 + 100
+    with pytest.raises(Exception):
+        snapshot.download_bundle(bundle, download_dir, parts=1)
+    progress = snapshot._load_progress(os.path.join(download_dir, "bundle.zip.part.json"))
+    assert progress["received"]["0"] >= 3 * 4096
+
+    path = snapshot.download_bundle(bundle, download_dir, parts=1)
+    assert open(path, "rb").read() == payload
+    assert RangeHandler.ranges[-1][0] == progress["received"]["0"]
+
+def test_concurrent_sync_downloads_once(tmp_path, server):
+    dist, url = server
+    source = tmp_path / "src"
+    make_db(source, "chroma_db_clause", os.urandom(300_000))
+    snapshot.build_bundles(["chroma_db_clause"], "v1", str(dist), base_dir=str(source))
+    root = str(tmp_path / "snapshots")
+    installs = []
+    original = snapshot._install_snapshot
+
+    def counting(manifest, root, log):
+        installs.append(manifest["version"])
+        return original(manifest, root, log)
+
+    snapshot._install_snapshot = counting
+    try:
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            snapshot.sync_snapshot(f"{url}/{snapshot.MANIFEST_FILE}", root, log=lambda *_: None))) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        snapshot._install_snapshot = original
+    assert results == ["v1"] * 4
+    # 파일 잠금은 같은 프로세스의 다른 파일 핸들끼리도 배타적 → 설치는 1번만
+    assert installs == ["v1"]
+    assert snapshot.current_version(root) == "v1"
+
+def test_sync_never_removes_live_version_dir(tmp_path, server):
+    dist, url = server
+    source = tmp_path / "src"
+    make_db(source, "chroma_db_clause", os.urandom(1000))
+    snapshot.build_bundles(["chroma_db_clause"], "v1", str(dist), base_dir=str(source))
+    root = tmp_path / "snapshots"
+    # current가 v1 폴더를 가리키지만 manifest가 없음(버전 정보 손상) → v1을 지우면 활성 DB가 사라짐
+    live = root / "v1"
+    make_db(live, "chroma_db_clause", b"live")
+    os.symlink("v1", root / snapshot.CURRENT_LINK)
+
+    assert snapshot.sync_snapshot(f"{url}/{snapshot.MANIFEST_FILE}", str(root), log=lambda *_: None) == "v1"
+    assert (live / "chroma_db_clause" / "chroma.sqlite3").read_bytes() == b"live"
+    assert os.path.realpath(root / snapshot.CURRENT_LINK) != os.path.realpath(live)
+    assert snapshot.current_version(str(root)) == "v1"
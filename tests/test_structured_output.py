@@ -0,0 +1,84 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import structured_output
+
+class RecordingLLM:
+    """재질의 프롬프트를 기록하고 정해진 응답을 돌려주는 LLM 대역"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.prompts = []
+
+    def invoke(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return AIMessage(content=self.responses.pop(0))
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"situations": ["a", "b"]}', {"situations": ["a", "b"]}),
+    # 코드펜스 + 앞 설명문
+    ('다음은 결과입니다.\n```json\n{"a": 1}\n```', {"a": 1}),
+    # 닫는 괄호 앞 쉼표 (문자열 안의 쉼표는 그대로)
+    ('{"a": [1, 2,], "b": "x, }",}', {"a": [1, 2], "b": "x, }"}),
+    # 잘린 문자열/배열/객체
+    ('{"a": 1, "b": "잘린 문', {"a": 1, "b": "잘린 문"}),
+    ('{"a": {"b": [1, 2', {"a": {"b": [1, 2]}}),
+    ('{"a": 1, "b": ', {"a": 1}),
+    ('{"a": 1,', {"a": 1}),
+])
+def test_loads_repairs_common_failures(text, expected):
+    assert structured_output.loads(text) == expected
+
+def test_loads_raises_when_nothing_recoverable():
+    with pytest.raises(json.JSONDecodeError):
+        structured_output.loads("JSON이 아닌 응답")
+
+def test_repair_candidates_close_open_structures_first():
+    candidates = structured_output._repair_candidates('{"a": [1, {"b": "c')
+    assert json.loads(candidates[0]) == {"a": [1, {"b": "c"}]}
+
+def test_incremental_parser_keeps_fields_of_cut_stream():
+    parser = structured_output.IncrementalJSONParser()
+    # 필드 경계가 없는 청크에서는 다시 파싱하지 않음
+    assert parser.feed('{"product_name": "펫') == {}
+    assert parser.feed('보험A", "match_') == {"product_name": "펫보험A"}
+    parser.feed('score": 90, "summ')
+    assert parser.close() == {"product_name": "펫보험A", "match_score": 90}
+    assert parser.buffer == '{"product_name": "펫보험A", "match_score": 90, "summ'
+
+def test_parse_structured_reports_missing_fields():
+    model, partial, missing = structured_output.parse_structured(
+        '{"keywords": [{"original": "a", "professional": "b"}]}', structured_output.KeywordProductsPayload)
+    assert model is None
+    assert missing == ["products"]
+    assert partial["keywords"][0]["professional"] == "b"
+
+def test_reask_fills_only_missing_fields():
+    text = '{"product_name": "펫보험A", "feature_name": "배상", "match_score": 90, "summary": "요약"'
+    llm = RecordingLLM(json.dumps({
+        "easy_explanation": "쉬운 설명", "reasoning": "근거", "evidence_snippet": "제3조", "limitations": "고의 제외",
+        # 이미 있는 필드는 재질의 응답에 있어도 덮어쓰지 않음
+        "product_name": "다른 상품",
+    }, ensure_ascii=False))
+    model = structured_output.ensure_structured(llm, text, structured_output.AnalysisPayload, context="테스트")
+    assert model.product_name == "펫보험A"
+    assert model.limitations == "고의 제외"
+    assert len(llm.prompts) == 1
+    fields_section = llm.prompts[0].split("**[작성할 필드]**")[1]
+    assert "- limitations:" in fields_section
+    assert "- product_name:" not in fields_section
+
+def test_ensure_structured_raises_after_failed_reask():
+    llm = RecordingLLM("여전히 JSON 아님")
+    with pytest.raises(structured_output.StructuredOutputError):
+        structured_output.ensure_structured(llm, '{"situations": ', structured_output.SituationsPayload)
+    assert len(llm.prompts) == 1
+
+def test_valid_response_needs_no_reask():
+    llm = RecordingLLM()
+    model = structured_output.ensure_structured(llm, '```json\n{"situations": ["a", "b", "c"]}\n```',
+                                                structured_output.SituationsPayload)
+    assert model.situations == ["a", "b", "c"]
+    assert llm.prompts == []
@@ -0,0 +1,68 @@
+import os
+import socket
+import importlib
+
+import pytest
+
+import warmup
+
+@pytest.fixture
+def fresh_warmup():
+    """모듈 전역 상태(STATE, 엔드포인트, 워밍업 스레드)를 테스트마다 초기화"""
+    module = importlib.reload(warmup)
+    yield module
+    if module._server is not None:
+        module._server.shutdown()
+        module._server.server_close()
+
+def _fail():
+    raise RuntimeError("boom")
+
+def test_optional_step_failure_keeps_worker_ready(fresh_warmup, tmp_path):
+    template = str(tmp_path / ".ready.{pid}")
+    report = fresh_warmup.run_warmup([("model", lambda: None), ("llm_client", _fail)],
+                                     ready_file=template, optional=("llm_client",))
+    assert report["ready"] is True
+    assert "llm_client" in report["errors"]
+    # 워커마다 별도 파일
+    assert os.path.exists(str(tmp_path / f".ready.{os.getpid()}"))
+
+def test_required_step_failure_is_not_ready(fresh_warmup, tmp_path):
+    ready_file = str(tmp_path / ".ready")
+    report = fresh_warmup.run_warmup([("canned_query_clause", _fail)], ready_file=ready_file,
+                                     optional=("llm_client",))
+    assert report["ready"] is False
+    assert not os.path.exists(ready_file)
+
+def test_start_background_runs_once(fresh_warmup):
+    calls = []
+    first = fresh_warmup.start_background([("step", lambda: calls.append(1))], ready_file=None)
+    first.join(timeout=5)
+    second = fresh_warmup.start_background([("step", lambda: calls.append(1))], ready_file=None)
+    assert second is first
+    assert calls == [1]
+
+def test_readiness_server_skips_busy_port(fresh_warmup):
+    busy = socket.socket()
+    busy.bind(("127.0.0.1", 0))
+    busy.listen(1)
+    port = busy.getsockname()[1]
+    try:
+        server = fresh_warmup.start_readiness_server(port, host="127.0.0.1", span=8)
+        if server is None:
+            pytest.skip("연속된 빈 포트 없음")
+        assert server.server_address[1] != port
+        assert fresh_warmup.STATE.to_dict()["port"] == server.server_address[1]
+        # 프로세스당 1회 (다시 호출해도 같은 서버)
+        assert fresh_warmup.start_readiness_server(port, host="127.0.0.1", span=8) is server
+    finally:
+        busy.close()
+
+def test_readiness_server_all_ports_busy_does_not_raise(fresh_warmup):
+    busy = socket.socket()
+    busy.bind(("127.0.0.1", 0))
+    busy.listen(1)
+    try:
+        assert fresh_warmup.start_readiness_server(busy.getsockname()[1], host="127.0.0.1", span=1) is None
+    finally:
+        busy.close()
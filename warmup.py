@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import atexit
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Tuple
+
+# ============================================================================
+# 1. 설정 및 상수
+# ============================================================================
+# 워커마다 별도 파일 ({pid}는 프로세스 ID로 치환, 종료 시 삭제)
+READY_FILE = os.getenv("HILIGHT_READY_FILE", ".ready.{pid}")
+# 준비 상태 엔드포인트 시작 포트 (사용 중이면 다음 포트로, 워커 여러 개가 한 노드에서 실행되는 경우)
+READY_PORT = int(os.getenv("HILIGHT_READY_PORT", "0"))
+READY_PORT_SPAN = int(os.getenv("HILIGHT_READY_PORT_SPAN", "16"))
+# 필수 단계가 실패한 워밍업을 다시 시도하기까지 대기 시간 (초)
+WARMUP_RETRY_SEC = float(os.getenv("HILIGHT_WARMUP_RETRY_SEC", "60"))
+TOUCH_BLOCK = 1024 * 1024
+
+WARMUP_TEXTS = ["보험금 지급사유", "반려견이 다른 사람을 물었어요", "해외여행 중 휴대품을 도난당했어요"]
+CANNED_QUERY = "보험금을 지급하지 않는 사유"
+
+# ============================================================================
+# 2. 준비 상태 (프로세스 단위)
+# ============================================================================
+class WarmupState:
+    def __init__(self):
+        self.ready = False
+        self.started_at = None
+        self.finished_at = None
+        self.timings = {}
+        self.errors = {}
+        self.optional = ()
+        self.port = None
+        self.lock = threading.Lock()
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "ready": self.ready,
+                "pid": os.getpid(),
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "port": self.port,
+                "timings_sec": dict(self.timings),
+                "errors": dict(self.errors),
+                "optional_steps": list(self.optional),
+            }
+
+STATE = WarmupState()
+
+def is_ready() -> bool:
+    return STATE.ready
+
+def ready_file_path(path: Optional[str] = READY_FILE) -> Optional[str]:
+    return path.replace("{pid}", str(os.getpid())) if path else path
+
+def _write_ready_file(path: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(STATE.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def _clear_ready_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# ============================================================================
+# 3. 워밍업 단계
+# ============================================================================
+def touch_files(directory: str) -> int:
+    """인덱스 파일(HNSW, sqlite)을 끝까지 읽어 OS 페이지 캐시에 올림, 읽은 바이트 수 반환"""
+    total = 0
+    if not directory or not os.path.isdir(directory):
+        return total
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            with open(os.path.join(dirpath, name), "rb") as f:
+                while True:
+                    block = f.read(TOUCH_BLOCK)
+                    if not block:
+                        break
+                    total += len(block)
+    return total
+
+def encode_dummy(embeddings):
+    """지연 초기화(토크나이저, torch 스레드 풀 등)를 미리 발생시키는 더미 인코딩"""
+    embeddings.embed_query(WARMUP_TEXTS[0])
+    embeddings.embed_documents(WARMUP_TEXTS)
+
+def canned_query(vectorstore):
+    if vectorstore is None:
+        raise RuntimeError("벡터 DB 없음")
+    vectorstore.similarity_search(CANNED_QUERY, k=1)
+
+def run_warmup(steps: List[Tuple[str, Callable]], ready_file: Optional[str] = READY_FILE,
+               optional: Tuple[str, ...] = ()) -> dict:
+    """단계별로 실행하며 소요 시간을 기록, 필수 단계가 모두 성공하면 준비 완료 표시 (optional 단계 실패는 기록만)"""
+    per_worker = bool(ready_file) and "{pid}" in ready_file
+    ready_file = ready_file_path(ready_file)
+    with STATE.lock:
+        STATE.ready = False
+        STATE.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        STATE.finished_at = None
+        STATE.timings = {}
+        STATE.errors = {}
+        STATE.optional = tuple(optional)
+    if ready_file:
+        _clear_ready_file(ready_file)
+
+    start_total = time.perf_counter()
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            with STATE.lock:
+                STATE.errors[name] = str(e)
+            print(f"❌ [워밍업] {name} 실패: {e}")
+        with STATE.lock:
+            STATE.timings[name] = round(time.perf_counter() - start, 3)
+
+    with STATE.lock:
+        STATE.timings["total"] = round(time.perf_counter() - start_total, 3)
+        STATE.finished_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        STATE.ready = not any(name not in optional for name in STATE.errors)
+    if ready_file and STATE.ready:
+        _write_ready_file(ready_file)
+        if per_worker:
+            atexit.register(_clear_ready_file, ready_file)
+    print(f"{'✅' if STATE.ready else '❌'} 워밍업 {'완료' if STATE.ready else '실패'}: {STATE.timings}")
+    return STATE.to_dict()
+
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+_last_start = 0.0
+
+def start_background(steps, ready_file: Optional[str] = READY_FILE,
+                     optional: Tuple[str, ...] = ()) -> Optional[threading.Thread]:
+    """UI는 바로 띄우고 모델/인덱스는 백그라운드에서 준비 (steps는 단계 목록 또는 목록을 만드는 함수)
+
+    프로세스당 한 번만 실행되며, 필수 단계가 실패했으면 WARMUP_RETRY_SEC 이후 호출에서 다시 시도합니다.
+    """
+    global _thread, _last_start
+    with _thread_lock:
+        if _thread is not None and (_thread.is_alive() or STATE.ready
+                                    or time.monotonic() - _last_start < WARMUP_RETRY_SEC):
+            return _thread
+
+        def target():
+            run_warmup(steps() if callable(steps) else steps, ready_file, optional)
+
+        _last_start = time.monotonic()
+        _thread = threading.Thread(target=target, name="warmup", daemon=True)
+        _thread.start()
+        return _thread
+
+# ============================================================================
+# 4. 준비 상태 엔드포인트 (로드밸런서용)
+# ============================================================================
+class _ReadinessHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/ready"):
+            status = 200 if STATE.ready else 503
+        elif self.path.startswith("/healthz"):
+            status = 200
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps(STATE.to_dict(), ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+def start_readiness_server(port: int = READY_PORT, host: str = "0.0.0.0",
+                           span: int = READY_PORT_SPAN) -> Optional[ThreadingHTTPServer]:
+    """/ready (준비 전 503), /healthz 엔드포인트 실행 (port가 0이면 실행하지 않음, 프로세스당 1회)
+
+    port부터 port+span-1까지 비어 있는 포트를 사용하고, 모두 사용 중이면 경고만 출력합니다 (워커는 계속 실행).
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is not None:
+            return _server
+        for candidate in range(port, port + max(span, 1)):
+            try:
+                _server = ThreadingHTTPServer((host, candidate), _ReadinessHandler)
+            except OSError:
+                continue
+            with STATE.lock:
+                STATE.port = candidate
+            threading.Thread(target=_server.serve_forever, name="readiness", daemon=True).start()
+            print(f"🩺 준비 상태 엔드포인트: http://{host}:{candidate}/ready (pid {os.getpid()})")
+            return _server
+    print(f"⚠️ 준비 상태 엔드포인트 포트 {port}~{port + max(span, 1) - 1} 모두 사용 중 → 엔드포인트 없이 실행 ({ready_file_path(READY_FILE)} 참고)")
+    return None
+
+# ============================================================================
+# 5. CLI: 노드 사전 워밍업 (워커 기동 전 페이지 캐시 적재 및 소요 시간 측정)
+# ============================================================================
+if __name__ == "__main__":
+    import argparse
+    import snapshot
+    from langchain_chroma import Chroma
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    parser = argparse.ArgumentParser(description="임베딩 모델 및 벡터 인덱스 워밍업")
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--ready-file", default=".ready", help="노드 단위 결과 파일 (워커별 파일과 구분)")
+    args = parser.parse_args()
+
+    clause_dir = snapshot.resolve_db_dir("chroma_db_clause")
+    catalog_dir = snapshot.resolve_db_dir("chroma_db_catalog")
+    resources = {}
+
+    def load_model():
+        resources["embeddings"] = HuggingFaceEmbeddings(
+            model_name=args.model,
+            model_kwargs={'device': args.device},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+
+    def query_collections():
+        for persist_dir, collection in [(clause_dir, "insurance_rag"), (catalog_dir, "insurance_catalog")]:
+            if os.path.isdir(persist_dir):
+                canned_query(Chroma(persist_directory=persist_dir, embedding_function=resources["embeddings"], collection_name=collection))
+
+    report = run_warmup([
+        ("embedding_model_load", load_model),
+        ("dummy_encode", lambda: encode_dummy(resources["embeddings"])),
+        ("touch_clause_index", lambda: touch_files(clause_dir)),
+        ("touch_catalog_index", lambda: touch_files(catalog_dir)),
+        ("canned_queries", query_collections),
+    ], ready_file=args.ready_file)
+    print(json.dumps(report, ensure_ascii=False, indent=2))